@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import bs4
+
+import instrument
+import scrape_games
+import synthetic_games
+
+# the default corpus is synthetic, written on first use, so the benchmark runs from a fresh
+# checkout and its baseline is comparable between machines
+PATH_CORPUS = "bench_corpus"
+DEFAULT_CORPUS_GAMES = 50
+PATH_ROSTER_VALUES = "tests/test_cases/roster_values.json"
+PATH_BENCHMARK_BASELINE = "bench_baseline.json"
+DEFAULT_REPEATS = 5
+DEFAULT_TOLERANCE = 0.2
+STAGES = ["soup", "find_raw_boxes", "clean_raw_boxes", "find_raw_plays", "parse_all_plays",
+          "identify_player", "track_shot_clock", "track_partic", "correct_time_played",
+          "end to end"]
+
+
+# Below are functions for loading the corpus of stored pages.
+
+
+def load_corpus(corpus_path=PATH_CORPUS, roster_path=PATH_ROSTER_VALUES):
+    """Loads every game in a corpus of stored stats.ncaa.org pages. A game is a box score page
+    saved as box_{box ID}.html with its play-by-play page saved as pbp_{PBP ID}.html in the same
+    directory.
+
+    Args:
+        corpus_path: The directory containing the stored pages.
+        roster_path: A JSON file from team season ID to roster, in the format
+            of tests/test_cases/roster_values.json. Teams without a roster in
+            the file get an empty roster. If the corpus directory contains its
+            own rosters.json, that file is used instead.
+
+    Returns:
+        A list of dicts, one per game, with keys 'box ID', 'box html',
+        'pbp html', 'home roster', 'away roster' and 'player names' (the
+        (player ID, name, roster) arguments of every call to identify_player
+        made while cleaning the game)."""
+    if os.path.exists(os.path.join(corpus_path, "rosters.json")):
+        roster_path = os.path.join(corpus_path, "rosters.json")
+    rosters = {}
+    if os.path.exists(roster_path):
+        with open(roster_path, 'r') as roster_file:
+            rosters = json.load(roster_file)
+
+    games = []
+    for file_name in sorted(os.listdir(corpus_path)):
+        match = re.fullmatch(r"box_(\d+)\.html", file_name)
+        if match is None:
+            continue
+        with open(os.path.join(corpus_path, file_name), 'rb') as box_file:
+            box_html = box_file.read()
+        box_soup = bs4.BeautifulSoup(box_html, 'html.parser')
+        pbp_path = os.path.join(corpus_path, f"pbp_{scrape_games.find_pbp_id(box_soup)}.html")
+        if not os.path.exists(pbp_path):
+            continue
+        with open(pbp_path, 'rb') as pbp_file:
+            pbp_html = pbp_file.read()
+
+        h_team_season_id, a_team_season_id = scrape_games.find_team_ids(box_soup)[:2]
+        h_roster = rosters.get(str(h_team_season_id), [])
+        a_roster = rosters.get(str(a_team_season_id), [])
+        games.append({
+            'box ID': int(match.group(1)),
+            'box html': box_html,
+            'pbp html': pbp_html,
+            'home roster': h_roster,
+            'away roster': a_roster,
+            'player names': find_player_names(box_soup, bs4.BeautifulSoup(pbp_html, 'html.parser'),
+                                              h_roster, a_roster)
+        })
+    return games
+
+
+def find_player_names(box_soup, pbp_soup, h_roster, a_roster):
+    """Finds the arguments of every call to identify_player made while cleaning a game, so
+    identify_player can be timed on its own.
+
+    Returns:
+        A list of (player ID, name, roster) tuples."""
+    player_names = []
+    for raw_box in scrape_games.find_raw_boxes(box_soup):
+        if raw_box[2].strip().lower() != "team":
+            roster = a_roster if raw_box[1] else h_roster
+            player_names.append((raw_box[0], scrape_games.clean_name(raw_box[2].strip()), roster))
+    for play_row in scrape_games.find_raw_plays(pbp_soup):
+        try:
+            play = scrape_games.parse_play_row(play_row, [], [])
+        except ValueError:
+            continue
+        if (play is not None) and (play['player']['name'] is not None):
+            roster = a_roster if play['is away'] else h_roster
+            player_names.append((None, play['player']['name'], roster))
+    return player_names
+
+
+# Below are functions for timing the parse and tracking pipeline.
+
+
+def run_game(game, metrics):
+    """Runs the whole parse and tracking pipeline on one game, timing each stage.
+
+    Args:
+        game: A game dict returned by load_corpus.
+        metrics: The instrument.Metrics to record the timings in."""
+    with metrics.timer("end to end"):
+        with metrics.timer("soup"):
+            box_soup = bs4.BeautifulSoup(game['box html'], 'html.parser')
+            pbp_soup = bs4.BeautifulSoup(game['pbp html'], 'html.parser')
+        with metrics.timer("find_raw_boxes"):
+            raw_boxes = scrape_games.find_raw_boxes(box_soup)
+        with metrics.timer("clean_raw_boxes"):
+            boxes = scrape_games.clean_raw_boxes(raw_boxes, game['home roster'],
+                                                 game['away roster'])
+        with metrics.timer("find_raw_plays"):
+            raw_plays = scrape_games.find_raw_plays(pbp_soup)
+        with metrics.timer("parse_all_plays"):
+            plays = scrape_games.parse_all_plays(raw_plays, game['home roster'],
+                                                 game['away roster'])
+        with metrics.timer("track_shot_clock"):
+            scrape_games.track_shot_clock(plays)
+        with metrics.timer("track_partic"):
+            scrape_games.track_partic(plays)
+        with metrics.timer("correct_time_played"):
+            scrape_games.correct_time_played(boxes, plays)
+
+    with metrics.timer("identify_player"):
+        for player_id, name, roster in game['player names']:
+            scrape_games.identify_player(player_id, name, roster)
+
+
+def run_benchmark(games, repeats=DEFAULT_REPEATS):
+    """Times the pipeline over every game in the corpus.
+
+    Args:
+        games: The games returned by load_corpus.
+        repeats: The number of times to run each game. The median of the
+            per-game times is reported, so more repeats give steadier results.
+
+    Returns:
+        A dict with the keys and values:
+        'games': The number of games in the corpus.
+        'stages': A dict from each stage in STAGES to its median seconds per
+            game.
+        'games per second': The number of games per second the whole pipeline
+            processes.
+        'peak memory': The peak number of bytes allocated while running the
+            pipeline once over the whole corpus."""
+    if len(games) == 0:
+        raise ValueError("The benchmark corpus contains no games.")
+
+    # warm up once so imports and caches don't count against the first game
+    run_game(games[0], instrument.Metrics())
+
+    metrics = instrument.Metrics()
+    for _ in range(repeats):
+        for game in games:
+            run_game(game, metrics)
+    stages = {stage: summary['p50'] for stage, summary in metrics.summary()['stages'].items()}
+
+    # measure memory separately since tracing allocations slows everything down
+    tracemalloc.start()
+    for game in games:
+        run_game(game, instrument.Metrics())
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'games': len(games),
+        'stages': stages,
+        'games per second': 1 / stages["end to end"],
+        'peak memory': peak_memory
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Finds the stages that got slower than the baseline by more than the tolerance.
+
+    Args:
+        results: The results returned by run_benchmark.
+        baseline: Results returned by an earlier run of run_benchmark.
+        tolerance: The fraction by which a stage may be slower than the
+            baseline before it is counted as a regression.
+
+    Returns:
+        A list of (stage, baseline seconds, current seconds) tuples, one for
+        each regressed stage. Peak memory is compared the same way and reported
+        as the stage 'peak memory', in bytes."""
+    regressions = []
+    for stage, seconds in results['stages'].items():
+        baseline_seconds = baseline['stages'].get(stage)
+        if (baseline_seconds is not None) and (seconds > baseline_seconds * (1 + tolerance)):
+            regressions.append((stage, baseline_seconds, seconds))
+    if results['peak memory'] > baseline['peak memory'] * (1 + tolerance):
+        regressions.append(("peak memory", baseline['peak memory'], results['peak memory']))
+    return regressions
+
+
+def print_results(results):
+    """Prints the results of a benchmark run as a table."""
+    print(f"{results['games']} games, {results['games per second']:.2f} games/sec, "
+          f"peak memory {results['peak memory'] / 2 ** 20:.1f} MiB")
+    for stage in STAGES:
+        if stage in results['stages']:
+            print(f"    {stage:<22}{1000 * results['stages'][stage]:>10.3f} ms/game")
+
+
+# Main method. Runs the benchmark and compares it to the saved baseline.
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the parse and tracking pipeline on "
+                                                 "stored pages. Needs no network or database.")
+    parser.add_argument('--corpus', default=PATH_CORPUS)
+    parser.add_argument('--rosters', default=PATH_ROSTER_VALUES)
+    parser.add_argument('--baseline', default=PATH_BENCHMARK_BASELINE)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="save the results as the new baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    if (args.corpus == PATH_CORPUS) and not os.path.exists(PATH_CORPUS):
+        synthetic_games.write_corpus(PATH_CORPUS, DEFAULT_CORPUS_GAMES)
+        print(f"Wrote a synthetic corpus of {DEFAULT_CORPUS_GAMES} games to {PATH_CORPUS}.")
+    start = time.perf_counter()
+    games = load_corpus(args.corpus, args.rosters)
+    print(f"Loaded corpus in {time.perf_counter() - start:.1f}s.")
+    results = run_benchmark(games, args.repeats)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f"Saved baseline to {args.baseline}.")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to make one.")
+        return 0
+    with open(args.baseline, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for stage, baseline_value, value in regressions:
+        print(f"REGRESSION in {stage}: {baseline_value:.6g} -> {value:.6g} "
+              f"({100 * (value / baseline_value - 1):+.0f}%)")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,237 @@
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+import instrument
+import scrape_log
+
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 2       # seconds, so one burst of errors only cuts the limit once
+SLOW_LATENCY = 5            # seconds; slower successes are treated as a sign of congestion
+LATENCY_SMOOTHING = 0.2
+WINDOW_SIZE = 50
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30
+TRANSPORT_ATTEMPTS = 8
+PARSE_RETRIES = 3
+BREAKER_ERROR_RATE = 0.5
+BREAKER_MIN_SAMPLES = 20
+BREAKER_PAUSE = 30
+MAX_BREAKER_PAUSE = 600
+
+LOGGER = scrape_log.get_logger("crawl_control")
+
+
+class RetryBudget:
+    """The attempts left for getting one usable page. Transport attempts are spent on every fetch
+    of the page, whatever the reason for it; parse retries are spent when a fetched page could not
+    be parsed and has to be fetched again. Since a parse retry also needs a fetch, a page never
+    costs more than the transport attempts it started with.
+    """
+
+    def __init__(self, transport_attempts=TRANSPORT_ATTEMPTS, parse_retries=PARSE_RETRIES):
+        self.transport_left = transport_attempts
+        self.parse_left = parse_retries
+        self.transport_attempts = 0
+        self.parse_retries = 0
+
+    def has_transport(self):
+        """Returns whether any transport attempts are left."""
+        return self.transport_left > 0
+
+    def spend_transport(self):
+        """Uses up one transport attempt. Returns False if there were none left."""
+        if self.transport_left <= 0:
+            return False
+        self.transport_left -= 1
+        self.transport_attempts += 1
+        return True
+
+    def spend_parse(self):
+        """Uses up one parse retry. Returns False if there were none left, or if there are no
+        transport attempts left to fetch the page again with."""
+        if (self.parse_left <= 0) or (self.transport_left <= 0):
+            return False
+        self.parse_left -= 1
+        self.parse_retries += 1
+        return True
+
+
+class CrawlController:
+    """Decides how many requests may be in flight to stats.ncaa.org at once and how long to wait
+    between retries. The concurrency limit grows by about one request per round trip while
+    requests succeed, and is halved when the site starts failing or slowing down (AIMD, as in TCP
+    congestion control). If most recent requests have failed, the circuit breaker opens and no
+    requests are let through until a pause has passed; one request is then let through as a
+    probe, which closes the breaker if it succeeds and reopens it for twice as long if not. The
+    limit also sets how many pages are fetched at once by map. Safe to share between threads.
+    """
+
+    def __init__(self, initial_concurrency=INITIAL_CONCURRENCY, min_concurrency=MIN_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, metrics=None, seed=None):
+        self.condition = threading.Condition()
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.outcomes = collections.deque(maxlen=WINDOW_SIZE)
+        self.latency = None
+        self.last_decrease = 0
+        self.state = 'closed'
+        self.open_until = 0
+        self.pause = BREAKER_PAUSE
+        self.metrics = metrics if metrics is not None else instrument.Metrics()
+        self.rng = random.Random(seed)
+
+    def new_budget(self):
+        """Returns a fresh RetryBudget for one page."""
+        return RetryBudget()
+
+    def acquire(self):
+        """Waits until a request may be sent, then counts it as in flight. Every call must be
+        followed by a call to release once the request is done."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.state == 'open':
+                    if now < self.open_until:
+                        self.condition.wait(self.open_until - now)
+                        continue
+                    self.state = 'half open'
+                    LOGGER.info("Circuit breaker half open; sending a probe.")
+                limit = 1 if self.state == 'half open' else int(self.limit)
+                if self.in_flight < limit:
+                    break
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, ok, latency=None):
+        """Records the outcome of a request sent after a call to acquire and adjusts the
+        concurrency limit.
+
+        Args:
+            ok: Whether the site handled the request well. Failures that are
+                not the site's fault, like a 404, should count as ok. None if
+                the request says nothing about the site, e.g. because its
+                proxy was dead, in which case it is not recorded.
+            latency: The number of seconds the request took, or None if it
+                never got a response."""
+        with self.condition:
+            self.in_flight -= 1
+            if ok is None:
+                self.condition.notify_all()
+                return
+            self.outcomes.append(ok)
+            if latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+            if ok and self.state == 'half open':
+                self.close_breaker()
+            elif (not ok) and self.state == 'half open':
+                self.open_breaker(min(2 * self.pause, MAX_BREAKER_PAUSE))
+            elif (not ok) and (len(self.outcomes) >= BREAKER_MIN_SAMPLES) \
+                    and (self.error_rate() >= BREAKER_ERROR_RATE) and (self.state == 'closed'):
+                self.open_breaker(BREAKER_PAUSE)
+
+            if ok and ((latency is None) or (latency < SLOW_LATENCY)):
+                self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+            else:
+                self.decrease()
+            self.condition.notify_all()
+
+    def decrease(self):
+        """Cuts the concurrency limit, unless it was already cut very recently. Must be called
+        with the condition held."""
+        now = time.monotonic()
+        if now - self.last_decrease < DECREASE_INTERVAL:
+            return
+        self.last_decrease = now
+        self.limit = max(self.limit * DECREASE_FACTOR, self.min_concurrency)
+        self.metrics.count('concurrency decreases')
+
+    def open_breaker(self, pause):
+        """Stops letting requests through for the given number of seconds. Must be called with
+        the condition held."""
+        self.state = 'open'
+        self.pause = pause
+        self.open_until = time.monotonic() + pause
+        self.metrics.count('breaker trips')
+        LOGGER.warning("Circuit breaker open for %s seconds. (Error rate: %.2f)", pause,
+                       self.error_rate())
+
+    def close_breaker(self):
+        """Lets requests through again after a successful probe, starting over at the minimum
+        concurrency. Must be called with the condition held."""
+        self.state = 'closed'
+        self.pause = BREAKER_PAUSE
+        self.outcomes.clear()
+        self.limit = float(self.min_concurrency)
+        LOGGER.info("Circuit breaker closed.")
+
+    def error_rate(self):
+        """Returns the fraction of recent requests that failed."""
+        if len(self.outcomes) == 0:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def backoff(self, attempt):
+        """Returns the number of seconds to wait before retrying after the given number of failed
+        attempts. The wait is chosen uniformly at random up to an exponentially growing cap
+        ("full jitter"), so retries of different pages don't arrive at the site together."""
+        cap = min(BASE_BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF)
+        with self.condition:
+            return self.rng.uniform(0, cap)
+
+    def map(self, function, items):
+        """Calls a function on each item in threads and yields the results in the order of the
+        items. As many calls run at once as the concurrency limit allows when each is started,
+        so the number of pages being fetched follows the limit as it grows and shrinks. The
+        function should only fetch pages, since the calls share nothing else safely.
+
+        Args:
+            function: The function to call, e.g. one that fetches the pages of
+                a game.
+            items: An iterable of the items to call it on.
+
+        Yields:
+            The result of each call. Exceptions raised by a call are raised
+            when its result is reached."""
+        items = iter(items)
+        end = object()
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            try:
+                while True:
+                    with self.condition:
+                        limit = max(int(self.limit), self.min_concurrency)
+                    while len(pending) < limit:
+                        item = next(items, end)
+                        if item is end:
+                            break
+                        pending.append(executor.submit(function, item))
+                    if len(pending) == 0:
+                        return
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def summary(self):
+        """Returns a dict of the controller's current 'concurrency limit', 'in flight', 'error
+        rate', 'latency' (smoothed, in seconds) and 'breaker' state."""
+        with self.condition:
+            return {
+                'concurrency limit': int(self.limit),
+                'in flight': self.in_flight,
+                'error rate': self.error_rate(),
+                'latency': self.latency,
+                'breaker': self.state
+            }
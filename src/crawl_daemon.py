@@ -0,0 +1,242 @@
+import copy
+import datetime
+import heapq
+import sys
+import time
+
+import database
+import dead_letters
+import scrape_games
+import scrape_log
+import scrape_util
+import win_probability
+
+EXPECTED_GAME_LENGTH = datetime.timedelta(hours=2, minutes=15)
+RECHECK_DELAYS = [datetime.timedelta(minutes=15), datetime.timedelta(minutes=30),
+                  datetime.timedelta(hours=1), datetime.timedelta(hours=2),
+                  datetime.timedelta(hours=4), datetime.timedelta(hours=8)]
+LISTING_INTERVAL = datetime.timedelta(hours=1)
+LISTING_DAYS_BEHIND = 1
+LISTING_DAYS_AHEAD = 2
+UNKNOWN_START_HOUR = 19
+
+LOGGER = scrape_log.get_logger("crawl_daemon")
+
+
+class CrawlSchedule:
+    """The games the daemon is waiting to fetch, ordered by when each is next due. A game is first
+    due shortly after it is expected to end. If it is not final when fetched, it is fetched again
+    after each of the RECHECK_DELAYS in turn, so late-finalized games are checked often at first
+    and less often as time goes on, then given up on.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.games = {}
+        self.finished = set()
+
+    def __len__(self):
+        return len(self.games)
+
+    def add(self, game, start_time):
+        """Schedules a game to be fetched after it is expected to end.
+
+        Args:
+            game: A game from a work list returned by
+                scrape_games.enumerate_games.
+            start_time: The expected start time of the game, as a
+                datetime.datetime.
+
+        Returns:
+            Whether the game was added. Games that are already scheduled or
+            finished are not added again."""
+        box_id = game['box ID']
+        if (box_id in self.games) or (box_id in self.finished):
+            return False
+        self.games[box_id] = dict(game, **{'start time': start_time, 'checks': 0})
+        heapq.heappush(self.heap, (start_time + EXPECTED_GAME_LENGTH, box_id))
+        return True
+
+    def next_due(self):
+        """Returns the time the next game is due, or None if no games are scheduled."""
+        if len(self.heap) == 0:
+            return None
+        return self.heap[0][0]
+
+    def pop_due(self, now):
+        """Removes and returns the games that are due at the given time, in the order they became
+        due."""
+        due = []
+        while (len(self.heap) > 0) and (self.heap[0][0] <= now):
+            due.append(self.games[heapq.heappop(self.heap)[1]])
+        return due
+
+    def finish(self, game):
+        """Marks a game as done, so it is never scheduled again."""
+        del self.games[game['box ID']]
+        self.finished.add(game['box ID'])
+
+    def recheck(self, game, now):
+        """Schedules a game that was not final to be fetched again later.
+
+        Returns:
+            False if the game has been checked as many times as there are
+            RECHECK_DELAYS and was given up on instead."""
+        if game['checks'] >= len(RECHECK_DELAYS):
+            self.finish(game)
+            return False
+        heapq.heappush(self.heap, (now + RECHECK_DELAYS[game['checks']], game['box ID']))
+        game['checks'] += 1
+        return True
+
+
+class HeldLetters:
+    """Stands in for the dead-letter store while a game is checked, holding the failures recorded
+    until it is known whether the game has finished. A game that is still being played often has
+    no play-by-play page yet, which is not a failure worth replaying.
+    """
+
+    def __init__(self):
+        self.letters = []
+
+    def add(self, *args, **kwargs):
+        """Holds the arguments of a call to dead_letters.DeadLetterStore.add."""
+        self.letters.append((args, kwargs))
+
+    def send(self, store):
+        """Records the held failures in a dead_letters.DeadLetterStore."""
+        for args, kwargs in self.letters:
+            store.add(*args, **kwargs)
+
+
+class CrawlDaemon:
+    """Keeps the database up to date by fetching each game once it should be over, instead of
+    re-scraping whole days on a fixed schedule. Every LISTING_INTERVAL, the scoreboards around
+    today are listed and any new games are scheduled from their start times. Between listings, the
+    daemon sleeps until the next game is due.
+    """
+
+    def __init__(self, scraper, conn, context=None):
+        self.scraper = scraper
+        self.conn = conn
+        # the scrape_games.RunContext games are uploaded with
+        self.context = context
+        self.cursor = conn.cursor()
+        self.schedule = CrawlSchedule()
+        self.next_listing = None
+
+    def step(self, now):
+        """Lists new games if a listing is due, then fetches every game that is due.
+
+        Args:
+            now: The current time, as a datetime.datetime.
+
+        Returns:
+            The time at which the daemon next has something to do."""
+        if (self.next_listing is None) or (now >= self.next_listing):
+            self.list_games(now)
+            self.next_listing = now + LISTING_INTERVAL
+
+        for game in self.schedule.pop_due(now):
+            status = {'final': False}
+            context = copy.copy(self.context) if self.context is not None \
+                else scrape_games.RunContext()
+            held = context.dead_letters = HeldLetters()
+            # rows stored by an earlier check, before the game was final, are compared and fixed
+            plays = scrape_games.scrape_game(self.scraper, self.cursor, game['season'],
+                                             game['box ID'], reupload=(game['checks'] > 0),
+                                             status=status, context=context)
+            with self.scraper.metrics.timer('commit'):
+                self.conn.commit()
+            if (plays is not None) and status['final']:
+                self.scraper.metrics.count('games finalized')
+                self.schedule.finish(game)
+            elif self.schedule.recheck(game, now):
+                LOGGER.info("Game not final; checking again later. (Check %s)", game['checks'],
+                            extra={'box_id': game['box ID']})
+                # the game is checked again, so what failed now may just not be up yet
+                continue
+            else:
+                self.scraper.metrics.count('games given up')
+                LOGGER.warning("Game never became final.", extra={'box_id': game['box ID']})
+            if (self.context is not None) and (self.context.dead_letters is not None):
+                held.send(self.context.dead_letters)
+
+        next_due = self.schedule.next_due()
+        if (next_due is None) or (next_due > self.next_listing):
+            return self.next_listing
+        return next_due
+
+    def list_games(self, now):
+        """Lists the games on the scoreboards around the given time and schedules the new ones."""
+        today = now.date()
+        work = scrape_games.enumerate_games(
+            self.scraper, today - datetime.timedelta(LISTING_DAYS_BEHIND),
+            today + datetime.timedelta(LISTING_DAYS_AHEAD))
+        added = 0
+        for game in work:
+            # only fetch the box scores of new games, to find their start times
+            if (game['box ID'] not in self.schedule.games) \
+                    and (game['box ID'] not in self.schedule.finished):
+                added += self.schedule.add(game, self.find_start_time(game))
+        LOGGER.info("Listed %s games, %s new. (%s pending)", len(work), added,
+                    len(self.schedule))
+
+    def find_start_time(self, game):
+        """Finds the start time of a game from its box score page. If the page can't be fetched
+        or doesn't list a time, as is common before a game starts, the game is assumed to start
+        at UNKNOWN_START_HOUR on its scoreboard date."""
+        default = datetime.datetime.combine(game['date'], datetime.time(UNKNOWN_START_HOUR))
+        page = self.scraper.open_page(
+            url=f"http://stats.ncaa.org/contests/{game['box ID']}/box_score")
+        if page is None:
+            return default
+        try:
+            return parse_game_time(scrape_games.find_game_time(page.soup), default)
+        except (AttributeError, IndexError, ValueError):
+            return default
+        finally:
+            page.release()
+
+    def run(self):
+        """Runs forever, sleeping whenever nothing is due."""
+        while True:
+            wake = self.step(datetime.datetime.now())
+            idle = (wake - datetime.datetime.now()).total_seconds()
+            if idle > 0:
+                LOGGER.debug("Idle for %.0f seconds. (%s pending)", idle, len(self.schedule))
+                time.sleep(idle)
+
+
+def parse_game_time(game_time, default):
+    """Converts a game time returned by scrape_games.find_game_time to a datetime.datetime. If it
+    has only a date, the game is assumed to start at the hour of the default."""
+    if ":" in game_time:
+        return datetime.datetime.strptime(game_time, '%Y/%m/%d %H:%M')
+    date = datetime.datetime.strptime(game_time, '%Y/%m/%d').date()
+    return datetime.datetime.combine(date, default.time())
+
+
+# Main method. Runs the daemon until interrupted.
+
+
+def main(argv):
+    scrape_log.configure()
+    store = dead_letters.DeadLetterStore()
+    # score the plays of each game as it is fetched, once a model has been fit
+    model = win_probability.load_model()
+    scorer = win_probability.GameScorer(model) if model is not None else None
+    scraper = scrape_util.Scraper(thread_count=scrape_games.DEFAULT_THREAD_COUNT)
+    context = scrape_games.RunContext(dead_letters=store, scorer=scorer)
+    daemon = CrawlDaemon(scraper, database.connect_to_db(), context)
+    scrape_games.ensure_schema(daemon.cursor, scorer=scorer)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    store.close()
+    scraper.metrics.write_report(scrape_games.PATH_RUN_REPORT)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
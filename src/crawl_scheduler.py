@@ -0,0 +1,165 @@
+import datetime
+import heapq
+import json
+import os
+import time
+
+import scrape_log
+
+NEW_GAMES = 0
+MISSING_PBP = 1
+BACKFILL = 2
+PRIORITY_NAMES = ["new games", "missing play-by-play", "backfill"]
+RECENT_DAYS = 3
+MISSING_PBP_DAYS = 30
+BATCH_SIZE = 10
+PATH_DEFERRED = "deferred_work.json"
+
+LOGGER = scrape_log.get_logger("crawl_scheduler")
+
+
+class CrawlScheduler:
+    """Orders the games of a crawl by priority and runs them in batches until the work or the
+    time budget runs out. Finished games from the last few days come first, then games already
+    in the database that are missing their play-by-play, then older games being backfilled; within
+    each class, newer games come first. Each batch is committed before the next starts, so
+    stopping at the budget never leaves work half done, and whatever was not reached is reported
+    as deferred and written out for the next run to pick up (see load_deferred).
+    """
+
+    def __init__(self, budget_seconds=None):
+        """Starts the clock on the budget.
+
+        Args:
+            budget_seconds: The number of seconds of wall-clock time the crawl
+                may take, or None for no limit."""
+        self.queue = []
+        self.queued = set()
+        self.count = 0
+        self.started = time.monotonic()
+        self.budget_seconds = budget_seconds
+        self.completed = [0 for _ in PRIORITY_NAMES]
+        self.batch_seconds = []
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, game, priority):
+        """Adds a game from a work list (see scrape_games.enumerate_games) in the given priority
+        class. Returns False, without adding it, if the game is already queued."""
+        # games missing their play-by-play are identified by PBP ID instead of box ID
+        key = (priority == MISSING_PBP, game['box ID'])
+        if key in self.queued:
+            return False
+        self.queued.add(key)
+        heapq.heappush(self.queue, (priority, -game['date'].toordinal(), self.count, game))
+        self.count += 1
+        return True
+
+    def add_range(self, work, end_date):
+        """Adds the games of a date range, as new games if they were played in the RECENT_DAYS
+        before the end of the range and as backfill otherwise."""
+        recent = end_date - datetime.timedelta(RECENT_DAYS)
+        for game in work:
+            self.add(game, NEW_GAMES if game['date'] >= recent else BACKFILL)
+
+    def time_left(self):
+        """Returns the number of seconds left in the budget, or None if there is no budget."""
+        if self.budget_seconds is None:
+            return None
+        return self.budget_seconds - (time.monotonic() - self.started)
+
+    def has_time_for_batch(self):
+        """Returns whether another batch is expected to finish within the budget, judging by how
+        long batches have taken so far."""
+        time_left = self.time_left()
+        if time_left is None:
+            return True
+        if len(self.batch_seconds) == 0:
+            return time_left > 0
+        return time_left > sum(self.batch_seconds) / len(self.batch_seconds)
+
+    def next_batch(self):
+        """Removes the next batch of games from the queue. All games in a batch are in the same
+        priority class.
+
+        Returns:
+            A tuple of the priority class of the batch and its games."""
+        priority = self.queue[0][0]
+        games = []
+        while (len(self.queue) > 0) and (self.queue[0][0] == priority) \
+                and (len(games) < BATCH_SIZE):
+            games.append(heapq.heappop(self.queue)[3])
+        return priority, games
+
+    def run(self, run_batch, metrics):
+        """Runs batches of games in priority order until the queue is empty or the budget is
+        spent.
+
+        Args:
+            run_batch: A function that scrapes, uploads and commits a batch,
+                given its priority class and list of games.
+            metrics: The instrument.Metrics of the run.
+
+        Returns:
+            The report returned by report."""
+        while len(self.queue) > 0:
+            if not self.has_time_for_batch():
+                LOGGER.warning("Time budget spent; deferring %s games.", len(self.queue))
+                break
+            priority, games = self.next_batch()
+            with metrics.timer('batch') as batch_timer:
+                run_batch(priority, games)
+            self.batch_seconds.append(batch_timer.elapsed)
+            self.completed[priority] += len(games)
+
+        report = self.report()
+        for name, box_ids in report['deferred'].items():
+            metrics.count(f"deferred {name}", len(box_ids))
+        return report
+
+    def report(self):
+        """Summarizes the crawl.
+
+        Returns:
+            A dict with the keys 'completed' (from the name of each priority
+            class to the number of games of it that were run) and 'deferred'
+            (from the name of each priority class to the list of IDs of its
+            games still in the queue)."""
+        deferred = {name: [] for name in PRIORITY_NAMES}
+        for priority, _, _, game in sorted(self.queue):
+            deferred[PRIORITY_NAMES[priority]].append(game['box ID'])
+        return {
+            'completed': dict(zip(PRIORITY_NAMES, self.completed)),
+            'deferred': deferred
+        }
+
+    def write_deferred(self, path=PATH_DEFERRED):
+        """Writes the games still in the queue to the given path as JSON, so they can be picked
+        up by a later run with load_deferred. Dates are written in ISO-8601 format. If the queue
+        is empty, the file is removed instead, so finished work is not picked up again."""
+        if len(self.queue) == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        deferred = [dict(game, date=game['date'].isoformat(), priority=PRIORITY_NAMES[priority])
+                    for priority, _, _, game in sorted(self.queue)]
+        with open(path, 'w') as deferred_file:
+            json.dump(deferred, deferred_file, indent=4)
+
+    def load_deferred(self, path=PATH_DEFERRED):
+        """Adds the games deferred by an earlier run, as written by write_deferred, in the
+        priority classes they were deferred in. Games already queued keep their place.
+
+        Returns:
+            The number of games added."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r') as deferred_file:
+            deferred = json.load(deferred_file)
+        count = 0
+        for game in deferred:
+            priority = PRIORITY_NAMES.index(game.pop('priority'))
+            game['date'] = datetime.date.fromisoformat(game['date'])
+            count += self.add(game, priority)
+        return count
@@ -0,0 +1,18 @@
+import pymysql
+
+PATH_DATABASE_INFO = "src/db_info.txt"
+
+
+def connect_to_db():
+    """Opens and returns a connection to the database as specified in a txt
+    file.
+
+    Returns:
+        A pymysql connection to the database specified in the text file
+        PATH_DATABASE_INFO."""
+    with open(PATH_DATABASE_INFO, 'r') as db_info_file:
+        host = db_info_file.readline()[:-1]
+        user = db_info_file.readline()[:-1]
+        password = db_info_file.readline()[:-1]
+        db = db_info_file.readline()
+    return pymysql.connect(host, user, password, db)
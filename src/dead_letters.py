@@ -0,0 +1,120 @@
+import datetime
+import hashlib
+import json
+import sqlite3
+import threading
+
+PATH_DEAD_LETTERS = "dead_letters.sqlite"
+CREATE_QUERY = ("CREATE TABLE IF NOT EXISTS dead_letters ("
+                "dead_letter_id INTEGER PRIMARY KEY, stage TEXT NOT NULL, "
+                "game_id INTEGER NOT NULL, by_pbp INTEGER NOT NULL, season INTEGER, "
+                "url TEXT, exception TEXT NOT NULL, raw_input TEXT, input_hash TEXT, "
+                "parser_version INTEGER NOT NULL, created TEXT NOT NULL, "
+                "resolved TEXT)")
+INSERT_QUERY = ("INSERT INTO dead_letters (stage, game_id, by_pbp, season, url, "
+                "exception, raw_input, input_hash, parser_version, created) "
+                "VALUES (%s)" % ", ".join(["?"] * 10))
+FETCH_PENDING_QUERY = ("SELECT dead_letter_id, stage, game_id, by_pbp, season, url, "
+                       "exception, raw_input, input_hash, parser_version, created "
+                       "FROM dead_letters WHERE resolved IS NULL ORDER BY dead_letter_id")
+RESOLVE_QUERY = "UPDATE dead_letters SET resolved = ? WHERE dead_letter_id = ?"
+FIELDS = ['dead letter ID', 'stage', 'game ID', 'by PBP', 'season', 'url', 'exception',
+          'raw input', 'input hash', 'parser version', 'created']
+
+
+class DeadLetterStore:
+    """A SQLite file of the failures of a crawl: pages that could not be fetched or parsed, play
+    rows that could not be parsed, and plays that could not be uploaded. Each failure is written
+    with the game it belongs to, the stage it happened in, the exception, the raw input (or, for
+    whole pages, a hash of it) and the parser version, so the run carries on and the failures can
+    be replayed with scrape_games.reprocess_dead_letters once the cause is fixed.
+    """
+
+    def __init__(self, path=PATH_DEAD_LETTERS):
+        # pages are fetched from several threads, so the connection is shared under a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(CREATE_QUERY)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, stage, game_id, failures, parser_version, season=None, by_pbp=False,
+            url=None):
+        """Records the failures of one stage of a game, in a single transaction.
+
+        Args:
+            stage: The name of the stage, e.g. 'box score' or 'parse play'.
+            game_id: The ID the game was scraped by: its box ID, or its PBP ID
+                if by_pbp is True.
+            failures: A list of (raw input, exception) tuples. Raw inputs that
+                are bytes are whole pages, and only their hash is kept; others
+                are kept as JSON. The exception can also be a message string.
+            parser_version: The scrape_games.PARSER_VERSION of the run.
+            season: The year of the season of the game, if known.
+            by_pbp: True if game_id is a PBP ID.
+            url: The URL of the page the failures came from, if any."""
+        created = datetime.datetime.now().isoformat(timespec='seconds')
+        rows = []
+        for raw_input, error in failures:
+            if isinstance(raw_input, bytes):
+                input_hash = hashlib.sha1(raw_input).hexdigest()
+                raw_input = None
+            elif raw_input is not None:
+                raw_input = json.dumps(raw_input, default=str)
+                input_hash = hashlib.sha1(raw_input.encode()).hexdigest()
+            else:
+                input_hash = None
+            rows.append((stage, game_id, by_pbp, season, url, format_error(error), raw_input,
+                         input_hash, parser_version, created))
+        if len(rows) == 0:
+            return
+        with self.lock:
+            self.conn.executemany(INSERT_QUERY, rows)
+            self.conn.commit()
+
+    def pending(self):
+        """Returns the failures that have not been resolved, oldest first, as a list of dicts
+        with the keys in FIELDS."""
+        with self.lock:
+            rows = self.conn.execute(FETCH_PENDING_QUERY).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def resolve(self, dead_letter_ids):
+        """Marks the failures with the given IDs as resolved, so they are not replayed again."""
+        resolved = datetime.datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.conn.executemany(RESOLVE_QUERY, [(resolved, dead_letter_id)
+                                                  for dead_letter_id in dead_letter_ids])
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def format_error(error):
+    """Returns an exception as a 'TypeName: message' string. Strings are returned unchanged."""
+    if isinstance(error, str):
+        return error
+    return f"{type(error).__name__}: {error}"
+
+
+def group_by_game(dead_letters):
+    """Groups failures by the game they belong to.
+
+    Args:
+        dead_letters: A list of failures as returned by DeadLetterStore.pending.
+
+    Returns:
+        A dict from (game ID, by PBP) tuples to lists of the failures of that
+        game, in the order the games first failed."""
+    games = {}
+    for dead_letter in dead_letters:
+        key = (dead_letter['game ID'], bool(dead_letter['by PBP']))
+        games.setdefault(key, []).append(dead_letter)
+    return games
+
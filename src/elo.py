@@ -0,0 +1,290 @@
+import datetime
+import json
+import math
+import sys
+import zlib
+
+import pymysql
+
+import database
+import scrape_log
+
+INITIAL_RATING = 1500
+K_FACTOR = 20
+HOME_ADVANTAGE = 80     # Elo points
+CARRYOVER = 2 / 3       # share of a school's distance from average kept into the next season
+STREAM_BATCH_SIZE = 1000
+COMMIT_INTERVAL = 30    # checkpoints written between commits
+FIRST_DATE = datetime.date(1900, 1, 1)
+SCORED_GAMES = ("FROM games g "
+                "JOIN team_seasons home_ts ON home_ts.team_season_id = g.h_team_season_id "
+                "JOIN team_seasons away_ts ON away_ts.team_season_id = g.a_team_season_id "
+                "JOIN (SELECT game_id, SUM(CASE WHEN is_away THEN 0 ELSE 2 * fgm + 3pm + ftm END) "
+                "AS h_points, SUM(CASE WHEN is_away THEN 2 * fgm + 3pm + ftm ELSE 0 END) "
+                "AS a_points FROM boxes GROUP BY game_id) s ON s.game_id = g.game_id "
+                "WHERE g.start_time >= %s AND NOT g.is_exhibition")
+STREAM_GAMES_QUERY = ("SELECT g.game_id, g.start_time, home_ts.season_year, g.h_team_season_id,"
+                      "g.a_team_season_id, home_ts.school_id, away_ts.school_id, s.h_points,"
+                      f"s.a_points {SCORED_GAMES} ORDER BY g.start_time, g.game_id")
+FETCH_DAY_COUNTS_QUERY = (f"SELECT DATE(g.start_time), COUNT(*) {SCORED_GAMES} "
+                          f"GROUP BY DATE(g.start_time)")
+CREATE_CHECKPOINTS_QUERY = ("CREATE TABLE IF NOT EXISTS elo_checkpoints ("
+                            "checkpoint_date DATE NOT NULL PRIMARY KEY, games INT,"
+                            "state MEDIUMBLOB);")
+UPLOAD_CHECKPOINT_QUERY = ("INSERT INTO elo_checkpoints (checkpoint_date, games, state) "
+                           "VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE games = VALUES(games),"
+                           "state = VALUES(state);")
+FETCH_CHECKPOINT_QUERY = ("SELECT checkpoint_date, state FROM elo_checkpoints "
+                          "WHERE checkpoint_date <= %s ORDER BY checkpoint_date DESC LIMIT 1")
+FETCH_CHECKPOINT_COUNTS_QUERY = "SELECT checkpoint_date, games FROM elo_checkpoints"
+DELETE_CHECKPOINTS_QUERY = "DELETE FROM elo_checkpoints WHERE checkpoint_date >= %s"
+
+LOGGER = scrape_log.get_logger("elo")
+
+
+class EloEngine:
+    """Elo ratings of schools with margin of victory and home court, updated one game at a time
+    in order of start time. Ratings carry over between seasons, regressed toward average. The
+    state is a small dict of numbers, so a pass over every game keeps constant memory and can be
+    checkpointed and resumed at any day.
+    """
+
+    def __init__(self, state=None, k=K_FACTOR, home_advantage=HOME_ADVANTAGE,
+                 carryover=CARRYOVER):
+        """
+        Args:
+            state: The state of an earlier pass to resume from, as returned by
+                snapshot, or None to start with every school average.
+            k: The K factor: the most a game can move a rating, before the
+                margin of victory multiplier.
+            home_advantage: The Elo points added to the home team's rating.
+            carryover: The share of each school's distance from average kept
+                into the next season."""
+        state = state or {'ratings': {}, 'season': None, 'team seasons': {}}
+        self.ratings = dict(state['ratings'])
+        self.season = state['season']
+        self.team_seasons = dict(state['team seasons'])
+        self.k = k
+        self.home_advantage = home_advantage
+        self.carryover = carryover
+
+    def rating(self, school_id):
+        return self.ratings.get(school_id, INITIAL_RATING)
+
+    def predict(self, h_school_id, a_school_id):
+        """Returns the probability that the home team wins."""
+        difference = self.rating(h_school_id) + self.home_advantage - self.rating(a_school_id)
+        return 1 / (1 + 10 ** (-difference / 400))
+
+    def update(self, game):
+        """Updates the ratings of both teams of a game.
+
+        Args:
+            game: The game, as a dict with the keys 'season', 'home team
+                season ID', 'away team season ID', 'home school ID', 'away
+                school ID', 'home points' and 'away points'.
+
+        Returns:
+            The probability the home team had of winning before the game."""
+        if game['season'] != self.season:
+            if self.season is not None:
+                self.ratings = {school_id: INITIAL_RATING
+                                + self.carryover * (rating - INITIAL_RATING)
+                                for school_id, rating in self.ratings.items()}
+            self.season = game['season']
+            self.team_seasons = {}
+        self.team_seasons[game['home team season ID']] = game['home school ID']
+        self.team_seasons[game['away team season ID']] = game['away school ID']
+
+        expected = self.predict(game['home school ID'], game['away school ID'])
+        margin = game['home points'] - game['away points']
+        result = 1 if margin > 0 else 0 if margin < 0 else 0.5
+        # the margin of victory multiplier, damped when the favorite wins so ratings don't inflate
+        winner_difference = (self.rating(game['home school ID']) + self.home_advantage
+                             - self.rating(game['away school ID'])) * (1 if margin > 0 else -1)
+        multiplier = math.log(abs(margin) + 1) * 2.2 / (winner_difference * 0.001 + 2.2)
+        change = self.k * multiplier * (result - expected)
+        self.ratings[game['home school ID']] = self.rating(game['home school ID']) + change
+        self.ratings[game['away school ID']] = self.rating(game['away school ID']) - change
+        return expected
+
+    def snapshot(self):
+        """Returns a copy of the state of the engine, to store or resume from."""
+        return {'ratings': dict(self.ratings), 'season': self.season,
+                'team seasons': dict(self.team_seasons)}
+
+    def team_season_ratings(self):
+        """Returns a dict from the team season ID of each team of the current season that has
+        played to its rating."""
+        return {team_season_id: self.rating(school_id)
+                for team_season_id, school_id in self.team_seasons.items()}
+
+
+def run(engine, games, checkpoint):
+    """Passes games through an engine in order, checkpointing its state at the end of each day
+    with games.
+
+    Args:
+        engine: The EloEngine.
+        games: An iterable of games in order of start time, each a dict as
+            taken by EloEngine.update with a 'date' key as well.
+        checkpoint: A function called with the date, the number of games of
+            that date and the state of the engine after the last of them.
+
+    Returns:
+        The number of games passed."""
+    day = None
+    day_count = 0
+    count = 0
+    for game in games:
+        if (day is not None) and (game['date'] != day):
+            checkpoint(day, day_count, engine.snapshot())
+            day_count = 0
+        day = game['date']
+        engine.update(game)
+        day_count += 1
+        count += 1
+    if day is not None:
+        checkpoint(day, day_count, engine.snapshot())
+    return count
+
+
+def stream_games(conn, start_date):
+    """Reads the scored games from a date onward in order of start time through a server-side
+    cursor, so memory does not grow with the number of games.
+
+    Args:
+        conn: A pymysql connection used for nothing else until the games are
+            all read.
+        start_date: The first date of games, as a datetime.date.
+
+    Yields:
+        The games, as dicts as taken by run."""
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(STREAM_GAMES_QUERY, (start_date,))
+    try:
+        rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+        while len(rows) > 0:
+            for game_id, start_time, season, h_id, a_id, h_school, a_school, h_points, a_points \
+                    in rows:
+                yield {'game ID': game_id, 'date': start_time.date(), 'season': season,
+                       'home team season ID': h_id, 'away team season ID': a_id,
+                       'home school ID': h_school, 'away school ID': a_school,
+                       'home points': int(h_points), 'away points': int(a_points)}
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+    finally:
+        cursor.close()
+
+
+def encode_state(state):
+    """Compresses the state of an engine for the checkpoints table. JSON only has string keys,
+    so ratings and team seasons are stored as lists of pairs."""
+    return zlib.compress(json.dumps({
+        'ratings': list(state['ratings'].items()),
+        'season': state['season'],
+        'team seasons': list(state['team seasons'].items())
+    }).encode())
+
+
+def decode_state(record):
+    """Reverses encode_state."""
+    state = json.loads(zlib.decompress(record).decode())
+    return {'ratings': dict(state['ratings']), 'season': state['season'],
+            'team seasons': dict(state['team seasons'])}
+
+
+def load_checkpoint(cursor, date):
+    """Reads the state of the engine at the end of a date.
+
+    Returns:
+        A tuple of the date of the latest checkpoint on or before the date and
+        its state, or (None, None) if there is none."""
+    cursor.execute(FETCH_CHECKPOINT_QUERY, (date,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    return row[0], decode_state(row[1])
+
+
+def load_ratings(cursor, date):
+    """Returns a dict from the team season ID of each team that has played in the season so far
+    to its rating at the end of a date, read from a single checkpoint."""
+    state = load_checkpoint(cursor, date)[1]
+    return {} if state is None else EloEngine(state).team_season_ratings()
+
+
+def find_replay_date(cursor):
+    """Finds the earliest date whose games differ from the games checkpointed for it, because
+    games were added late, removed or not rated yet.
+
+    Returns:
+        The date, or None if every checkpoint is up to date."""
+    cursor.execute(FETCH_DAY_COUNTS_QUERY, (FIRST_DATE,))
+    day_counts = dict(cursor.fetchall())
+    cursor.execute(FETCH_CHECKPOINT_COUNTS_QUERY)
+    checkpoint_counts = dict(cursor.fetchall())
+    changed = [date for date in day_counts.keys() | checkpoint_counts.keys()
+               if day_counts.get(date) != checkpoint_counts.get(date)]
+    return min(changed) if len(changed) > 0 else None
+
+
+def replay(read_conn, write_conn, from_date):
+    """Replays the games from a date onward, starting from the checkpoint of the day before, and
+    replaces the checkpoints from the date onward.
+
+    Args:
+        read_conn: The pymysql connection to stream the games through.
+        write_conn: Another pymysql connection, to write checkpoints through
+            while the games are streamed.
+        from_date: The first date to replay, as a datetime.date.
+
+    Returns:
+        The number of games replayed."""
+    cursor = write_conn.cursor()
+    cursor.execute(CREATE_CHECKPOINTS_QUERY)
+    state = load_checkpoint(cursor, from_date - datetime.timedelta(1))[1]
+    cursor.execute(DELETE_CHECKPOINTS_QUERY, (from_date,))
+    written = [0]
+
+    def checkpoint(date, day_count, day_state):
+        cursor.execute(UPLOAD_CHECKPOINT_QUERY, (date, day_count, encode_state(day_state)))
+        written[0] += 1
+        if written[0] % COMMIT_INTERVAL == 0:
+            write_conn.commit()
+
+    count = run(EloEngine(state), stream_games(read_conn, from_date), checkpoint)
+    write_conn.commit()
+    LOGGER.info("Replayed %s games over %s days from %s.", count, written[0], from_date)
+    return count
+
+
+def update(read_conn, write_conn):
+    """Brings the checkpoints up to date, replaying from the earliest date with new or changed
+    games.
+
+    Returns:
+        The number of games replayed."""
+    cursor = write_conn.cursor()
+    cursor.execute(CREATE_CHECKPOINTS_QUERY)
+    from_date = find_replay_date(cursor)
+    if from_date is None:
+        LOGGER.info("Elo checkpoints are up to date.")
+        return 0
+    return replay(read_conn, write_conn, from_date)
+
+
+# Main method. Brings the checkpoints up to date, or replays every game from a date.
+
+
+def main(argv):
+    scrape_log.configure()
+    read_conn = database.connect_to_db()
+    write_conn = database.connect_to_db()
+    if len(argv) == 3:
+        replay(read_conn, write_conn, datetime.date(int(argv[0]), int(argv[1]), int(argv[2])))
+    else:
+        update(read_conn, write_conn)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+import json
+import math
+import threading
+import time
+
+
+class MetricsHook:
+    """Receives metrics as they are recorded, so they can be forwarded to an outside monitoring
+    system. Subclass this and override whichever methods you need, then pass an instance to
+    Metrics.add_hook. Hooks are called on the thread that recorded the metric, so they should be
+    quick and must not raise.
+    """
+
+    def on_timing(self, stage, seconds):
+        """Called each time a stage finishes, with the number of seconds it took."""
+        pass
+
+    def on_count(self, name, amount):
+        """Called each time a counter is incremented, with the amount it was incremented by."""
+        pass
+
+    def on_report(self, summary):
+        """Called with the summary of the run when a report is made."""
+        pass
+
+
+class Timer:
+    """Context manager that records how long its block took as one sample of a stage."""
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.record(self.stage, self.elapsed)
+
+
+class Metrics:
+    """Collects timings and counters for one scraping run. Timings are kept per stage (e.g.
+    'open_page', 'track_partic', 'upload_plays'), so the summary can show where the time went.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+        self.hooks = []
+        self.started = time.time()
+
+    def add_hook(self, hook):
+        """Registers a MetricsHook to be told about every metric recorded from now on."""
+        self.hooks.append(hook)
+
+    def timer(self, stage):
+        """Returns a context manager that times its block as one sample of the given stage."""
+        return Timer(self, stage)
+
+    def record(self, stage, seconds):
+        """Records one sample of how long the given stage took, in seconds."""
+        with self.lock:
+            self.timings.setdefault(stage, []).append(seconds)
+        for hook in self.hooks:
+            hook.on_timing(stage, seconds)
+
+    def count(self, name, amount=1):
+        """Increments the counter with the given name."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for hook in self.hooks:
+            hook.on_count(name, amount)
+
+    def summary(self):
+        """Summarizes the run so far.
+
+        Returns:
+            A dict with the keys and values:
+            'started': The time the run started, in ISO-8601 format.
+            'elapsed seconds': The number of seconds since the run started.
+            'stages': A dict from each stage to a dict of its 'count', 'total',
+                'mean', 'p50', 'p95', 'p99' and 'max' times in seconds.
+            'counters': A dict from each counter to its value.
+            'bytes fetched': The number of bytes of pages fetched.
+            'games': The number of games scraped.
+            'games per hour': The number of games scraped per hour."""
+        with self.lock:
+            timings = {stage: sorted(samples) for stage, samples in self.timings.items()}
+            counters = dict(self.counters)
+
+        elapsed = time.time() - self.started
+        stages = {}
+        for stage, samples in timings.items():
+            stages[stage] = {
+                'count': len(samples),
+                'total': sum(samples),
+                'mean': sum(samples) / len(samples),
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+                'max': samples[-1]
+            }
+
+        games = counters.get('games', 0)
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'elapsed seconds': elapsed,
+            'stages': stages,
+            'counters': counters,
+            'bytes fetched': counters.get('bytes fetched', 0),
+            'games': games,
+            'games per hour': 3600 * games / elapsed if elapsed > 0 else 0
+        }
+
+    def write_report(self, path):
+        """Writes the summary of the run to the given path as JSON and passes it to every hook.
+
+        Returns:
+            The summary that was written."""
+        summary = self.summary()
+        with open(path, 'w') as report_file:
+            json.dump(summary, report_file, indent=4)
+        for hook in self.hooks:
+            hook.on_report(summary)
+        return summary
+
+
+def percentile(sorted_samples, pct):
+    """Finds the given percentile of a sorted list of samples using the nearest-rank method.
+    Returns None if there are no samples."""
+    if len(sorted_samples) == 0:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_samples)), 1)
+    return sorted_samples[rank - 1]
@@ -0,0 +1,170 @@
+import numpy as np
+
+import stints
+
+
+class LineupMatrix:
+    """Which players of each team were on the court for each play of a game, as a boolean matrix
+    with a row per play and a column per player of the team's roster, built once from the 'home
+    partic' and 'away partic' lists of the plays. Per-player totals over the game, such as seconds
+    played, plus/minus and the team's stats while a player was on the court, are then a single
+    matrix-vector product each instead of a loop over plays and players.
+
+    Attributes:
+        home_roster, away_roster: The players of each team, as dicts of
+            'player ID' and 'name', in the order of the matrix columns: the
+            players of the box score first, in its order, then any other
+            players on the court in the plays.
+        home, away: The (plays x roster) boolean matrices of each team.
+        in_box: A tuple of a boolean array per team of which players of the
+            roster are in the box score.
+        box_seconds: A tuple of an array per team of the seconds each player
+            of the roster played according to the box score (0 if unknown).
+        seconds: The number of seconds of game time credited to each play:
+            the time since the play before it in the period, plus the rest of
+            the period if it is the period's last play.
+        home_points, away_points: The points each team scored on each play.
+        home_stats, away_stats: The (plays x stints.STAT_FIELDS) counts of
+            each team's stats on each play.
+    """
+
+    def __init__(self, plays, boxes=None):
+        """
+        Args:
+            plays: The tracked plays of the game, as a list of dicts.
+            boxes: The cleaned boxes of the game, as a list of dicts, or None
+                to build the rosters from the plays alone."""
+        boxes = [box for box in boxes or [] if box['name'] != "Team"]
+        self.home_roster, self.away_roster = [], []
+        indices = ({}, {})
+        box_seconds = ([], [])
+        for box in boxes:
+            team = int(bool(box['is away']))
+            player = {'player ID': box['player ID'], 'name': box['name']}
+            if player_key(player) not in indices[team]:
+                indices[team][player_key(player)] = len(indices[team])
+                self.rosters[team].append(player)
+                box_seconds[team].append(box['time played'] or 0)
+        self.home = self.build_team(plays, 'home partic', self.home_roster, indices[0])
+        self.away = self.build_team(plays, 'away partic', self.away_roster, indices[1])
+        self.in_box = tuple(np.arange(len(roster)) < len(seconds)
+                            for roster, seconds in zip(self.rosters, box_seconds))
+        self.box_seconds = tuple(np.array(seconds + [0] * (len(roster) - len(seconds)),
+                                          dtype=float)
+                                 for roster, seconds in zip(self.rosters, box_seconds))
+        self.indices = indices
+
+        periods = np.array([play['period'] for play in plays], dtype=np.int64)
+        times = np.array([float(play['time']) for play in plays])
+        self.seconds = elapsed_seconds(periods, times)
+        self.home_points = score_changes([play.get('home score') for play in plays])
+        self.away_points = score_changes([play.get('away score') for play in plays])
+        self.home_stats = np.zeros((len(plays), len(stints.STAT_FIELDS)))
+        self.away_stats = np.zeros((len(plays), len(stints.STAT_FIELDS)))
+        for i, play in enumerate(plays):
+            counts = dict.fromkeys(stints.STAT_FIELDS, 0)
+            stints.count_play(counts, play)
+            stats = self.away_stats if play['is away'] else self.home_stats
+            stats[i] = [counts[field] for field in stints.STAT_FIELDS]
+
+    @property
+    def rosters(self):
+        """The rosters of both teams, home first."""
+        return self.home_roster, self.away_roster
+
+    @staticmethod
+    def build_team(plays, partic_key, roster, index):
+        """Builds the matrix of one team, adding players on the court who are not in the roster
+        yet to it. Plays at the same time share their list of players, so each list is only
+        looked up once."""
+        rows = []
+        columns = []
+        list_columns = {}
+        for i, play in enumerate(plays):
+            partic = play.get(partic_key, [])
+            if id(partic) not in list_columns:
+                found = []
+                for player in partic:
+                    if player is None:
+                        continue
+                    if player_key(player) not in index:
+                        index[player_key(player)] = len(roster)
+                        roster.append({'player ID': player['player ID'],
+                                       'name': player['name']})
+                    found.append(index[player_key(player)])
+                list_columns[id(partic)] = found
+            rows += [i] * len(list_columns[id(partic)])
+            columns += list_columns[id(partic)]
+        matrix = np.zeros((len(plays), len(roster)), dtype=bool)
+        matrix[rows, columns] = True
+        return matrix
+
+    def seconds_played(self):
+        """Returns a tuple of an array per team of the seconds each player was on the court."""
+        return self.home.T @ self.seconds, self.away.T @ self.seconds
+
+    def plus_minus(self):
+        """Returns a tuple of an array per team of each player's plus/minus: the team's points
+        minus the opponent's while the player was on the court."""
+        margins = self.home_points - self.away_points
+        return self.home.T @ margins, -(self.away.T @ margins)
+
+    def on_court_stats(self):
+        """Returns a tuple of a dict per team with the keys 'team' and 'opponent', each a
+        (roster x stints.STAT_FIELDS) array of the stats of that side while each player of the
+        team was on the court."""
+        return ({'team': self.home.T @ self.home_stats, 'opponent': self.home.T @ self.away_stats},
+                {'team': self.away.T @ self.away_stats, 'opponent': self.away.T @ self.home_stats})
+
+    def discrepancies(self):
+        """Returns a tuple of an array per team of the seconds each player played according to
+        the box score minus the seconds they were on the court in the plays. Players missing
+        from the box score are counted as playing 0 seconds in it."""
+        h_seconds, a_seconds = self.seconds_played()
+        return self.box_seconds[0] - h_seconds, self.box_seconds[1] - a_seconds
+
+    def column(self, is_away, player):
+        """Returns the column of a player in the matrix of their team, or None if the player is
+        in neither the box score nor the plays."""
+        return self.indices[int(bool(is_away))].get(player_key(player))
+
+
+def player_key(player):
+    return player['player ID'], player['name']
+
+
+def elapsed_seconds(periods, times):
+    """Finds the seconds of game time credited to each play: the time since the play before it
+    in the same period (or since the start of the period), plus the time left in the period if it
+    is the period's last play, so the seconds of each period add up to its length.
+
+    Args:
+        periods: An array of the period of each play.
+        times: An array of the time remaining in the period at each play, in
+            seconds.
+
+    Returns:
+        An array of the seconds credited to each play."""
+    count = len(periods)
+    if count == 0:
+        return np.zeros(0)
+    new_period = np.ones(count, dtype=bool)
+    new_period[1:] = periods[1:] != periods[:-1]
+    last_in_period = np.append(new_period[1:], True)
+    lengths = np.where(periods < 2, stints.HALF_LENGTH, stints.OVERTIME_LENGTH)
+    previous = np.empty(count)
+    previous[0] = lengths[0]
+    previous[1:] = np.where(new_period[1:], lengths[1:], times[:-1])
+    return previous - times + np.where(last_in_period, times, 0)
+
+
+def score_changes(scores):
+    """Returns an array of the points a team scored on each play, given its score after each
+    play, which is None on plays that don't list it."""
+    filled = np.zeros(len(scores))
+    score = 0
+    for i, value in enumerate(scores):
+        if value is not None:
+            score = value
+        filled[i] = score
+    return np.diff(filled, prepend=0)
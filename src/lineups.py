@@ -0,0 +1,117 @@
+import scrape_log
+
+LINEUP_SIZE = 5
+PLAYER_SLOTS = [f"p{i}_id" for i in range(1, LINEUP_SIZE + 1)]
+CREATE_LINEUPS_QUERY = ("CREATE TABLE IF NOT EXISTS lineups ("
+                        "lineup_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY, "
+                        "team_season_id INT NOT NULL, lineup_key VARCHAR(64) NOT NULL, "
+                        "p1_id INT NULL, p2_id INT NULL, p3_id INT NULL, p4_id INT NULL, "
+                        "p5_id INT NULL, UNIQUE KEY (team_season_id, lineup_key), "
+                        "KEY (p1_id), KEY (p2_id), KEY (p3_id), KEY (p4_id), KEY (p5_id));")
+CREATE_LINEUP_PLAYS_QUERY = ("CREATE TABLE IF NOT EXISTS lineup_plays ("
+                             "game_id INT NOT NULL, play_in_game INT NOT NULL, period INT,"
+                             "time_remaining DECIMAL(6, 2), shot_clock DECIMAL(6, 2),"
+                             "h_score INT, a_score INT, agent_is_away BOOLEAN,"
+                             "action VARCHAR(32), flag1 VARCHAR(64), flag2 VARCHAR(32),"
+                             "flag3 BOOLEAN, flag4 BOOLEAN, flag5 BOOLEAN, flag6 BOOLEAN,"
+                             "possession INT, offense_is_away BOOLEAN,"
+                             "agent_id INT, agent_name VARCHAR(64), h_lineup_id INT,"
+                             "a_lineup_id INT, PRIMARY KEY (game_id, play_in_game),"
+                             "KEY (h_lineup_id), KEY (a_lineup_id));")
+INSERT_LINEUP_QUERY = ("INSERT IGNORE INTO lineups (team_season_id, lineup_key, p1_id, p2_id, "
+                       "p3_id, p4_id, p5_id) VALUES (%s, %s, %s, %s, %s, %s, %s)")
+FETCH_LINEUPS_QUERY = "SELECT lineup_id, lineup_key FROM lineups WHERE team_season_id = %s"
+
+LOGGER = scrape_log.get_logger("lineups")
+
+
+class LineupCache:
+    """Assigns each distinct five-player lineup of a team season a stable ID in the lineups table,
+    so plays can refer to the lineups on the court by ID instead of copying ten player IDs and
+    names. IDs are kept in memory once seen, so a run only queries the database for lineups it
+    has not seen before, and all new lineups of a game are inserted together.
+    """
+
+    def __init__(self):
+        self.lineup_ids = {}
+
+    def __len__(self):
+        return len(self.lineup_ids)
+
+    def assign(self, cursor, team_season_id, lineups):
+        """Finds the IDs of the given lineups of a team season, adding the lineups that are not
+        in the lineups table yet.
+
+        Args:
+            cursor: The pymysql cursor of the database connection.
+            team_season_id: The team season ID of the team, or None if it is
+                unknown.
+            lineups: A list of lineups, each a list of player dicts.
+
+        Returns:
+            The list of the lineup IDs of the lineups, in the same order. If
+            the team season ID is None, every lineup ID is None."""
+        if team_season_id is None:
+            return [None] * len(lineups)
+        player_ids = [make_player_ids(lineup) for lineup in lineups]
+        keys = [make_lineup_key(ids) for ids in player_ids]
+        new_lineups = {}
+        for key, ids in zip(keys, player_ids):
+            if (team_season_id, key) not in self.lineup_ids:
+                new_lineups[key] = ids
+
+        if len(new_lineups) > 0:
+            cursor.executemany(INSERT_LINEUP_QUERY, [(team_season_id, key) + tuple(ids)
+                                                     for key, ids in new_lineups.items()])
+            cursor.execute(FETCH_LINEUPS_QUERY, (team_season_id,))
+            for lineup_id, key in cursor.fetchall():
+                self.lineup_ids[(team_season_id, key)] = lineup_id
+            LOGGER.debug("Added %s lineups of team season %s.", len(new_lineups),
+                         team_season_id)
+        return [self.lineup_ids[(team_season_id, key)] for key in keys]
+
+
+def make_player_ids(lineup):
+    """Returns the player IDs of a lineup in a canonical order: ascending, with unidentified
+    players last. Lineups with more than LINEUP_SIZE players are cut, and lineups with fewer are
+    padded with unidentified players."""
+    player_ids = [player['player ID'] for player in lineup if player is not None]
+    player_ids.sort(key=lambda player_id: (player_id is None, player_id or 0))
+    return (player_ids + [None] * LINEUP_SIZE)[:LINEUP_SIZE]
+
+
+def make_lineup_key(player_ids):
+    """Returns the string that identifies a lineup within its team season, e.g. '12,15,40,41,'
+    for a lineup with one unidentified player."""
+    return ",".join("" if player_id is None else str(player_id) for player_id in player_ids)
+
+
+def make_wide_view_query():
+    """Builds the query that creates the plays_wide view, which shows lineup_plays in the shape
+    of the plays table: ten player ID and name column pairs per play, with names looked up in
+    player_seasons."""
+    columns = ["p.game_id", "p.play_in_game", "p.period", "p.time_remaining", "p.shot_clock",
+               "p.h_score", "p.a_score", "p.agent_is_away", "p.action", "p.flag1", "p.flag2",
+               "p.flag3", "p.flag4", "p.flag5", "p.flag6", "p.possession", "p.offense_is_away",
+               "p.agent_id", "p.agent_name"]
+    joins = []
+    for team in ["h", "a"]:
+        joins.append(f"LEFT JOIN lineups {team}l ON {team}l.lineup_id = p.{team}_lineup_id")
+        for i, slot in enumerate(PLAYER_SLOTS, 1):
+            alias = f"{team}p{i}"
+            columns += [f"{team}l.{slot} AS {team}_p{i}_id",
+                        f"{alias}.player_name AS {team}_p{i}_name"]
+            joins.append(f"LEFT JOIN player_seasons {alias} ON {alias}.player_id = {team}l.{slot} "
+                         f"AND {alias}.team_season_id = {team}l.team_season_id")
+    return (f"CREATE OR REPLACE VIEW plays_wide AS SELECT {', '.join(columns)} "
+            f"FROM lineup_plays p {' '.join(joins)};")
+
+
+def create_tables(cursor):
+    """Creates the lineups and lineup_plays tables and the plays_wide view, if they don't exist.
+
+    Args:
+        cursor: The pymysql cursor of the database connection."""
+    cursor.execute(CREATE_LINEUPS_QUERY)
+    cursor.execute(CREATE_LINEUP_PLAYS_QUERY)
+    cursor.execute(make_wide_view_query())
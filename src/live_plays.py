@@ -0,0 +1,188 @@
+import hashlib
+import re
+import sys
+import time
+
+import bs4
+
+import database
+import possessions
+import scrape_games
+import scrape_log
+import scrape_util
+
+POLL_INTERVAL = 30
+# backstops for a game whose end never shows on its page: seconds to follow a game at most, and
+# seconds to keep polling a page that has no new rows
+MAX_FOLLOW_TIME = 5 * 60 * 60
+IDLE_TIMEOUT = 60 * 60
+PLAY_TABLE = re.compile(rb"<table[^>]*class=[\"']mytable[\"']")
+
+LOGGER = scrape_log.get_logger("live_plays")
+
+
+class LiveGame:
+    """The saved state of a game whose play-by-play page is being polled while the game is in
+    progress. Each poll only parses the rows added since the last poll, and extends the shot clock
+    and participation tracking from where the last poll left off, so a poll costs time in
+    proportion to the new plays rather than to the length of the game.
+    """
+
+    def __init__(self, pbp_id, h_roster, a_roster):
+        self.pbp_id = pbp_id
+        self.h_roster = h_roster
+        self.a_roster = a_roster
+        self.reset()
+
+    def reset(self):
+        """Forgets everything parsed so far, so the next poll processes the whole page."""
+        self.plays = []
+        self.final = False
+        self.period = 0
+        self.period_rows = 0
+        self.last_row = None
+        self.earlier_periods_hash = None
+        self.period_indices = {}
+        self.shot_clock_state = None
+        self.partic_state = None
+        self.possession_state = None
+
+    def poll(self, content):
+        """Processes the rows added to the play-by-play page since the last poll.
+
+        Args:
+            content: The raw content of the play-by-play page.
+
+        Returns:
+            The plays to upsert, as a list of (index of the play in the game,
+            play) tuples: every new play, plus every earlier play whose
+            players on the court or team with the ball changed because of the
+            new plays."""
+        # only parse the page from the table of the period the last poll ended in
+        table_starts = [match.start() for match in PLAY_TABLE.finditer(content)]
+        if len(table_starts) < self.period + 2:
+            LOGGER.info("Page lost periods; reprocessing it.", extra={'pbp_id': self.pbp_id})
+            self.reset()
+            if len(table_starts) < 2:
+                return []
+        # the first period's table is parsed along with the summary table before it, which
+        # find_raw_plays expects on a whole page
+        start = table_starts[self.period + 1] if self.period > 0 else 0
+        tail = bs4.BeautifulSoup(content[start:], 'html.parser')
+        raw_plays = scrape_games.find_raw_plays(tail, first_period=self.period)
+        tail.decompose()
+
+        # if the rows seen before have changed, the page was corrected, so start over
+        if ((self.period > 0) and (self.hash_earlier_periods(content, table_starts)
+                                   != self.earlier_periods_hash)) \
+                or ((self.period_rows > 0) and ((len(raw_plays) < self.period_rows)
+                    or (raw_plays[self.period_rows - 1] != self.last_row))):
+            LOGGER.info("Earlier plays changed; reprocessing page.", extra={'pbp_id': self.pbp_id})
+            self.reset()
+            return self.poll(content)
+
+        new_rows = raw_plays[self.period_rows:]
+        if len(new_rows) == 0:
+            return []
+        new_plays = scrape_games.parse_all_plays(new_rows, self.h_roster, self.a_roster)
+        # the rows marking the end of the game are dropped from the plays, so look for them here.
+        # only the last play matters, so don't copy the plays of the whole game on every poll
+        self.final = scrape_games.is_game_over((new_plays or self.plays)[-1:], new_rows)
+        self.shot_clock_state = scrape_games.track_shot_clock(new_plays,
+                                                              state=self.shot_clock_state)
+        self.possession_state = possessions.assign_possessions(new_plays,
+                                                               state=self.possession_state)
+        self.partic_state = scrape_games.track_partic(new_plays, state=self.partic_state)
+
+        # earlier plays can only have changed if they are in the period the last poll ended in
+        first_index = len(self.plays)
+        self.plays.extend(new_plays)
+        changed = {}
+        for play in self.partic_state['changed'] + self.possession_state['changed']:
+            if id(play) in self.period_indices:
+                changed[self.period_indices[id(play)]] = play
+        changed = sorted(changed.items())
+
+        if new_rows[-1][0] != self.period:
+            self.period = new_rows[-1][0]
+            self.period_rows = 0
+            self.period_indices = {}
+            self.earlier_periods_hash = self.hash_earlier_periods(content, table_starts)
+        self.period_rows += sum(1 for row in new_rows if row[0] == self.period)
+        self.last_row = new_rows[-1]
+        for i, play in enumerate(new_plays):
+            if play['period'] == self.period:
+                self.period_indices[id(play)] = first_index + i
+        return changed + [(first_index + i, play) for i, play in enumerate(new_plays)]
+
+    def hash_earlier_periods(self, content, table_starts):
+        """Hashes the tables of the periods before the current one, so corrections to them can
+        be noticed without parsing them. The summary table is left out, since its scores change
+        on every poll."""
+        return hashlib.sha1(content[table_starts[1]:table_starts[self.period + 1]]).digest()
+
+
+def follow_game(scraper, conn, pbp_id, h_roster, a_roster, poll_interval=POLL_INTERVAL,
+                max_follow_time=MAX_FOLLOW_TIME, idle_timeout=IDLE_TIMEOUT):
+    """Polls the play-by-play page of a game in progress and upserts its plays as they happen,
+    until the game is final, or until the page has gone too long without new plays or the game
+    has been followed too long, in case its end never shows.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        conn: The pymysql connection to the database.
+        pbp_id: The PBP ID of the game.
+        h_roster: The home team's roster, as a list of dicts.
+        a_roster: The away team's roster, as a list of dicts.
+        poll_interval: The number of seconds between polls.
+        max_follow_time: The number of seconds to follow the game at most.
+        idle_timeout: The number of seconds without new plays to give up
+            after.
+
+    Returns:
+        The LiveGame of the game, holding all of its plays."""
+    cursor = conn.cursor()
+    game = LiveGame(pbp_id, h_roster, a_roster)
+    url = f"http://stats.ncaa.org/game/play_by_play/{pbp_id}"
+    start = time.monotonic()
+    last_new_play = start
+    while True:
+        page = scraper.open_page(url=url)
+        if page is not None:
+            with scraper.metrics.timer('live poll'):
+                indexed_plays = game.poll(page.content)
+            with scraper.metrics.timer('upsert_plays'):
+                scrape_games.upsert_plays(cursor, pbp_id, indexed_plays)
+                conn.commit()
+            scraper.metrics.count('live plays', len(indexed_plays))
+            LOGGER.debug("Upserted %s plays.", len(indexed_plays), extra={'pbp_id': pbp_id})
+            if game.final:
+                return game
+            if len(indexed_plays) > 0:
+                last_new_play = time.monotonic()
+        now = time.monotonic()
+        if (now - last_new_play >= idle_timeout) or (now - start >= max_follow_time):
+            LOGGER.warning("Stopped following the game before it was final.",
+                           extra={'pbp_id': pbp_id})
+            scraper.metrics.count('live games abandoned')
+            return game
+        time.sleep(poll_interval)
+
+
+# Main method. Follows one game until it is final.
+
+
+def main(argv):
+    scrape_log.configure()
+    pbp_id, h_team_season_id, a_team_season_id = (int(arg) for arg in argv[:3])
+    scraper = scrape_util.Scraper(thread_count=scrape_games.DEFAULT_THREAD_COUNT)
+    conn = database.connect_to_db()
+    cursor = conn.cursor()
+    scrape_games.ensure_schema(cursor)
+    h_roster = scrape_games.fetch_roster(cursor, h_team_season_id)
+    a_roster = scrape_games.fetch_roster(cursor, a_team_season_id)
+    follow_game(scraper, conn, pbp_id, h_roster, a_roster)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
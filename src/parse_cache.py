@@ -0,0 +1,101 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import zlib
+
+PATH_PARSE_CACHE = "parse_cache.sqlite"
+BUSY_TIMEOUT = 30   # seconds to wait for another worker process to finish writing
+CREATE_QUERY = ("CREATE TABLE IF NOT EXISTS parse_cache ("
+                "game_key TEXT NOT NULL, stage TEXT NOT NULL, versions TEXT NOT NULL, "
+                "record BLOB NOT NULL, PRIMARY KEY (game_key, stage))")
+FETCH_QUERY = "SELECT stage, versions, record FROM parse_cache WHERE game_key = ?"
+STORE_QUERY = ("INSERT OR REPLACE INTO parse_cache (game_key, stage, versions, record) "
+               "VALUES (?, ?, ?, ?)")
+
+
+class ParseCache:
+    """A SQLite file of the outputs of each stage of parsing a game, so reprocessing a game whose
+    pages and rosters have not changed skips the stages whose code has not changed either. Each
+    game is keyed by the hashes of its box score page, its play-by-play page and its rosters. Each
+    stage's output is stored with the versions of that stage and every stage before it, so bumping
+    the version of one stage invalidates only the outputs of that stage and the ones after it.
+    Outputs are pickled and compressed with zlib.
+    """
+
+    def __init__(self, path=PATH_PARSE_CACHE):
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.conn.execute(CREATE_QUERY)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self, game_key, stage_versions):
+        """Finds the output of the last stage of a game that is still valid.
+
+        Args:
+            game_key: The key of the game, as returned by make_game_key.
+            stage_versions: A list of (stage name, version) tuples of every
+                stage of parsing, in order (see
+                scrape_games.STAGE_VERSIONS).
+
+        Returns:
+            A tuple of the number of stages whose output is valid and the
+            output of the last of them. If no output is valid, returns
+            (0, None)."""
+        stored = {stage: (versions, record) for stage, versions, record
+                  in self.conn.execute(FETCH_QUERY, (game_key,))}
+        for done in range(len(stage_versions), 0, -1):
+            stage = stage_versions[done - 1][0]
+            if (stage in stored) \
+                    and (stored[stage][0] == format_versions(stage_versions[:done])):
+                return done, pickle.loads(zlib.decompress(stored[stage][1]))
+        return 0, None
+
+    def store(self, game_key, checkpoints):
+        """Stores the outputs of stages of a game in a single transaction.
+
+        Args:
+            game_key: The key of the game, as returned by make_game_key.
+            checkpoints: A list of tuples returned by make_checkpoint."""
+        self.conn.executemany(STORE_QUERY, [(game_key,) + checkpoint
+                                            for checkpoint in checkpoints])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def make_checkpoint(stage_versions, done, output):
+    """Serializes the output of a stage right after it runs, before later stages change it.
+
+    Args:
+        stage_versions: The list of (stage name, version) tuples of every
+            stage of parsing, in order.
+        done: The number of stages that have run, including this one.
+        output: The output of the stage.
+
+    Returns:
+        A tuple of the name of the stage, its version string and its
+        compressed output, to pass to ParseCache.store."""
+    return (stage_versions[done - 1][0], format_versions(stage_versions[:done]),
+            zlib.compress(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)))
+
+
+def format_versions(stage_versions):
+    """Returns the versions of a list of stages as one string, e.g. 'parse=1,track_partic=2'."""
+    return ",".join(f"{stage}={version}" for stage, version in stage_versions)
+
+
+def make_game_key(raw_boxes, pbp_html, h_roster, a_roster):
+    """Returns the cache key of a game: the SHA-1 hashes of its raw boxes, its play-by-play page
+    (empty if None) and its rosters, joined into one string."""
+    boxes = json.dumps(raw_boxes, default=str)
+    rosters = json.dumps([h_roster, a_roster], sort_keys=True, default=str)
+    contents = [boxes, pbp_html or b"", rosters]
+    return ":".join(hashlib.sha1(content.encode() if isinstance(content, str) else content)
+                    .hexdigest() for content in contents)
@@ -0,0 +1,255 @@
+import concurrent.futures
+import os
+
+import bs4
+
+import parse_cache
+import scrape_games
+
+WARMUP_HTML = "<table class='mytable'><tr class='smtext'><td>Team</td></tr></table>"
+
+# the parse_cache.ParseCache of a worker process, opened once when the worker starts
+worker_cache = None
+
+
+class ParseEngine:
+    """A pool of worker processes that turn raw boxes and play-by-play pages into cleaned boxes
+    and plays. Soup building and play parsing are pure-Python CPU work, so running them in
+    separate processes lets a backfill use every core while pages keep being fetched in the main
+    process. The small box score page is parsed in the main process, which needs its metadata
+    before it can fetch the rest of the game; only its raw boxes, the raw play-by-play page and
+    the rosters are sent to the workers, and only compact records (see pack_game) are sent back.
+    If given a cache path, each worker opens a parse_cache.ParseCache when it starts, keeps the
+    output of each stage in it and skips the stages whose output is cached. The cache is only
+    used here; scrape_game parses in the main process and never reads it.
+    """
+
+    def __init__(self, workers=None, cache_path=None):
+        self.workers = workers if workers else os.cpu_count()
+        self.cache_path = cache_path
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                               initializer=warm_worker,
+                                                               initargs=(cache_path,))
+        self.warm()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def warm(self):
+        """Starts every worker process and waits until each one is ready. Worker processes are
+        otherwise only started once work is submitted, which would put process startup on the
+        critical path of the first games."""
+        futures = [self.executor.submit(ping) for _ in range(self.workers)]
+        concurrent.futures.wait(futures)
+
+    def submit(self, raw_boxes, pbp_html, h_roster, a_roster):
+        """Parses and cleans the boxes and plays of a game in a worker process.
+
+        Args:
+            raw_boxes: The raw boxes of the game, as returned by
+                scrape_games.find_raw_boxes.
+            pbp_html: The raw content of the play-by-play webpage of the same
+                game, or None if it could not be fetched.
+            h_roster: The home team's roster, as a list of dicts.
+            a_roster: The away team's roster, as a list of dicts.
+
+        Returns:
+            A concurrent.futures.Future of the record and errors returned by
+            parse_game. The record can be turned back into boxes and plays
+            with unpack_game."""
+        return self.executor.submit(parse_game, raw_boxes, pbp_html, h_roster, a_roster)
+
+    def shutdown(self, wait=True):
+        """Stops the worker processes once all submitted work is finished."""
+        self.executor.shutdown(wait=wait)
+
+
+# Below are functions that are run inside the worker processes.
+
+
+def warm_worker(cache_path=None):
+    """Builds a small soup so the parser is fully loaded before the first real page arrives, and
+    opens the worker's parse cache, if it has one, so it is not opened again for every game."""
+    global worker_cache
+    bs4.BeautifulSoup(WARMUP_HTML, 'html.parser').decompose()
+    if cache_path is not None:
+        worker_cache = parse_cache.ParseCache(cache_path)
+
+
+def ping():
+    """Does nothing. Submitted once per worker to force every worker process to start."""
+    return os.getpid()
+
+
+def parse_game(raw_boxes, pbp_html, h_roster, a_roster, cache_path=None):
+    """Runs the whole parsing pipeline on the raw boxes and play-by-play page of a game.
+
+    Args:
+        raw_boxes: The raw boxes of the game, as returned by
+            scrape_games.find_raw_boxes.
+        pbp_html: The raw content of the play-by-play webpage of the same game,
+            or None if it could not be fetched.
+        h_roster: The home team's roster, as a list of dicts.
+        a_roster: The away team's roster, as a list of dicts.
+        cache_path: The path of the parse_cache.ParseCache to reuse and keep
+            the output of each stage in. If None, the cache opened by
+            warm_worker is used, or every stage is run if there is none.
+
+    Returns:
+        A tuple of the cleaned boxes and tracked plays of the game, packed by
+        pack_game, and the list of (play row, exception) tuples of the rows
+        that could not be parsed. If pbp_html is None, the record contains no
+        plays. Raises AttributeError if pbp_html is not a usable play-by-play
+        page, so it can be fetched again; nothing is cached for it."""
+    if cache_path is None:
+        boxes, plays, errors = run_stages(raw_boxes, pbp_html, h_roster, a_roster, worker_cache)
+    else:
+        with parse_cache.ParseCache(cache_path) as cache:
+            boxes, plays, errors = run_stages(raw_boxes, pbp_html, h_roster, a_roster, cache)
+    return pack_game(boxes, plays), errors
+
+
+def run_stages(raw_boxes, pbp_html, h_roster, a_roster, cache=None):
+    """Runs the stages in scrape_games.STAGE_VERSIONS on the raw boxes and play-by-play page of a
+    game, starting after the last stage whose output is cached, and caches the output of each
+    stage it runs.
+
+    Args:
+        raw_boxes: The raw boxes of the game, as returned by
+            scrape_games.find_raw_boxes.
+        pbp_html: The raw content of the play-by-play webpage, or None.
+        h_roster: The home team's roster, as a list of dicts.
+        a_roster: The away team's roster, as a list of dicts.
+        cache: The parse_cache.ParseCache of the run, or None.
+
+    Returns:
+        A tuple of the boxes, the plays and the play rows that could not be
+        parsed, as returned by parse_pages."""
+    stage_versions = scrape_games.STAGE_VERSIONS
+    done, output = 0, None
+    if cache is not None:
+        game_key = parse_cache.make_game_key(raw_boxes, pbp_html, h_roster, a_roster)
+        done, output = cache.load(game_key, stage_versions)
+
+    checkpoints = []
+    for stage, _ in stage_versions[done:]:
+        if stage == "parse":
+            output = parse_pages(raw_boxes, pbp_html, h_roster, a_roster)
+        else:
+            boxes, plays, _ = output
+            if len(plays) > 0:
+                if stage == "track_shot_clock":
+                    scrape_games.track_shot_clock(plays)
+                elif stage == "track_partic":
+                    scrape_games.track_partic(plays)
+                elif stage == "correct_time_played":
+                    scrape_games.correct_time_played(boxes, plays)
+        done += 1
+        if cache is not None:
+            checkpoints.append(parse_cache.make_checkpoint(stage_versions, done, output))
+
+    if len(checkpoints) > 0:
+        cache.store(game_key, checkpoints)
+    return output
+
+
+def parse_pages(raw_boxes, pbp_html, h_roster, a_roster):
+    """Cleans the raw boxes of a game and builds the soup of its play-by-play page and parses it,
+    the first stage of run_stages.
+
+    Returns:
+        A tuple of the cleaned boxes of the game, its parsed plays and the
+        list of (play row, exception) tuples of the rows that could not be
+        parsed. Raises AttributeError if pbp_html is not a usable
+        play-by-play page."""
+    boxes = scrape_games.clean_raw_boxes(raw_boxes, h_roster, a_roster)
+
+    raw_plays = []
+    if pbp_html is not None:
+        pbp_soup = bs4.BeautifulSoup(pbp_html, 'html.parser')
+        try:
+            raw_plays = scrape_games.find_raw_plays(pbp_soup)
+        finally:
+            pbp_soup.decompose()
+
+    errors = []
+    plays = scrape_games.parse_all_plays(raw_plays, h_roster, a_roster, errors=errors)
+    return boxes, plays, errors
+
+
+# Below are functions for converting parsed games to and from compact records that are cheap to
+# send between processes.
+
+
+def pack_game(boxes, plays):
+    """Converts the boxes and plays of a game into a compact record made only of tuples, ints,
+    strings and bools. Each distinct player is stored once, and plays refer to players by their
+    index in the record's player table.
+
+    Args:
+        boxes: The cleaned boxes of the game, as a list of dicts.
+        plays: The tracked plays of the game, as a list of dicts.
+
+    Returns:
+        A tuple (players, boxes, plays), where players is a tuple of
+        (player ID, name) pairs, each box is a tuple of the values of
+        scrape_games.NULLABLE_BOX_FIELDS, and each play is a tuple of the
+        values of scrape_games.NULLABLE_PLAY_FIELDS followed by the index of
+        the player who did the action, a tuple of the indices of the home
+        players on the court and a tuple of the indices of the away players on
+        the court."""
+    players = []
+    player_indices = {}
+    packed_boxes = tuple(tuple(box.get(field) for field in scrape_games.NULLABLE_BOX_FIELDS)
+                         for box in boxes)
+    packed_plays = []
+    for play in plays:
+        packed_play = tuple(play.get(field) for field in scrape_games.NULLABLE_PLAY_FIELDS)
+        packed_play += (index_player(play.get('player'), players, player_indices),
+                        tuple(index_player(player, players, player_indices)
+                              for player in play.get('home partic', [])),
+                        tuple(index_player(player, players, player_indices)
+                              for player in play.get('away partic', [])))
+        packed_plays.append(packed_play)
+    return tuple(players), packed_boxes, tuple(packed_plays)
+
+
+def index_player(player, players, player_indices):
+    """Finds the index of a player in the player table of a record, adding the player to the
+    table if they are not in it yet. Returns None if the player is None."""
+    if player is None:
+        return None
+    key = (player['player ID'], player['name'])
+    if key not in player_indices:
+        player_indices[key] = len(players)
+        players.append(key)
+    return player_indices[key]
+
+
+def unpack_game(record):
+    """Converts a record made by pack_game back into the boxes and plays of a game.
+
+    Args:
+        record: A record returned by pack_game.
+
+    Returns:
+        A tuple of the boxes and plays of the game, each as a list of dicts in
+        the same format as they were before packing. Plays that referred to the
+        same player refer to the same player dict."""
+    packed_players, packed_boxes, packed_plays = record
+    players = [{'player ID': player_id, 'name': name} for player_id, name in packed_players]
+    num_fields = len(scrape_games.NULLABLE_PLAY_FIELDS)
+
+    boxes = [dict(zip(scrape_games.NULLABLE_BOX_FIELDS, packed_box)) for packed_box in packed_boxes]
+    plays = []
+    for packed_play in packed_plays:
+        play = dict(zip(scrape_games.NULLABLE_PLAY_FIELDS, packed_play[:num_fields]))
+        agent, home, away = packed_play[num_fields:]
+        play['player'] = None if agent is None else players[agent]
+        play['home partic'] = [None if i is None else players[i] for i in home]
+        play['away partic'] = [None if i is None else players[i] for i in away]
+        plays.append(play)
+    return boxes, plays
@@ -0,0 +1,215 @@
+import numpy as np
+
+import scrape_log
+
+# actions that show which team has the ball: the team that shoots, shoots free throws, turns the
+# ball over or grabs a rebound has it
+BALL_ACTIONS = ["shot", "free throw", "turnover", "rebound"]
+BACKFILL_CHUNK_GAMES = 500
+# the tables plays are stored in: plays by default, lineup_plays in runs storing them by lineup ID
+PLAY_TABLES = ["plays", "lineup_plays"]
+FETCH_TABLE_QUERY = ("SELECT table_name FROM information_schema.tables "
+                     "WHERE table_schema = DATABASE() AND table_name = %s")
+FETCH_GAME_IDS_QUERY = ("SELECT game_id FROM games WHERE start_time >= %s AND start_time < %s "
+                        "ORDER BY game_id")
+FETCH_PLAYS_QUERY = ("SELECT p.game_id, p.play_in_game, p.period, p.agent_is_away, p.action "
+                     "FROM {table} p JOIN games g ON g.game_id = p.game_id "
+                     "WHERE g.start_time >= %s AND g.start_time < %s "
+                     "AND p.game_id >= %s AND p.game_id <= %s "
+                     "ORDER BY p.game_id, p.play_in_game")
+CREATE_UPDATES_QUERY = ("CREATE TEMPORARY TABLE IF NOT EXISTS possession_updates ("
+                        "game_id INT NOT NULL, play_in_game INT NOT NULL, possession INT,"
+                        "offense_is_away BOOLEAN, PRIMARY KEY (game_id, play_in_game));")
+CLEAR_UPDATES_QUERY = "DELETE FROM possession_updates"
+INSERT_UPDATES_QUERY = ("INSERT INTO possession_updates (game_id, play_in_game, possession,"
+                        "offense_is_away) VALUES (%s, %s, %s, %s)")
+APPLY_UPDATES_QUERY = ("UPDATE {table} p JOIN possession_updates u ON u.game_id = p.game_id "
+                       "AND u.play_in_game = p.play_in_game "
+                       "SET p.possession = u.possession, p.offense_is_away = u.offense_is_away")
+FETCH_COLUMNS_QUERY = ("SELECT column_name FROM information_schema.columns "
+                       "WHERE table_schema = DATABASE() AND table_name = 'plays' "
+                       "AND column_name = 'possession'")
+ADD_COLUMNS_QUERY = ("ALTER TABLE plays ADD COLUMN possession INT NULL AFTER flag6, "
+                     "ADD COLUMN offense_is_away BOOLEAN NULL AFTER possession")
+
+LOGGER = scrape_log.get_logger("possessions")
+
+
+def assign_possessions(plays, state=None):
+    """Splits the plays of a game into possessions in one pass. A possession is a run of plays in
+    one period in which the same team has the ball, as shown by the BALL_ACTIONS: a defensive
+    rebound, or a shot or turnover by the other team, starts a new possession, while offensive
+    rebounds and the free throws after a made shot keep the same one. Plays that don't show who
+    has the ball (fouls, substitutions, timeouts, ...) belong to the possession they happen in;
+    those at the start of a period, before any team has the ball, belong to the first possession
+    of the period. Run on the output of track_shot_clock.
+
+    Sets the keys 'possession' (the index of the possession in the game) and 'offense is away'
+    (whether the away team had the ball, or None if no team did in the whole period) of each play.
+
+    Args:
+        plays: The plays of the game, as a list of dicts.
+        state: The state returned by an earlier call, if plays continues the
+            plays passed to that call. If None, the game starts here.
+
+    Returns:
+        The state after the last play, to pass to the next call if more plays
+        of the game arrive. Its 'changed' list holds the plays from earlier
+        calls whose 'offense is away' was set by this call."""
+    if state is None:
+        state = {'possession': -1, 'offense is away': None, 'period': None, 'waiting': []}
+    possession = state['possession']
+    offense = state['offense is away']
+    period = state['period']
+    waiting = state['waiting']     # plays at the start of a period, before a team has the ball
+    earlier_waiting = list(waiting)
+    changed = []
+
+    for play in plays:
+        if play['period'] != period:
+            period = play['period']
+            possession += 1
+            offense = None
+            waiting = []
+            earlier_waiting = []
+
+        if play['action'] in BALL_ACTIONS:
+            if offense is None:
+                for waiting_play in waiting:
+                    waiting_play['offense is away'] = play['is away']
+                changed += earlier_waiting
+                earlier_waiting = []
+                waiting = []
+            elif play['is away'] != offense:
+                possession += 1
+            offense = play['is away']
+        elif offense is None:
+            waiting.append(play)
+
+        play['possession'] = possession
+        play['offense is away'] = offense
+
+    return {'possession': possession, 'offense is away': offense, 'period': period,
+            'waiting': waiting, 'changed': changed}
+
+
+def assign_possessions_batch(game_ids, periods, is_away, actions):
+    """Splits plays into possessions the same way as assign_possessions, for many games at once.
+    Every argument is an array with one entry per play, sorted by game and then by order in the
+    game.
+
+    Args:
+        game_ids: The game ID of each play.
+        periods: The period of each play.
+        is_away: Whether the away team did each play.
+        actions: The action of each play, as strings.
+
+    Returns:
+        A tuple of an int array of the index of the possession of each play in
+        its game, and a float array of whether the away team had the ball on
+        each play (1.0 or 0.0), which is NaN if no team had the ball in the
+        whole period."""
+    game_ids = np.asarray(game_ids)
+    periods = np.asarray(periods)
+    count = len(game_ids)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    new_game = np.ones(count, dtype=bool)
+    new_game[1:] = game_ids[1:] != game_ids[:-1]
+    new_period = new_game.copy()
+    new_period[1:] |= periods[1:] != periods[:-1]
+    period_ids = np.cumsum(new_period) - 1
+
+    # carry the team of the last ball action forward through each period, then back to the plays
+    # before the period's first ball action
+    is_ball = np.isin(np.asarray(actions, dtype=object), BALL_ACTIONS)
+    positions = np.where(is_ball, np.arange(count), -1)
+    last_ball = np.maximum.accumulate(positions)
+    period_starts = np.flatnonzero(new_period)
+    period_first = period_starts[period_ids]
+    known = last_ball >= period_first
+    next_ball = np.where(is_ball, np.arange(count), count)[::-1]
+    next_ball = np.minimum.accumulate(next_ball)[::-1]
+    period_ends = np.append(period_starts[1:], count)
+    source = np.where(known, last_ball, next_ball)
+    has_offense = source < period_ends[period_ids]
+    offense = np.full(count, np.nan)
+    away = np.asarray(is_away, dtype=float)
+    offense[has_offense] = away[source[has_offense]]
+
+    # a new possession starts with each period and each change of the team with the ball
+    changed = np.zeros(count, dtype=bool)
+    changed[1:] = known[1:] & known[:-1] & (offense[1:] != offense[:-1])
+    starts = new_period | (changed & ~new_period)
+    totals = np.cumsum(starts)
+    game_first = np.flatnonzero(new_game)
+    game_offsets = totals[game_first][np.cumsum(new_game) - 1]
+    return totals - game_offsets, offense
+
+
+def backfill(conn, start_date, end_date, metrics=None):
+    """Assigns possessions to the plays already in the database of the games in a date range,
+    using the batch mode, and stores them with the plays, in both the plays and lineup_plays
+    tables. Games are read and written BACKFILL_CHUNK_GAMES at a time, committing after each
+    chunk. Each chunk's possessions are inserted into a temporary table in multi-row inserts and
+    written to the plays with one joined UPDATE, instead of one UPDATE per play.
+
+    Args:
+        conn: The pymysql connection to the database.
+        start_date: The first date of games, inclusive, as a datetime.date.
+        end_date: The last date of games, exclusive.
+        metrics: The instrument.Metrics of the run, or None.
+
+    Returns:
+        The number of plays updated."""
+    cursor = conn.cursor()
+    add_columns(cursor)
+    cursor.execute(CREATE_UPDATES_QUERY)
+    cursor.execute(FETCH_GAME_IDS_QUERY, (start_date, end_date))
+    game_ids = [row[0] for row in cursor.fetchall()]
+    count = 0
+    for table in PLAY_TABLES:
+        cursor.execute(FETCH_TABLE_QUERY, (table,))
+        if len(cursor.fetchall()) == 0:
+            continue
+        for i in range(0, len(game_ids), BACKFILL_CHUNK_GAMES):
+            chunk = game_ids[i:i + BACKFILL_CHUNK_GAMES]
+            count += backfill_chunk(cursor, table, start_date, end_date, chunk[0], chunk[-1])
+            conn.commit()
+    if metrics is not None:
+        metrics.count('plays with possessions', count)
+    return count
+
+
+def backfill_chunk(cursor, table, start_date, end_date, first_game_id, last_game_id):
+    """Assigns possessions to the plays of the games in a date range whose IDs are in a range,
+    and writes them to a table of plays through the possession_updates temporary table.
+
+    Returns:
+        The number of plays updated."""
+    cursor.execute(FETCH_PLAYS_QUERY.format(table=table),
+                   (start_date, end_date, first_game_id, last_game_id))
+    rows = cursor.fetchall()
+    if len(rows) == 0:
+        return 0
+    game_ids, plays_in_game, periods, is_away, actions = zip(*rows)
+    possessions, offense = assign_possessions_batch(
+        game_ids, periods, [bool(away) for away in is_away], actions)
+    offense = [None if np.isnan(away) else bool(away) for away in offense]
+    cursor.execute(CLEAR_UPDATES_QUERY)
+    cursor.executemany(INSERT_UPDATES_QUERY, list(zip(game_ids, plays_in_game,
+                                                      possessions.tolist(), offense)))
+    cursor.execute(APPLY_UPDATES_QUERY.format(table=table))
+    return len(rows)
+
+
+def add_columns(cursor):
+    """Adds the possession and offense_is_away columns to the plays table, if it doesn't have
+    them yet.
+
+    Args:
+        cursor: The pymysql cursor of the database connection."""
+    cursor.execute(FETCH_COLUMNS_QUERY)
+    if len(cursor.fetchall()) == 0:
+        cursor.execute(ADD_COLUMNS_QUERY)
+        LOGGER.info("Added the possession columns to the plays table.")
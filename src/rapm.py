@@ -0,0 +1,318 @@
+import concurrent.futures
+import os
+import sys
+
+import numpy as np
+import scipy.sparse
+
+import database
+import lineups
+import ratings
+import scrape_log
+
+DEFAULT_PENALTIES = [300, 1000, 3000, 10000, 30000]
+DEFAULT_FOLDS = 5
+CREATE_PLAYER_RATINGS_QUERY = ("CREATE TABLE IF NOT EXISTS player_ratings ("
+                               "player_id INT NOT NULL, season_year INT NOT NULL,"
+                               "offense DECIMAL(6, 2), defense DECIMAL(6, 2),"
+                               "total DECIMAL(6, 2), possessions DECIMAL(8, 1),"
+                               "penalty DOUBLE, PRIMARY KEY (player_id, season_year),"
+                               "KEY (season_year));")
+UPLOAD_PLAYER_RATINGS_QUERY = ("INSERT INTO player_ratings (player_id, season_year, offense,"
+                               "defense, total, possessions, penalty) VALUES (%s, %s, %s, %s,"
+                               "%s, %s, %s) ON DUPLICATE KEY UPDATE offense = VALUES(offense),"
+                               "defense = VALUES(defense), total = VALUES(total),"
+                               "possessions = VALUES(possessions), penalty = VALUES(penalty);")
+FETCH_PRIOR_QUERY = "SELECT player_id, offense, defense FROM player_ratings WHERE season_year = %s"
+STINT_PLAYER_COLUMNS = [f"s.{team}_{slot}" for team in "ha" for slot in lineups.PLAYER_SLOTS]
+FETCH_STINTS_QUERY = (f"SELECT s.game_id, {', '.join(STINT_PLAYER_COLUMNS)}, s.h_points,"
+                      f"s.a_points, s.h_possessions, s.a_possessions FROM stints s "
+                      f"JOIN games g ON g.game_id = s.game_id "
+                      f"JOIN team_seasons t ON t.team_season_id = g.h_team_season_id "
+                      f"WHERE t.season_year = %s AND NOT g.is_exhibition "
+                      f"ORDER BY s.game_id, s.stint_in_game")
+
+LOGGER = scrape_log.get_logger("rapm")
+
+# the design of the season being cross-validated, set once in each worker process
+worker_data = {}
+
+
+def make_stint_arrays(rows):
+    """Converts stint rows into arrays.
+
+    Args:
+        rows: Tuples of a game ID, the 5 home and 5 away player IDs (None for
+            unidentified players), the home and away points and the home and
+            away possessions of each stint, as read by FETCH_STINTS_QUERY.
+
+    Returns:
+        A dict of arrays with one entry per stint, with the keys 'game IDs',
+        'home players' and 'away players' (each stints x 5, with -1 for
+        unidentified players), 'home points', 'away points', 'home
+        possessions' and 'away possessions'."""
+    size = lineups.LINEUP_SIZE
+    players = np.array([[-1 if player_id is None else player_id
+                         for player_id in row[1:1 + 2 * size]] for row in rows],
+                       dtype=np.int64).reshape(len(rows), 2 * size)
+    values = np.array([[float(value or 0) for value in row[1 + 2 * size:]] for row in rows],
+                      dtype=float).reshape(len(rows), 4)
+    return {
+        'game IDs': np.array([row[0] for row in rows], dtype=np.int64),
+        'home players': players[:, :size],
+        'away players': players[:, size:],
+        'home points': values[:, 0],
+        'away points': values[:, 1],
+        'home possessions': values[:, 2],
+        'away possessions': values[:, 3]
+    }
+
+
+def build_design(stint_arrays, player_ids):
+    """Builds the sparse design matrix of the stints.
+
+    Each stint gives two rows, one per team on offense, of points per 100
+    possessions = average + offense of each player on offense - defense of
+    each player on defense +/- half the home advantage, weighted by the
+    team's possessions. The columns are the offense of each player, then the
+    defense of each player, then the home advantage.
+
+    Args:
+        stint_arrays: The stints, as returned by make_stint_arrays.
+        player_ids: The sorted array of the IDs of the players to rate.
+
+    Returns:
+        A tuple of the design matrix, the points per 100 possessions of each
+        row, the weight of each row and the game ID of each row."""
+    count = len(player_ids)
+    offense = np.concatenate([stint_arrays['home players'], stint_arrays['away players']])
+    defense = np.concatenate([stint_arrays['away players'], stint_arrays['home players']])
+    points = np.concatenate([stint_arrays['home points'], stint_arrays['away points']])
+    weights = np.concatenate([stint_arrays['home possessions'],
+                              stint_arrays['away possessions']])
+    venues = np.repeat([0.5, -0.5], len(stint_arrays['game IDs']))
+    game_ids = np.tile(stint_arrays['game IDs'], 2)
+    kept = weights > 0
+    offense, defense, points, weights = offense[kept], defense[kept], points[kept], weights[kept]
+    venues, game_ids = venues[kept], game_ids[kept]
+
+    row_count = len(weights)
+    rows = [np.repeat(np.arange(row_count), offense.shape[1])] * 2 + [np.arange(row_count)]
+    columns = [np.searchsorted(player_ids, offense).ravel(),
+               count + np.searchsorted(player_ids, defense).ravel(),
+               np.full(row_count, 2 * count)]
+    values = [np.where(offense >= 0, 1.0, 0.0).ravel(), np.where(defense >= 0, -1.0, 0.0).ravel(),
+              venues]
+    design = scipy.sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+        shape=(row_count, 2 * count + 1))
+    design.eliminate_zeros()
+    return design, 100 * points / np.maximum(weights, 1e-9), weights, game_ids
+
+
+def make_prior(player_ids, prior_ratings):
+    """Makes the solution vector that ratings are pulled toward instead of zero: each player's
+    ratings of an earlier season, or zero for players without them.
+
+    Args:
+        player_ids: The sorted array of the IDs of the players to rate.
+        prior_ratings: A dict from player ID to an (offense, defense) tuple.
+
+    Returns:
+        The prior solution vector, with a zero home advantage."""
+    count = len(player_ids)
+    prior = np.zeros(2 * count + 1)
+    for i, player_id in enumerate(player_ids):
+        if int(player_id) in prior_ratings:
+            prior[i], prior[count + i] = prior_ratings[int(player_id)]
+    return prior
+
+
+def solve(design, targets, weights, penalty, prior=None):
+    """Solves the ridge regression of the design, pulling ratings toward a prior.
+
+    Returns:
+        A tuple of the average points per 100 possessions, the solution and
+        the number of iterations."""
+    average = np.average(targets, weights=weights) if len(weights) > 0 else 0
+    residuals = targets - average
+    if prior is not None:
+        residuals = residuals - design @ prior
+    solution, iterations = ratings.solve_ridge(design, residuals, weights, penalty)
+    if prior is not None:
+        solution = solution + prior
+    return average, solution, iterations
+
+
+def fit_rapm(stint_arrays, penalty, prior_ratings=None):
+    """Fits regularized adjusted plus-minus ratings of every identified player in the stints.
+
+    Args:
+        stint_arrays: The stints, as returned by make_stint_arrays.
+        penalty: The ridge penalty, in possessions.
+        prior_ratings: A dict from player ID to an (offense, defense) tuple
+            of earlier ratings to pull each player toward, or None to pull
+            every player toward average.
+
+    Returns:
+        The ratings, as a dict with the keys 'player IDs', 'offense' and
+        'defense' (arrays of the points each player adds on offense and
+        prevents on defense per 100 possessions, compared to average),
+        'possessions' (an array of the possessions of both teams each player
+        was on the court for), 'home advantage', 'average', 'penalty' and
+        'iterations'."""
+    player_ids = find_players(stint_arrays)
+    design, targets, weights, _ = build_design(stint_arrays, player_ids)
+    prior = None if prior_ratings is None else make_prior(player_ids, prior_ratings)
+    average, solution, iterations = solve(design, targets, weights, penalty, prior)
+    count = len(player_ids)
+    on_court = np.abs(design[:, :2 * count]).T @ weights
+    possessions = on_court[:count] + on_court[count:]
+    return {
+        'player IDs': player_ids.tolist(),
+        'offense': solution[:count],
+        'defense': solution[count:2 * count],
+        'possessions': possessions,
+        'home advantage': solution[2 * count],
+        'average': average,
+        'penalty': penalty,
+        'iterations': iterations
+    }
+
+
+def find_players(stint_arrays):
+    """Returns the sorted array of the IDs of the identified players in the stints."""
+    players = np.concatenate([stint_arrays['home players'].ravel(),
+                              stint_arrays['away players'].ravel()])
+    return np.unique(players[players >= 0])
+
+
+# Below are functions for choosing the penalty by cross-validation in worker processes.
+
+
+def cross_validate(stint_arrays, penalties=None, folds=DEFAULT_FOLDS, workers=None,
+                   prior_ratings=None):
+    """Scores each penalty by the error of predicting held-out games. Stints are split into
+    folds by game, and every (penalty, fold) pair is fit in a pool of worker processes, each of
+    which receives the design matrix once.
+
+    Args:
+        stint_arrays: The stints, as returned by make_stint_arrays.
+        penalties: The penalties to try, or None for DEFAULT_PENALTIES.
+        folds: The number of folds.
+        workers: The number of worker processes, or None for one per CPU.
+        prior_ratings: The prior ratings, as taken by fit_rapm, or None.
+
+    Returns:
+        A dict from each penalty to the possession-weighted mean squared error
+        of its predictions of points per 100 possessions on held-out games."""
+    penalties = DEFAULT_PENALTIES if penalties is None else penalties
+    player_ids = find_players(stint_arrays)
+    design, targets, weights, game_ids = build_design(stint_arrays, player_ids)
+    prior = None if prior_ratings is None else make_prior(player_ids, prior_ratings)
+    fold_ids = game_ids % folds
+    tasks = [(penalty, fold) for penalty in penalties for fold in range(folds)]
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers or os.cpu_count(), len(tasks)), initializer=init_worker,
+            initargs=(design, targets, weights, fold_ids, prior)) as executor:
+        results = list(executor.map(score_fold, tasks))
+
+    errors = {}
+    for (penalty, _), (squared_error, weight) in zip(tasks, results):
+        total = errors.get(penalty, (0, 0))
+        errors[penalty] = (total[0] + squared_error, total[1] + weight)
+    return {penalty: squared_error / weight if weight > 0 else np.inf
+            for penalty, (squared_error, weight) in errors.items()}
+
+
+def init_worker(design, targets, weights, fold_ids, prior):
+    """Keeps the design of the season being cross-validated in a worker process."""
+    worker_data.update({'design': design, 'targets': targets, 'weights': weights,
+                        'fold IDs': fold_ids, 'prior': prior})
+
+
+def score_fold(task):
+    """Fits one penalty on every fold but one and scores it on the held-out fold.
+
+    Args:
+        task: A (penalty, index of the held-out fold) tuple.
+
+    Returns:
+        A tuple of the weighted sum of squared errors of the held-out rows and
+        the sum of their weights."""
+    penalty, fold = task
+    held_out = worker_data['fold IDs'] == fold
+    design, targets, weights = (worker_data['design'], worker_data['targets'],
+                                worker_data['weights'])
+    average, solution, _ = solve(design[~held_out], targets[~held_out], weights[~held_out],
+                                 penalty, worker_data['prior'])
+    predictions = average + design[held_out] @ solution
+    return (float(np.sum(weights[held_out] * (predictions - targets[held_out]) ** 2)),
+            float(np.sum(weights[held_out])))
+
+
+# Below are functions for reading stints and writing ratings.
+
+
+def fetch_stints(cursor, season_year):
+    """Reads the stints of the games of a season, as returned by make_stint_arrays."""
+    cursor.execute(FETCH_STINTS_QUERY, (season_year,))
+    return make_stint_arrays(cursor.fetchall())
+
+
+def fetch_prior(cursor, season_year):
+    """Reads the ratings of a season as a dict from player ID to an (offense, defense) tuple."""
+    cursor.execute(FETCH_PRIOR_QUERY, (season_year,))
+    return {player_id: (float(offense), float(defense))
+            for player_id, offense, defense in cursor.fetchall()}
+
+
+def make_rating_rows(player_ratings, season_year):
+    """Makes the tuples of values of ratings for UPLOAD_PLAYER_RATINGS_QUERY."""
+    return [(player_id, season_year, round(float(offense), 2), round(float(defense), 2),
+             round(float(offense + defense), 2), round(float(possessions), 1),
+             float(player_ratings['penalty']))
+            for player_id, offense, defense, possessions
+            in zip(player_ratings['player IDs'], player_ratings['offense'],
+                   player_ratings['defense'], player_ratings['possessions'])]
+
+
+def rate_season(conn, season_year, workers=None, use_prior=True):
+    """Fits and stores the RAPM ratings of the players of a season, with the penalty chosen by
+    cross-validation.
+
+    Args:
+        conn: The pymysql connection to the database.
+        season_year: The year of the season.
+        workers: The number of cross-validation processes, or None.
+        use_prior: Whether to pull players toward their ratings of the
+            season before, where they have them.
+
+    Returns:
+        The ratings, as returned by fit_rapm."""
+    cursor = conn.cursor()
+    cursor.execute(CREATE_PLAYER_RATINGS_QUERY)
+    stint_arrays = fetch_stints(cursor, season_year)
+    prior_ratings = fetch_prior(cursor, season_year - 1) if use_prior else None
+    errors = cross_validate(stint_arrays, workers=workers, prior_ratings=prior_ratings)
+    penalty = min(errors, key=errors.get)
+    player_ratings = fit_rapm(stint_arrays, penalty, prior_ratings=prior_ratings)
+    cursor.executemany(UPLOAD_PLAYER_RATINGS_QUERY,
+                       make_rating_rows(player_ratings, season_year))
+    conn.commit()
+    LOGGER.info("Rated %s players from %s stints with penalty %s.",
+                len(player_ratings['player IDs']), len(stint_arrays['game IDs']), penalty)
+    return player_ratings
+
+
+# Main method. Rates the players of a season, optionally with a number of worker processes.
+
+
+def main(argv):
+    scrape_log.configure()
+    workers = int(argv[1]) if len(argv) > 1 else None
+    rate_season(database.connect_to_db(), int(argv[0]), workers=workers)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
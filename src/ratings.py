@@ -0,0 +1,593 @@
+import datetime
+import json
+import sys
+import zlib
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+import database
+import scrape_games
+import scrape_log
+
+DEFAULT_PENALTY = 1.0    # ridge penalty, in games, that pulls teams with few games to average
+SOLVER_TOLERANCE = 1e-6    # relative residual; far below the 0.01 precision ratings are stored at
+CREATE_RATINGS_QUERY = ("CREATE TABLE IF NOT EXISTS team_ratings ("
+                        "team_season_id INT NOT NULL, rating_date DATE NOT NULL,"
+                        "adj_offense DECIMAL(6, 2), adj_defense DECIMAL(6, 2),"
+                        "adj_tempo DECIMAL(6, 2), games INT,"
+                        "PRIMARY KEY (team_season_id, rating_date), KEY (rating_date));")
+UPLOAD_RATINGS_QUERY = ("INSERT INTO team_ratings (team_season_id, rating_date, adj_offense,"
+                        "adj_defense, adj_tempo, games) VALUES (%s, %s, %s, %s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE adj_offense = VALUES(adj_offense),"
+                        "adj_defense = VALUES(adj_defense), adj_tempo = VALUES(adj_tempo),"
+                        "games = VALUES(games);")
+CREATE_SNAPSHOTS_QUERY = ("CREATE TABLE IF NOT EXISTS rating_snapshots ("
+                          "season_start DATE NOT NULL, rating_date DATE NOT NULL,"
+                          "average_efficiency DOUBLE, average_tempo DOUBLE,"
+                          "home_advantage DOUBLE, games INT, iterations INT,"
+                          "last_game_id INT, game_digest VARCHAR(255), state MEDIUMBLOB,"
+                          "PRIMARY KEY (season_start, rating_date));")
+UPLOAD_SNAPSHOT_QUERY = ("INSERT INTO rating_snapshots (season_start, rating_date,"
+                         "average_efficiency, average_tempo, home_advantage, games, iterations,"
+                         "last_game_id, game_digest, state) "
+                         "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+                         "ON DUPLICATE KEY UPDATE average_efficiency = VALUES(average_efficiency),"
+                         "average_tempo = VALUES(average_tempo),"
+                         "home_advantage = VALUES(home_advantage), games = VALUES(games),"
+                         "iterations = VALUES(iterations), last_game_id = VALUES(last_game_id),"
+                         "game_digest = VALUES(game_digest), state = VALUES(state);")
+FETCH_SNAPSHOT_QUERY = ("SELECT rating_date, average_efficiency, average_tempo, home_advantage,"
+                        "games, last_game_id, game_digest, state FROM rating_snapshots "
+                        "WHERE season_start = %s AND rating_date < %s "
+                        "ORDER BY rating_date DESC LIMIT 1")
+FETCH_RATINGS_QUERY = ("SELECT r.team_season_id, r.adj_offense, r.adj_defense, r.adj_tempo "
+                       "FROM team_ratings r JOIN team_seasons t "
+                       "ON t.team_season_id = r.team_season_id "
+                       "WHERE r.rating_date = %s AND t.season_year = %s "
+                       "ORDER BY r.team_season_id")
+RATED_GAMES = ("FROM games g JOIN boxes b ON b.game_id = g.game_id "
+               "WHERE g.start_time >= %s AND g.start_time < %s "
+               "AND g.h_team_season_id IS NOT NULL AND g.a_team_season_id IS NOT NULL "
+               "AND NOT g.is_exhibition")
+FETCH_GAMES_QUERY = ("SELECT g.game_id, g.start_time, g.h_team_season_id, g.a_team_season_id,"
+                     "b.is_away, SUM(b.fgm), SUM(b.3pm), SUM(b.ftm), SUM(b.fga), SUM(b.orb),"
+                     f"SUM(b.tov), SUM(b.fta) {RATED_GAMES} GROUP BY g.game_id, b.is_away "
+                     "ORDER BY g.start_time, g.game_id, b.is_away")
+FETCH_NEW_GAMES_QUERY = ("SELECT g.game_id, g.start_time, g.h_team_season_id, g.a_team_season_id,"
+                         "b.is_away, SUM(b.fgm), SUM(b.3pm), SUM(b.ftm), SUM(b.fga), SUM(b.orb),"
+                         f"SUM(b.tov), SUM(b.fta) {RATED_GAMES} "
+                         "AND (g.game_id > %s OR g.start_time >= %s) GROUP BY g.game_id, b.is_away "
+                         "ORDER BY g.start_time, g.game_id, b.is_away")
+FETCH_DIGEST_QUERY = ("SELECT COUNT(DISTINCT g.game_id), SUM(b.fgm), SUM(b.3pm), SUM(b.ftm),"
+                      f"SUM(b.fga), SUM(b.orb), SUM(b.tov), SUM(b.fta) {RATED_GAMES} "
+                      "AND g.game_id <= %s")
+
+LOGGER = scrape_log.get_logger("ratings")
+
+
+def fetch_games(cursor, start_date, end_date, covered=None):
+    """Reads the games of a date range whose teams both have team season IDs, with each team's
+    points and possessions summed from the boxes.
+
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        start_date: The first date of games, inclusive, as a datetime.date.
+        end_date: The last date of games, exclusive.
+        covered: A tuple of the last game ID and the end date, exclusive, of
+            games that were already read, which are skipped: those with a
+            game ID up to the last one that start before the end date. None
+            to read every game.
+
+    Returns:
+        A list of games, each a dict with the keys 'game ID', 'date',
+        'home team season ID', 'away team season ID', 'home points',
+        'away points' and 'possessions' (the average of both teams' estimates
+        of FGA - ORB + TOV + 0.44 * FTA)."""
+    if covered is None:
+        cursor.execute(FETCH_GAMES_QUERY, (start_date, end_date))
+    else:
+        cursor.execute(FETCH_NEW_GAMES_QUERY, (start_date, end_date) + tuple(covered))
+    games = {}
+    for game_id, start_time, h_id, a_id, is_away, fgm, fg3m, ftm, fga, orb, tov, fta \
+            in cursor.fetchall():
+        if game_id not in games:
+            games[game_id] = {'game ID': game_id, 'date': start_time.date(),
+                              'home team season ID': h_id, 'away team season ID': a_id,
+                              'home points': None, 'away points': None, 'possessions': 0}
+        team = "away" if is_away else "home"
+        games[game_id][f'{team} points'] = int(2 * fgm + fg3m + ftm)
+        games[game_id]['possessions'] += float(fga - orb + tov + 0.44 * fta) / 2
+    return [game for game in games.values()
+            if (game['home points'] is not None) and (game['away points'] is not None)
+            and (game['possessions'] > 0)]
+
+
+def fetch_digest(cursor, start_date, end_date, last_game_id):
+    """Sums the box stats of the games of a date range up to a game ID in the database, so a
+    later update can tell whether the games it read were added to, removed or corrected since.
+
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        start_date: The first date of games, inclusive, as a datetime.date.
+        end_date: The last date of games, exclusive.
+        last_game_id: The highest game ID to include.
+
+    Returns:
+        The number of games and the sums, as one string."""
+    cursor.execute(FETCH_DIGEST_QUERY, (start_date, end_date, last_game_id))
+    return ",".join(str(int(value or 0)) for value in cursor.fetchone())
+
+
+def game_weights(games, rating_date, half_life=None):
+    """Weighs games by recency: a game half_life days before the rating date counts half as much
+    as one on it. Games after the rating date get no weight.
+
+    Args:
+        games: The games, as returned by fetch_games.
+        rating_date: The date of the ratings, as a datetime.date.
+        half_life: The half-life of the weights in days, or None to weigh
+            every game before the rating date equally.
+
+    Returns:
+        An array of the weight of each game."""
+    ages = np.array([(rating_date - game['date']).days for game in games], dtype=float)
+    weights = np.ones(len(games)) if half_life is None else 0.5 ** (ages / half_life)
+    weights[ages < 0] = 0
+    return weights
+
+
+def build_design(home, away, team_count):
+    """Builds the sparse design matrices of the efficiency and tempo models.
+
+    Each game gives two efficiency rows, home team on offense first, of points
+    per 100 possessions = average + offense of the team + defense of the
+    opponent +/- half the home advantage. The columns are the offense of each
+    team, then the defense of each team, then the home advantage. Each game
+    gives one tempo row, of possessions = average + tempo of both teams.
+
+    Args:
+        home: An array of the index of the home team of each game.
+        away: An array of the index of the away team of each game.
+        team_count: The number of teams.
+
+    Returns:
+        A tuple of the efficiency and tempo design matrices."""
+    game_count = len(home)
+    offense = np.ravel(np.column_stack([home, away]))
+    defense = np.ravel(np.column_stack([away, home]))
+    columns = np.column_stack([offense, team_count + defense,
+                               np.full(2 * game_count, 2 * team_count)])
+    values = np.tile([[1, 1, 0.5], [1, 1, -0.5]], (game_count, 1))
+    efficiency_design = scipy.sparse.csr_matrix(
+        (values.ravel(), (np.repeat(np.arange(2 * game_count), 3), columns.ravel())),
+        shape=(2 * game_count, 2 * team_count + 1))
+    tempo_design = scipy.sparse.csr_matrix(
+        (np.ones(2 * game_count), (np.repeat(np.arange(game_count), 2), offense)),
+        shape=(game_count, team_count))
+    return efficiency_design, tempo_design
+
+
+def solve_ridge(design, targets, weights, penalty, start=None):
+    """Solves the weighted ridge regression min sum(w * (design @ x - targets) ** 2) +
+    penalty * |x| ** 2 with Jacobi-preconditioned conjugate gradients on its sparse normal
+    equations.
+
+    Args:
+        design: The sparse design matrix.
+        targets: The array of targets of each row.
+        weights: The array of weights of each row.
+        penalty: The ridge penalty.
+        start: The solution to start from, e.g. an earlier solution of a
+            similar problem, or None to start from zero.
+
+    Returns:
+        A tuple of the solution and the number of iterations it took."""
+    weighted = design.T.multiply(weights).tocsr()
+    normal = (weighted @ design + penalty * scipy.sparse.identity(design.shape[1])).tocsr()
+    iterations = [0]
+
+    def count_iteration(_):
+        iterations[0] += 1
+
+    # teams' diagonal entries grow with their games, so scaling by them evens out convergence
+    preconditioner = scipy.sparse.diags(1 / normal.diagonal())
+    solution, info = scipy.sparse.linalg.cg(normal, weighted @ targets, x0=start,
+                                            rtol=SOLVER_TOLERANCE, M=preconditioner,
+                                            callback=count_iteration)
+    if info != 0:
+        LOGGER.warning("Ratings did not converge after %s iterations.", iterations[0])
+    return solution, iterations[0]
+
+
+class RatingsUpdater:
+    """Keeps the games of a season and the latest ratings fit to them, so ratings can be updated
+    as games are added without starting over: only the games not added yet are converted to
+    rows, and the solvers start from the latest solution, which changes little when a night's
+    games are added, so they converge in a few iterations. The games it has can be stored with
+    the ratings (see encode_games), so a later run only reads the games added since.
+    """
+
+    def __init__(self, half_life=None, penalty=DEFAULT_PENALTY, ratings=None):
+        """
+        Args:
+            half_life: The half-life of the recency weights in days, or None
+                to weigh every game equally (see game_weights).
+            penalty: The ridge penalty on every rating, in units of games.
+            ratings: Earlier ratings to start the solvers from, as returned
+                by rate or by load_snapshot, or None to start from average
+                ratings."""
+        self.half_life = half_life
+        self.penalty = penalty
+        self.ratings = ratings
+        self.games = []
+        self.game_ids = set()
+        self.team_ids = []
+        self.team_index = {}
+        self.dates = []
+        self.home = []
+        self.away = []
+        self.efficiencies = []
+        self.possessions = []
+
+    def __len__(self):
+        return len(self.dates)
+
+    def add_games(self, games):
+        """Adds the games that have not been added yet.
+
+        Args:
+            games: The games, as returned by fetch_games.
+
+        Returns:
+            The number of games added."""
+        new_games = [game for game in games if game['game ID'] not in self.game_ids]
+        new_teams = {game[f'{team} team season ID'] for game in new_games
+                     for team in ["home", "away"]}
+        for team_id in sorted(new_teams - self.team_index.keys()):
+            self.team_index[team_id] = len(self.team_ids)
+            self.team_ids.append(team_id)
+        for game in new_games:
+            self.games.append(game)
+            self.game_ids.add(game['game ID'])
+            self.dates.append(game['date'])
+            self.home.append(self.team_index[game['home team season ID']])
+            self.away.append(self.team_index[game['away team season ID']])
+            self.efficiencies += [100 * game['home points'] / game['possessions'],
+                                  100 * game['away points'] / game['possessions']]
+            self.possessions.append(game['possessions'])
+        return len(new_games)
+
+    def rate(self, rating_date):
+        """Fits opponent- and venue-adjusted offensive and defensive efficiency and tempo for
+        every team season in the games added so far, as of a date, starting from the latest
+        ratings.
+
+        Args:
+            rating_date: The date of the ratings, as a datetime.date. Only
+                games on or before it count.
+
+        Returns:
+            The ratings, as a dict with the keys:
+            'team season IDs': The list of team season IDs, in the order of
+                the rating arrays.
+            'offense', 'defense': Arrays of the points each team would score
+                and allow per 100 possessions against an average team on a
+                neutral court.
+            'tempo': An array of the possessions each team would have against
+                an average team.
+            'games': An array of the number of games of each team that
+                counted. Teams with none, whose games are all after the
+                rating date, are rated average.
+            'home advantage': The points per 100 possessions the home team
+                gains over the away team.
+            'average efficiency', 'average tempo': The league averages.
+            'efficiency solution', 'tempo solution': The solver solutions, to
+                warm-start a later fit.
+            'iterations': The total iterations of both solvers."""
+        weights = game_weights([{'date': date} for date in self.dates], rating_date,
+                               self.half_life)
+        counted = weights > 0
+        # teams whose games don't count yet keep zero ratings, held there by the penalty
+        efficiency_design, tempo_design = build_design(
+            np.asarray(self.home, dtype=np.int64)[counted],
+            np.asarray(self.away, dtype=np.int64)[counted], len(self.team_ids))
+        weights = weights[counted]
+        efficiencies = np.asarray(self.efficiencies, dtype=float)[np.repeat(counted, 2)]
+        possessions = np.asarray(self.possessions, dtype=float)[counted]
+
+        efficiency_weights = np.repeat(weights, 2)
+        average_efficiency = np.average(efficiencies, weights=efficiency_weights) \
+            if len(weights) > 0 else 0
+        average_tempo = np.average(possessions, weights=weights) if len(weights) > 0 else 0
+        efficiency_start, tempo_start = None, None
+        if self.ratings is not None:
+            efficiency_start, tempo_start = align_start(self.ratings, self.team_index)
+        efficiency_solution, efficiency_iterations = solve_ridge(
+            efficiency_design, efficiencies - average_efficiency, efficiency_weights,
+            self.penalty, efficiency_start)
+        tempo_solution, tempo_iterations = solve_ridge(
+            tempo_design, possessions - average_tempo, weights, self.penalty, tempo_start)
+
+        count = len(self.team_ids)
+        games_played = np.asarray(tempo_design.sum(axis=0)).ravel().astype(int)
+        self.ratings = {
+            'team season IDs': list(self.team_ids),
+            'offense': average_efficiency + efficiency_solution[:count],
+            'defense': average_efficiency + efficiency_solution[count:2 * count],
+            'tempo': average_tempo + tempo_solution,
+            'games': games_played,
+            'home advantage': efficiency_solution[2 * count],
+            'average efficiency': average_efficiency,
+            'average tempo': average_tempo,
+            'efficiency solution': efficiency_solution,
+            'tempo solution': tempo_solution,
+            'iterations': efficiency_iterations + tempo_iterations
+        }
+        return self.ratings
+
+
+def fit_ratings(games, rating_date, half_life=None, penalty=DEFAULT_PENALTY, start=None):
+    """Fits ratings to games from scratch, or from the solution of earlier ratings.
+
+    Args:
+        games: The games, as returned by fetch_games.
+        rating_date: The date of the ratings, as a datetime.date. Only games
+            on or before it count.
+        half_life: The half-life of the recency weights in days, or None.
+        penalty: The ridge penalty on every rating, in units of games.
+        start: Ratings to start the solvers from, or None.
+
+    Returns:
+        The ratings, as returned by RatingsUpdater.rate."""
+    updater = RatingsUpdater(half_life=half_life, penalty=penalty, ratings=start)
+    updater.add_games(games)
+    return updater.rate(rating_date)
+
+
+def align_start(ratings, team_index):
+    """Maps the solver solutions of earlier ratings onto the teams of a new fit, starting teams
+    that are new at average.
+
+    Returns:
+        A tuple of the efficiency and tempo starting solutions."""
+    count = len(team_index)
+    efficiency_start = np.zeros(2 * count + 1)
+    tempo_start = np.zeros(count)
+    old_count = len(ratings['team season IDs'])
+    for old, team_id in enumerate(ratings['team season IDs']):
+        if team_id in team_index:
+            new = team_index[team_id]
+            efficiency_start[new] = ratings['efficiency solution'][old]
+            efficiency_start[count + new] = ratings['efficiency solution'][old_count + old]
+            tempo_start[new] = ratings['tempo solution'][old]
+    if old_count > 0:
+        efficiency_start[2 * count] = ratings['efficiency solution'][2 * old_count]
+    return efficiency_start, tempo_start
+
+
+def make_rating_rows(ratings, rating_date):
+    """Makes the tuples of values of ratings for UPLOAD_RATINGS_QUERY, leaving out teams without
+    any games that counted."""
+    return [(team_id, rating_date, round(float(offense), 2), round(float(defense), 2),
+             round(float(tempo), 2), int(games))
+            for team_id, offense, defense, tempo, games
+            in zip(ratings['team season IDs'], ratings['offense'], ratings['defense'],
+                   ratings['tempo'], ratings['games'])
+            if games > 0]
+
+
+def upload_ratings(cursor, ratings, rating_date):
+    """Writes ratings to the team_ratings table as of a date, replacing any ratings of the same
+    teams on that date.
+
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        ratings: The ratings, as returned by fit_ratings.
+        rating_date: The date of the ratings, as a datetime.date."""
+    rows = make_rating_rows(ratings, rating_date)
+    if len(rows) > 0:
+        cursor.executemany(UPLOAD_RATINGS_QUERY, rows)
+
+
+def encode_games(games):
+    """Compresses the games of an updater for the snapshots table, each as a list of its values
+    with the date as a day number."""
+    return zlib.compress(json.dumps([
+        [game['game ID'], game['date'].toordinal(), game['home team season ID'],
+         game['away team season ID'], game['home points'], game['away points'],
+         game['possessions']] for game in games]).encode())
+
+
+def decode_games(record):
+    """Reverses encode_games."""
+    return [{'game ID': game_id, 'date': datetime.date.fromordinal(day),
+             'home team season ID': h_id, 'away team season ID': a_id,
+             'home points': h_points, 'away points': a_points, 'possessions': possessions}
+            for game_id, day, h_id, a_id, h_points, a_points, possessions
+            in json.loads(zlib.decompress(record).decode())]
+
+
+def upload_snapshot(cursor, ratings, season_start, rating_date, games=()):
+    """Writes ratings to the team_ratings table as of a date, along with the league averages and
+    home advantage they were fit with, so a later update can start from them, and the games they
+    were fit to, so a later update only has to read the games added since.
+
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        ratings: The ratings, as returned by RatingsUpdater.rate.
+        season_start: The first date of the season, as a datetime.date.
+        rating_date: The date of the ratings.
+        games: The games the ratings were fit to, as kept by the
+            RatingsUpdater."""
+    upload_ratings(cursor, ratings, rating_date)
+    last_game_id = max((game['game ID'] for game in games), default=None)
+    digest = None if last_game_id is None else fetch_digest(
+        cursor, season_start, rating_date + datetime.timedelta(1), last_game_id)
+    cursor.execute(UPLOAD_SNAPSHOT_QUERY, (
+        season_start, rating_date, float(ratings['average efficiency']),
+        float(ratings['average tempo']), float(ratings['home advantage']),
+        int(ratings['games'].sum() // 2), ratings['iterations'], last_game_id, digest,
+        encode_games(games)))
+
+
+def load_snapshot(cursor, season_start, rating_date):
+    """Reads the latest ratings of a season stored before a date, as a starting point for
+    updating them.
+
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        season_start: The first date of the season, as a datetime.date.
+        rating_date: The date of the ratings to be updated.
+
+    Returns:
+        A tuple of the date of the stored ratings and the ratings, in the
+        form RatingsUpdater takes to start from, with the number of games they
+        were fit to at 'game count', the league averages at 'average
+        efficiency' and 'average tempo', the games they were fit to at 'games'
+        (None if they were not stored), the highest game ID of those at 'last
+        game ID' and the digest of the games up to it at 'game digest' (see
+        fetch_digest). (None, None) if the season has none."""
+    cursor.execute(FETCH_SNAPSHOT_QUERY, (season_start, rating_date))
+    snapshot = cursor.fetchone()
+    if snapshot is None:
+        return None, None
+    snapshot_date, average_efficiency, average_tempo, home_advantage, game_count, last_game_id, \
+        digest, state = snapshot
+    # team season IDs are unique across seasons, but the ratings of another season can share the
+    # date of the snapshot
+    cursor.execute(FETCH_RATINGS_QUERY, (snapshot_date, scrape_games.find_season(season_start)[0]))
+    rows = cursor.fetchall()
+    offense, defense, tempo = (np.array([float(row[i]) for row in rows]) for i in range(1, 4))
+    return snapshot_date, {
+        'team season IDs': [row[0] for row in rows],
+        'efficiency solution': np.concatenate([offense - average_efficiency,
+                                               defense - average_efficiency,
+                                               [home_advantage]]),
+        'tempo solution': tempo - average_tempo,
+        'game count': game_count,
+        'average efficiency': average_efficiency,
+        'average tempo': average_tempo,
+        'games': None if state is None else decode_games(state),
+        'last game ID': last_game_id,
+        'game digest': digest
+    }
+
+
+def create_tables(cursor):
+    """Creates the team_ratings and rating_snapshots tables, if they don't exist.
+
+    Args:
+        cursor: The pymysql cursor of the database connection."""
+    cursor.execute(CREATE_RATINGS_QUERY)
+    cursor.execute(CREATE_SNAPSHOTS_QUERY)
+
+
+def update_ratings(conn, season_start, rating_date, half_life=None):
+    """Updates the ratings of a season through a date from the latest stored snapshot of the
+    season, and stores them as the snapshot of that date. Only the games uploaded since the
+    snapshot are read from the database and added to the games stored with it, and the solvers
+    start from its ratings. If the games the snapshot was fit to have changed since, because
+    games were added late, removed or corrected, every game of the season is read again.
+    Meant to be run after each night's scrape.
+
+    Args:
+        conn: The pymysql connection to the database.
+        season_start: The first date of the season, as a datetime.date.
+        rating_date: The date of the ratings; games on it count.
+        half_life: The half-life of the recency weights in days, or None.
+
+    Returns:
+        The ratings, as returned by RatingsUpdater.rate."""
+    cursor = conn.cursor()
+    create_tables(cursor)
+    snapshot_date, start = load_snapshot(cursor, season_start, rating_date)
+    end_date = rating_date + datetime.timedelta(1)
+    updater = RatingsUpdater(half_life=half_life, ratings=start)
+    covered = None
+    if (start is not None) and (start['last game ID'] is not None):
+        snapshot_end = snapshot_date + datetime.timedelta(1)
+        if fetch_digest(cursor, season_start, snapshot_end, start['last game ID']) \
+                == start['game digest']:
+            covered = (start['last game ID'], snapshot_end)
+            updater.add_games(start['games'])
+        else:
+            LOGGER.info("Games rated on %s have changed since; reading every game again.",
+                        snapshot_date)
+    new_count = updater.add_games(fetch_games(cursor, season_start, end_date, covered))
+    ratings = updater.rate(rating_date)
+    upload_snapshot(cursor, ratings, season_start, rating_date, updater.games)
+    conn.commit()
+    LOGGER.info("Rated %s teams from %s games, %s of them read, in %s iterations, starting from "
+                "the ratings of %s; home advantage %.2f.", len(ratings['team season IDs']),
+                len(updater), new_count, ratings['iterations'], snapshot_date,
+                ratings['home advantage'])
+    return ratings
+
+
+def rate_history(conn, season_start, end_date, half_life=None):
+    """Regenerates the daily ratings snapshots of a season, adding each day's games to the
+    ratings of the day before.
+
+    Args:
+        conn: The pymysql connection to the database.
+        season_start: The first date of the season, as a datetime.date.
+        end_date: The date of the last snapshot.
+        half_life: The half-life of the recency weights in days, or None.
+
+    Returns:
+        The number of snapshots stored."""
+    cursor = conn.cursor()
+    create_tables(cursor)
+    games = fetch_games(cursor, season_start, end_date + datetime.timedelta(1))
+    updater = RatingsUpdater(half_life=half_life)
+    days = daily_games(games, end_date)
+    for rating_date, day_games in days:
+        updater.add_games(day_games)
+        upload_snapshot(cursor, updater.rate(rating_date), season_start, rating_date,
+                        updater.games)
+    conn.commit()
+    count = len(days)
+    LOGGER.info("Stored %s daily ratings snapshots from %s games.", count, len(updater))
+    return count
+
+
+def daily_games(games, end_date):
+    """Groups games by date, from the date of the first game through an end date, including days
+    without games.
+
+    Returns:
+        A list of (date, list of that date's games) tuples."""
+    if len(games) == 0:
+        return []
+    by_date = {}
+    for game in games:
+        by_date.setdefault(game['date'], []).append(game)
+    first_date = min(by_date)
+    dates = [first_date + datetime.timedelta(day)
+             for day in range((end_date - first_date).days + 1)]
+    return [(date, by_date.get(date, [])) for date in dates]
+
+
+# Main method. Updates the ratings of the season starting on a date through a rating date, or
+# with 'history' first, regenerates every daily snapshot of the season through it.
+
+
+def main(argv):
+    scrape_log.configure()
+    history = argv[:1] == ['history']
+    if history:
+        argv = argv[1:]
+    season_start = datetime.date(int(argv[0]), int(argv[1]), int(argv[2]))
+    rating_date = datetime.date(int(argv[3]), int(argv[4]), int(argv[5]))
+    half_life = float(argv[6]) if len(argv) > 6 else None
+    if history:
+        rate_history(database.connect_to_db(), season_start, rating_date, half_life=half_life)
+    else:
+        update_ratings(database.connect_to_db(), season_start, rating_date,
+                       half_life=half_life)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
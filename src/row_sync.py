@@ -0,0 +1,116 @@
+import datetime
+import decimal
+import math
+
+import scrape_log
+
+LOGGER = scrape_log.get_logger("row_sync")
+
+
+class RowTable:
+    """A table whose rows each belong to one game, such as boxes or plays. Knows the queries to
+    read the rows of a game back and to write only the rows that differ from a fresh parse.
+    """
+
+    def __init__(self, name, columns, index_column=None):
+        """
+        Args:
+            name: The name of the table.
+            columns: The columns of the table, in the order of the tuples
+                uploaded to it. The first column must be game_id.
+            index_column: The column that numbers the rows of a game (e.g.
+                'play_in_game'), which must be the second column. None if the
+                table has one row per game."""
+        self.name = name
+        self.columns = columns
+        self.index_column = index_column
+        column_list = ", ".join(columns)
+        self.fetch_query = f"SELECT {column_list} FROM {name} WHERE game_id = %s"
+        updates = ", ".join(f"{column} = VALUES({column})" for column in columns[1:])
+        self.upsert_query = (f"INSERT INTO {name} ({column_list}) VALUES "
+                             f"({', '.join(['%s'] * len(columns))}) "
+                             f"ON DUPLICATE KEY UPDATE {updates}")
+        if index_column is not None:
+            self.delete_query = f"DELETE FROM {name} WHERE game_id = %s AND {index_column} = %s"
+        else:
+            self.delete_query = f"DELETE FROM {name} WHERE game_id = %s"
+
+    def key(self, row):
+        """Returns the key of a row within its game: its index, or None if the table has one row
+        per game."""
+        return row[1] if self.index_column is not None else None
+
+    def sync(self, cursor, game_id, fresh_rows):
+        """Makes the rows of a game in the table match a fresh parse, writing only the rows that
+        differ.
+
+        Args:
+            cursor: The pymysql cursor of the database connection.
+            game_id: The PBP ID of the game.
+            fresh_rows: The tuples of the freshly parsed rows of the game, as
+                they would be uploaded.
+
+        Returns:
+            A tuple of the number of rows inserted or updated, the number of
+            rows deleted and the number of rows left unchanged."""
+        cursor.execute(self.fetch_query, (game_id,))
+        existing = {self.key(row): row for row in cursor.fetchall()}
+        changed, deleted = diff_rows(existing, {self.key(row): row for row in fresh_rows})
+        if len(changed) > 0:
+            cursor.executemany(self.upsert_query, changed)
+        if len(deleted) > 0:
+            if self.index_column is not None:
+                cursor.executemany(self.delete_query, [(game_id, key) for key in deleted])
+            else:
+                cursor.execute(self.delete_query, (game_id,))
+        unchanged = len(fresh_rows) - len(changed)
+        LOGGER.debug("%s: %s rows written, %s deleted, %s unchanged.", self.name, len(changed),
+                     len(deleted), unchanged, extra={'pbp_id': game_id})
+        return len(changed), len(deleted), unchanged
+
+
+def diff_rows(existing, fresh):
+    """Compares the rows of a game in the database to a fresh parse.
+
+    Args:
+        existing: A dict from the key of each row in the database to the row.
+        fresh: A dict from the key of each freshly parsed row to the row.
+
+    Returns:
+        A tuple of the list of fresh rows that are new or differ from the
+        database, in order of their keys, and the list of keys of database
+        rows that are not in the fresh parse."""
+    changed = [fresh[key] for key in sorted(fresh, key=sort_key)
+               if (key not in existing) or not same_row(existing[key], fresh[key])]
+    deleted = [key for key in sorted(existing, key=sort_key) if key not in fresh]
+    return changed, deleted
+
+
+def sort_key(key):
+    return -1 if key is None else key
+
+
+def same_row(old_row, new_row):
+    """Returns whether a row read from the database holds the same values as a freshly parsed
+    row."""
+    return (len(old_row) == len(new_row)) \
+        and all(same_value(old, new) for old, new in zip(old_row, new_row))
+
+
+def same_value(old, new):
+    """Returns whether a value read from the database is the same as a freshly parsed value,
+    allowing for the types the database returns: booleans come back as ints, decimals as
+    decimal.Decimal and start times as datetime.datetime."""
+    if (old is None) or (new is None):
+        return (old is None) and (new is None)
+    if isinstance(old, datetime.datetime) and isinstance(new, str):
+        try:
+            new = datetime.datetime.strptime(new, '%Y/%m/%d %H:%M' if ":" in new else '%Y/%m/%d')
+        except ValueError:
+            return False
+    if isinstance(old, (float, decimal.Decimal)) or isinstance(new, float):
+        try:
+            return math.isclose(float(old), float(new), abs_tol=1e-6)
+        except (TypeError, ValueError):
+            return False
+    return old == new
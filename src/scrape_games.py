@@ -1,16 +1,34 @@
 import time
+import argparse
+import concurrent.futures
 import datetime
 import re
 import sys
 
+import numpy as np
 import pymysql
 
+import crawl_scheduler
+import database
+import dead_letters
+import lineup_matrix
+import lineups
+import parse_engine
+import possessions
+import row_sync
+import scrape_log
 import scrape_util
+import stints
+import win_probability
 
-CRAWL_DELAY = 1
-VERBOSE = 3
-MAX_RETRIES = 15
 DEFAULT_THREAD_COUNT = 25
+SCOREBOARD_THREADS = 8
+PARSER_VERSION = 1    # increment whenever a change to parsing changes its output
+
+# the stages of processing a parsed game, in order. increment a stage's version whenever a change
+# to it changes its output, so cached outputs of it and later stages are recomputed.
+STAGE_VERSIONS = [("parse", PARSER_VERSION), ("track_shot_clock", 1), ("track_partic", 1),
+                  ("correct_time_played", 2)]
 
 YEAR_DIVISIONS = [
     {'year': 2011, 'code': 10220},
@@ -27,7 +45,7 @@ YEAR_DIVISIONS = [
 CLOCK_RESETTING_ACTIONS = ["jump ball", "possession arrow", "shot", "turnover", "steal",
                            "foul committed", "free throw"]
 
-PATH_DATABASE_INFO = "src/db_info.txt"
+PATH_RUN_REPORT = "run_report.json"
 UPLOAD_GAME_QUERY = ("INSERT INTO games (game_id, h_team_season_id,"
                      "a_team_season_id, h_name, a_name, start_time, location,"
                      "attendance, referee1, referee2, referee3,"
@@ -42,34 +60,134 @@ UPLOAD_BOX_QUERY = ("INSERT INTO boxes (game_id, box_in_game, player_id,"
                     "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
                     "%s, %s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
                     "game_id = game_id;")
+# text of the play-by-play rows marking the end of the game or of a period, in either notation
+GAME_END_MARKERS = ["game end", "end of game"]
+PERIOD_END_MARKERS = ["period end", "end of"]
 NULLABLE_PLAY_FIELDS = ["period", "time", "shot clock", "home score", "away score", "is away",
                         "action", "flag 1", "flag 2", "flag 3", "flag 4", "flag 5", "flag 6"]
 UPLOAD_PLAY_QUERY = ("INSERT INTO plays (game_id, play_in_game, period,"
                      "time_remaining, shot_clock, h_score, a_score,"
                      "agent_is_away, action, flag1, flag2, flag3, flag4,"
-                     "flag5, flag6, agent_id, agent_name, h_p1_id, h_p1_name,"
-                     "h_p2_id, h_p2_name, h_p3_id, h_p3_name, h_p4_id,"
-                     "h_p4_name, h_p5_id, h_p5_name, a_p1_id, a_p1_name,"
-                     "a_p2_id, a_p2_name, a_p3_id, a_p3_name, a_p4_id,"
-                     "a_p4_name, a_p5_id, a_p5_name) VALUES (%s, %s, %s, %s,"
+                     "flag5, flag6, possession, offense_is_away, agent_id,"
+                     "agent_name, h_p1_id, h_p1_name, h_p2_id, h_p2_name,"
+                     "h_p3_id, h_p3_name, h_p4_id, h_p4_name, h_p5_id,"
+                     "h_p5_name, a_p1_id, a_p1_name, a_p2_id, a_p2_name,"
+                     "a_p3_id, a_p3_name, a_p4_id, a_p4_name, a_p5_id,"
+                     "a_p5_name) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s,"
                      "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
                      "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
-                     "%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+                     "%s, %s) ON DUPLICATE KEY UPDATE "
                      "game_id = game_id;")
+UPSERT_PLAY_QUERY = ("INSERT INTO plays (game_id, play_in_game, period,"
+                     "time_remaining, shot_clock, h_score, a_score,"
+                     "agent_is_away, action, flag1, flag2, flag3, flag4,"
+                     "flag5, flag6, possession, offense_is_away, agent_id,"
+                     "agent_name, h_p1_id, h_p1_name, h_p2_id, h_p2_name,"
+                     "h_p3_id, h_p3_name, h_p4_id, h_p4_name, h_p5_id,"
+                     "h_p5_name, a_p1_id, a_p1_name, a_p2_id, a_p2_name,"
+                     "a_p3_id, a_p3_name, a_p4_id, a_p4_name, a_p5_id,"
+                     "a_p5_name) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s,"
+                     "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
+                     "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
+                     "%s, %s) ON DUPLICATE KEY UPDATE "
+                     "h_p1_id = VALUES(h_p1_id), h_p1_name = VALUES(h_p1_name),"
+                     "h_p2_id = VALUES(h_p2_id), h_p2_name = VALUES(h_p2_name),"
+                     "h_p3_id = VALUES(h_p3_id), h_p3_name = VALUES(h_p3_name),"
+                     "h_p4_id = VALUES(h_p4_id), h_p4_name = VALUES(h_p4_name),"
+                     "h_p5_id = VALUES(h_p5_id), h_p5_name = VALUES(h_p5_name),"
+                     "a_p1_id = VALUES(a_p1_id), a_p1_name = VALUES(a_p1_name),"
+                     "a_p2_id = VALUES(a_p2_id), a_p2_name = VALUES(a_p2_name),"
+                     "a_p3_id = VALUES(a_p3_id), a_p3_name = VALUES(a_p3_name),"
+                     "a_p4_id = VALUES(a_p4_id), a_p4_name = VALUES(a_p4_name),"
+                     "a_p5_id = VALUES(a_p5_id), a_p5_name = VALUES(a_p5_name),"
+                     "possession = VALUES(possession),"
+                     "offense_is_away = VALUES(offense_is_away);")
+GAME_COLUMNS = ["game_id", "h_team_season_id", "a_team_season_id", "h_name", "a_name", "start_time",
+                "location", "attendance", "referee1", "referee2", "referee3", "is_exhibition"]
+BOX_COLUMNS = ["game_id", "box_in_game", "player_id", "player_name", "is_away", "position",
+               "seconds_played", "fgm", "fga", "3pm", "3pa", "ftm", "fta", "orb", "drb", "ast",
+               "tov", "stl", "blk", "pf"]
+PLAY_COLUMNS = ["game_id", "play_in_game", "period", "time_remaining", "shot_clock", "h_score",
+                "a_score", "agent_is_away", "action", "flag1", "flag2", "flag3", "flag4", "flag5",
+                "flag6", "possession", "offense_is_away", "agent_id", "agent_name", "h_p1_id",
+                "h_p1_name", "h_p2_id", "h_p2_name", "h_p3_id", "h_p3_name", "h_p4_id",
+                "h_p4_name", "h_p5_id", "h_p5_name", "a_p1_id", "a_p1_name", "a_p2_id",
+                "a_p2_name", "a_p3_id", "a_p3_name", "a_p4_id", "a_p4_name", "a_p5_id",
+                "a_p5_name"]
+LINEUP_PLAY_COLUMNS = PLAY_COLUMNS[:PLAY_COLUMNS.index("h_p1_id")] + ["h_lineup_id",
+                                                                      "a_lineup_id"]
+UPLOAD_LINEUP_PLAY_QUERY = ("INSERT INTO lineup_plays (game_id, play_in_game,"
+                            "period, time_remaining, shot_clock, h_score, a_score,"
+                            "agent_is_away, action, flag1, flag2, flag3, flag4,"
+                            "flag5, flag6, possession, offense_is_away, agent_id,"
+                            "agent_name, h_lineup_id, a_lineup_id) VALUES (%s, %s,"
+                            "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,"
+                            "%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+                            "game_id = game_id;")
+STINT_COLUMNS = (["game_id", "stint_in_game", "period", "start_time", "end_time", "first_play",
+                  "last_play", "h_lineup_id", "a_lineup_id"]
+                 + [f"{team}_p{i}_id" for team in "ha" for i in range(1, 6)]
+                 + ["h_points", "a_points", "h_possessions", "a_possessions"]
+                 + [f"{team}_{field.lower()}" for team in "ha" for field in stints.STAT_FIELDS])
+UPLOAD_STINT_QUERY = (f"INSERT INTO stints ({', '.join(STINT_COLUMNS)}) VALUES "
+                      f"({', '.join(['%s'] * len(STINT_COLUMNS))}) ON DUPLICATE KEY UPDATE "
+                      f"game_id = game_id;")
+GAMES_TABLE = row_sync.RowTable("games", GAME_COLUMNS)
+BOXES_TABLE = row_sync.RowTable("boxes", BOX_COLUMNS, index_column="box_in_game")
+PLAYS_TABLE = row_sync.RowTable("plays", PLAY_COLUMNS, index_column="play_in_game")
+LINEUP_PLAYS_TABLE = row_sync.RowTable("lineup_plays", LINEUP_PLAY_COLUMNS,
+                                       index_column="play_in_game")
+STINTS_TABLE = row_sync.RowTable("stints", STINT_COLUMNS, index_column="stint_in_game")
 FETCH_TEAM_SEASON_ID_QUERY = ("SELECT team_season_id FROM team_seasons WHERE "
                               "school_id = %s AND season_year = %s")
 FETCH_DIVISION_CODE_QUERY = "SELECT division_code FROM seasons WHERE year = %s"
+FETCH_GAMES_MISSING_PLAYS_QUERY = ("SELECT game_id, start_time FROM games WHERE "
+                                   "start_time >= %s AND start_time < %s AND "
+                                   "game_id NOT IN (SELECT game_id FROM plays)")
+FETCH_GAMES_MISSING_LINEUP_PLAYS_QUERY = ("SELECT game_id, start_time FROM games WHERE "
+                                          "start_time >= %s AND start_time < %s AND "
+                                          "game_id NOT IN (SELECT game_id FROM lineup_plays)")
 FETCH_ROSTER_QUERY = ("SELECT player_id, player_name FROM player_seasons "
                       "WHERE team_season_id = %s")
 
+LOGGER = scrape_log.get_logger("scrape_games")
+
+
+class RunContext:
+    """What a run needs to upload games besides their pages, which are all the
+    scrape_util.Scraper fetches: the store failures are recorded in, the
+    lineups of a run storing plays by lineup ID and the model the plays are
+    scored with. Any of them can be None if the run doesn't use it.
+    """
+
+    def __init__(self, dead_letters=None, lineups=None, scorer=None):
+        """
+        Args:
+            dead_letters: The dead_letters.DeadLetterStore failed pages and
+                plays are recorded in.
+            lineups: The lineups.LineupCache plays are stored by lineup ID
+                with, instead of by player.
+            scorer: The win_probability.GameScorer the plays of each game are
+                scored with as it is uploaded."""
+        self.dead_letters = dead_letters
+        self.lineups = lineups
+        self.scorer = scorer
+
 
 # Below are functions for scraping game information from stats.ncaa.org.
 
 
 def scrape_range(start_year, start_month, start_day, end_year, end_month,
-                 end_day):
+                 end_day, parse_workers=0, report_path=None, metrics=None,
+                 budget_seconds=None, reupload=False, parse_cache_path=None,
+                 lineup_plays=False, scorer=None):
     """Scrape each game in the given date range and upload the results to the
-    database.
+    database. All scoreboards in the range are fetched first, so the games of
+    every day can be scheduled together by priority: games from the last few
+    days of the range first, then games from shortly before the range that
+    are missing their play-by-play, then the rest of the range (see
+    crawl_scheduler). Games an earlier run deferred at its time budget are
+    scheduled again in the classes they were deferred in.
 
     Args:
         start_year: The year of the first date of games to scrape, inclusive.
@@ -77,54 +195,172 @@ def scrape_range(start_year, start_month, start_day, end_year, end_month,
         start_day: The day of the first date of games to scrape, inclusive.
         end_year: The year of the last date of games to scrape, exclusive.
         end_month: The month of the last date of games to scrape, exclusive.
-        end_day: The day of the last date of games to scrape, exclusive."""
-    scraper = scrape_util.Scraper(thread_count=DEFAULT_THREAD_COUNT,
-                                      verbose=VERBOSE)
-    conn = connect_to_db()
+        end_day: The day of the last date of games to scrape, exclusive.
+        parse_workers: The number of worker processes to parse pages in. If 0,
+            pages are parsed in this process.
+        report_path: The path to write the JSON summary of the run's timings
+            and counters to. If None, uses PATH_RUN_REPORT.
+        metrics: The instrument.Metrics to record the run in, e.g. one with
+            hooks added to forward metrics to monitoring. If None, a new one
+            is made.
+        budget_seconds: The number of seconds the run may take. Once the
+            budget is spent, the run stops after committing the games it has
+            finished, and writes the games it did not reach to
+            crawl_scheduler.PATH_DEFERRED, where the next run picks them up.
+            If None, every game is scraped.
+        reupload: True to compare each game to the rows already in the
+            database and write only the rows that differ (see upload_game),
+            e.g. to reprocess a season after a parser fix.
+        parse_cache_path: The path of a parse_cache.ParseCache for the parse
+            workers to keep the output of each parsing stage in, so games
+            whose pages, rosters and parser stages have not changed are not
+            parsed again. Only used if parse_workers is greater than 0.
+        lineup_plays: True to store plays in the lineup_plays table, which
+            refers to the players on the court by lineup ID, instead of the
+            plays table (see upload_lineup_plays).
+        scorer: The win_probability.GameScorer to score the plays of each game
+            with as it is uploaded, or None to not score them.
+
+    Pages, play rows and plays that fail are recorded in the dead-letter store
+    at dead_letters.PATH_DEAD_LETTERS (see reprocess_dead_letters).
+
+    Returns:
+        The summary of the run, as returned by instrument.Metrics.summary."""
+    scheduler = crawl_scheduler.CrawlScheduler(budget_seconds)
+    store = dead_letters.DeadLetterStore()
+    conn = database.connect_to_db()
     cursor = conn.cursor()
+    ensure_schema(cursor, lineup_plays=lineup_plays, scorer=scorer)
+    context = RunContext(dead_letters=store,
+                         lineups=lineups.LineupCache() if lineup_plays else None,
+                         scorer=scorer)
+    scraper = scrape_util.Scraper(thread_count=DEFAULT_THREAD_COUNT, metrics=metrics)
+    engine = None
+    if parse_workers > 0:
+        engine = parse_engine.ParseEngine(workers=parse_workers, cache_path=parse_cache_path)
+
+    # find every game in the range before scraping any of them
+    start_date = datetime.date(start_year, start_month, start_day)
+    end_date = datetime.date(end_year, end_month, end_day)
+    with scraper.metrics.timer('enumerate_games'):
+        scheduler.add_range(enumerate_games(scraper, start_date, end_date), end_date)
+        for game in fetch_games_missing_plays(
+                cursor, start_date - datetime.timedelta(crawl_scheduler.MISSING_PBP_DAYS),
+                start_date, lineup_plays=lineup_plays):
+            scheduler.add(game, crawl_scheduler.MISSING_PBP)
+        deferred = scheduler.load_deferred()
+    if deferred > 0:
+        LOGGER.info("Picked up %s games deferred by an earlier run.", deferred)
+
+    # scrape the games in batches, committing after each one
+    def run_batch(priority, games):
+        scrape_work(scraper, cursor, games, engine=engine,
+                    by_pbp=(priority == crawl_scheduler.MISSING_PBP), reupload=reupload,
+                    context=context)
+        with scraper.metrics.timer('commit'):
+            conn.commit()
+
+    scheduler_report = scheduler.run(run_batch, scraper.metrics)
+    if engine is not None:
+        engine.shutdown()
+    store.close()
+    scheduler.write_deferred()
+    if len(scheduler) > 0:
+        LOGGER.warning("Stopped at the time budget. Deferred: %s",
+                       {name: len(box_ids) for name, box_ids
+                        in scheduler_report['deferred'].items()})
+    else:
+        LOGGER.info("Finished scraping all days in range.")
 
-    # make the dates into datetime objects
-    start_date = datetime.datetime(start_year, start_month, start_day)
-    end_date = datetime.datetime(end_year, end_month, end_day)
+    if report_path is None:
+        report_path = PATH_RUN_REPORT
+    return scraper.metrics.write_report(report_path)
 
-    # get the season code
-    season = start_year
-    if start_month > 6:
-        season += 1
-    season_code = [division['code'] for division in YEAR_DIVISIONS
-                   if division['year'] == season][0]
 
-    # iterate through each day in the date range
-    while start_date < end_date:
-        # get the current day and increment
-        year = start_date.year
-        month = start_date.month
-        day = start_date.day
-        start_date += datetime.timedelta(1)
+def find_season(date):
+    """Finds the season that a date is in.
+
+    Args:
+        date: A datetime.date.
+
+    Returns:
+        A tuple of the year of the season (the year it ends in) and the
+        stats.ncaa.org code of the season, or None as the code if the season is
+        not in YEAR_DIVISIONS."""
+    season = date.year
+    if date.month > 6:
+        season += 1
+    season_codes = [division['code'] for division in YEAR_DIVISIONS
+                    if division['year'] == season]
+    return season, season_codes[0] if len(season_codes) > 0 else None
 
-        # scrape all games from that day
-        scrape_day(scraper, cursor, year, month, day, season, season_code)
-        conn.commit()
 
-    scraper.log("Finished scraping all days in range.", 0)
+def enumerate_games(scraper, start_date, end_date):
+    """Fetches the scoreboards of every day in a date range concurrently and
+    lists the games played on them.
 
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        start_date: The first date to list games from, inclusive, as a
+            datetime.date.
+        end_date: The last date to list games from, exclusive.
 
-def scrape_day(scraper, cursor, year, month, day, season, season_code):
-    """Scrapes all games on the given date.
+    Returns:
+        The work list of the range: a list of dicts with the keys 'box ID',
+        'season' and 'date', one per game, in order of date. A game listed on
+        more than one scoreboard appears only once, on its first date."""
+    dates = []
+    date = start_date
+    while date < end_date:
+        season, season_code = find_season(date)
+        if season_code is None:
+            LOGGER.warning("No division code for season %s. (Date: %s)", season, date)
+        else:
+            dates.append((date, season, season_code))
+        date += datetime.timedelta(1)
+
+    def fetch_day(day):
+        date, _, season_code = day
+        LOGGER.info("Started listing day. (Date: %s/%s/%s)", date.month, date.day, date.year)
+        return scrape_box_ids(scraper, date.year, date.month, date.day, season_code)
+
+    work = []
+    seen_box_ids = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCOREBOARD_THREADS) as executor:
+        for (date, season, _), box_ids in zip(dates, executor.map(fetch_day, dates)):
+            for box_id in box_ids:
+                if box_id not in seen_box_ids:
+                    seen_box_ids.add(box_id)
+                    work.append({'box ID': box_id, 'season': season, 'date': date})
+    scraper.metrics.count('games listed', len(work))
+    return work
+
+
+def scrape_work(scraper, cursor, work, engine=None, by_pbp=False, reupload=False,
+                context=None):
+    """Scrapes and uploads every game in a work list. The pages of as many games
+    are fetched at once as the scraper's crawl_control.CrawlController allows,
+    while the games already fetched are parsed and uploaded in this thread.
 
     Args:
         scraper: The src.scrape_util.Scraper object used to scrape webpages.
         cursor: The pymysql cursor of the database connection.
-        year: The year of the date of games to scrape.
-        month: The month of the date of games to scrape.
-        day: The day of the date of games to scrape.
-        season: The year of the season that the date is in.
-        season_code: The stats.ncaa.org code of the season."""
-    scraper.log(f"Started parsing day. (Date: {month}/{day}/{year})", 0)
-    box_ids = scrape_box_ids(scraper, year, month, day, season_code)
-    for box_id in box_ids:
-        scrape_game(scraper, cursor, season, box_id)
-    time.sleep(CRAWL_DELAY)
+        work: A work list of games, as returned by enumerate_games.
+        engine: The parse_engine.ParseEngine to parse pages in, or None to
+            parse them in this process.
+        by_pbp: True if the 'box ID' of each game is its PBP ID instead.
+        reupload: True to write only the rows that differ from the database.
+        context: The RunContext of the run, or None."""
+    if engine is not None:
+        scrape_games_pooled(scraper, cursor, work, engine, by_pbp=by_pbp,
+                            reupload=reupload, context=context)
+    else:
+        fetched = scraper.controller.map(
+            lambda game: fetch_game(scraper, game['season'], game['box ID'], by_pbp=by_pbp,
+                                    context=context), work)
+        for game, pages in zip(work, fetched):
+            upload_fetched_game(scraper, cursor, game['season'], game['box ID'], pages,
+                                by_pbp=by_pbp, reupload=reupload, context=context)
 
 
 def scrape_box_ids(scraper, year, month, day, season_code):
@@ -140,30 +376,32 @@ def scrape_box_ids(scraper, year, month, day, season_code):
     Returns:
         The list of box IDs from the games on that date. If the scoreboard
         could not be found, returns None instead."""
-    retries_left = MAX_RETRIES
-    while retries_left > 0:
+    budget = scraper.controller.new_budget()
+    url = f"http://stats.ncaa.org/season_divisions/{season_code}/scoreboards?" \
+          f"game_date={month}%2F{day}%2F{year}"
+    while True:
         # open the page
-        url = f"http://stats.ncaa.org/season_divisions/{season_code}/scoreboards?" \
-              f"game_date={month}%2F{day}%2F{year}"
-        soup = scraper.open_page(url=url)
-
-        # inexplicably, sometimes the soup will be set in the scraper but return None anyway
-        if soup is None:
-            scraper.log(f"Soup did not return. (URL: {url})")
-            soup = scraper.last_soup
+        page = scraper.open_page(url=url, budget=budget)
+        if page is None:
+            return []
 
         try:
-            return find_box_ids(soup)
+            with scraper.metrics.timer('find_box_ids'):
+                return find_box_ids(page.soup)
         except AttributeError as e:
-            scraper.log(f"Error parsing day: '{e}' (Date: {month}/{day}/{year})")
-            retries_left -= 1
-            if retries_left <= 0:
-                scraper.log(f"Done retrying. (Date: {month}/{day}/{year})", 0)
+            LOGGER.info("Error parsing day: '%s' (Date: %s/%s/%s)", e, month, day,
+                        year, extra={'url': url})
+            if not budget.spend_parse():
+                LOGGER.warning("Done retrying. (Date: %s/%s/%s)", month, day,
+                               year, extra={'url': url})
                 return []
-        time.sleep(CRAWL_DELAY)
+        finally:
+            page.release()
+        time.sleep(scraper.controller.backoff(budget.parse_retries))
 
 
-def scrape_game(scraper, cursor, season, box_id, by_pbp=False):
+def scrape_game(scraper, cursor, season, box_id, by_pbp=False, reupload=False, status=None,
+                context=None):
     """Gets and uploads all information from the game at the given box ID.
 
     Args:
@@ -172,16 +410,81 @@ def scrape_game(scraper, cursor, season, box_id, by_pbp=False):
         season: The year of the season in which the game was played.
         box_id: The box ID of the game (or PBP ID, if by_pbp is True
         by_pbp: True if the game is being scraped by PBP ID instead of box
-            ID."""
-    box_soup = scrape_box_score(scraper, box_id, by_pbp=by_pbp)
-    if box_soup is not None:
-        pbp_id = find_pbp_id(box_soup)
+            ID.
+        reupload: True to write only the rows that differ from the database.
+        status: A dict in which 'final' is set to whether the play-by-play
+            shows that the game has ended (see is_game_over), or None.
+        context: The RunContext of the run, or None.
+
+    Returns:
+        The plays of the game, as a list of dicts. If the box score could not
+        be found, returns None instead."""
+    pages = fetch_game(scraper, season, box_id, by_pbp=by_pbp, context=context)
+    return upload_fetched_game(scraper, cursor, season, box_id, pages, by_pbp=by_pbp,
+                               reupload=reupload, status=status, context=context)
+
+
+def fetch_game(scraper, season, box_id, by_pbp=False, context=None):
+    """Fetches the box score and play-by-play pages of a game. Only pages are
+    fetched, without using the database, so the pages of several games can be
+    fetched at once (see crawl_control.CrawlController.map).
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        season: The year of the season in which the game was played.
+        box_id: The box ID of the game (or PBP ID, if by_pbp is True).
+        by_pbp: True if the game is identified by PBP ID instead of box ID.
+        context: The RunContext of the run, or None.
+
+    Returns:
+        None if a viable box score could not be found. Otherwise, a tuple of
+        the scrape_util.Page of the box score, the PBP ID of the game and the
+        scrape_util.Page of the play-by-play, or None as the play-by-play if a
+        viable page could not be found."""
+    box_page = scrape_box_score(scraper, box_id, by_pbp=by_pbp, season=season, context=context)
+    if box_page is None:
+        return None
+    with scraper.metrics.timer('find_pbp_id'):
+        pbp_id = find_pbp_id(box_page.soup)
+    return box_page, pbp_id, scrape_plays(scraper, pbp_id, season=season, context=context)
+
+
+def upload_fetched_game(scraper, cursor, season, box_id, pages, by_pbp=False, reupload=False,
+                        status=None, context=None):
+    """Parses and uploads the pages of a game fetched by fetch_game.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object the game was fetched with.
+        cursor: The pymysql cursor of the database connection.
+        season: The year of the season in which the game was played.
+        box_id: The box ID of the game (or PBP ID, if by_pbp is True).
+        pages: The pages of the game, as returned by fetch_game.
+        by_pbp: True if the game is identified by PBP ID instead of box ID.
+        reupload: True to write only the rows that differ from the database.
+        status: A dict in which 'final' is set, as in scrape_game, or None.
+        context: The RunContext of the run, or None.
+
+    Returns:
+        The same as scrape_game."""
+    if pages is None:
+        return None
+    context = context or RunContext()
+    metrics = scraper.metrics
+    box_page, pbp_id, pbp_page = pages
+    box_soup = box_page.soup
+    metrics.count('games')
+    with metrics.timer('find_game_time'):
         game_time = find_game_time(box_soup)
+    with metrics.timer('find_location'):
         location = find_location(box_soup)
+    with metrics.timer('find_attendance'):
         attendance = find_attendance(box_soup)
+    with metrics.timer('find_referees'):
         referees = find_referees(box_soup)
+    with metrics.timer('find_team_ids'):
         h_team_season_id, a_team_season_id, h_school_id, a_school_id \
             = find_team_ids(box_soup)
+    with metrics.timer('fetch_team_season_id'):
         if h_team_season_id is None:
             h_team_season_id = fetch_team_season_id(cursor,
                                                     h_school_id,
@@ -190,95 +493,429 @@ def scrape_game(scraper, cursor, season, box_id, by_pbp=False):
             a_team_season_id = fetch_team_season_id(cursor,
                                                     a_school_id,
                                                     season)
+    with metrics.timer('find_names_and_exhibition'):
         h_name, a_name, is_exhibition = find_names_and_exhibition(box_soup)
+    with metrics.timer('fetch_roster'):
         h_roster = fetch_roster(cursor, h_team_season_id)
         a_roster = fetch_roster(cursor, a_team_season_id)
-        upload_game(cursor, pbp_id, h_team_season_id, a_team_season_id, h_name,
-                    a_name, game_time, location, attendance, referees,
-                    is_exhibition)
+    with metrics.timer('upload_game'):
+        count_rows(metrics, upload_game(cursor, pbp_id, h_team_season_id, a_team_season_id,
+                                        h_name, a_name, game_time, location, attendance,
+                                        referees, is_exhibition, reupload=reupload))
 
+    with metrics.timer('find_raw_boxes'):
         raw_boxes = find_raw_boxes(box_soup)
+    with metrics.timer('clean_raw_boxes'):
         boxes = clean_raw_boxes(raw_boxes, h_roster, a_roster)
-        upload_boxes(cursor, pbp_id, boxes)
-
-        pbp_soup = scrape_plays(scraper, pbp_id)
-        if pbp_soup is not None:
-            raw_plays = find_raw_plays(pbp_soup)
-            plays = parse_all_plays(raw_plays, h_roster, a_roster)
+    box_page.release()
+    with metrics.timer('upload_boxes'):
+        count_rows(metrics, upload_boxes(cursor, pbp_id, boxes, reupload=reupload))
+
+    if pbp_page is not None:
+        with metrics.timer('find_raw_plays'):
+            raw_plays = find_raw_plays(pbp_page.soup)
+        pbp_page.release()
+        errors = []
+        with metrics.timer('parse_all_plays'):
+            plays = parse_all_plays(raw_plays, h_roster, a_roster, errors=errors)
+        record_dead_letters(scraper, context, 'parse play', box_id, errors, season=season,
+                            by_pbp=by_pbp, url=pbp_page.url)
+        if status is not None:
+            status['final'] = is_game_over(plays, raw_plays)
+        with metrics.timer('track_shot_clock'):
             track_shot_clock(plays)
+        with metrics.timer('assign_possessions'):
+            possessions.assign_possessions(plays)
+        with metrics.timer('track_partic'):
             track_partic(plays)
+        with metrics.timer('correct_time_played'):
             correct_time_played(boxes, plays)
-            upload_plays(cursor, pbp_id, plays)
+        errors = []
+        with metrics.timer('upload_plays'):
+            if context.lineups is not None:
+                count_rows(metrics, upload_lineup_plays(
+                    cursor, pbp_id, plays, (h_team_season_id, a_team_season_id),
+                    context.lineups, errors=errors, reupload=reupload))
+            else:
+                count_rows(metrics, upload_plays(cursor, pbp_id, plays, errors=errors,
+                                                 reupload=reupload))
+        with metrics.timer('find_stints'):
+            game_stints = stints.find_stints(plays, lineup_matrix.LineupMatrix(plays))
+        with metrics.timer('upload_stints'):
+            count_rows(metrics, upload_stints(cursor, pbp_id, game_stints,
+                                              (h_team_season_id, a_team_season_id),
+                                              lineup_cache=context.lineups, reupload=reupload))
+        if context.scorer is not None:
+            with metrics.timer('win_probability'):
+                context.scorer.upload_game(cursor, pbp_id, season, game_time,
+                                           (h_team_season_id, a_team_season_id), plays)
+        record_dead_letters(scraper, context, 'upload play', box_id, errors, season=season,
+                            by_pbp=by_pbp)
+        metrics.count('plays', len(plays))
+        return plays
+    return []
+
+
+def scrape_games_pooled(scraper, cursor, work, engine, by_pbp=False, reupload=False,
+                        context=None):
+    """Gets and uploads all information from the games in a work list,
+    fetching the pages of as many games at once as the scraper's crawl
+    controller allows, in threads of this process, while the worker
+    processes of the parse engine parse the pages of games fetched earlier.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        cursor: The pymysql cursor of the database connection.
+        work: A work list of games, as returned by enumerate_games. If by_pbp
+            is True, the 'box ID' of each game is its PBP ID instead.
+        engine: The parse_engine.ParseEngine to parse pages in.
+        by_pbp: True if the games are being scraped by PBP ID instead of box
+            ID.
+        reupload: True to write only the rows that differ from the database.
+        context: The RunContext of the run, or None."""
+    in_flight = []
+    fetched = scraper.controller.map(
+        lambda work_game: fetch_game_pages(scraper, work_game['season'], work_game['box ID'],
+                                           by_pbp=by_pbp, context=context), work)
+    for game in fetched:
+        if game is not None:
+            submit_game(scraper, cursor, game, engine)
+            in_flight.append(game)
+
+        # upload any games that have finished parsing, in the order they were fetched
+        while (len(in_flight) > 0) and in_flight[0]['future'].done():
+            upload_parsed_game(scraper, cursor, in_flight.pop(0), engine, reupload=reupload,
+                               context=context)
+
+    for game in in_flight:
+        upload_parsed_game(scraper, cursor, game, engine, reupload=reupload, context=context)
+
+
+def fetch_game_pages(scraper, season, box_id, by_pbp=False, context=None):
+    """Fetches the box score and play-by-play pages of a game and finds the
+    metadata and raw boxes of the box score. As in fetch_game, the database
+    is not used, so the pages of several games can be fetched at once.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        season: The year of the season in which the game was played.
+        box_id: The box ID of the game (or PBP ID, if by_pbp is True).
+        by_pbp: True if the game is identified by PBP ID instead of box ID.
+        context: The RunContext of the run, or None.
+
+    Returns:
+        None if a viable box score could not be found. Otherwise, a dict with
+        the keys 'metadata' (the game's metadata, as returned by
+        find_box_metadata), 'raw boxes', 'pbp html' (the raw play-by-play
+        page, or None if it could not be fetched) and 'work' (the season, box
+        ID and by_pbp the game was fetched with), to pass to submit_game."""
+    if by_pbp:
+        url = f"http://stats.ncaa.org/game/box_score/{box_id}"
+    else:
+        url = f"http://stats.ncaa.org/contests/{box_id}/box_score"
+
+    metadata = None
+    failure = (None, "Could not fetch page.")
+    budget = scraper.controller.new_budget()
+    while True:
+        box_page = scraper.open_page(url=url, budget=budget)
+        if box_page is None:
+            break
+        # the box score page is small, so it is parsed here, once, and only its raw boxes are
+        # sent to the workers along with the play-by-play page
+        try:
+            with scraper.metrics.timer('find_box_metadata'):
+                raw_boxes = find_raw_boxes(box_page.soup)
+                metadata = find_box_metadata(box_page.soup)
+            break
+        except (AttributeError, IndexError) as e:
+            LOGGER.info("Error parsing box score: '%s'", e,
+                        extra={'url': url, 'box_id': box_id})
+            failure = (box_page.content, e)
+            if not budget.spend_parse():
+                break
+        finally:
+            box_page.release()
+        time.sleep(scraper.controller.backoff(budget.parse_retries))
+
+    if metadata is None:
+        LOGGER.warning("Done retrying.", extra={'url': url, 'box_id': box_id})
+        record_dead_letters(scraper, context, 'box score', box_id, [failure], season=season,
+                            by_pbp=by_pbp, url=url)
+        return None
+
+    pbp_page = scraper.open_page(
+        url=f"http://stats.ncaa.org/game/play_by_play/{metadata['pbp ID']}")
+    pbp_html = pbp_page.content if pbp_page is not None else None
+    if pbp_page is None:
+        record_dead_letters(scraper, context, 'play-by-play', metadata['pbp ID'],
+                            [(None, "Could not fetch page.")], season=season,
+                            by_pbp=True)
+    return {
+        'metadata': metadata,
+        'raw boxes': raw_boxes,
+        'pbp html': pbp_html,
+        'work': (season, box_id, by_pbp)
+    }
+
+
+def submit_game(scraper, cursor, game, engine):
+    """Finds the team season IDs and rosters of a game fetched by
+    fetch_game_pages and submits its raw boxes and play-by-play page to the
+    parse engine.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object the game was fetched with.
+        cursor: The pymysql cursor of the database connection.
+        game: A dict returned by fetch_game_pages. The keys 'team season IDs'
+            (the home and away team season IDs), 'pages' (the raw boxes, the
+            raw play-by-play page and the rosters the game was submitted with)
+            and 'future' (the future of the packed boxes and plays and the
+            play rows that could not be parsed) are added to it.
+        engine: The parse_engine.ParseEngine to parse pages in."""
+    season = game['work'][0]
+    h_team_season_id, a_team_season_id, h_school_id, a_school_id \
+        = game['metadata']['team IDs']
+    if h_team_season_id is None:
+        h_team_season_id = fetch_team_season_id(cursor, h_school_id, season)
+    if a_team_season_id is None:
+        a_team_season_id = fetch_team_season_id(cursor, a_school_id, season)
+    with scraper.metrics.timer('fetch_roster'):
+        h_roster = fetch_roster(cursor, h_team_season_id)
+        a_roster = fetch_roster(cursor, a_team_season_id)
+
+    scraper.metrics.count('games')
+    game['team season IDs'] = (h_team_season_id, a_team_season_id)
+    game['pages'] = (game.pop('raw boxes'), game.pop('pbp html'), h_roster, a_roster)
+    game['future'] = engine.submit(*game['pages'])
+
+
+def wait_for_parse(scraper, game, engine, context=None):
+    """Waits for a game submitted by submit_game to finish parsing. If
+    its play-by-play page could not be parsed, the page is fetched and
+    submitted again, the same way scrape_plays retries it; once out of
+    retries, the failure is dead-lettered and the game is parsed without
+    plays.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object the game was fetched with.
+        game: A dict submitted by submit_game. Its 'pages' and 'future' are
+            replaced by those of the last submission.
+        engine: The parse_engine.ParseEngine the game was submitted to.
+        context: The RunContext of the run, or None.
+
+    Returns:
+        The packed boxes and plays of the game and the list of
+        (play row, exception) tuples of the rows that could not be parsed,
+        as returned by parse_engine.parse_game."""
+    season = game['work'][0]
+    pbp_id = game['metadata']['pbp ID']
+    url = f"http://stats.ncaa.org/game/play_by_play/{pbp_id}"
+    budget = scraper.controller.new_budget()
+    while True:
+        try:
+            return game['future'].result()
+        except AttributeError as e:
+            raw_boxes, pbp_html, h_roster, a_roster = game['pages']
+            LOGGER.info("Error parsing play-by-play: '%s'", e,
+                        extra={'url': url, 'pbp_id': pbp_id})
+            if budget.spend_parse():
+                time.sleep(scraper.controller.backoff(budget.parse_retries))
+                pbp_page = scraper.open_page(url=url, budget=budget)
+                if pbp_page is None:
+                    record_dead_letters(scraper, context, 'play-by-play', pbp_id,
+                                        [(None, "Could not fetch page.")], season=season,
+                                        by_pbp=True, url=url)
+                pbp_html = pbp_page.content if pbp_page is not None else None
+            else:
+                LOGGER.warning("Done retrying.", extra={'url': url, 'pbp_id': pbp_id})
+                record_dead_letters(scraper, context, 'play-by-play', pbp_id, [(pbp_html, e)],
+                                    season=season, by_pbp=True, url=url)
+                pbp_html = None
+            game['pages'] = (raw_boxes, pbp_html, h_roster, a_roster)
+            game['future'] = engine.submit(*game['pages'])
+
 
+def upload_parsed_game(scraper, cursor, game, engine, reupload=False, context=None):
+    """Waits for a game submitted by submit_game to finish parsing and
+    uploads it. As in scrape_game, a game without a usable play-by-play page
+    has only its metadata and boxes uploaded, so plays stored before are kept.
 
-def scrape_box_score(scraper, box_id, by_pbp=False):
-    """Gets box score information for the game.
+    Args:
+        scraper: The src.scrape_util.Scraper object the game was fetched with.
+        cursor: The pymysql cursor of the database connection.
+        game: A dict submitted by submit_game.
+        engine: The parse_engine.ParseEngine the game was submitted to.
+        reupload: True to write only the rows that differ from the database.
+        context: The RunContext of the run, or None."""
+    context = context or RunContext()
+    metrics = scraper.metrics
+    season, box_id, by_pbp = game['work']
+    metadata = game['metadata']
+    h_team_season_id, a_team_season_id = game['team season IDs']
+    h_name, a_name, is_exhibition = metadata['team names']
+    with metrics.timer('upload_game'):
+        count_rows(metrics, upload_game(cursor, metadata['pbp ID'], h_team_season_id,
+                                        a_team_season_id, h_name, a_name, metadata['game time'],
+                                        metadata['location'], metadata['attendance'],
+                                        metadata['referees'], is_exhibition, reupload=reupload))
+
+    # only the time spent waiting on the workers is seen from this process
+    with metrics.timer('wait for parse'):
+        record, errors = wait_for_parse(scraper, game, engine, context=context)
+        boxes, plays = parse_engine.unpack_game(record)
+    record_dead_letters(scraper, context, 'parse play', box_id, errors, season=season,
+                        by_pbp=by_pbp)
+    with metrics.timer('upload_boxes'):
+        count_rows(metrics, upload_boxes(cursor, metadata['pbp ID'], boxes, reupload=reupload))
+    if game['pages'][1] is None:
+        return
+    with metrics.timer('assign_possessions'):
+        possessions.assign_possessions(plays)
+    errors = []
+    with metrics.timer('upload_plays'):
+        if context.lineups is not None:
+            count_rows(metrics, upload_lineup_plays(
+                cursor, metadata['pbp ID'], plays, game['team season IDs'], context.lineups,
+                errors=errors, reupload=reupload))
+        else:
+            count_rows(metrics, upload_plays(cursor, metadata['pbp ID'], plays, errors=errors,
+                                             reupload=reupload))
+    with metrics.timer('find_stints'):
+        game_stints = stints.find_stints(plays, lineup_matrix.LineupMatrix(plays))
+    with metrics.timer('upload_stints'):
+        count_rows(metrics, upload_stints(cursor, metadata['pbp ID'], game_stints,
+                                          game['team season IDs'], lineup_cache=context.lineups,
+                                          reupload=reupload))
+    if context.scorer is not None:
+        with metrics.timer('win_probability'):
+            context.scorer.upload_game(cursor, metadata['pbp ID'], season, metadata['game time'],
+                                       game['team season IDs'], plays)
+    record_dead_letters(scraper, context, 'upload play', box_id, errors, season=season,
+                        by_pbp=by_pbp)
+    metrics.count('plays', len(plays))
+
+
+def scrape_box_score(scraper, box_id, by_pbp=False, season=None, context=None):
+    """Gets box score information for the game. If no viable page can be
+    found, the failure is dead-lettered.
 
     Args:
         scraper: The src.scrape_util.Scraper object used to scrape webpages.
         box_id: The NCAA box ID of the game (or PBP ID, if by_pbp is True)
         by_pbp: True if the game is identified by PBP ID instead of box ID.
+        season: The year of the season of the game, recorded with any
+            failure so the game can be reprocessed.
+        context: The RunContext of the run, or None.
 
     Returns:
-        None if a viable soup could not be found; if a soup could be found,
-        returns a bs4.BeautifulSoup object of the box score webpage."""
-    retries_left = MAX_RETRIES
-    while retries_left > 0:
+        None if a viable page could not be found; otherwise, the
+        scrape_util.Page of the box score webpage."""
+    budget = scraper.controller.new_budget()
+    if by_pbp:
+        url = f"http://stats.ncaa.org/game/box_score/{box_id}"
+    else:
+        url = f"http://stats.ncaa.org/contests/{box_id}/box_score"
+    while True:
         # open the page
-        if by_pbp:
-            url = f"http://stats.ncaa.org/game/box_score/{box_id}"
-        else:
-            url = f"http://stats.ncaa.org/contests/{box_id}/box_score"
-        soup = scraper.open_page(url=url)
-
-        # inexplicably, sometimes the soup will not return anything despite existing
-        if soup is None:
-            scraper.log(f"Soup did not return. Box ID: {box_id}", 4)
-            soup = scraper.last_soup
+        page = scraper.open_page(url=url, budget=budget)
+        if page is None:
+            record_dead_letters(scraper, context, 'box score', box_id,
+                                [(None, "Could not fetch page.")], season=season, by_pbp=by_pbp,
+                                url=url)
+            return None
 
         try:
-            find_raw_boxes(soup)    # janky bellwether for whether the soup is usable
-            return soup
+            find_raw_boxes(page.soup)    # janky bellwether for whether the soup is usable
+            return page
         except AttributeError as e:
-            scraper.log(f"Error parsing box score: '{e}' (Box ID: {box_id})")
-            if retries_left <= 0:
-                scraper.log(f"Done retrying. (Box ID: {box_id})", 1)
+            page.release()
+            LOGGER.info("Error parsing box score: '%s'", e,
+                        extra={'url': url, 'box_id': box_id})
+            if not budget.spend_parse():
+                LOGGER.warning("Done retrying.",
+                               extra={'url': url, 'box_id': box_id})
+                record_dead_letters(scraper, context, 'box score', box_id, [(page.content, e)],
+                                    season=season, by_pbp=by_pbp, url=url)
                 return None
-        retries_left -= 1
-        time.sleep(CRAWL_DELAY)
+        time.sleep(scraper.controller.backoff(budget.parse_retries))
 
 
-def scrape_plays(scraper, pbp_id):
-    """Gets all plays from the game with the given PBP ID.
+def scrape_plays(scraper, pbp_id, season=None, context=None):
+    """Gets all plays from the game with the given PBP ID. If no viable page
+    can be found, the failure is dead-lettered.
 
     Args:
         scraper: The src.scrape_util.Scraper object used to scrape webpages.
         pbp_id: The NCAA PBP ID of the game.
+        season: The year of the season of the game, recorded with any
+            failure so the game can be reprocessed.
+        context: The RunContext of the run, or None.
 
     Returns:
-        None if a viable soup could not be found; if a soup could be found,
-        returns a bs4.BeautifulSoup object of the play-by-play webpage."""
-    retries_left = MAX_RETRIES
-    while retries_left > 0:
+        None if a viable page could not be found; otherwise, the
+        scrape_util.Page of the play-by-play webpage."""
+    budget = scraper.controller.new_budget()
+    url = f"http://stats.ncaa.org/game/play_by_play/{pbp_id}"
+    while True:
         # open the page
-        url = f"http://stats.ncaa.org/game/play_by_play/{pbp_id}"
-        soup = scraper.open_page(url=url)
-
-        # inexplicably, sometimes the soup will be set in the scraper but return None anyway
-        if soup is None:
-            scraper.log(f"Soup did not return. PBP ID: {pbp_id}")
-            soup = scraper.last_soup
+        page = scraper.open_page(url=url, budget=budget)
+        if page is None:
+            record_dead_letters(scraper, context, 'play-by-play', pbp_id,
+                                [(None, "Could not fetch page.")], season=season, by_pbp=True,
+                                url=url)
+            return None
 
         try:
-            find_raw_plays(soup)  # janky bellwether for whether the soup is usable
-            return soup
+            find_raw_plays(page.soup)  # janky bellwether for whether the soup is usable
+            return page
         except AttributeError as e:
-            scraper.log(f"Error parsing play-by-play: '{e}' (PBP ID: {pbp_id})")
-            retries_left -= 1
-            if retries_left <= 0:
-                scraper.log(f"Done retrying. (PBP ID: {pbp_id})", 1)
+            page.release()
+            LOGGER.info("Error parsing play-by-play: '%s'", e,
+                        extra={'url': url, 'pbp_id': pbp_id})
+            if not budget.spend_parse():
+                LOGGER.warning("Done retrying.",
+                               extra={'url': url, 'pbp_id': pbp_id})
+                record_dead_letters(scraper, context, 'play-by-play', pbp_id, [(page.content, e)],
+                                    season=season, by_pbp=True, url=url)
                 return None
-        time.sleep(CRAWL_DELAY)
+        time.sleep(scraper.controller.backoff(budget.parse_retries))
+
+
+def record_dead_letters(scraper, context, stage, game_id, failures, season=None,
+                        by_pbp=False, url=None):
+    """Counts the failures of one stage of a game and records them in the
+    dead-letter store of the run, if it has one.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object of the run.
+        context: The RunContext of the run, or None.
+        stage: The name of the stage that failed, e.g. 'box score'.
+        game_id: The ID the game was scraped by: its box ID, or its PBP ID if
+            by_pbp is True.
+        failures: A list of (raw input, exception) tuples, as described in
+            dead_letters.DeadLetterStore.add.
+        season: The year of the season of the game, if known.
+        by_pbp: True if game_id is a PBP ID.
+        url: The URL of the page the failures came from, if any."""
+    if len(failures) == 0:
+        return
+    scraper.metrics.count('dead letters', len(failures))
+    if (context is not None) and (context.dead_letters is not None):
+        context.dead_letters.add(stage, game_id, failures, PARSER_VERSION,
+                                 season=season, by_pbp=by_pbp, url=url)
+
+
+def count_rows(metrics, counts):
+    """Adds the counts of rows written, deleted and left unchanged by a
+    re-upload to the metrics of the run. Does nothing if counts is None, as
+    it is when not re-uploading."""
+    if counts is None:
+        return
+    written, deleted, unchanged = counts
+    metrics.count('rows written', written)
+    metrics.count('rows deleted', deleted)
+    metrics.count('rows unchanged', unchanged)
 
 
 # Below are functions dedicated to extracting information from BeautifulSoup
@@ -511,12 +1148,16 @@ def find_raw_boxes(soup):
     return boxes
 
 
-def find_raw_plays(soup):
+def find_raw_plays(soup, first_period=0):
     """Given a play-by-play page, find the plays in the game.
 
     Args:
         soup: A bs4.BeautifulSoup object of a stats.ncaa.org play-by-play
             webpage.
+        first_period: The period of the first table of plays in the soup. If
+            greater than 0, the soup is taken to be the tail of a page
+            starting at that period's table, without the summary table the
+            full page starts with.
 
     Returns:
         The plays of the game as a list of lists, each sub-list representing
@@ -528,8 +1169,11 @@ def find_raw_plays(soup):
         score formatted like "46-41" with away team first,
         home team play]"""
     plays = []
-    period = 0
-    for el_table in soup.find_all('table', class_='mytable')[1:]:
+    period = first_period
+    el_tables = soup.find_all('table', class_='mytable')
+    if first_period == 0:
+        el_tables = el_tables[1:]   # skip the summary table
+    for el_table in el_tables:
         for el_tr in el_table.find_all('tr'):
             play_row = [period]
             for el_td in el_tr.find_all('td'):
@@ -541,6 +1185,34 @@ def find_raw_plays(soup):
     return plays
 
 
+def find_box_metadata(soup):
+    """Given a box score page, find all the metadata of the game.
+
+    Args:
+        soup: A bs4.BeautifulSoup object of a stats.ncaa.org box score webpage.
+
+    Returns:
+        A dict with the keys and values:
+        'pbp ID': The PBP ID of the game.
+        'game time': The start time of the game, as returned by find_game_time.
+        'location': The location of the game, or None if it is not listed.
+        'attendance': The attendance of the game, or None if it is not listed.
+        'referees': A list of the names of the three referees.
+        'team IDs': The team season IDs and school IDs of each team, as
+            returned by find_team_ids.
+        'team names': The names of each team and whether the game was an
+            exhibition, as returned by find_names_and_exhibition."""
+    return {
+        'pbp ID': find_pbp_id(soup),
+        'game time': find_game_time(soup),
+        'location': find_location(soup),
+        'attendance': find_attendance(soup),
+        'referees': find_referees(soup),
+        'team IDs': find_team_ids(soup),
+        'team names': find_names_and_exhibition(soup)
+    }
+
+
 # Below are functions dedicated to cleaning values found by the raw box score
 # parsing functions, specifically parsing the actual box scores themselves and
 # not the game metadata.
@@ -767,19 +1439,21 @@ def clean_stat(raw_stat):
 # Below are functions for interacting with the database.
 
 
-def connect_to_db():
-    """Opens and returns a connection to the database as specified in a txt
-    file.
+def ensure_schema(cursor, lineup_plays=False, scorer=None):
+    """Creates the tables and columns added since the database was first set up, if they don't
+    exist, so every entry point that uploads games can run against an older database.
 
-    Returns:
-        A pymysql connection to the database specified in the text file
-        PATH_DATABASE_INFO."""
-    with open(PATH_DATABASE_INFO, 'r') as db_info_file:
-        host = db_info_file.readline()[:-1]
-        user = db_info_file.readline()[:-1]
-        password = db_info_file.readline()[:-1]
-        db = db_info_file.readline()
-    return pymysql.connect(host, user, password, db)
+    Args:
+        cursor: The pymysql cursor of the database connection.
+        lineup_plays: True to also create the tables of lineups.
+        scorer: The win_probability.GameScorer the plays will be scored
+            with, whose tables are also created, or None."""
+    stints.create_tables(cursor)
+    possessions.add_columns(cursor)
+    if lineup_plays:
+        lineups.create_tables(cursor)
+    if scorer is not None:
+        scorer.create_tables(cursor)
 
 
 def fetch_division_code(cursor, year):
@@ -795,6 +1469,33 @@ def fetch_division_code(cursor, year):
     return cursor.fetchone()[0]
 
 
+def fetch_games_missing_plays(cursor, start_date, end_date, lineup_plays=False):
+    """Fetches the games in the database that have no plays, so their
+    play-by-play can be scraped again.
+
+    Args:
+        cursor: The cursor of the pymysql database connection.
+        start_date: The first date of games to fetch, inclusive, as a
+            datetime.date.
+        end_date: The last date of games to fetch, exclusive.
+        lineup_plays: True to look for the plays in the lineup_plays table,
+            where a run storing plays by lineup ID uploads them, instead of
+            the plays table.
+
+    Returns:
+        A work list of the games, in the format returned by enumerate_games,
+        except that the 'box ID' of each game is its PBP ID."""
+    query = FETCH_GAMES_MISSING_LINEUP_PLAYS_QUERY if lineup_plays \
+        else FETCH_GAMES_MISSING_PLAYS_QUERY
+    cursor.execute(query, (start_date.strftime('%Y/%m/%d'), end_date.strftime('%Y/%m/%d')))
+    work = []
+    for game_id, start_time in cursor.fetchall():
+        date = datetime.datetime.strptime(str(start_time)[:10].replace("-", "/"),
+                                          '%Y/%m/%d').date()
+        work.append({'box ID': game_id, 'season': find_season(date)[0], 'date': date})
+    return work
+
+
 def fetch_team_season_id(cursor, school_id, season):
     """Get the team season ID of the team with the specified school ID in the
     given season.
@@ -841,8 +1542,11 @@ def fetch_roster(cursor, team_season_id):
 
 def upload_game(cursor, game_id, h_team_season_id, a_team_season_id, h_name,
                 a_name, start_time, location, attendance, referees,
-                is_exhibition):
-    """Uploads the given game metadata to the database.
+                is_exhibition, reupload=False):
+    """Uploads the given game metadata to the database. Games that were
+    already uploaded are left as they are, unless reupload is True, in which
+    case the row is compared to the database and rewritten only if it
+    differs. The same goes for upload_boxes and upload_plays.
 
     Args:
         cursor: The pymysql cursor object of the database connection.
@@ -855,7 +1559,12 @@ def upload_game(cursor, game_id, h_team_season_id, a_team_season_id, h_name,
         location: The location of the game.
         attendance: The attendance of the game.
         referees: A list of the referees of the game.
-        is_exhibition: Whether the game was an exhibition."""
+        is_exhibition: Whether the game was an exhibition.
+        reupload: True to write the row only if it differs from the database.
+
+    Returns:
+        If reupload is True, the counts of rows written, deleted and left
+        unchanged, as returned by row_sync.RowTable.sync. Otherwise, None."""
     if game_id is None:
         raise ValueError('Game ID not found.')
     if h_name is None:
@@ -867,19 +1576,26 @@ def upload_game(cursor, game_id, h_team_season_id, a_team_season_id, h_name,
     game_tuple = (game_id, h_team_season_id, a_team_season_id, h_name, a_name,
                   start_time, location, attendance, referees[0], referees[1],
                   referees[2], is_exhibition)
+    if reupload:
+        return GAMES_TABLE.sync(cursor, game_id, [game_tuple])
     try:
         cursor.execute(UPLOAD_GAME_QUERY, game_tuple)
     except pymysql.IntegrityError:
         pass
 
 
-def upload_boxes(cursor, game_id, boxes):
+def upload_boxes(cursor, game_id, boxes, reupload=False):
     """Uploads the given box scores to the database.
 
     Args:
         cursor: The pymysql cursor object of the database connection.
         game_id: The PBP ID of the game.
-        boxes: The boxes in the game as a list of dicts."""
+        boxes: The boxes in the game as a list of dicts.
+        reupload: True to write only the boxes that differ from the database.
+
+    Returns:
+        The same as upload_game."""
+    box_tuples = []
     i = 0   # tracks which box it is in the game
     for box in boxes:
         box_tuple = (game_id, i)
@@ -887,56 +1603,208 @@ def upload_boxes(cursor, game_id, boxes):
             if field not in box:
                 box[field] = None   # replace nullable fields with None
             box_tuple += (box[field],)
+        box_tuples.append(box_tuple)
+        i += 1
 
+    if reupload:
+        return BOXES_TABLE.sync(cursor, game_id, box_tuples)
+    for box_tuple in box_tuples:
         try:
             cursor.execute(UPLOAD_BOX_QUERY, box_tuple)
         except pymysql.IntegrityError:
             pass
-        i += 1
 
 
-def upload_plays(cursor, game_id, plays):
-    """Uploads the given plays to the database.
+def upload_plays(cursor, game_id, plays, errors=None, reupload=False):
+    """Uploads the given plays to the database. Plays that can't be uploaded
+    are skipped, so the rest of the game is still uploaded.
 
     Args:
         cursor: The pymysql cursor object of the database connection.
         game_id: The PBP ID of the game.
-        plays: The plays in the game as a list of dicts."""
+        plays: The plays in the game as a list of dicts.
+        errors: A list to which a (play, exception) tuple is appended
+            for each play that could not be uploaded, or None to only log
+            them.
+        reupload: True to write only the plays that differ from the database.
+
+    Returns:
+        The same as upload_game."""
+    if reupload:
+        play_tuples = []
+        for i, play in enumerate(plays):
+            try:
+                play_tuples.append(make_play_tuple(game_id, i, play))
+            except TypeError as e:
+                LOGGER.error("Error uploading play %s: '%s'", i, e, extra={'pbp_id': game_id})
+                if errors is not None:
+                    errors.append((play, e))
+        return PLAYS_TABLE.sync(cursor, game_id, play_tuples)
+
     i = 0   # tracks which play it is in the game
     for play in plays:
-        play_tuple = (game_id, i)
-        for field in NULLABLE_PLAY_FIELDS:
-            if field not in play:
-                play[field] = None
-            play_tuple += (play[field],)
-
-        play_tuple += (play['player']['player ID'], play['player']['name'])
-        for player in play['home partic']:
-            play_tuple += (player['player ID'], player['name'])
-        for player in play['away partic']:
-            play_tuple += (player['player ID'], player['name'])
-
         try:
-            cursor.execute(UPLOAD_PLAY_QUERY, play_tuple)
+            cursor.execute(UPLOAD_PLAY_QUERY, make_play_tuple(game_id, i, play))
         except pymysql.IntegrityError:
             pass
-        except TypeError:
-            breakpoint()
-        except pymysql.InternalError:
-            breakpoint()
+        except (TypeError, pymysql.InternalError) as e:
+            LOGGER.error("Error uploading play %s: '%s'", i, e, extra={'pbp_id': game_id})
+            if errors is not None:
+                errors.append((play, e))
         i += 1
 
 
+def upload_lineup_plays(cursor, game_id, plays, team_season_ids, lineup_cache,
+                        errors=None, reupload=False):
+    """Uploads the given plays to the lineup_plays table, which stores the
+    players on the court as the IDs of the home and away lineups (see
+    lineups.LineupCache) instead of ten player ID and name pairs. Player
+    names are left to player_seasons; the plays_wide view shows the plays in
+    the shape of the plays table.
+
+    Args:
+        cursor: The pymysql cursor object of the database connection.
+        game_id: The PBP ID of the game.
+        plays: The plays in the game as a list of dicts.
+        team_season_ids: The home and away team season IDs of the game.
+        lineup_cache: The lineups.LineupCache of the run.
+        errors: A list to which a (play, exception) tuple is appended for
+            each play that could not be uploaded, or None to only log them.
+        reupload: True to write only the plays that differ from the database.
+
+    Returns:
+        The same as upload_game."""
+    h_lineup_ids = lineup_cache.assign(cursor, team_season_ids[0],
+                                       [play['home partic'] for play in plays])
+    a_lineup_ids = lineup_cache.assign(cursor, team_season_ids[1],
+                                       [play['away partic'] for play in plays])
+    play_tuples = []
+    for i, play in enumerate(plays):
+        try:
+            play_tuple = make_play_tuple(game_id, i, dict(play, **{'home partic': [],
+                                                                   'away partic': []}))
+            play_tuples.append(play_tuple + (h_lineup_ids[i], a_lineup_ids[i]))
+        except TypeError as e:
+            LOGGER.error("Error uploading play %s: '%s'", i, e, extra={'pbp_id': game_id})
+            if errors is not None:
+                errors.append((play, e))
+
+    if reupload:
+        return LINEUP_PLAYS_TABLE.sync(cursor, game_id, play_tuples)
+    if len(play_tuples) > 0:
+        cursor.executemany(UPLOAD_LINEUP_PLAY_QUERY, play_tuples)
+
+
+def upload_stints(cursor, game_id, game_stints, team_season_ids, lineup_cache=None,
+                  reupload=False):
+    """Uploads the stints of a game (see stints.find_stints) to the stints
+    table in one batch, so lineup analyses can read a few dozen stints per
+    game instead of every play.
+
+    Args:
+        cursor: The pymysql cursor object of the database connection.
+        game_id: The PBP ID of the game.
+        game_stints: The stints of the game, as returned by
+            stints.find_stints.
+        team_season_ids: The home and away team season IDs of the game.
+        lineup_cache: The lineups.LineupCache of the run, if plays are stored
+            by lineup ID, so stints get lineup IDs too. Otherwise, stints are
+            identified by their players alone.
+        reupload: True to write only the stints that differ from the
+            database.
+
+    Returns:
+        The same as upload_game."""
+    h_lineup_ids = [None] * len(game_stints)
+    a_lineup_ids = [None] * len(game_stints)
+    if lineup_cache is not None:
+        h_lineup_ids = lineup_cache.assign(cursor, team_season_ids[0],
+                                           [stint['home lineup'] for stint in game_stints])
+        a_lineup_ids = lineup_cache.assign(cursor, team_season_ids[1],
+                                           [stint['away lineup'] for stint in game_stints])
+
+    stint_tuples = []
+    for i, stint in enumerate(game_stints):
+        stint_tuple = (game_id, i, stint['period'], stint['start time'], stint['end time'],
+                       stint['first play'], stint['last play'], h_lineup_ids[i],
+                       a_lineup_ids[i])
+        stint_tuple += tuple(lineups.make_player_ids(stint['home lineup']))
+        stint_tuple += tuple(lineups.make_player_ids(stint['away lineup']))
+        stint_tuple += (stint['home points'], stint['away points'],
+                        round(stint['home possessions'], 2), round(stint['away possessions'], 2))
+        stint_tuple += tuple(stint['home stats'][field] for field in stints.STAT_FIELDS)
+        stint_tuple += tuple(stint['away stats'][field] for field in stints.STAT_FIELDS)
+        stint_tuples.append(stint_tuple)
+
+    if reupload:
+        return STINTS_TABLE.sync(cursor, game_id, stint_tuples)
+    if len(stint_tuples) > 0:
+        cursor.executemany(UPLOAD_STINT_QUERY, stint_tuples)
+
+
 # Below are functions for parsing a play from the play-by-play logs.
 
 
-def parse_all_plays(raw_plays, h_roster, a_roster):
+def make_play_tuple(game_id, play_in_game, play):
+    """Makes the tuple of values of a play for UPLOAD_PLAY_QUERY or
+    UPSERT_PLAY_QUERY.
+
+    Args:
+        game_id: The PBP ID of the game.
+        play_in_game: The index of the play in the game.
+        play: The play, as a dict. Missing nullable fields are set to None,
+            and so are its possession fields if assign_possessions has not
+            been run on it.
+
+    Returns:
+        The values of the play as a tuple."""
+    play_tuple = (game_id, play_in_game)
+    for field in NULLABLE_PLAY_FIELDS:
+        if field not in play:
+            play[field] = None
+        play_tuple += (play[field],)
+
+    play_tuple += (play.get('possession'), play.get('offense is away'))
+    play_tuple += (play['player']['player ID'], play['player']['name'])
+    for player in play['home partic']:
+        play_tuple += (player['player ID'], player['name'])
+    for player in play['away partic']:
+        play_tuple += (player['player ID'], player['name'])
+    return play_tuple
+
+
+def upsert_plays(cursor, game_id, indexed_plays):
+    """Inserts the given plays of a game, or updates them if they were already
+    uploaded. Used while a game is in progress, when plays already uploaded
+    can still gain players on the court. Since correct_time_played can't be
+    run until the game is over, teams with fewer than 5 players on the court
+    are padded with unknown players, and teams with more are cut to 5.
+
+    Args:
+        cursor: The pymysql cursor object of the database connection.
+        game_id: The PBP ID of the game.
+        indexed_plays: A list of (index of the play in the game, play) tuples."""
+    unknown = {'player ID': None, 'name': None}
+    play_tuples = []
+    for play_in_game, play in indexed_plays:
+        play = dict(play, **{
+            'home partic': (play['home partic'] + [unknown] * 5)[:5],
+            'away partic': (play['away partic'] + [unknown] * 5)[:5]
+        })
+        play_tuples.append(make_play_tuple(game_id, play_in_game, play))
+    if len(play_tuples) > 0:
+        cursor.executemany(UPSERT_PLAY_QUERY, play_tuples)
+
+
+def parse_all_plays(raw_plays, h_roster, a_roster, errors=None):
     """Parses all plays in the game that can be parsed.
 
     Args:
         raw_plays: A list of the raw play rows of the play-by-play log.
         h_roster: The home team's roster, as a list of dicts.
         a_roster: The away team's roster, as a list of dicts.
+        errors: A list to which a (play row, exception) tuple is appended for
+            each row that could not be parsed, or None to skip them silently.
 
     Returns:
         All the plays that could be parsed, as a list of dicts of parsed
@@ -947,11 +1815,44 @@ def parse_all_plays(raw_plays, h_roster, a_roster):
             play = parse_play_row(play_row, h_roster, a_roster)
             if play is not None:
                 plays.append(play)
-        except ValueError:
-            pass
+        except ValueError as e:
+            if errors is not None:
+                errors.append((play_row, e))
     return plays
 
 
+def is_game_over(plays, raw_plays=None):
+    """Finds whether the play-by-play of a game shows that the game has ended. The rows marking
+    the end of a period or the game are dropped by parse_play_row, and the last play of a real
+    game often comes before 0:00, so the raw rows are checked for them: an end-of-game row, or an
+    end-of-period row in the second half or later with the score not tied. Failing that, the game
+    has ended if its last play is at the end of the second half or an overtime with the score
+    not tied.
+
+    Args:
+        plays: The parsed plays of the game, as a list of dicts.
+        raw_plays: The raw play rows of the game, as returned by
+            find_raw_plays, or None if they are not at hand.
+
+    Returns:
+        True if the game has ended."""
+    for play_row in reversed(raw_plays or []):
+        text = f"{play_row[2]} {play_row[4]}".lower()
+        if any(marker in text for marker in GAME_END_MARKERS):
+            return True
+        if any(marker in text for marker in PERIOD_END_MARKERS):
+            scores = clean_score(play_row[3])
+            return (play_row[0] >= 1) and (scores['home'] is not None) \
+                and (scores['home'] != scores['away'])
+        if len(text.strip()) > 0:
+            break   # the last row is a play, not the end of a period
+    if len(plays) == 0:
+        return False
+    last_play = plays[-1]
+    return (last_play['period'] >= 1) and (last_play['time'] == 0) \
+        and (last_play['home score'] != last_play['away score'])
+
+
 def parse_play_row(play_row, h_roster, a_roster):
     """From a list representing a row of play-by-play data, extracts the
     information about the play that occurred and returns it as a dict.
@@ -1781,7 +2682,7 @@ def parse_semicolon_three_pointer(play, player):
 # play-by-play logs from a game and fixing irregularities.
 
 
-def track_shot_clock(plays, max_shot_clock=30, orb_to_20=True):
+def track_shot_clock(plays, max_shot_clock=30, orb_to_20=True, state=None):
     """Tracks the number of seconds on the shot clock when each event happened
     and adds the shot clock to the dict of each play at the index 'shot clock'.
 
@@ -1792,10 +2693,20 @@ def track_shot_clock(plays, max_shot_clock=30, orb_to_20=True):
         orb_to_20: Whether the shot clock resets to 20 seconds after an
             offensive rebound. Before the 2018–19 season the shot clock always
             reset to the maximum after offensive rebounds, so this should be
-            set to false for seasons before 2019."""
-    shot_clock = max_shot_clock
-    last_play_time = 1200
-    shot_clock_end = 1200 - shot_clock
+            set to false for seasons before 2019.
+        state: The state returned by an earlier call, if plays continues the
+            plays passed to that call. If None, tracking starts at the
+            beginning of the game.
+
+    Returns:
+        The state of the shot clock after the last play, as a dict to pass to
+        the next call if more plays of the game arrive."""
+    if state is None:
+        state = {'shot clock': max_shot_clock, 'time': 1200,
+                 'shot clock end': 1200 - max_shot_clock}
+    shot_clock = state['shot clock']
+    last_play_time = state['time']
+    shot_clock_end = state['shot clock end']
 
     for play in plays:
         if play['time'] != last_play_time:
@@ -1811,8 +2722,10 @@ def track_shot_clock(plays, max_shot_clock=30, orb_to_20=True):
             else:
                 shot_clock_end = max(play['time'] - max_shot_clock, 0)
 
+    return {'shot clock': shot_clock, 'time': last_play_time, 'shot clock end': shot_clock_end}
+
 
-def track_partic(plays):
+def track_partic(plays, state=None):
     """Tracks which players were on the court during each play and records
     participation in each play's dict. Constructs lists of the players (as
     dicts of 'player ID' and 'name') and adds the list of home players on the
@@ -1821,14 +2734,32 @@ def track_partic(plays):
     are errors in the scorekeeping; this is corrected by correct_minutes.
 
     Args:
-        plays: The parsed list of plays in the game, as a list of dicts."""
-    h_partic = []
-    a_partic = []
-    backfilled = []
-    last_period = 0
-    last_time = 1200
-    last_h_partic = []
-    last_a_partic = []
+        plays: The parsed list of plays in the game, as a list of dicts.
+        state: The state returned by an earlier call, if plays continues the
+            plays passed to that call. If None, tracking starts at the
+            beginning of the game.
+
+    Returns:
+        The state of the tracking after the last play, as a dict to pass to
+        the next call if more plays of the game arrive. Its 'changed' list
+        holds the plays from earlier calls whose participation was changed by
+        this call (players are backfilled onto earlier plays in the same
+        period when they first appear)."""
+    if state is None:
+        state = {'home partic': [], 'away partic': [], 'backfilled': [], 'period': 0,
+                 'time': 1200, 'last home partic': [], 'last away partic': [],
+                 'period plays': []}
+    h_partic = state['home partic']
+    a_partic = state['away partic']
+    backfilled = state['backfilled']
+    last_period = state['period']
+    last_time = state['time']
+    last_h_partic = state['last home partic']
+    last_a_partic = state['last away partic']
+    period_plays = state['period plays']
+    earlier_plays = period_plays
+    earlier_count = len(period_plays)
+    changed_lists = set()
 
     # go for the front and make a list of players known so far
     for play in plays:
@@ -1839,6 +2770,7 @@ def track_partic(plays):
             a_partic = []
             h_partic = []
             backfilled = []
+            period_plays = []
             last_period = play['period']
             last_time = 1200
             last_a_partic = []
@@ -1852,6 +2784,7 @@ def track_partic(plays):
 
         play['home partic'] = last_h_partic
         play['away partic'] = last_a_partic
+        period_plays.append(play)
 
         # no need to change participation if no player did this action
         if (player['name'] != "Floor") and (player['name'] != "Team"):
@@ -1861,12 +2794,11 @@ def track_partic(plays):
                     h_partic.append(player)
 
                 if (player not in backfilled) and not subbed_in:
-                    for prev_play in plays:
-                        if 'home partic' in prev_play:
-                            if (prev_play['period'] == play['period']) \
-                                    and (prev_play['time'] >= play['time']) \
-                                    and (player not in prev_play['home partic']):
-                                prev_play['home partic'].append(player)
+                    for prev_play in period_plays:
+                        if (prev_play['time'] >= play['time']) \
+                                and (player not in prev_play['home partic']):
+                            prev_play['home partic'].append(player)
+                            changed_lists.add(id(prev_play['home partic']))
 
                     # update subs
                     last_a_partic = a_partic.copy()
@@ -1884,12 +2816,11 @@ def track_partic(plays):
                     a_partic.append(player)
 
                 if (player not in backfilled) and not subbed_in:
-                    for prev_play in plays:
-                        if 'away partic' in prev_play:
-                            if (prev_play['period'] == play['period']) \
-                                    and (prev_play['time'] >= play['time']) \
-                                    and (player not in prev_play['away partic']):
-                                prev_play['away partic'].append(player)
+                    for prev_play in period_plays:
+                        if (prev_play['time'] >= play['time']) \
+                                and (player not in prev_play['away partic']):
+                            prev_play['away partic'].append(player)
+                            changed_lists.add(id(prev_play['away partic']))
 
                     # update subs
                     last_a_partic = a_partic.copy()
@@ -1902,60 +2833,41 @@ def track_partic(plays):
                 if (play['action'] == "substitution") and not play['flag 3'] and (player in a_partic):
                     a_partic.remove(player)
 
+    # plays at the same time share their lists of players, so look for the changed lists
+    changed_earlier = []
+    if len(changed_lists) > 0:
+        changed_earlier = [play for play in earlier_plays[:earlier_count]
+                           if (id(play['home partic']) in changed_lists)
+                           or (id(play['away partic']) in changed_lists)]
 
-def get_time_discrepancies(boxes, plays):
+    return {'home partic': h_partic, 'away partic': a_partic, 'backfilled': backfilled,
+            'period': last_period, 'time': last_time, 'last home partic': last_h_partic,
+            'last away partic': last_a_partic, 'period plays': period_plays,
+            'changed': changed_earlier}
+
+
+def get_time_discrepancies(boxes, plays, matrix=None):
     """Finds the difference between the time each player is listed as playing
     in the box score and the time implied by play-by-play data.
 
     Args:
         plays: The parsed list of plays in the game, as a list of dicts.
         boxes: The parsed list of boxes in the game, as a list of dicts.
+        matrix: The lineup_matrix.LineupMatrix of the game, or None to build
+            it.
 
     Returns:
         A dict for each team from player name to player dict and time
         discrepancy (keys 'player', 'disrepancy'). Home team first."""
-    h_minutes = dict()
-    a_minutes = dict()
-    for player in boxes:
-        if player['name'] != "Team":
-            if player['is away']:
-                a_minutes[player['name']] = {
-                    'player': {
-                        'player ID': player['player ID'],
-                        'name': player['name']
-                    },
-                    'discrepancy': player['time played']
-                }
-            else:
-                h_minutes[player['name']] = {
-                    'player': {
-                        'player ID': player['player ID'],
-                        'name': player['name']
-                    },
-                    'discrepancy': player['time played']
-                }
-
-    # calculate the playing time inferred from play-by-play compared to the box score
-    last_time = 1200
-    last_period = 0
-    for play in plays:
-        if play['period'] == last_period:
-            time_diff = last_time - int(play['time'])
-        else:
-            time_diff = last_time
-
-        last_time = int(play['time'])
-        last_period = play['period']
-
-        try:
-            for player in play['home partic']:
-                h_minutes[player['name']]['time played'] -= time_diff
-            for player in play['away partic']:
-                a_minutes[player['name']]['time played'] -= time_diff
-        except KeyError:
-            pass
-
-    return h_minutes, a_minutes
+    if matrix is None:
+        matrix = lineup_matrix.LineupMatrix(plays, boxes)
+    minutes = ({}, {})
+    for team, roster, in_box, discrepancies in zip(range(2), matrix.rosters, matrix.in_box,
+                                                   matrix.discrepancies()):
+        for player, listed, discrepancy in zip(roster, in_box, discrepancies):
+            if listed:
+                minutes[team][player['name']] = {'player': player, 'discrepancy': discrepancy}
+    return minutes
 
 
 def correct_time_played(boxes, plays):
@@ -1968,101 +2880,128 @@ def correct_time_played(boxes, plays):
     Args:
         plays: The parsed list of plays in the game, as a list of dicts.
         boxes: The parsed list of boxes in the game, as a list of dicts."""
-    h_minutes, a_minutes = get_time_discrepancies(boxes, plays)
-
-    last_time = 1200
-    last_period = 0
+    matrix = lineup_matrix.LineupMatrix(plays, boxes)
+    h_discrepancies, a_discrepancies = matrix.discrepancies()
 
     # add or remove players who are logged as playing too many or too few minutes if more or fewer
-    # than 5 people are on the court for each team
-    for play in plays:
-        if play['period'] == last_period:
-            time_diff = last_time - int(play['time'])
+    # than 5 people are on the court for each team; plays at the same time share their lists, so
+    # a play may already have been fixed by the time it is reached
+    wrong_size = (matrix.home.sum(axis=1) != 5) | (matrix.away.sum(axis=1) != 5)
+    for i in np.flatnonzero(wrong_size):
+        fix_lineup(plays[i]['home partic'], matrix, False, h_discrepancies, matrix.seconds[i])
+        fix_lineup(plays[i]['away partic'], matrix, True, a_discrepancies, matrix.seconds[i])
+
+
+def fix_lineup(partic, matrix, is_away, discrepancies, seconds):
+    """Adds the players of the box score with the most extra seconds to a list
+    of players on the court while it has fewer than 5, or removes those with
+    the fewest while it has more, and updates their discrepancies.
+
+    Args:
+        partic: The list of players on the court of one team on a play.
+        matrix: The lineup_matrix.LineupMatrix of the game.
+        is_away: Whether the team is the away team.
+        discrepancies: The array of box score minus play-by-play seconds of
+            each player of the team's roster in the matrix.
+        seconds: The seconds of game time credited to the play."""
+    roster = matrix.rosters[int(is_away)]
+    in_box = matrix.in_box[int(is_away)]
+    while len(partic) != 5:
+        on_court = np.zeros(len(roster), dtype=bool)
+        for player in partic:
+            if player is not None:
+                on_court[matrix.column(is_away, player)] = True
+        if len(partic) < 5:
+            candidates = in_box & ~on_court
+            if not candidates.any():
+                break
+            column = np.argmax(np.where(candidates, discrepancies, -np.inf))
+            partic.append(roster[column])
+            discrepancies[column] -= seconds
         else:
-            time_diff = last_time
-
-        last_time = int(play['time'])
-        last_period = play['period']
-
-        # add the players with the most extra minutes to partic1 if there
-        # are less than 5
-        while len(play['home partic']) < 5:
-            max_player = None
-            max_discrepancy = None
-
-            for player_name in h_minutes:
-                player = h_minutes[player_name]
-                if (player['player'] not in play['home partic']) \
-                        and ((max_discrepancy is None)
-                             or (player['discrepancy'] > max_discrepancy)):
-                    max_player = player['player']
-                    max_discrepancy = player['discrepancy']
-
-            play['home partic'].append(max_player)
-            h_minutes[max_player['name']]['discrepancy'] -= time_diff
-
-        # add the players with the most extra minutes to partic2 if there
-        # are less than 5
-        while len(play['away partic']) < 5:
-            max_player = None
-            max_discrepancy = None
-
-            for player_name in a_minutes:
-                player = a_minutes[player_name]
-                if (player['player'] not in play['away partic']) \
-                        and ((max_discrepancy is None)
-                             or (player['discrepancy'] > max_discrepancy)):
-                    max_player = player['player']
-                    max_discrepancy = player['discrepancy']
-
-            play['away partic'].append(max_player)
-            a_minutes[max_player['name']]['discrepancy'] -= time_diff
-
-        # remove the players with the most extra plays from partic1 if there
-        # are more than 5
-        while len(play['home partic']) > 5:
-            min_player = None
-            min_discrepancy = None
-
-            for player_name in h_minutes:
-                player = h_minutes[player_name]
-                if (player['player'] in play['home partic']) \
-                        and ((min_discrepancy is None)
-                             or (player['discrepancy'] < min_discrepancy)):
-                    min_player = player['player']
-                    min_discrepancy = player['discrepancy']
-
-            play['home partic'].remove(min_player)
-            h_minutes[min_player['name']]['discrepancy'] += time_diff
-
-        # remove the players with the most extra plays from partic2 if there
-        # are more than 5
-        while len(play['away partic']) > 5:
-            min_player = None
-            min_discrepancy = None
-
-            for player_name in a_minutes:
-                player = a_minutes[player_name]
-                if (player['player'] in play['away partic']) \
-                        and ((min_discrepancy is None)
-                             or (player['discrepancy'] < min_discrepancy)):
-                    min_player = player['player']
-                    min_discrepancy = player['discrepancy']
-
-            play['away partic'].remove(min_player)
-            a_minutes[min_player['name']]['discrepancy'] += time_diff
-
-
-# Main method. Going to be entirely rewritten eventually.
+            candidates = in_box & on_court
+            if not candidates.any():
+                break
+            column = np.argmin(np.where(candidates, discrepancies, np.inf))
+            partic.remove(roster[column])
+            discrepancies[column] += seconds
+
+
+def reprocess_dead_letters(scraper, conn, context):
+    """Scrapes again only the games with unresolved failures in a dead-letter
+    store. Each game is re-uploaded, so rows from the failed run are
+    corrected. After a game is scraped again, its old failures are resolved;
+    any that still happen are recorded again with the current PARSER_VERSION.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        conn: The pymysql connection to the database.
+        context: The RunContext of the run. Its dead_letters is the
+            dead_letters.DeadLetterStore to replay, where new failures are
+            recorded too.
+
+    Returns:
+        The number of games scraped again."""
+    cursor = conn.cursor()
+    ensure_schema(cursor, lineup_plays=(context.lineups is not None), scorer=context.scorer)
+    store = context.dead_letters
+    games = dead_letters.group_by_game(store.pending())
+    for (game_id, by_pbp), failures in games.items():
+        season = next((failure['season'] for failure in failures
+                       if failure['season'] is not None), None)
+        LOGGER.info("Reprocessing %s failures.", len(failures),
+                    extra={'box_id': game_id})
+        scrape_game(scraper, cursor, season, game_id, by_pbp=by_pbp, reupload=True,
+                    context=context)
+        with scraper.metrics.timer('commit'):
+            conn.commit()
+        store.resolve([failure['dead letter ID'] for failure in failures])
+    return len(games)
+
+
+# Main method. Going to be entirely rewritten eventually. Takes --parse-workers N to parse pages
+# in N worker processes and --lineup-plays to store plays by lineup ID, anywhere in the arguments.
 
 
 def main(argv):
-    if len(argv) == 6:
-        scrape_range(int(argv[0]), int(argv[1]), int(argv[2]), int(argv[3]), int(argv[4]), int(argv[5]))
+    scrape_log.configure()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--parse-workers', type=int, default=0)
+    parser.add_argument('--lineup-plays', action='store_true')
+    options, argv = parser.parse_known_args(argv)
+    # score the plays of each game as it is uploaded, once a model has been fit
+    model = win_probability.load_model()
+    scorer = win_probability.GameScorer(model) if model is not None else None
+    range_options = {'parse_workers': options.parse_workers,
+                     'lineup_plays': options.lineup_plays, 'scorer': scorer}
+
+    if argv[:1] == ['reprocess']:
+        with dead_letters.DeadLetterStore() as store:
+            context = RunContext(dead_letters=store,
+                                 lineups=lineups.LineupCache() if options.lineup_plays else None,
+                                 scorer=scorer)
+            scraper = scrape_util.Scraper(thread_count=DEFAULT_THREAD_COUNT)
+            count = reprocess_dead_letters(scraper, database.connect_to_db(), context)
+        LOGGER.info("Reprocessed %s games.", count)
+    elif (argv[:1] == ['possessions']) and (len(argv) == 7):
+        count = possessions.backfill(database.connect_to_db(),
+                                     datetime.date(int(argv[1]), int(argv[2]), int(argv[3])),
+                                     datetime.date(int(argv[4]), int(argv[5]), int(argv[6])))
+        LOGGER.info("Assigned possessions to %s plays.", count)
+    elif (argv[:1] == ['reupload']) and (len(argv) == 7):
+        scrape_range(int(argv[1]), int(argv[2]), int(argv[3]), int(argv[4]), int(argv[5]), int(argv[6]),
+                     reupload=True, **range_options)
+    elif len(argv) == 7:
+        scrape_range(int(argv[0]), int(argv[1]), int(argv[2]), int(argv[3]), int(argv[4]), int(argv[5]),
+                     budget_seconds=float(argv[6]), **range_options)
+    elif len(argv) == 6:
+        scrape_range(int(argv[0]), int(argv[1]), int(argv[2]), int(argv[3]), int(argv[4]), int(argv[5]),
+                     **range_options)
     else:
         today = datetime.datetime.today()
         yesterday = today - datetime.timedelta(1)
-        scrape_range(yesterday.year, yesterday.month, yesterday.day, today.year, today.month, today.day)
+        scrape_range(yesterday.year, yesterday.month, yesterday.day, today.year, today.month, today.day,
+                     **range_options)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+ROOT_LOGGER_NAME = "ncaa"
+DEFAULT_LEVEL = logging.INFO
+LOG_FIELDS = ["url", "box_id", "pbp_id", "attempt", "latency"]
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each log record as one JSON object per line. Besides the time, level, logger and
+    message, any of the fields in LOG_FIELDS that were passed in the record's extra dict are
+    included as their own keys so they can be filtered on without parsing the message.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in LOG_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Puts log records on a queue without formatting them first. The stdlib QueueHandler formats
+    every record in the calling thread; leaving that to the listener thread means the only cost
+    of logging to a fetch worker is putting a record on a queue.
+    """
+
+    def __init__(self, log_queue, listener):
+        super().__init__(log_queue)
+        self.listener = listener
+
+    def prepare(self, record):
+        return record
+
+
+def get_logger(name):
+    """Returns the logger with the given name, as a child of the scraper's root logger."""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def configure(level=DEFAULT_LEVEL, path=None):
+    """Sends all of the scraper's logging through a queue to a background thread that writes it
+    as JSON lines. Safe to call more than once; each call replaces the previous configuration.
+
+    Args:
+        level: The minimum level of messages to log, e.g. logging.DEBUG to
+            include every page fetch.
+        path: The path of the file to append log lines to. If None, logs to
+            stderr.
+
+    Returns:
+        The logging.handlers.QueueListener writing the log lines. It is stopped
+        (and the queue flushed) by shutdown, which runs automatically when the
+        program exits."""
+    if path is None:
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(path)
+    handler.setFormatter(JsonLinesFormatter())
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    shutdown()
+    root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    root_logger.handlers = [DeferredQueueHandler(log_queue, listener)]
+    root_logger.setLevel(level)
+    root_logger.propagate = False
+    listener.start()
+    return listener
+
+
+def shutdown():
+    """Writes any log lines still waiting on the queue and stops the background thread. Called
+    automatically when the program exits."""
+    for handler in logging.getLogger(ROOT_LOGGER_NAME).handlers:
+        if isinstance(handler, DeferredQueueHandler) and (handler.listener is not None):
+            handler.listener.stop()
+            handler.listener = None
+
+
+atexit.register(shutdown)
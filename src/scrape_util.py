@@ -1,11 +1,15 @@
 import time
 import random
-import datetime
 import signal
+import threading
 
 import bs4
 import requests
 
+import crawl_control
+import instrument
+import scrape_log
+
 PROXY_SOURCES = [
     "https://www.free-proxy-list.net",
     "http://www.spys.one/en/",
@@ -14,10 +18,10 @@ PROXY_SOURCES = [
 UA_SOURCES = [
     "https://deviceatlas.com/blog/list-of-user-agent-strings#desktop"
 ]
-MAX_RETRIES = 15
-RETRY_DELAY = 1
 TIMEOUT_LENGTH = 10
 
+LOGGER = scrape_log.get_logger("scrape_util")
+
 
 class Snake:
     """The thread_count variable defines how many user-agent strings and
@@ -32,21 +36,15 @@ class Snake:
     of system waiting involved in http requests.
     """
 
-    def __init__(self, thread_count='all', verbose=1):
-        self.verbose = verbose
+    def __init__(self, thread_count='all'):
         self.ips = Retriever(thread_count).thread_ips
-        self.log("Finished getting IPs.")
+        LOGGER.info("Finished getting IPs.")
         self.uas = UserAgent(thread_count).thread_uas
-        self.log("Finished getting user-agents.")
+        LOGGER.info("Finished getting user-agents.")
         self.masks = []
         for i, u in zip(self.ips, self.uas):
             self.masks.append({"address": i, "user-agent": u})
 
-    def log(self, message, verbosity=1):
-        """Log a message if it is not too verbose."""
-        if verbosity < self.verbose:
-            print(datetime.datetime.strftime(datetime.datetime.now(), "%H:%M:%S: ") + message)
-
 
 class Retriever:
     def __init__(self, thread_count='all'):
@@ -150,8 +148,12 @@ class Timeout:
         """Sets an alarm to raise a TimeoutError if not canceled in time."""
         self.error_message = error_message
         self.canceled = False
-        signal.signal(signal.SIGALRM, self.handle_timeout)
-        signal.alarm(seconds)
+
+        # signal handlers can only be set from the main thread, so timeouts in other threads rely
+        # on the timeout passed to the request instead
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGALRM, self.handle_timeout)
+            signal.alarm(seconds)
 
     def handle_timeout(self, ignore_1, ignore_2):
         """Raises a TimeoutError when time is up if not canceled."""
@@ -163,79 +165,162 @@ class Timeout:
         self.canceled = True
 
 
-class Scraper:
-    """A scraper has masks and opens pages. It's all automated in here to allow automatic retries when pages
-    inevitably don't load the first time.
+class Page:
+    """A webpage fetched by a Scraper. The raw content is kept as bytes and is only parsed into a
+    soup the first time the soup is used, so callers that only need the bytes (e.g. to pass them
+    to a parse worker or a cache) never pay for parsing. Call release once done with the soup to
+    free the parsed tree.
     """
 
-    def __init__(self, thread_count, verbose=1):
-        self.session = requests.Session()
-        self.masks = Snake(thread_count=thread_count, verbose=verbose).masks
-        self.thread_count = thread_count
-        self.verbose = verbose
-        self.last_soup = None
+    def __init__(self, url, content, status, headers, elapsed, proxy):
+        self.url = url
+        self.content = content
+        self.status = status
+        self.headers = headers
+        self.elapsed = elapsed
+        self.proxy = proxy
+        self.parsed = None
 
-    def open_page(self, url, retries_left=MAX_RETRIES):
-        """Opens the page at a given URL and returns a soup of its content."""
-        while retries_left > 0:
-            # if there are no masks left, get a new set of masks
-            if not self.has_mask():
-                self.masks = Snake(thread_count=self.thread_count).masks
+    def __repr__(self):
+        return f'<Page of {self.url} ({self.status}, {len(self.content)} bytes)>'
 
-            # remove the first mask in the list and get its headers and IP
-            mask = self.masks[0]
-            del self.masks[0]
-            headers = {
-                'User-Agent': mask['user-agent']
-            }
-            ip = mask['address']
+    @property
+    def soup(self):
+        """A bs4.BeautifulSoup object of the page's content, built on first use."""
+        if self.parsed is None:
+            self.parsed = bs4.BeautifulSoup(self.content, 'html.parser')
+        return self.parsed
 
-            try:
-                self.log(f"Fetching page. (URL: {url})")
+    def release(self):
+        """Frees the parsed tree of the page, if it was built. The raw content is kept, so the
+        soup is rebuilt if it is used again."""
+        if self.parsed is not None:
+            self.parsed.decompose()
+            self.parsed = None
 
-                # create a timeout in case the request takes forever
-                timeout = Timeout()
-                self.log(f"Timeout set. (URL: {url})", 5)
 
-                # open the page
-                response = self.session.get(url, proxies={'https': ip, 'http': ip}, headers=headers)
+class Scraper:
+    """A scraper has masks and opens pages. It's all automated in here to allow automatic retries when pages
+    inevitably don't load the first time.
+    """
 
-                if response.status_code != 200:
-                    # if the page doesn't load, cancel any timeouts, sleep, and retry
+    def __init__(self, thread_count, metrics=None, masks=None, controller=None):
+        self.session = requests.Session()
+        self.fixed_masks = masks
+        self.mask_lock = threading.Lock()
+        self.masks = list(masks) if masks is not None else Snake(thread_count=thread_count).masks
+        self.thread_count = thread_count
+        self.metrics = metrics if metrics is not None else instrument.Metrics()
+        self.controller = controller if controller is not None \
+            else crawl_control.CrawlController(metrics=self.metrics)
+
+    def open_page(self, url, budget=None):
+        """Fetches the page at a given URL and returns it as a Page, without parsing it. Returns
+        None if the page could not be fetched.
+
+        Args:
+            url: The URL of the page.
+            budget: The crawl_control.RetryBudget of the page, shared with any
+                retries made because the page could not be parsed. If None, a
+                new budget is used."""
+        if budget is None:
+            budget = self.controller.new_budget()
+        with self.metrics.timer('open_page'):
+            while budget.spend_transport():
+                attempt = budget.transport_attempts
+                fields = {'url': url, 'attempt': attempt}
+                host_ok = False
+                latency = None
+                self.controller.acquire()
+                try:
+                    LOGGER.debug("Fetching page.", extra=fields)
+
+                    # create a timeout in case the request takes forever
+                    timeout = Timeout()
+
+                    # remove the first mask in the list and get its headers and IP
+                    mask = self.take_mask()
+                    headers = {
+                        'User-Agent': mask['user-agent']
+                    }
+                    ip = mask['address']
+
+                    # open the page
+                    self.metrics.count('page attempts')
+                    with self.metrics.timer('fetch attempt') as attempt_timer:
+                        response = self.session.get(url, proxies={'https': ip, 'http': ip},
+                                                    headers=headers, timeout=TIMEOUT_LENGTH)
                     timeout.cancel()
-                    if retries_left <= 0:
-                        self.log(f"Done retrying. (URL: {url})", 1)
-                    else:
-                        self.log(f"Page load failed. (URL: {url})")
-                        retries_left -= 1
-                        time.sleep(RETRY_DELAY)
-                else:
-                    # if success, add the mask back into the list, cancel any timeouts, and return the soup
-                    self.masks.append(mask)
+                    latency = fields['latency'] = attempt_timer.elapsed
+
+                    # only server errors and rate limiting mean the site is struggling
+                    host_ok = (response.status_code < 500) and (response.status_code != 429)
+                    if response.status_code == 200:
+                        # if success, add the mask back into the list and return the content
+                        self.return_mask(mask)
+                        self.metrics.count('pages fetched')
+                        self.metrics.count('bytes fetched', len(response.content))
+                        return Page(url, response.content, response.status_code,
+                                    response.headers, latency, ip)
+                    LOGGER.info("Page load failed with status %s.", response.status_code,
+                                extra=fields)
+                except (TimeoutError, requests.exceptions.ProxyError, IndexError,
+                        ConnectionResetError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                    # if the page fails to load, cancel any timeouts
                     timeout.cancel()
-                    soup = bs4.BeautifulSoup(response.content, 'html.parser')
-                    self.last_soup = soup
-                    return soup
-            except (TimeoutError, requests.exceptions.ProxyError, IndexError, ConnectionResetError,
-                    requests.exceptions.ChunkedEncodingError) as e:
-                # if the page fails to load, cancel any timeouts, sleep, and retry
-                timeout.cancel()
-                if retries_left <= 0:
-                    self.log(f"Done retrying. (URL: {url})", 1)
-                else:
-                    self.log(f"Page load failed: '{e}' (URL: {url})")
+                    LOGGER.info("Page load failed: '%s'", e, extra=fields)
+
+                    # a dead proxy or a missing mask says nothing about the site
+                    if is_proxy_error(e):
+                        host_ok = None
 
                     # if it's an IndexError, get a new set of masks.
                     if isinstance(e, IndexError):
-                        self.masks = Snake(thread_count=self.thread_count).masks
-            retries_left -= 1
-            time.sleep(RETRY_DELAY)
+                        with self.mask_lock:
+                            self.rotate_masks()
+                finally:
+                    self.controller.release(host_ok, latency)
+
+                # back off before retrying
+                if budget.has_transport():
+                    self.metrics.count('page retries')
+                    time.sleep(self.controller.backoff(attempt))
+
+        LOGGER.warning("Done retrying.", extra={'url': url})
+        self.metrics.count('pages failed')
+        return None
+
+    def take_mask(self):
+        """Removes the first available mask from the list and returns it, getting a new set of
+        masks first if there are none left."""
+        with self.mask_lock:
+            if not self.has_mask():
+                self.rotate_masks()
+            return self.masks.pop(0)
+
+    def return_mask(self, mask):
+        """Puts a mask that worked back at the end of the list."""
+        with self.mask_lock:
+            self.masks.append(mask)
+
+    def rotate_masks(self):
+        """Replaces the current masks with a freshly retrieved set. If the scraper was given a
+        fixed set of masks, that set is reused instead."""
+        self.metrics.count('mask rotations')
+        with self.metrics.timer('get masks'):
+            if self.fixed_masks is not None:
+                self.masks = list(self.fixed_masks)
+            else:
+                self.masks = Snake(thread_count=self.thread_count).masks
 
     def has_mask(self):
         """Returns whether any masks are available."""
         return len(self.masks) != 0
 
-    def log(self, message, verbosity=3):
-        """Log a message if it is not too verbose."""
-        if verbosity < self.verbose:
-            print(datetime.datetime.strftime(datetime.datetime.now(), "%H:%M:%S: ") + message)
+
+def is_proxy_error(error):
+    """Returns whether a failed request failed before it reached the site: its proxy refused it or
+    could not be connected to, or there was no mask to send it with."""
+    return isinstance(error, (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout,
+                              IndexError))
@@ -0,0 +1,398 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+import scipy.sparse
+import scipy.special
+
+import database
+import ratings
+import scrape_games
+import scrape_log
+import scrape_util
+
+DEFAULT_SIMULATIONS = 200000
+CHUNK_SIZE = 2000       # simulations drawn at once, each from its own seeded stream
+MARGIN_SD = 11.0        # standard deviation of a game's margin around its prediction, in points
+DEFAULT_SEED = 0
+PATH_PROJECTIONS = "projections.json"
+FETCH_LATEST_SNAPSHOT_QUERY = ("SELECT season_start, rating_date FROM rating_snapshots "
+                               "WHERE rating_date <= %s ORDER BY rating_date DESC LIMIT 1")
+
+LOGGER = scrape_log.get_logger("simulator")
+
+# the schedule or bracket being simulated, kept in each worker process by init_worker
+worker_data = {}
+
+
+# Below are functions for predicting games from ratings.
+
+
+def load_ratings(cursor, rating_date):
+    """Reads the latest stored team ratings on or before a date (see ratings.update_ratings).
+
+    Returns:
+        A tuple of the first date of the season of the ratings and the
+        ratings, as returned by ratings.load_snapshot. (None, None) if there
+        are none."""
+    cursor.execute(FETCH_LATEST_SNAPSHOT_QUERY, (rating_date,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    season_start, snapshot_date = row
+    return season_start, ratings.load_snapshot(cursor, season_start,
+                                               snapshot_date + datetime.timedelta(1))[1]
+
+
+def predict_margins(team_ratings, home, away, neutral):
+    """Predicts the home team's margin in games, from its points per 100 possessions minus the
+    away team's, over the possessions both teams' tempos predict.
+
+    Args:
+        team_ratings: The ratings, as returned by ratings.load_snapshot.
+        home: An array of the index of the home team of each game in the
+            ratings.
+        away: An array of the index of the away team of each game.
+        neutral: A boolean array that is True for games on a neutral court.
+
+    Returns:
+        A float array of the predicted margins."""
+    count = len(team_ratings['team season IDs'])
+    efficiency = team_ratings['efficiency solution']
+    offense, defense, home_advantage = efficiency[:count], efficiency[count:2 * count], \
+        efficiency[2 * count]
+    tempo = team_ratings['tempo solution']
+    difference = offense[home] + defense[away] - offense[away] - defense[home] \
+        + np.where(neutral, 0, home_advantage)
+    possessions = team_ratings['average tempo'] + tempo[home] + tempo[away]
+    return difference * possessions / 100
+
+
+def win_probabilities(margins):
+    """Returns the probability that the team a margin is predicted for wins, with the margin
+    normally distributed around the prediction."""
+    return scipy.special.ndtr(np.asarray(margins) / MARGIN_SD)
+
+
+def team_indices(team_ratings, team_season_ids):
+    """Returns an array of the index of each team season ID in the ratings. Teams that are not
+    rated are added as average teams, so the ratings are extended in place."""
+    index = {team_id: i for i, team_id in enumerate(team_ratings['team season IDs'])}
+    missing = [team_id for team_id in dict.fromkeys(team_season_ids) if team_id not in index]
+    if len(missing) > 0:
+        count = len(index)
+        efficiency = team_ratings['efficiency solution']
+        team_ratings['efficiency solution'] = np.concatenate([
+            efficiency[:count], np.zeros(len(missing)), efficiency[count:2 * count],
+            np.zeros(len(missing)), efficiency[2 * count:]])
+        team_ratings['tempo solution'] = np.concatenate([team_ratings['tempo solution'],
+                                                         np.zeros(len(missing))])
+        team_ratings['team season IDs'] = list(team_ratings['team season IDs']) + missing
+        index.update({team_id: count + i for i, team_id in enumerate(missing)})
+    return np.array([index[team_id] for team_id in team_season_ids], dtype=np.int64)
+
+
+# Below are functions for drawing simulations in worker processes.
+
+
+def run_simulations(simulate, data, simulations, workers, seed):
+    """Draws simulations in chunks of CHUNK_SIZE in a pool of worker processes. Each chunk draws
+    from its own stream spawned from the seed, so the results depend on the seed and not on the
+    number of workers.
+
+    Args:
+        simulate: The function that draws a chunk, given a (seed sequence,
+            count) task, and returns a tuple of arrays to be summed.
+        data: The dict of arrays the function reads from worker_data.
+        simulations: The number of simulations.
+        workers: The number of worker processes, or None for one per CPU.
+        seed: The seed of the streams.
+
+    Returns:
+        The tuple of sums of the arrays returned for each chunk."""
+    counts = [CHUNK_SIZE] * (simulations // CHUNK_SIZE)
+    if simulations % CHUNK_SIZE > 0:
+        counts.append(simulations % CHUNK_SIZE)
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(counts)), counts))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers or os.cpu_count(), len(tasks)), initializer=init_worker,
+            initargs=(data,)) as executor:
+        results = list(executor.map(simulate, tasks))
+    return tuple(sum(arrays) for arrays in zip(*results))
+
+
+def init_worker(data):
+    """Keeps the schedule or bracket being simulated in a worker process."""
+    worker_data.clear()
+    worker_data.update(data)
+
+
+def simulate_season_chunk(task):
+    """Plays out the remaining schedule of a season a number of times, every game of every
+    simulation in one draw.
+
+    Args:
+        task: A (numpy.random.SeedSequence, number of simulations) tuple.
+
+    Returns:
+        A tuple of arrays of each team's total wins over the simulations,
+        its total squared wins, and its total share of first place in each
+        group (ties split evenly), with a row for each group."""
+    seed_sequence, count = task
+    rng = np.random.default_rng(seed_sequence)
+    home_wins = (rng.random((len(worker_data['probabilities']), count), dtype=np.float32)
+                 < worker_data['probabilities'][:, np.newaxis]).astype(np.float32)
+    # each team wins every away game but the ones the home team wins
+    wins = worker_data['base wins'] + (worker_data['teams'] @ home_wins).T
+    titles = np.zeros((len(worker_data['groups']), wins.shape[1]))
+    for i, group in enumerate(worker_data['groups']):
+        group_wins = wins[:, group]
+        first = group_wins == group_wins.max(axis=1, keepdims=True)
+        titles[i, group] = (first / first.sum(axis=1, keepdims=True)).sum(axis=0)
+    return wins.sum(axis=0, dtype=float), (wins ** 2).sum(axis=0, dtype=float), titles
+
+
+def simulate_bracket_chunk(task):
+    """Plays out a single-elimination bracket a number of times, each round of every
+    simulation in one draw.
+
+    Args:
+        task: A (numpy.random.SeedSequence, number of simulations) tuple.
+
+    Returns:
+        A tuple of one array of how many times each team won each round, with
+        a row for each team and a column for each round."""
+    seed_sequence, count = task
+    rng = np.random.default_rng(seed_sequence)
+    probabilities = worker_data['probabilities']
+    team_count = len(probabilities)
+    alive = np.tile(worker_data['slots'], (count, 1))
+    rounds = []
+    while alive.shape[1] > 1:
+        top, bottom = alive[:, 0::2], alive[:, 1::2]
+        # an empty slot is a bye, so its opponent advances
+        top_wins = (bottom < 0) | ((top >= 0) & (rng.random(top.shape)
+                                                 < probabilities[top, np.maximum(bottom, 0)]))
+        alive = np.where(top_wins, top, bottom)
+        rounds.append(np.bincount(alive[alive >= 0], minlength=team_count))
+    return np.column_stack(rounds),
+
+
+def simulate_season(team_ratings, schedule, current_wins=None, groups=None,
+                    simulations=DEFAULT_SIMULATIONS, workers=None, seed=DEFAULT_SEED):
+    """Projects the final records of a season by simulating its remaining games.
+
+    Args:
+        team_ratings: The ratings, as returned by load_ratings.
+        schedule: The remaining games, as a list of dicts with the keys 'home
+            team season ID', 'away team season ID' and 'neutral'.
+        current_wins: A dict from team season ID to its wins so far.
+        groups: A dict from the name of a group of teams, such as a
+            conference, to the list of team season IDs in it, to find the
+            chance of each team finishing first in its group.
+        simulations: The number of seasons to simulate.
+        workers: The number of worker processes, or None for one per CPU.
+        seed: The seed of the random draws.
+
+    Returns:
+        A dict from each team season ID in the schedule or groups to a dict
+        with the keys 'expected wins', 'wins SD' and 'group titles', a dict
+        from the name of each group the team is in to its chance of finishing
+        first (ties split evenly)."""
+    current_wins = current_wins or {}
+    groups = groups or {}
+    home = team_indices(team_ratings, [game['home team season ID'] for game in schedule])
+    away = team_indices(team_ratings, [game['away team season ID'] for game in schedule])
+    group_indices = {name: team_indices(team_ratings, team_ids)
+                     for name, team_ids in groups.items()}
+    team_ids = team_ratings['team season IDs']
+    neutral = np.array([bool(game.get('neutral')) for game in schedule], dtype=bool)
+    probabilities = win_probabilities(predict_margins(team_ratings, home, away, neutral))
+
+    # a sparse row for each team with 1 in the column of each of its home games and -1 in that
+    # of each of its away games, so its product with the home results of every game is the
+    # team's wins less its away games
+    games = np.arange(len(schedule))
+    teams = scipy.sparse.csr_matrix((np.concatenate([np.ones(len(schedule), dtype=np.float32),
+                                                     -np.ones(len(schedule), dtype=np.float32)]),
+                                     (np.concatenate([home, away]), np.tile(games, 2))),
+                                    shape=(len(team_ids), len(schedule)))
+    base_wins = np.array([current_wins.get(team_id, 0) for team_id in team_ids],
+                         dtype=np.float32) + np.bincount(away, minlength=len(team_ids))
+    wins, squared_wins, titles = run_simulations(simulate_season_chunk, {
+        'probabilities': probabilities.astype(np.float32), 'teams': teams,
+        'base wins': base_wins.astype(np.float32), 'groups': list(group_indices.values())
+    }, simulations, workers, seed)
+
+    expected = wins / simulations
+    spread = np.sqrt(np.maximum(squared_wins / simulations - expected ** 2, 0))
+    teams = set(home.tolist()) | set(away.tolist())
+    for group in group_indices.values():
+        teams.update(group.tolist())
+    projections = {team_ids[i]: {'expected wins': float(expected[i]), 'wins SD': float(spread[i]),
+                                 'group titles': {}} for i in sorted(teams)}
+    for row, (name, group) in enumerate(group_indices.items()):
+        for i in group:
+            projections[team_ids[i]]['group titles'][name] = float(titles[row, i] / simulations)
+    return projections
+
+
+def simulate_tournament(team_ratings, bracket, simulations=DEFAULT_SIMULATIONS, workers=None,
+                        seed=DEFAULT_SEED):
+    """Projects how far each team of a single-elimination tournament on neutral courts
+    advances.
+
+    Args:
+        team_ratings: The ratings, as returned by load_ratings.
+        bracket: The team season IDs of the bracket in order, so that the
+            first plays the second, the winner plays the winner of the third
+            and fourth, and so on. The length must be a power of 2; None marks
+            a bye.
+        simulations: The number of tournaments to simulate.
+        workers: The number of worker processes, or None for one per CPU.
+        seed: The seed of the random draws.
+
+    Returns:
+        A dict from each team season ID in the bracket to a list of its
+        probability of winning each round; the last is winning the
+        tournament."""
+    if (len(bracket) < 2) or (len(bracket) & (len(bracket) - 1) != 0):
+        raise ValueError(f"Expected a bracket of a power of 2 slots. Received {len(bracket)}.")
+    team_ids = [team_id for team_id in bracket if team_id is not None]
+    teams = team_indices(team_ratings, team_ids)
+    slots = np.full(len(bracket), -1, dtype=np.int64)
+    slots[[i for i, team_id in enumerate(bracket) if team_id is not None]] = \
+        np.arange(len(team_ids))
+    # the chance of the row team beating the column team on a neutral court
+    probabilities = win_probabilities(predict_margins(
+        team_ratings, np.repeat(teams, len(teams)), np.tile(teams, len(teams)),
+        np.ones(len(teams) ** 2, dtype=bool))).reshape(len(teams), len(teams))
+    round_wins, = run_simulations(simulate_bracket_chunk, {
+        'probabilities': probabilities, 'slots': slots
+    }, simulations, workers, seed)
+    return {team_id: (round_wins[i] / simulations).tolist() for i, team_id in enumerate(team_ids)}
+
+
+# Below are functions for reading schedules and records.
+
+
+def load_schedule_file(path):
+    """Reads a schedule or bracket from a JSON file, with team season IDs as the teams.
+
+    A schedule file has the key 'games', a list of objects with the keys 'home', 'away' and
+    optionally 'neutral', and optionally 'groups', an object from the name of each group to a
+    list of its teams. A bracket file has the key 'bracket', a list of teams and nulls.
+
+    Returns:
+        A dict with the key 'bracket' or the keys 'games' and 'groups', in the
+        forms simulate_tournament and simulate_season take."""
+    with open(path) as schedule_file:
+        stored = json.load(schedule_file)
+    if 'bracket' in stored:
+        return {'bracket': stored['bracket']}
+    return {'games': [{'home team season ID': game['home'], 'away team season ID': game['away'],
+                       'neutral': game.get('neutral', False)} for game in stored['games']],
+            'groups': stored.get('groups', {})}
+
+
+def fetch_schedule(scraper, cursor, start_date, end_date):
+    """Lists the games on the scoreboards of a date range and finds their teams from their box
+    score pages, which are up before games are played.
+
+    Args:
+        scraper: The src.scrape_util.Scraper object used to scrape webpages.
+        cursor: The pymysql cursor of the database connection.
+        start_date: The first date of games, inclusive, as a datetime.date.
+        end_date: The last date of games, exclusive.
+
+    Returns:
+        The games, in the form simulate_season takes. Games whose teams could
+        not be found are left out."""
+    schedule = []
+    for game in scrape_games.enumerate_games(scraper, start_date, end_date):
+        page = scrape_games.scrape_box_score(scraper, game['box ID'], season=game['season'])
+        if page is None:
+            continue
+        try:
+            h_team_season_id, a_team_season_id, h_school_id, a_school_id \
+                = scrape_games.find_team_ids(page.soup)
+        except (AttributeError, IndexError, ValueError) as e:
+            LOGGER.info("Error finding teams: '%s' (Box ID: %s)", e, game['box ID'])
+            continue
+        finally:
+            page.release()
+        if h_team_season_id is None:
+            h_team_season_id = scrape_games.fetch_team_season_id(cursor, h_school_id,
+                                                                 game['season'])
+        if a_team_season_id is None:
+            a_team_season_id = scrape_games.fetch_team_season_id(cursor, a_school_id,
+                                                                 game['season'])
+        if (h_team_season_id is not None) and (a_team_season_id is not None):
+            schedule.append({'home team season ID': h_team_season_id,
+                             'away team season ID': a_team_season_id, 'neutral': False})
+    LOGGER.info("Found the teams of %s games from %s to %s.", len(schedule), start_date,
+                end_date)
+    return schedule
+
+
+def fetch_current_wins(cursor, season_start, end_date):
+    """Counts the wins of each team season in the games played from the start of a season up to
+    a date, exclusive.
+
+    Returns:
+        A dict from team season ID to wins."""
+    wins = {}
+    for game in ratings.fetch_games(cursor, season_start, end_date):
+        for team, opponent in [('home', 'away'), ('away', 'home')]:
+            team_id = game[f'{team} team season ID']
+            wins[team_id] = wins.get(team_id, 0) \
+                + int(game[f'{team} points'] > game[f'{opponent} points'])
+    return wins
+
+
+def write_projections(projections, path=PATH_PROJECTIONS):
+    """Writes projections to a JSON file, keyed by team season ID."""
+    with open(path, 'w') as projections_file:
+        json.dump({str(team_id): projection for team_id, projection in projections.items()},
+                  projections_file, indent=2)
+
+
+# Main method. Simulates the rest of the season from a schedule file or the scoreboards of a date
+# range, or a tournament from a bracket file, with the latest stored ratings.
+
+
+def main(argv):
+    scrape_log.configure()
+    conn = database.connect_to_db()
+    cursor = conn.cursor()
+    today = datetime.date.today()
+    season_start, team_ratings = load_ratings(cursor, today)
+    if team_ratings is None:
+        raise ValueError("No stored ratings to simulate with. Run ratings.py first.")
+    if len(argv) in (1, 2):
+        schedule = load_schedule_file(argv[0])
+        simulations = int(argv[1]) if len(argv) > 1 else DEFAULT_SIMULATIONS
+    else:
+        start_date = datetime.date(int(argv[0]), int(argv[1]), int(argv[2]))
+        end_date = datetime.date(int(argv[3]), int(argv[4]), int(argv[5]))
+        simulations = int(argv[6]) if len(argv) > 6 else DEFAULT_SIMULATIONS
+        scraper = scrape_util.Scraper(thread_count=scrape_games.DEFAULT_THREAD_COUNT)
+        schedule = {'games': fetch_schedule(scraper, cursor, start_date, end_date),
+                    'groups': {}}
+
+    if 'bracket' in schedule:
+        projections = simulate_tournament(team_ratings, schedule['bracket'], simulations)
+    else:
+        projections = simulate_season(team_ratings, schedule['games'],
+                                      fetch_current_wins(cursor, season_start, today),
+                                      schedule['groups'], simulations)
+    write_projections(projections)
+    LOGGER.info("Wrote projections of %s teams from %s simulations to %s.", len(projections),
+                simulations, PATH_PROJECTIONS)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,382 @@
+import argparse
+import concurrent.futures
+import datetime
+import http.server
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+import instrument
+import scrape_log
+import scrape_util
+import synthetic_games
+
+# the default corpus is the benchmark's synthetic one, written on first use, so the server runs
+# from a fresh checkout
+PATH_CORPUS = "bench_corpus"
+DEFAULT_CORPUS_GAMES = 50
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+DEFAULT_CONCURRENCY = 16
+SITE_URL = "http://stats.ncaa.org"
+ERROR_STATUSES = [500, 502, 503, 504]
+EMPTY_SCOREBOARD_HTML = (b"<html><body>\n<table style=\"border-collapse: collapse\">\n</table>\n"
+                         b"</body></html>\n")
+
+DEFAULT_FAULTS = {
+    'latency': 0,           # seconds added to every response
+    'latency jitter': 0,    # up to this many more seconds, chosen at random per response
+    'error rate': 0,        # fraction of responses that are a 5xx error
+    'timeout rate': 0,      # fraction of requests that are never answered
+    'truncate rate': 0,     # fraction of responses whose body is cut off partway through
+    'hang seconds': 30      # how long an unanswered request is held open before closing it
+}
+
+BOX_SCORE_PATH = re.compile(r"/contests/(\d+)/box_score")
+BOX_SCORE_BY_PBP_PATH = re.compile(r"/game/box_score/(\d+)")
+PLAY_BY_PLAY_PATH = re.compile(r"/game/play_by_play/(\d+)")
+SCOREBOARD_PATH = re.compile(r"/season_divisions/(\d+)/scoreboards")
+PBP_LINK = re.compile(rb"/game/play_by_play/(\d+)")
+
+LOGGER = scrape_log.get_logger("stand_in_server")
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """A local stand-in for stats.ncaa.org that serves scoreboard, box score and play-by-play
+    pages from a stored corpus, so the scraper can be run end to end without the real site or
+    real proxies. Faults like slow responses, 5xx errors, requests that are never answered and
+    truncated bodies can be injected at configurable rates.
+
+    The server also works as a proxy: requests with an absolute URL in their request line (which
+    is how HTTP proxies are sent requests) are served by the URL's path. So a Scraper whose masks
+    all point at the server fetches the usual stats.ncaa.org URLs from the corpus instead.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, corpus_path=PATH_CORPUS, address=(DEFAULT_HOST, DEFAULT_PORT), faults=None,
+                 seed=None):
+        """Loads the corpus and binds the server. Call serve_forever (or start) to serve.
+
+        Args:
+            corpus_path: The directory of stored pages, in the layout written by
+                synthetic_games.write_corpus: box_{box ID}.html,
+                pbp_{PBP ID}.html and scoreboard_{YYYYMMDD}.html.
+            address: The (host, port) to listen on. Port 0 picks a free port.
+            faults: A dict of fault rates overriding DEFAULT_FAULTS.
+            seed: The seed of the random faults, or None to seed randomly."""
+        self.pages = load_pages(corpus_path)
+        self.faults = dict(DEFAULT_FAULTS)
+        if faults is not None:
+            self.faults.update(faults)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.metrics = instrument.Metrics()
+        self.thread = None
+        super().__init__(address, StandInHandler)
+
+    @property
+    def url(self):
+        """The URL of the server, for use as a proxy address or as the base of page URLs."""
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        """Serves requests on a background thread and returns the server."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving, releases any requests being held open and closes the socket."""
+        self.stopping.set()
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def choose_fault(self):
+        """Decides which fault, if any, to inject into the next response.
+
+        Returns:
+            A tuple of the fault ('timeout', 'error', 'truncate' or None) and
+            the number of seconds to wait before responding."""
+        with self.rng_lock:
+            draw = self.rng.random()
+            delay = self.faults['latency'] + self.rng.random() * self.faults['latency jitter']
+        if draw < self.faults['timeout rate']:
+            return 'timeout', delay
+        draw -= self.faults['timeout rate']
+        if draw < self.faults['error rate']:
+            return 'error', delay
+        draw -= self.faults['error rate']
+        if draw < self.faults['truncate rate']:
+            return 'truncate', delay
+        return None, delay
+
+    def choose_error_status(self):
+        """Chooses the status code of an injected 5xx error."""
+        with self.rng_lock:
+            return self.rng.choice(ERROR_STATUSES)
+
+    def report(self):
+        """Summarizes the requests served so far.
+
+        Returns:
+            The summary returned by instrument.Metrics.summary, with the
+            additional keys 'pages' (the number of pages in the corpus) and
+            'faults' (the fault rates in use)."""
+        summary = self.metrics.summary()
+        summary['pages'] = len(self.pages)
+        summary['faults'] = dict(self.faults)
+        return summary
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Handles a single request to a StandInServer."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.metrics.count('requests')
+        with server.metrics.timer('respond'):
+            fault, delay = server.choose_fault()
+            if delay > 0:
+                server.stopping.wait(delay)
+
+            if fault == 'timeout':
+                # hold the connection open without answering, then drop it
+                server.metrics.count('timeouts injected')
+                server.stopping.wait(server.faults['hang seconds'])
+                self.close_connection = True
+                return
+            if fault == 'error':
+                server.metrics.count('errors injected')
+                self.send_page(server.choose_error_status(), b"<html><body>Error</body></html>")
+                return
+
+            content = find_page(server.pages, self.path)
+            if content is None:
+                server.metrics.count('pages not found')
+                self.send_page(404, b"<html><body>Not Found</body></html>")
+                return
+            if fault == 'truncate':
+                # promise the whole body but send only part of it
+                server.metrics.count('truncations injected')
+                self.send_page(200, content, length=len(content) // 2)
+                self.close_connection = True
+                return
+
+            server.metrics.count('pages served')
+            server.metrics.count('bytes served', len(content))
+            self.send_page(200, content)
+
+    def send_page(self, status, content, length=None):
+        """Sends a response with the given status and HTML content. If a length is given, only
+        that many bytes of the content are sent, but the Content-Length header still promises the
+        whole content."""
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content if length is None else content[:length])
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args, extra={'url': self.path})
+
+
+# Below are functions for loading the corpus and finding pages in it.
+
+
+def load_pages(corpus_path):
+    """Reads every stored page in a corpus into memory.
+
+    Args:
+        corpus_path: The directory of stored pages.
+
+    Returns:
+        A dict with the keys 'box' (from box ID to page), 'box by PBP ID' (from
+        PBP ID to box score page), 'pbp' (from PBP ID to page) and 'scoreboard'
+        (from date as YYYYMMDD to page). Pages are kept as bytes."""
+    pages = {'box': {}, 'box by PBP ID': {}, 'pbp': {}, 'scoreboard': {}}
+    for file_name in os.listdir(corpus_path):
+        match = re.fullmatch(r"(box|pbp|scoreboard)_(\d+)\.html", file_name)
+        if match is None:
+            continue
+        with open(os.path.join(corpus_path, file_name), 'rb') as page_file:
+            content = page_file.read()
+        kind, key = match.group(1), int(match.group(2))
+        if kind == 'scoreboard':
+            pages['scoreboard'][match.group(2)] = content
+        else:
+            pages[kind][key] = content
+        if kind == 'box':
+            pbp_match = PBP_LINK.search(content)
+            if pbp_match is not None:
+                pages['box by PBP ID'][int(pbp_match.group(1))] = content
+    return pages
+
+
+def find_page(pages, url):
+    """Finds the stored page for the path of a request.
+
+    Args:
+        pages: The pages returned by load_pages.
+        url: The path of the request, or its absolute URL if the request was
+            sent to the server as a proxy.
+
+    Returns:
+        The content of the page as bytes, or None if there is no such page. A
+        scoreboard for a date with no stored scoreboard is served as an empty
+        scoreboard, since that is what stats.ncaa.org does on days without
+        games."""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path
+    for pattern, kind in [(BOX_SCORE_PATH, 'box'), (BOX_SCORE_BY_PBP_PATH, 'box by PBP ID'),
+                          (PLAY_BY_PLAY_PATH, 'pbp')]:
+        match = pattern.fullmatch(path)
+        if match is not None:
+            return pages[kind].get(int(match.group(1)))
+
+    if SCOREBOARD_PATH.fullmatch(path) is not None:
+        game_date = urllib.parse.parse_qs(parts.query).get('game_date')
+        if game_date is None:
+            return None
+        try:
+            date = datetime.datetime.strptime(game_date[0], '%m/%d/%Y')
+        except ValueError:
+            return None
+        return pages['scoreboard'].get(date.strftime('%Y%m%d'), EMPTY_SCOREBOARD_HTML)
+    return None
+
+
+def corpus_urls(pages, season_code=0):
+    """Lists the stats.ncaa.org URLs of every page in a corpus, in the order the scraper would
+    fetch them: each day's scoreboard, then the box score and play-by-play of each game."""
+    urls = []
+    for date in sorted(pages['scoreboard']):
+        urls.append(f"{SITE_URL}/season_divisions/{season_code}/scoreboards?"
+                    f"game_date={date[4:6]}%2F{date[6:]}%2F{date[:4]}")
+    for box_id in sorted(pages['box']):
+        urls.append(f"{SITE_URL}/contests/{box_id}/box_score")
+    for pbp_id in sorted(pages['pbp']):
+        urls.append(f"{SITE_URL}/game/play_by_play/{pbp_id}")
+    return urls
+
+
+# Below are functions for driving a Scraper against the server to measure crawler throughput.
+
+
+def drive(server, urls, concurrency=DEFAULT_CONCURRENCY):
+    """Fetches pages through the server at full concurrency, using a Scraper whose masks all use
+    the server as their proxy.
+
+    Args:
+        server: A started StandInServer.
+        urls: The stats.ncaa.org URLs to fetch, e.g. from corpus_urls.
+        concurrency: The number of threads fetching pages, and the number of
+            masks the scraper is given. The scraper's crawl controller
+            decides how many of them may have a request in flight at once.
+
+    Returns:
+        A dict with the keys and values:
+        'pages': The number of pages requested.
+        'pages fetched': The number of pages fetched successfully.
+        'pages failed': The number of pages that ran out of retries.
+        'concurrency': The number of threads fetching pages.
+        'seconds': The number of seconds the run took.
+        'pages per second': The number of pages fetched per second.
+        'scraper': The scraper's metrics summary.
+        'controller': The summary of the scraper's crawl controller at the end
+            of the run.
+        'server': The server's report."""
+    masks = [{'address': server.url, 'user-agent': f"stand-in/{i}"} for i in range(concurrency)]
+    scraper = scrape_util.Scraper(thread_count=concurrency, masks=masks)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(scraper.open_page, urls))
+    seconds = time.perf_counter() - start
+
+    fetched = sum(1 for page in results if page is not None)
+    return {
+        'pages': len(urls),
+        'pages fetched': fetched,
+        'pages failed': len(urls) - fetched,
+        'concurrency': concurrency,
+        'seconds': seconds,
+        'pages per second': fetched / seconds if seconds > 0 else 0,
+        'scraper': scraper.metrics.summary(),
+        'controller': scraper.controller.summary(),
+        'server': server.report()
+    }
+
+
+# Main method. Serves a corpus, or drives a scraper against it and prints a throughput report.
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve a corpus of stored stats.ncaa.org pages "
+                                                 "locally, directly or as a proxy.")
+    parser.add_argument('--corpus', default=PATH_CORPUS)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', type=float, default=DEFAULT_FAULTS['latency'])
+    parser.add_argument('--latency-jitter', type=float, default=DEFAULT_FAULTS['latency jitter'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_FAULTS['error rate'])
+    parser.add_argument('--timeout-rate', type=float, default=DEFAULT_FAULTS['timeout rate'])
+    parser.add_argument('--truncate-rate', type=float, default=DEFAULT_FAULTS['truncate rate'])
+    parser.add_argument('--hang-seconds', type=float, default=DEFAULT_FAULTS['hang seconds'])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--drive', action='store_true',
+                        help="fetch every page in the corpus through the server and print a "
+                             "throughput report instead of serving until interrupted")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--report', default=None, help="path to write the drive report to")
+    args = parser.parse_args(argv)
+
+    faults = {
+        'latency': args.latency,
+        'latency jitter': args.latency_jitter,
+        'error rate': args.error_rate,
+        'timeout rate': args.timeout_rate,
+        'truncate rate': args.truncate_rate,
+        'hang seconds': args.hang_seconds
+    }
+    scrape_log.configure()
+    if (args.corpus == PATH_CORPUS) and not os.path.exists(PATH_CORPUS):
+        synthetic_games.write_corpus(PATH_CORPUS, DEFAULT_CORPUS_GAMES)
+        print(f"Wrote a synthetic corpus of {DEFAULT_CORPUS_GAMES} games to {PATH_CORPUS}.")
+    server = StandInServer(args.corpus, (args.host, args.port), faults, args.seed)
+    if not args.drive:
+        print(f"Serving {args.corpus} at {server.url}.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return 0
+
+    with server:
+        report = drive(server, corpus_urls(server.pages), args.concurrency)
+    print(f"Fetched {report['pages fetched']}/{report['pages']} pages in "
+          f"{report['seconds']:.1f}s ({report['pages per second']:.1f} pages/sec) at concurrency "
+          f"{report['concurrency']}.")
+    if args.report is not None:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+    return 0 if report['pages failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+import numpy as np
+
+HALF_LENGTH = 1200
+OVERTIME_LENGTH = 300
+STAT_FIELDS = ["FGA", "FGM", "3PA", "3PM", "FTA", "FTM", "ORB", "DRB", "AST", "TOV", "STL",
+               "BLK", "PF"]
+CREATE_STINTS_QUERY = ("CREATE TABLE IF NOT EXISTS stints ("
+                       "game_id INT NOT NULL, stint_in_game INT NOT NULL, period INT,"
+                       "start_time DECIMAL(6, 2), end_time DECIMAL(6, 2),"
+                       "first_play INT, last_play INT, h_lineup_id INT, a_lineup_id INT,"
+                       "h_p1_id INT, h_p2_id INT, h_p3_id INT, h_p4_id INT, h_p5_id INT,"
+                       "a_p1_id INT, a_p2_id INT, a_p3_id INT, a_p4_id INT, a_p5_id INT,"
+                       "h_points INT, a_points INT, h_possessions DECIMAL(6, 2),"
+                       "a_possessions DECIMAL(6, 2), h_fga INT, h_fgm INT, h_3pa INT,"
+                       "h_3pm INT, h_fta INT, h_ftm INT, h_orb INT, h_drb INT, h_ast INT,"
+                       "h_tov INT, h_stl INT, h_blk INT, h_pf INT, a_fga INT, a_fgm INT,"
+                       "a_3pa INT, a_3pm INT, a_fta INT, a_ftm INT, a_orb INT, a_drb INT,"
+                       "a_ast INT, a_tov INT, a_stl INT, a_blk INT, a_pf INT,"
+                       "PRIMARY KEY (game_id, stint_in_game), KEY (h_lineup_id),"
+                       "KEY (a_lineup_id));")
+
+
+def find_stints(plays, matrix):
+    """Collapses the plays of a game into stints: runs of consecutive plays in the same period
+    with the same players on the court for both teams. Run after correct_time_played, so each
+    team has 5 players on every play. The points and stats of each stint are the sums over its
+    plays of those the lineup matrix counted for each play.
+
+    Args:
+        plays: The tracked plays of the game, as a list of dicts.
+        matrix: The lineup_matrix.LineupMatrix of the plays.
+
+    Returns:
+        A list of stints, each a dict with the keys:
+        'period': The period of the stint.
+        'start time': The time remaining in the period when the stint began,
+            in seconds.
+        'end time': The time remaining when it ended: when the next stint in
+            the period began, or 0 at the end of the period.
+        'first play', 'last play': The indices of the first and last plays
+            of the stint in the game.
+        'home lineup', 'away lineup': The lists of players on the court.
+        'home points', 'away points': The points each team scored.
+        'home possessions', 'away possessions': The possessions each team
+            had, estimated as FGA - ORB + TOV + 0.44 * FTA.
+        'home stats', 'away stats': Dicts from each of STAT_FIELDS to the
+            team's count of it."""
+    stints = []
+    last_key = None
+    for i, play in enumerate(plays):
+        key = (play['period'], lineup_key(play['home partic']), lineup_key(play['away partic']))
+        if key != last_key:
+            if (len(stints) > 0) and (stints[-1]['period'] == play['period']):
+                start_time = play['time']
+                stints[-1]['end time'] = start_time
+            else:
+                start_time = period_length(play['period'])
+            stints.append({
+                'period': play['period'],
+                'start time': start_time,
+                'end time': 0,
+                'first play': i,
+                'last play': i,
+                'home lineup': list(play['home partic']),
+                'away lineup': list(play['away partic'])
+            })
+            last_key = key
+        stints[-1]['last play'] = i
+
+    if len(stints) == 0:
+        return stints
+    starts = [stint['first play'] for stint in stints]
+    for team, points, stats in [("home", matrix.home_points, matrix.home_stats),
+                                ("away", matrix.away_points, matrix.away_stats)]:
+        for stint, stint_points, stint_stats in zip(stints, np.add.reduceat(points, starts),
+                                                    np.add.reduceat(stats, starts, axis=0)):
+            stint[f'{team} points'] = int(stint_points)
+            stats = stint[f'{team} stats'] = dict(zip(STAT_FIELDS,
+                                                      stint_stats.astype(int).tolist()))
+            stint[f'{team} possessions'] = stats['FGA'] - stats['ORB'] + stats['TOV'] \
+                + 0.44 * stats['FTA']
+    return stints
+
+
+def count_play(stats, play):
+    """Adds the action of a play to the stat counts of the team that did it."""
+    action = play['action']
+    if action == "shot":
+        stats['FGA'] += 1
+        stats['FGM'] += bool(play.get('flag 3'))
+        if play.get('flag 2') == "3":
+            stats['3PA'] += 1
+            stats['3PM'] += bool(play.get('flag 3'))
+    elif action == "free throw":
+        stats['FTA'] += 1
+        stats['FTM'] += bool(play.get('flag 3'))
+    elif action == "rebound":
+        if play.get('flag 3'):
+            stats['ORB'] += 1
+        else:
+            stats['DRB'] += 1
+    elif action == "assist":
+        stats['AST'] += 1
+    elif action == "turnover":
+        stats['TOV'] += 1
+    elif action == "steal":
+        stats['STL'] += 1
+    elif action == "block":
+        stats['BLK'] += 1
+    elif action == "foul committed":
+        stats['PF'] += 1
+
+
+def lineup_key(lineup):
+    """Returns a hashable key of the players in a lineup that doesn't depend on their order."""
+    return frozenset((player['player ID'], player['name']) for player in lineup
+                     if player is not None)
+
+
+def period_length(period):
+    """Returns the length of a period in seconds: 20 minutes for the two halves and 5 minutes
+    for each overtime."""
+    return HALF_LENGTH if period < 2 else OVERTIME_LENGTH
+
+
+def create_tables(cursor):
+    """Creates the stints table, if it doesn't exist.
+
+    Args:
+        cursor: The pymysql cursor of the database connection."""
+    cursor.execute(CREATE_STINTS_QUERY)
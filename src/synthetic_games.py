@@ -0,0 +1,606 @@
+import argparse
+import datetime
+import html
+import json
+import os
+import random
+import sys
+
+FIRST_NAMES = ["Aaron", "Brandon", "Calvin", "Darius", "Elijah", "Franklin", "Gavin", "Isaiah",
+               "Jalen", "Keegan", "Landon", "Marcus", "Nolan", "Oscar", "Preston", "Quentin",
+               "Reggie", "Simon", "Trevor", "Victor", "Wesley", "Xavier", "Tyrese", "Zachary"]
+LAST_NAMES = ["Anderson", "Baxter", "Carter", "Dawson", "Ellison", "Fletcher", "Garrison",
+              "Harper", "Ingram", "Jennings", "Kendall", "Lawson", "Morrison", "Norwood",
+              "Oakley", "Porter", "Quinlan", "Redmond", "Sawyer", "Thornton", "Underwood",
+              "Vaughn", "Whitaker", "Yardley"]
+SCHOOL_NAMES = ["Northern", "Southern", "Eastern", "Western", "Central", "Coastal", "Upstate",
+                "Valley", "Mountain", "Lakeshore", "Prairie", "Riverside"]
+REFEREE_NAMES = ["Pat Adams", "Sam Brooks", "Lee Collins", "Jo Dunn", "Kim Ellis", "Max Ford"]
+POSITIONS = ["G", "G", "F", "F", "C"]
+ROSTER_SIZE = 13
+REGULATION_LENGTH = 1200
+OVERTIME_LENGTH = 300
+FIRST_BOX_ID = 1700000
+FIRST_PBP_ID = 4700000
+FIRST_TEAM_SEASON_ID = 500000
+FIRST_PLAYER_ID = 2500000
+NOTATIONS = ["caps", "semicolon"]
+
+DEFAULT_SETTINGS = {
+    'turnover rate': 0.17,
+    'steal rate': 0.5,
+    'three point rate': 0.38,
+    'three point make rate': 0.35,
+    'two point make rate': 0.5,
+    'assist rate': 0.55,
+    'block rate': 0.08,
+    'offensive rebound rate': 0.3,
+    'deadball rebound rate': 0.05,
+    'shooting foul rate': 0.12,
+    'free throw make rate': 0.7,
+    'substitution rate': 0.12,
+    'timeout rate': 0.02,
+    'missing substitution rate': 0.03,
+    'garbage rate': 0.01
+}
+
+
+# Below are functions for making the teams that play in synthetic games.
+
+
+def make_teams(rng, count):
+    """Makes teams with rosters of players with made-up names and IDs.
+
+    Args:
+        rng: The random.Random used to make the teams.
+        count: The number of teams to make.
+
+    Returns:
+        A list of dicts with keys 'team season ID', 'name' and 'roster', where
+        the roster is a list of dicts with keys 'player ID', 'name' and
+        'position', in the same format as scrape_games.fetch_roster plus the
+        position."""
+    teams = []
+    for i in range(count):
+        roster = []
+        names = set()
+        while len(roster) < ROSTER_SIZE:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            if name not in names:
+                names.add(name)
+                roster.append({
+                    'player ID': FIRST_PLAYER_ID + i * ROSTER_SIZE + len(roster),
+                    'name': name,
+                    'position': POSITIONS[len(roster) % len(POSITIONS)]
+                })
+        teams.append({
+            'team season ID': FIRST_TEAM_SEASON_ID + i,
+            'name': f"{rng.choice(SCHOOL_NAMES)} St. {i + 1}",
+            'roster': roster
+        })
+    return teams
+
+
+# Below are functions for simulating games.
+
+
+def simulate_game(rng, home, away, settings=None):
+    """Simulates a game between two teams, possession by possession, including substitutions,
+    timeouts, overtimes, missing substitution entries and unparseable garbage entries.
+
+    Args:
+        rng: The random.Random used to simulate the game.
+        home: The home team, as a dict returned by make_teams.
+        away: The away team, as a dict returned by make_teams.
+        settings: A dict of rates overriding DEFAULT_SETTINGS.
+
+    Returns:
+        A dict with keys 'home', 'away', 'events' and 'boxes'. Events are dicts
+        with keys 'period', 'time', 'is away', 'player' (None for team
+        actions), 'action', 'home score', 'away score' and any details needed
+        to write the play out. Boxes map each player ID to a dict of the
+        player's stats and seconds played."""
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    game = {
+        'home': home,
+        'away': away,
+        'events': [],
+        'boxes': {player['player ID']: new_box() for player in home['roster'] + away['roster']},
+        'team boxes': {False: new_box(), True: new_box()},
+        'score': {False: 0, True: 0},
+        'on court': {False: home['roster'][:5], True: away['roster'][:5]},
+        'settings': settings,
+        'rng': rng
+    }
+
+    period = 0
+    offense = rng.random() < 0.5
+    add_event(game, period, REGULATION_LENGTH, offense, game['on court'][offense][4],
+              "jump ball", won=True)
+    add_event(game, period, REGULATION_LENGTH, not offense, game['on court'][not offense][4],
+              "jump ball", won=False)
+
+    while True:
+        time_left = REGULATION_LENGTH if period < 2 else OVERTIME_LENGTH
+        while time_left > 0:
+            elapsed = min(rng.uniform(5, 28), time_left)
+            time_left = round(time_left - elapsed, 2)
+            for is_away in [False, True]:
+                for player in game['on court'][is_away]:
+                    game['boxes'][player['player ID']]['seconds'] += elapsed
+            if not simulate_trip(game, period, time_left, offense):
+                offense = not offense
+            simulate_stoppage(game, period, time_left)
+
+        if (period >= 1) and (game['score'][False] != game['score'][True]):
+            break
+        period += 1
+
+    return game
+
+
+def new_box():
+    """Returns an empty stat line for a player or team."""
+    return {stat: 0 for stat in ["seconds", "FGM", "FGA", "3PM", "3PA", "FTM", "FTA", "ORB", "DRB",
+                                 "AST", "TOV", "STL", "BLK", "PF"]}
+
+
+def add_event(game, period, time_left, is_away, player, action, **details):
+    """Adds an event to the game with the current score."""
+    event = {
+        'period': period,
+        'time': time_left,
+        'is away': is_away,
+        'player': player,
+        'action': action,
+        'home score': game['score'][False],
+        'away score': game['score'][True]
+    }
+    event.update(details)
+    game['events'].append(event)
+
+
+def credit(game, is_away, player, stat, amount=1):
+    """Adds to a stat in the box of a player, or of the team if player is None."""
+    if player is None:
+        game['team boxes'][is_away][stat] += amount
+    else:
+        game['boxes'][player['player ID']][stat] += amount
+
+
+def simulate_trip(game, period, time_left, offense):
+    """Simulates one trip down the court by the offense.
+
+    Returns:
+        True if the offense keeps the ball (an offensive rebound), False
+        otherwise."""
+    rng = game['rng']
+    settings = game['settings']
+    defense = not offense
+    shooter = rng.choice(game['on court'][offense])
+
+    if rng.random() < settings['turnover rate']:
+        add_event(game, period, time_left, offense, shooter, "turnover",
+                  kind=rng.choice(["badpass", "lostball", "travel", "offensive"]))
+        credit(game, offense, shooter, "TOV")
+        if rng.random() < settings['steal rate']:
+            stealer = rng.choice(game['on court'][defense])
+            add_event(game, period, time_left, defense, stealer, "steal")
+            credit(game, defense, stealer, "STL")
+        return False
+
+    is_three = rng.random() < settings['three point rate']
+    make_rate = settings['three point make rate'] if is_three else settings['two point make rate']
+    made = rng.random() < make_rate
+    shot_type = "jump shot" if is_three else rng.choice(["jump shot", "layup", "dunk"])
+    add_event(game, period, time_left, offense, shooter, "shot", three=is_three, made=made,
+              kind=shot_type)
+    credit(game, offense, shooter, "FGA")
+    if is_three:
+        credit(game, offense, shooter, "3PA")
+    if made:
+        game['score'][offense] += 3 if is_three else 2
+        game['events'][-1]['home score'] = game['score'][False]
+        game['events'][-1]['away score'] = game['score'][True]
+        credit(game, offense, shooter, "FGM")
+        if is_three:
+            credit(game, offense, shooter, "3PM")
+        if rng.random() < settings['assist rate']:
+            passer = rng.choice([p for p in game['on court'][offense] if p is not shooter])
+            add_event(game, period, time_left, offense, passer, "assist")
+            credit(game, offense, passer, "AST")
+    elif rng.random() < settings['block rate']:
+        blocker = rng.choice(game['on court'][defense])
+        add_event(game, period, time_left, defense, blocker, "block")
+        credit(game, defense, blocker, "BLK")
+
+    # shooting fouls lead to free throws, both on missed shots and and-ones
+    if rng.random() < settings['shooting foul rate']:
+        fouler = rng.choice(game['on court'][defense])
+        add_event(game, period, time_left, defense, fouler, "foul committed")
+        add_event(game, period, time_left, offense, shooter, "foul received")
+        credit(game, defense, fouler, "PF")
+        attempts = 1 if made else (3 if is_three else 2)
+        for attempt in range(attempts):
+            ft_made = rng.random() < settings['free throw make rate']
+            if ft_made:
+                game['score'][offense] += 1
+            add_event(game, period, time_left, offense, shooter, "free throw", made=ft_made,
+                      attempt=attempt + 1, attempts=attempts)
+            credit(game, offense, shooter, "FTA")
+            if ft_made:
+                credit(game, offense, shooter, "FTM")
+        made = ft_made
+
+    if made:
+        return False
+
+    if rng.random() < settings['deadball rebound rate']:
+        add_event(game, period, time_left, defense, None, "rebound", kind="deadball")
+        return False
+    offensive = rng.random() < settings['offensive rebound rate']
+    rebounding_team = offense if offensive else defense
+    rebounder = rng.choice(game['on court'][rebounding_team])
+    add_event(game, period, time_left, rebounding_team, rebounder, "rebound",
+              kind="offensive" if offensive else "defensive")
+    credit(game, rebounding_team, rebounder, "ORB" if offensive else "DRB")
+    return offensive
+
+
+def simulate_stoppage(game, period, time_left):
+    """Simulates what happens during a stoppage after a trip: timeouts, substitutions (some of
+    whose entries go missing, as in real scorekeeping) and garbage entries."""
+    rng = game['rng']
+    settings = game['settings']
+    if (time_left > 0) and (rng.random() < settings['timeout rate']):
+        is_away = rng.random() < 0.5
+        add_event(game, period, time_left, is_away, None, "timeout",
+                  kind=rng.choice(["full", "short", "media"]))
+
+    for is_away in [False, True]:
+        if (time_left > 0) and (rng.random() < settings['substitution rate']):
+            team = game['away'] if is_away else game['home']
+            bench = [p for p in team['roster'] if p not in game['on court'][is_away]]
+            for _ in range(rng.randint(1, 2)):
+                leaving = rng.choice(game['on court'][is_away])
+                entering = rng.choice(bench)
+                bench.remove(entering)
+                game['on court'][is_away].remove(leaving)
+                game['on court'][is_away].append(entering)
+                if rng.random() >= settings['missing substitution rate']:
+                    add_event(game, period, time_left, is_away, leaving, "substitution",
+                              entering=False)
+                if rng.random() >= settings['missing substitution rate']:
+                    add_event(game, period, time_left, is_away, entering, "substitution",
+                              entering=True)
+
+    if rng.random() < settings['garbage rate']:
+        is_away = rng.random() < 0.5
+        add_event(game, period, time_left, is_away, rng.choice(game['on court'][is_away]),
+                  "garbage", kind=rng.choice(["foul", "turnover", "blank"]))
+
+
+# Below are functions for writing out simulated games as stats.ncaa.org webpages.
+
+
+def write_play(event, notation):
+    """Writes out an event as the text of a play in the given notation.
+
+    Args:
+        event: An event dict from simulate_game.
+        notation: 'caps' for the older all caps notation, or 'semicolon' for
+            the newer notation.
+
+    Returns:
+        The text of the play, or None if the event has no text in that
+        notation (e.g. jump balls are not recorded in caps notation)."""
+    if notation == "caps":
+        return write_caps_play(event)
+    else:
+        return write_semicolon_play(event)
+
+
+def write_caps_play(event):
+    """Writes out an event in caps notation, e.g. 'JONES,BOB Defensive Rebound'."""
+    action = event['action']
+    if event['player'] is None:
+        name = "TEAM"
+    else:
+        first, last = event['player']['name'].split(" ", 1)
+        name = f"{last.upper()},{first.upper()}"
+
+    if action == "shot":
+        result = "made" if event['made'] else "missed"
+        if event['three']:
+            return f"{name} {result} Three Point Jumper"
+        return f"{name} {result} " + {"jump shot": "Jumper", "layup": "Layup",
+                                       "dunk": "Dunk"}[event['kind']]
+    elif action == "free throw":
+        return f"{name} {'made' if event['made'] else 'missed'} Free Throw"
+    elif action == "rebound":
+        return f"{name} {event['kind'].title()} Rebound"
+    elif action == "turnover":
+        return f"{name} Turnover"
+    elif action == "steal":
+        return f"{name} Steal"
+    elif action == "assist":
+        return f"{name} Assist"
+    elif action == "block":
+        return f"{name} Blocked Shot"
+    elif action == "foul committed":
+        return f"{name} Commits Foul"
+    elif action == "substitution":
+        return f"{name} {'Enters' if event['entering'] else 'Leaves'} Game"
+    elif action == "timeout":
+        return {"full": "TEAM 30 Second Timeout", "short": "TEAM 20 Second Timeout",
+                "media": "TEAM Media Timeout"}[event['kind']]
+    elif action == "garbage":
+        return write_semicolon_play(event)
+    return None
+
+
+def write_semicolon_play(event):
+    """Writes out an event in semicolon notation, e.g. 'Bob Jones, rebound defensive'."""
+    action = event['action']
+    name = "Team" if event['player'] is None else event['player']['name']
+
+    if action == "jump ball":
+        return f"{name}, jumpball {'won' if event['won'] else 'lost'}"
+    elif action == "shot":
+        kind = {"jump shot": "jumpshot", "layup": "layup", "dunk": "dunk"}[event['kind']]
+        qualifiers = [] if (event['three'] or kind == "jumpshot") else ["pointsinthepaint"]
+        result = "made" if event['made'] else "missed"
+        length = "3pt" if event['three'] else "2pt"
+        return f"{name}, {length} {kind} {';'.join(qualifiers)}  {result}"
+    elif action == "free throw":
+        result = "made" if event['made'] else "missed"
+        return f"{name}, freethrow {event['attempt']}of{event['attempts']}  {result}"
+    elif action == "rebound":
+        return f"{name}, rebound {event['kind']}"
+    elif action == "turnover":
+        return f"{name}, turnover {event['kind']}"
+    elif action in ["steal", "assist", "block"]:
+        return f"{name}, {action}"
+    elif action == "foul committed":
+        return f"{name}, foul personal"
+    elif action == "foul received":
+        return f"{name}, foulon"
+    elif action == "substitution":
+        return f"{name}, substitution {'in' if event['entering'] else 'out'}"
+    elif action == "timeout":
+        if event['kind'] == "media":
+            return "Floor, timeout commercial"
+        return f"Team, timeout {event['kind']}"
+    elif action == "garbage":
+        # entries the parser can't make sense of, as found in real play-by-play logs
+        if event['kind'] == "foul":
+            return f"{name}, foul unknowntype"
+        elif event['kind'] == "turnover":
+            return f"{name}, turnover unknowntype"
+        return ""
+    return None
+
+
+def write_time(time_left, notation):
+    """Writes out the time remaining in a period as MM:SS (caps) or MM:SS:cc (semicolon)."""
+    centiseconds = int(round(time_left * 100))
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    if notation == "caps":
+        return f"{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}:{centiseconds:02d}"
+
+
+def write_summary_table(game):
+    """Writes out the table of scores by period that starts both kinds of game page."""
+    rows = ""
+    for is_away in [True, False]:
+        team = game['away'] if is_away else game['home']
+        rows += (f"<tr><td><a href=\"/teams/{team['team season ID']}\">"
+                 f"{html.escape(team['name'])}</a></td><td>{game['score'][is_away]}</td></tr>\n")
+    return f"<table class=\"mytable\">\n<tr><td>Team</td><td>Total</td></tr>\n{rows}</table>\n"
+
+
+def write_pbp_html(game, notation):
+    """Writes out a game as a stats.ncaa.org play-by-play webpage in the given notation."""
+    periods = {}
+    for event in game['events']:
+        text = write_play(event, notation)
+        if text is None:
+            continue
+        text = html.escape(text)
+        away_text, home_text = (text, "") if event['is away'] else ("", text)
+        score = f"{event['away score']}-{event['home score']}"
+        periods.setdefault(event['period'], []).append(
+            f"<tr><td class=\"smtext\">{write_time(event['time'], notation)}</td>"
+            f"<td class=\"smtext\">{away_text}</td><td class=\"smtext\">{score}</td>"
+            f"<td class=\"smtext\">{home_text}</td></tr>")
+
+    tables = ""
+    for period in sorted(periods):
+        tables += ("<table class=\"mytable\" width=\"100%\">\n"
+                   f"<tr><td class=\"boldtext\">Time</td>"
+                   f"<td class=\"boldtext\">{html.escape(game['away']['name'])}</td>"
+                   f"<td class=\"boldtext\">Score</td>"
+                   f"<td class=\"boldtext\">{html.escape(game['home']['name'])}</td></tr>\n"
+                   + "\n".join(periods[period]) + "\n</table>\n")
+    return f"<html><body>\n{write_summary_table(game)}{tables}</body></html>\n"
+
+
+def write_box_html(game, box_id, pbp_id, start_time):
+    """Writes out a game as a stats.ncaa.org box score webpage.
+
+    Args:
+        game: A game dict returned by simulate_game.
+        box_id: The box ID of the game.
+        pbp_id: The PBP ID of the game, linked from the page's menu.
+        start_time: The start time of the game, as a datetime.datetime."""
+    menu = (f"<ul class=\"level1\"><li><a href=\"/game/play_by_play/{pbp_id}\">Play by Play</a>"
+            f"</li><li><a href=\"/contests/{box_id}/box_score\">Box Score</a></li>"
+            "<li><a href=\"#\">Team Stats</a></li><li><a href=\"#\">Individual Stats</a></li>"
+            "<li><a href=\"#\">Game Notes</a></li></ul>\n")
+    rng = game['rng']
+    referees = rng.sample(REFEREE_NAMES, 3)
+    metadata = ("<table width=\"50%\" align=\"center\"><tr><td>Period scores</td></tr></table>\n"
+                "<table width=\"50%\" align=\"center\"><tr><td>Records</td></tr></table>\n"
+                "<table width=\"50%\" align=\"center\">"
+                f"<tr><td>Game Date:</td><td>{start_time.strftime('%m/%d/%Y %I:%M %p')}</td></tr>"
+                f"<tr><td>Location:</td><td>{html.escape(game['home']['name'])} Arena</td></tr>"
+                f"<tr><td>Attendance:</td><td>{rng.randint(500, 15000):,}</td></tr></table>\n"
+                "<table width=\"50%\" align=\"center\"><tr><td>Officials:</td>"
+                f"<td>\n{referees[0]}\n\n{referees[1]}\n\n{referees[2]}\n</td></tr></table>\n")
+
+    box_tables = ""
+    for is_away in [True, False]:
+        team = game['away'] if is_away else game['home']
+        rows = ""
+        for player in team['roster']:
+            box = game['boxes'][player['player ID']]
+            if box['seconds'] == 0:
+                continue
+            first, last = player['name'].split(" ", 1)
+            seconds = int(round(box['seconds']))
+            rows += (f"<tr class=\"smtext\"><td><a href=\"/players/{player['player ID']}\">"
+                     f"{html.escape(last)}, {html.escape(first)}</a></td>"
+                     f"<td>{player['position']}</td><td>1</td>"
+                     f"<td>{seconds // 60}:{seconds % 60:02d}</td>"
+                     + write_box_stats(box) + "</tr>\n")
+        rows += ("<tr class=\"smtext\"><td>TEAM</td><td></td><td></td><td></td>"
+                 + write_box_stats(game['team boxes'][is_away]) + "</tr>\n")
+        box_tables += ("<table class=\"mytable\" width=\"100%\">\n"
+                       f"<tr class=\"heading\"><td colspan=\"20\">{html.escape(team['name'])}</td>"
+                       "</tr>\n<tr class=\"grey_heading\"><td>Player</td><td>Pos</td><td>GP</td>"
+                       "<td>MP</td><td>FGM</td><td>FGA</td><td>3FG</td><td>3FGA</td><td>FT</td>"
+                       "<td>FTA</td><td>PTS</td><td>ORebs</td><td>DRebs</td><td>Tot Reb</td>"
+                       "<td>AST</td><td>TO</td><td>STL</td><td>BLK</td><td>Fouls</td><td>DQ</td>"
+                       f"</tr>\n{rows}</table>\n")
+
+    return (f"<html><body>\n{menu}{write_summary_table(game)}{metadata}{box_tables}"
+            "</body></html>\n")
+
+
+def write_scoreboard_html(box_ids):
+    """Writes out a stats.ncaa.org scoreboard webpage linking to the box scores of the given
+    games."""
+    rows = "".join(f"<tr style=\"border-bottom: 1px solid #cccccc\"><td>"
+                   f"<a class=\"skipMask\" href=\"/contests/{box_id}/box_score\">Box Score</a>"
+                   "</td></tr>\n" for box_id in box_ids)
+    return ("<html><body>\n<table style=\"border-collapse: collapse\">\n"
+            f"{rows}</table>\n</body></html>\n")
+
+
+def write_box_stats(box):
+    """Writes out the stat cells of one row of a box score, from FGM through DQ. Zero stats are
+    left blank, as they are on stats.ncaa.org."""
+    points = 2 * box['FGM'] + box['3PM'] + box['FTM']
+    stats = [box['FGM'], box['FGA'], box['3PM'], box['3PA'], box['FTM'], box['FTA'], points,
+             box['ORB'], box['DRB'], box['ORB'] + box['DRB'], box['AST'], box['TOV'], box['STL'],
+             box['BLK'], box['PF'], 0]
+    return "".join(f"<td>{stat if stat != 0 else ''}</td>" for stat in stats)
+
+
+# Below are functions for generating whole corpora of synthetic games.
+
+
+def generate_games(count, seed=0, team_count=None, notation=None, settings=None):
+    """Generates synthetic games, one at a time.
+
+    Args:
+        count: The number of games to generate.
+        seed: The seed of the random game simulator. The same seed always
+            generates the same games.
+        team_count: The number of teams the games are played between. Defaults
+            to enough teams that each plays about 30 games, like a season.
+        notation: 'caps' or 'semicolon' to write every game in that notation,
+            or None to choose randomly for each game.
+        settings: A dict of rates overriding DEFAULT_SETTINGS.
+
+    Yields:
+        A dict for each game with keys 'box ID', 'pbp ID', 'start time',
+        'notation', 'box html', 'pbp html', 'home team season ID', 'away team
+        season ID', 'home roster' and 'away roster'. The rosters are in the
+        format returned by scrape_games.fetch_roster."""
+    rng = random.Random(seed)
+    if team_count is None:
+        team_count = max(2, count // 15)
+    teams = make_teams(rng, team_count)
+    season_start = datetime.datetime(2019, 11, 5, 19, 0)
+
+    for i in range(count):
+        home, away = rng.sample(teams, 2)
+        game = simulate_game(rng, home, away, settings)
+        game_notation = notation if notation is not None else rng.choice(NOTATIONS)
+        start_time = season_start + datetime.timedelta(days=i * 120 // max(count, 1),
+                                                       hours=rng.randint(-7, 2))
+        yield {
+            'box ID': FIRST_BOX_ID + i,
+            'pbp ID': FIRST_PBP_ID + i,
+            'start time': start_time,
+            'notation': game_notation,
+            'box html': write_box_html(game, FIRST_BOX_ID + i, FIRST_PBP_ID + i, start_time),
+            'pbp html': write_pbp_html(game, game_notation),
+            'home team season ID': home['team season ID'],
+            'away team season ID': away['team season ID'],
+            'home roster': strip_positions(home['roster']),
+            'away roster': strip_positions(away['roster'])
+        }
+
+
+def strip_positions(roster):
+    """Returns a roster in the format returned by scrape_games.fetch_roster."""
+    return [{'player ID': player['player ID'], 'name': player['name']} for player in roster]
+
+
+def write_corpus(path, count, seed=0, team_count=None, notation=None, settings=None):
+    """Writes synthetic games to a directory as a corpus of stored pages, in the layout read by
+    benchmark.load_corpus: box_{box ID}.html, pbp_{PBP ID}.html and a rosters.json from team
+    season ID to roster. A scoreboard_{YYYYMMDD}.html listing the games of each day is written
+    too, for stand_in_server to serve.
+
+    Args:
+        path: The directory to write the corpus to. It is created if needed.
+        count: The number of games to write.
+        seed, team_count, notation, settings: As in generate_games.
+
+    Returns:
+        The list of box IDs of the games written."""
+    os.makedirs(path, exist_ok=True)
+    rosters = {}
+    box_ids = []
+    box_ids_by_date = {}
+    for game in generate_games(count, seed, team_count, notation, settings):
+        rosters[str(game['home team season ID'])] = game['home roster']
+        rosters[str(game['away team season ID'])] = game['away roster']
+        with open(os.path.join(path, f"box_{game['box ID']}.html"), 'w') as box_file:
+            box_file.write(game['box html'])
+        with open(os.path.join(path, f"pbp_{game['pbp ID']}.html"), 'w') as pbp_file:
+            pbp_file.write(game['pbp html'])
+        box_ids.append(game['box ID'])
+        box_ids_by_date.setdefault(game['start time'].strftime('%Y%m%d'), []).append(game['box ID'])
+
+    for date, date_box_ids in box_ids_by_date.items():
+        with open(os.path.join(path, f"scoreboard_{date}.html"), 'w') as scoreboard_file:
+            scoreboard_file.write(write_scoreboard_html(date_box_ids))
+    with open(os.path.join(path, "rosters.json"), 'w') as rosters_file:
+        json.dump(rosters, rosters_file)
+    return box_ids
+
+
+# Main method. Writes a corpus of synthetic games.
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write a corpus of synthetic stats.ncaa.org "
+                                                 "box score and play-by-play pages.")
+    parser.add_argument('path')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--teams', type=int, default=None)
+    parser.add_argument('--notation', choices=NOTATIONS, default=None)
+    args = parser.parse_args(argv)
+    box_ids = write_corpus(args.path, args.games, args.seed, args.teams, args.notation)
+    print(f"Wrote {len(box_ids)} games to {args.path}.")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,449 @@
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+import pymysql
+
+import database
+import elo
+import scrape_log
+import stints
+
+PATH_MODEL = "win_probability.json"
+FEATURES = ["intercept", "margin", "possession", "rating gap", "time"]
+RATING_SCALE = 100      # Elo points per unit of the rating gap feature
+SCALE_MINUTES = 0.1     # minutes of noise added to the time left, so the scale is never 0
+PENALTY = 1e-4
+SOLVER_TOLERANCE = 1e-8
+MAX_ITERATIONS = 50
+STREAM_BATCH_SIZE = 100000
+UPLOAD_BATCH_SIZE = 10000
+FETCH_GAMES_QUERY = ("SELECT g.game_id, DATE(g.start_time), home_ts.season_year, "
+                     "home_ts.school_id, away_ts.school_id FROM games g "
+                     "JOIN team_seasons home_ts ON home_ts.team_season_id = g.h_team_season_id "
+                     "JOIN team_seasons away_ts ON away_ts.team_season_id = g.a_team_season_id "
+                     "WHERE g.start_time >= %s AND g.start_time < %s AND NOT g.is_exhibition "
+                     "ORDER BY g.game_id")
+FETCH_PLAYS_QUERY = ("SELECT p.game_id, p.play_in_game, p.period, p.time_remaining, p.h_score, "
+                     "p.a_score, p.offense_is_away FROM plays p "
+                     "JOIN games g ON g.game_id = p.game_id "
+                     "WHERE g.start_time >= %s AND g.start_time < %s AND NOT g.is_exhibition "
+                     "ORDER BY p.game_id, p.play_in_game")
+FETCH_SCHOOL_QUERY = "SELECT school_id FROM team_seasons WHERE team_season_id = %s"
+CREATE_PROBABILITIES_QUERY = ("CREATE TABLE IF NOT EXISTS win_probabilities ("
+                              "game_id INT NOT NULL, play_in_game INT NOT NULL,"
+                              "home_win_probability FLOAT,"
+                              "PRIMARY KEY (game_id, play_in_game));")
+UPLOAD_PROBABILITIES_QUERY = ("INSERT INTO win_probabilities (game_id, play_in_game, "
+                              "home_win_probability) VALUES (%s, %s, %s) ON DUPLICATE KEY "
+                              "UPDATE home_win_probability = VALUES(home_win_probability);")
+
+LOGGER = scrape_log.get_logger("win_probability")
+
+
+class WinProbabilityModel:
+    """A logistic regression of whether the home team wins on the state of the game at each play
+    (see make_features). Its few coefficients are stored as JSON, so scoring a game is a handful
+    of array operations.
+    """
+
+    def __init__(self, coefficients, info=None):
+        """
+        Args:
+            coefficients: The coefficient of each of the FEATURES.
+            info: A dict of facts about how the model was fit, stored with it."""
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.info = info or {}
+
+    def predict(self, features):
+        """Returns the probability that the home team wins at each row of a feature matrix."""
+        return sigmoid(features @ self.coefficients)
+
+    def score_plays(self, plays, rating_gap=0):
+        """Returns an array of the probability that the home team wins after each play of a
+        game.
+
+        Args:
+            plays: The plays of the game, as a list of dicts, with 'offense is
+                away' set by possessions.assign_possessions.
+            rating_gap: The home team's pregame rating minus the away team's,
+                in Elo points."""
+        periods = np.array([play['period'] for play in plays], dtype=float)
+        times = np.array([play['time'] for play in plays], dtype=float)
+        starts = np.zeros(len(plays), dtype=bool)
+        starts[:1] = True
+        margins = fill_scores(starts, to_floats([play.get('home score') for play in plays])) \
+            - fill_scores(starts, to_floats([play.get('away score') for play in plays]))
+        offense = to_floats([play.get('offense is away') for play in plays])
+        return self.predict(make_features(periods, times, margins, offense,
+                                          np.full(len(plays), float(rating_gap))))
+
+    def save(self, path=PATH_MODEL):
+        """Writes the model to a JSON file."""
+        with open(path, 'w') as model_file:
+            json.dump({'features': FEATURES, 'coefficients': self.coefficients.tolist(),
+                       'info': self.info}, model_file, indent=2)
+
+
+class GameScorer:
+    """Scores the plays of games as they are uploaded and stores the probabilities in the
+    win_probabilities table. Pregame rating gaps are read from the Elo checkpoints of the day
+    before each game, kept for the day so a night's games need one read each.
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model: The WinProbabilityModel to score plays with."""
+        self.model = model
+        self.states = {}
+        self.school_ids = {}
+
+    def create_tables(self, cursor):
+        create_tables(cursor)
+
+    def school_id(self, cursor, team_season_id):
+        if team_season_id not in self.school_ids:
+            cursor.execute(FETCH_SCHOOL_QUERY, (team_season_id,))
+            row = cursor.fetchone()
+            self.school_ids[team_season_id] = None if row is None else row[0]
+        return self.school_ids[team_season_id]
+
+    def state(self, cursor, game_date):
+        """Returns the state of the Elo engine at the end of the day before a date, or None if
+        there is no checkpoint that early. Missing states are not kept, in case the checkpoint
+        is written later in the run."""
+        if game_date not in self.states:
+            state = elo.load_checkpoint(cursor, game_date - datetime.timedelta(1))[1]
+            if state is None:
+                return None
+            self.states[game_date] = state
+        return self.states[game_date]
+
+    def upload_game(self, cursor, game_id, season, game_time, team_season_ids, plays):
+        """Scores the plays of a game and uploads their probabilities in one batch.
+
+        Args:
+            cursor: The pymysql cursor of the database connection.
+            game_id: The PBP ID of the game.
+            season: The year of the season of the game.
+            game_time: The start time of the game, as returned by
+                scrape_games.find_game_time.
+            team_season_ids: The home and away team season IDs of the game.
+            plays: The plays of the game, as a list of dicts.
+
+        Returns:
+            The array of probabilities."""
+        game_date = datetime.datetime.strptime(game_time[:10], '%Y/%m/%d').date()
+        h_school_id, a_school_id = (self.school_id(cursor, team_season_id)
+                                    for team_season_id in team_season_ids)
+        gap = rating_gap(self.state(cursor, game_date), season, h_school_id, a_school_id)
+        probabilities = self.model.score_plays(plays, gap)
+        if len(plays) > 0:
+            cursor.executemany(UPLOAD_PROBABILITIES_QUERY, [
+                (game_id, i, round(float(probability), 4))
+                for i, probability in enumerate(probabilities)])
+        return probabilities
+
+
+def sigmoid(values):
+    return 1 / (1 + np.exp(-np.clip(values, -500, 500)))
+
+
+def to_floats(values):
+    """Converts a list of numbers, booleans and Nones to a float array with NaN for None."""
+    return np.array([np.nan if value is None else float(value) for value in values])
+
+
+def fill_scores(starts, scores):
+    """Carries the last listed score forward over the plays that don't list one, within each
+    game. Plays before a game's first listed score get 0.
+
+    Args:
+        starts: A boolean array that is True at the first play of each game.
+        scores: A float array of a team's score after each play, NaN where
+            the play doesn't list it.
+
+    Returns:
+        The filled float array."""
+    listed = ~np.isnan(scores)
+    values = np.where(listed, scores, 0)
+    sources = np.where(listed | starts, np.arange(len(scores)), 0)
+    return values[np.maximum.accumulate(sources)] if len(scores) > 0 else values
+
+
+def make_features(periods, times, margins, offense_is_away, rating_gaps):
+    """Makes the feature matrix of plays. The outcome of a game is close to the current margin,
+    plus a point or so for having the ball and the pregame edge prorated over the time left,
+    give or take noise that grows with the square root of the time left. So each term is divided
+    by that square root:
+
+        margin: The home team's margin.
+        possession: 1 if the home team has the ball, -1 if the away team
+            does, 0 if neither.
+        rating gap: The rating gap scaled by the share of regulation left.
+        time: The share of regulation left, for home court.
+
+    Args:
+        periods: An array of the period of each play.
+        times: An array of the seconds left in the period at each play.
+        margins: An array of the home team's score minus the away team's.
+        offense_is_away: A float array of 1 where the away team has the ball,
+            0 where the home team does and NaN where neither does.
+        rating_gaps: An array of the home team's pregame rating minus the
+            away team's at each play, in Elo points.
+
+    Returns:
+        A float array with a row for each play and a column for each of the
+        FEATURES."""
+    remaining = np.maximum(np.where(periods < 2, (1 - periods) * stints.HALF_LENGTH + times,
+                                    times), 0)
+    scale = np.sqrt(remaining / 60 + SCALE_MINUTES)
+    share = np.minimum(remaining / (2 * stints.HALF_LENGTH), 1)
+    possession = np.where(np.isnan(offense_is_away), 0, 1 - 2 * np.nan_to_num(offense_is_away))
+    return np.column_stack([np.ones(len(periods)), margins / scale, possession / scale,
+                            rating_gaps / RATING_SCALE * share / scale, share / scale])
+
+
+def rating_gap(state, season, h_school_id, a_school_id):
+    """Returns the home team's Elo rating minus the away team's, from the state of the engine
+    before a game. If the state is from an earlier season, the gap is regressed as it would be
+    at the season's first game.
+
+    Args:
+        state: The state of the elo.EloEngine, or None if there is none.
+        season: The year of the season of the game.
+        h_school_id: The home team's school ID.
+        a_school_id: The away team's school ID."""
+    if state is None:
+        return 0.0
+    engine = elo.EloEngine(state)
+    gap = engine.rating(h_school_id) - engine.rating(a_school_id)
+    return gap if state['season'] == season else gap * engine.carryover
+
+
+def game_starts(game_ids):
+    """Returns a boolean array that is True at the first play of each game, given the game ID of
+    each play in order of game."""
+    starts = np.ones(len(game_ids), dtype=bool)
+    starts[1:] = game_ids[1:] != game_ids[:-1]
+    return starts
+
+
+def game_outcomes(starts, margins):
+    """Finds the outcome of the game of each play from its final margin.
+
+    Args:
+        starts: The array returned by game_starts.
+        margins: An array of the home team's margin after each play.
+
+    Returns:
+        A float array of 1 where the home team won the play's game, 0 where it
+        lost and NaN where the last play is tied."""
+    ends = np.append(starts[1:], True)
+    final = margins[ends]
+    results = np.where(final > 0, 1.0, np.where(final < 0, 0.0, np.nan))
+    return results[np.cumsum(starts) - 1]
+
+
+def fit_model(features, outcomes, penalty=PENALTY):
+    """Fits the coefficients of a logistic regression by Newton's method, solving the small
+    system of the features at each step.
+
+    Args:
+        features: The feature matrix, as returned by make_features.
+        outcomes: An array of 1 where the home team won and 0 where it lost.
+        penalty: The ridge penalty, which keeps the fit stable if a feature
+            separates the outcomes.
+
+    Returns:
+        A tuple of the coefficients and the number of iterations."""
+    coefficients = np.zeros(features.shape[1])
+    iterations = 0
+    while iterations < MAX_ITERATIONS:
+        iterations += 1
+        probabilities = sigmoid(features @ coefficients)
+        gradient = features.T @ (probabilities - outcomes) + penalty * coefficients
+        hessian = (features.T * (probabilities * (1 - probabilities))) @ features \
+            + penalty * np.eye(len(coefficients))
+        step = np.linalg.solve(hessian, gradient)
+        coefficients -= step
+        if np.abs(step).max() < SOLVER_TOLERANCE:
+            break
+    return coefficients, iterations
+
+
+def log_loss(probabilities, outcomes):
+    clipped = np.clip(probabilities, 1e-12, 1 - 1e-12)
+    return float(-np.mean(outcomes * np.log(clipped) + (1 - outcomes) * np.log(1 - clipped)))
+
+
+def fetch_plays(conn, start_date, end_date):
+    """Reads the plays of the games in a date range through a server-side cursor, into arrays.
+
+    Args:
+        conn: A pymysql connection used for nothing else until the plays are
+            all read.
+        start_date: The first date of games, inclusive.
+        end_date: The last date of games, exclusive.
+
+    Returns:
+        A dict of float arrays with keys 'game IDs', 'plays in game',
+        'periods', 'times', 'home scores', 'away scores' and 'offense is
+        away', in order of game and play. Missing values are NaN."""
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(FETCH_PLAYS_QUERY, (start_date, end_date))
+    chunks = []
+    try:
+        rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+        while len(rows) > 0:
+            chunks.append(np.array(rows, dtype=float))
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+    finally:
+        cursor.close()
+    table = np.concatenate(chunks) if len(chunks) > 0 else np.zeros((0, 7))
+    return dict(zip(['game IDs', 'plays in game', 'periods', 'times', 'home scores',
+                     'away scores', 'offense is away'], table.T))
+
+
+def fetch_rating_gaps(cursor, start_date, end_date):
+    """Finds the pregame Elo rating gap of each game in a date range, from the checkpoint of the
+    day before it.
+
+    Returns:
+        A dict from game ID to the home team's rating minus the away team's."""
+    cursor.execute(FETCH_GAMES_QUERY, (start_date, end_date))
+    games = cursor.fetchall()
+    states = {}
+    gaps = {}
+    for game_id, game_date, season, h_school_id, a_school_id in games:
+        if game_date not in states:
+            states[game_date] = elo.load_checkpoint(cursor, game_date - datetime.timedelta(1))[1]
+        gaps[game_id] = rating_gap(states[game_date], season, h_school_id, a_school_id)
+    return gaps
+
+
+def make_season_features(plays, gaps):
+    """Makes the features and outcomes of plays read by fetch_plays.
+
+    Args:
+        plays: The arrays returned by fetch_plays.
+        gaps: The rating gaps returned by fetch_rating_gaps. Games without a
+            gap get 0.
+
+    Returns:
+        A tuple of the feature matrix and the outcome array, which is NaN for
+        plays of games that end tied."""
+    starts = game_starts(plays['game IDs'])
+    margins = fill_scores(starts, plays['home scores']) - fill_scores(starts, plays['away scores'])
+    outcomes = game_outcomes(starts, margins)
+    game_ids = plays['game IDs'][starts]
+    game_gaps = np.array([gaps.get(int(game_id), 0.0) for game_id in game_ids])
+    features = make_features(plays['periods'], plays['times'], margins,
+                             plays['offense is away'], game_gaps[np.cumsum(starts) - 1])
+    return features, outcomes
+
+
+def train(read_conn, write_conn, start_date, end_date, path=PATH_MODEL):
+    """Fits the model to the plays of the games in a date range and writes it to a file.
+
+    Args:
+        read_conn: The pymysql connection to stream the plays through.
+        write_conn: Another pymysql connection, to read rating gaps through.
+        start_date: The first date of games, inclusive.
+        end_date: The last date of games, exclusive.
+        path: The path to write the model to.
+
+    Returns:
+        The WinProbabilityModel."""
+    plays = fetch_plays(read_conn, start_date, end_date)
+    gaps = fetch_rating_gaps(write_conn.cursor(), start_date, end_date)
+    features, outcomes = make_season_features(plays, gaps)
+    decided = ~np.isnan(outcomes)
+    coefficients, iterations = fit_model(features[decided], outcomes[decided])
+    model = WinProbabilityModel(coefficients, {
+        'start date': start_date.isoformat(), 'end date': end_date.isoformat(),
+        'plays': int(decided.sum()), 'iterations': iterations,
+        'log loss': log_loss(sigmoid(features[decided] @ coefficients), outcomes[decided])
+    })
+    model.save(path)
+    LOGGER.info("Fit the win probability model to %s plays in %s iterations; log loss %.4f.",
+                model.info['plays'], iterations, model.info['log loss'])
+    return model
+
+
+def load_model(path=PATH_MODEL):
+    """Reads a model written by WinProbabilityModel.save.
+
+    Returns:
+        The WinProbabilityModel, or None if there is no file at the path."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as model_file:
+        stored = json.load(model_file)
+    if stored['features'] != FEATURES:
+        raise ValueError(f"Model features {stored['features']} do not match {FEATURES}.")
+    return WinProbabilityModel(stored['coefficients'], stored['info'])
+
+
+def create_tables(cursor):
+    """Creates the win_probabilities table, if it doesn't exist.
+
+    Args:
+        cursor: The pymysql cursor of the database connection."""
+    cursor.execute(CREATE_PROBABILITIES_QUERY)
+
+
+def score_range(read_conn, write_conn, model, start_date, end_date):
+    """Scores the stored plays of the games in a date range, e.g. after the model is refit.
+
+    Args:
+        read_conn: The pymysql connection to stream the plays through.
+        write_conn: Another pymysql connection, to write probabilities
+            through.
+        model: The WinProbabilityModel.
+        start_date: The first date of games, inclusive.
+        end_date: The last date of games, exclusive.
+
+    Returns:
+        The number of plays scored."""
+    cursor = write_conn.cursor()
+    create_tables(cursor)
+    plays = fetch_plays(read_conn, start_date, end_date)
+    features, _ = make_season_features(plays, fetch_rating_gaps(cursor, start_date, end_date))
+    probabilities = np.round(model.predict(features), 4)
+    rows = list(zip(plays['game IDs'].astype(int).tolist(),
+                    plays['plays in game'].astype(int).tolist(), probabilities.tolist()))
+    for i in range(0, len(rows), UPLOAD_BATCH_SIZE):
+        cursor.executemany(UPLOAD_PROBABILITIES_QUERY, rows[i:i + UPLOAD_BATCH_SIZE])
+        write_conn.commit()
+    LOGGER.info("Scored %s plays from %s to %s.", len(rows), start_date, end_date)
+    return len(rows)
+
+
+# Main method. Fits the model to the games in a date range, or scores the stored plays of a range
+# with the fitted model.
+
+
+def main(argv):
+    scrape_log.configure()
+    score = argv[:1] == ['score']
+    if score:
+        argv = argv[1:]
+    start_date = datetime.date(int(argv[0]), int(argv[1]), int(argv[2]))
+    end_date = datetime.date(int(argv[3]), int(argv[4]), int(argv[5]))
+    read_conn = database.connect_to_db()
+    write_conn = database.connect_to_db()
+    if not score:
+        train(read_conn, write_conn, start_date, end_date)
+    else:
+        model = load_model()
+        if model is None:
+            raise FileNotFoundError(f"No win probability model at {PATH_MODEL}.")
+        score_range(read_conn, write_conn, model, start_date, end_date)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,32 @@
+import src.benchmark as benchmark
+
+
+def test_compare_to_baseline():
+    """Tests that only stages slower than the baseline by more than the
+    tolerance are reported as regressions."""
+    baseline = {
+        'stages': {'track_partic': 0.010, 'parse_all_plays': 0.020},
+        'peak memory': 1000
+    }
+    results = {
+        'stages': {'track_partic': 0.013, 'parse_all_plays': 0.021, 'soup': 0.5},
+        'peak memory': 1100
+    }
+    assert benchmark.compare_to_baseline(results, baseline, 0.2) == [
+        ('track_partic', 0.010, 0.013)]
+    assert benchmark.compare_to_baseline(results, baseline, 0.5) == []
+
+    results['peak memory'] = 2000
+    assert benchmark.compare_to_baseline(results, baseline, 0.5) == [
+        ('peak memory', 1000, 2000)]
+
+
+def test_main_default_corpus(tmp_path, monkeypatch):
+    """Tests that the benchmark runs without a corpus given, on a synthetic
+    corpus it writes on first use."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(benchmark, 'DEFAULT_CORPUS_GAMES', 2)
+    assert benchmark.main(["--repeats", "1"]) == 0
+    assert len(list((tmp_path / benchmark.PATH_CORPUS).glob("box_*.html"))) == 2
+    assert benchmark.main(["--repeats", "1", "--save-baseline"]) == 0
+    assert benchmark.main(["--repeats", "1", "--tolerance", "100"]) == 0
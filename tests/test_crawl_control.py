@@ -0,0 +1,106 @@
+import threading
+import time
+
+import src.crawl_control as crawl_control
+
+
+def test_retry_budget():
+    """Tests that parse retries need transport attempts left to be spent."""
+    budget = crawl_control.RetryBudget(transport_attempts=2, parse_retries=5)
+    assert budget.spend_transport()
+    assert budget.spend_parse()
+    assert budget.spend_transport()
+    assert not budget.has_transport()
+    assert not budget.spend_transport()
+    assert not budget.spend_parse()
+    assert budget.transport_attempts == 2
+    assert budget.parse_retries == 1
+
+
+def test_aimd():
+    """Tests that the concurrency limit grows while requests succeed and is
+    cut when they fail."""
+    controller = crawl_control.CrawlController(initial_concurrency=4, max_concurrency=8)
+    for _ in range(100):
+        controller.acquire()
+        controller.release(True, 0.1)
+    assert controller.summary()['concurrency limit'] == 8
+
+    controller.acquire()
+    controller.release(False)
+    assert controller.summary()['concurrency limit'] == 4
+
+    # a second failure right after the first doesn't cut the limit again
+    controller.acquire()
+    controller.release(False)
+    assert controller.summary()['concurrency limit'] == 4
+
+    controller.acquire()
+    controller.release(True, crawl_control.SLOW_LATENCY + 1)
+    assert controller.summary()['concurrency limit'] == 4
+
+
+def test_circuit_breaker():
+    """Tests that the breaker opens when most requests fail, and closes again
+    after a successful probe."""
+    controller = crawl_control.CrawlController()
+    for _ in range(crawl_control.BREAKER_MIN_SAMPLES):
+        controller.acquire()
+        controller.release(False)
+    assert controller.summary()['breaker'] == 'open'
+
+    controller.open_until = 0       # skip the pause
+    controller.acquire()
+    assert controller.summary()['breaker'] == 'half open'
+    controller.release(True, 0.1)
+    assert controller.summary()['breaker'] == 'closed'
+    assert controller.summary()['error rate'] == 0
+
+
+def test_backoff():
+    """Tests that backoff waits are jittered below an exponentially growing
+    cap."""
+    controller = crawl_control.CrawlController(seed=0)
+    for attempt in range(1, 12):
+        cap = min(crawl_control.BASE_BACKOFF * 2 ** (attempt - 1), crawl_control.MAX_BACKOFF)
+        assert 0 <= controller.backoff(attempt) <= cap
+
+
+def test_release_without_outcome():
+    """Tests that a request that never reached the site, e.g. through a dead
+    proxy, neither trips the breaker nor changes the limit."""
+    controller = crawl_control.CrawlController(initial_concurrency=4)
+    for _ in range(2 * crawl_control.BREAKER_MIN_SAMPLES):
+        controller.acquire()
+        controller.release(None)
+    summary = controller.summary()
+    assert summary['breaker'] == 'closed'
+    assert summary['concurrency limit'] == 4
+    assert summary['in flight'] == 0
+    assert summary['error rate'] == 0
+
+
+def test_map():
+    """Tests that map returns results in order while running as many calls at
+    once as the concurrency limit allows."""
+    controller = crawl_control.CrawlController(initial_concurrency=3)
+    lock = threading.Lock()
+    running = [0]
+    most_running = [0]
+
+    def call(item):
+        with lock:
+            running[0] += 1
+            most_running[0] = max(most_running[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return 2 * item
+
+    assert list(controller.map(call, range(12))) == [2 * item for item in range(12)]
+    assert most_running[0] == 3
+
+    controller.limit = 1.0
+    most_running[0] = 0
+    assert list(controller.map(call, range(4))) == [0, 2, 4, 6]
+    assert most_running[0] == 1
@@ -0,0 +1,207 @@
+import datetime
+
+import src.crawl_daemon as crawl_daemon
+import src.instrument as instrument
+import src.scrape_games as sg
+
+
+def make_game(box_id):
+    return {'box ID': box_id, 'season': 2020, 'date': datetime.date(2020, 3, 1)}
+
+
+def test_schedule():
+    """Tests that games come due after they should end, in order, and are
+    rechecked on a decaying schedule until given up on."""
+    schedule = crawl_daemon.CrawlSchedule()
+    start = datetime.datetime(2020, 3, 1, 19, 0)
+    assert schedule.next_due() is None
+    assert schedule.add(make_game(2), start + datetime.timedelta(hours=2))
+    assert schedule.add(make_game(1), start)
+    assert not schedule.add(make_game(1), start)
+    assert schedule.next_due() == start + crawl_daemon.EXPECTED_GAME_LENGTH
+
+    assert schedule.pop_due(start) == []
+    now = start + datetime.timedelta(hours=5)
+    due = schedule.pop_due(now)
+    assert [game['box ID'] for game in due] == [1, 2]
+
+    schedule.finish(due[1])
+    assert not schedule.add(make_game(2), start)
+    game = due[0]
+    for delay in crawl_daemon.RECHECK_DELAYS:
+        assert schedule.recheck(game, now)
+        assert schedule.next_due() == now + delay
+        now = schedule.next_due()
+        assert schedule.pop_due(now) == [game]
+    assert not schedule.recheck(game, now)
+    assert len(schedule) == 0
+
+
+def test_is_final():
+    play = {'period': 1, 'time': 0, 'home score': 70, 'away score': 65}
+    assert sg.is_game_over([play])
+    assert not sg.is_game_over([])
+    assert not sg.is_game_over([dict(play, period=0)])
+    assert not sg.is_game_over([dict(play, time=12.5)])
+    assert not sg.is_game_over([dict(play, **{'away score': 70})])
+
+
+def test_is_final_end_rows():
+    """Tests that a game whose last play comes before 0:00 is final once the
+    row marking the end of the game or its last period is on the page."""
+    roster = [{'player ID': 1, 'name': "Bob Jones"}]
+    raw_plays = [[1, "00:41:00", "", "60-62", "Bob Jones, 2pt jumpshot  made"],
+                 [1, "00:35:00", "Team, timeout short", "60-62", ""]]
+    plays = sg.parse_all_plays(raw_plays, roster, roster)
+    assert plays[-1]['time'] > 0
+    assert not sg.is_game_over(plays, raw_plays)
+
+    ended = raw_plays + [[1, "00:00:00", "", "60-62", "game end"]]
+    assert sg.parse_all_plays(ended, roster, roster) == plays
+    assert sg.is_game_over(plays, ended)
+    assert sg.is_game_over(plays, raw_plays + [[1, "00:00:00", "period end", "60-62", ""]])
+    assert sg.is_game_over(plays, raw_plays + [[1, "00:00", "", "60-62", "End of 2nd Half"],
+                                                     [1, "", "", "", ""]])
+    # the end of the first half, or of a tied second half, is not the end of the game
+    assert not sg.is_game_over(plays, raw_plays + [[0, "00:00:00", "period end", "60-62",
+                                                          ""]])
+    assert not sg.is_game_over(plays, raw_plays + [[1, "00:00:00", "period end", "62-62",
+                                                          ""]])
+
+
+class FakeConn:
+    def cursor(self):
+        return None
+
+    def commit(self):
+        pass
+
+
+class FakeScraper:
+    def __init__(self):
+        self.metrics = instrument.Metrics()
+
+
+class FakeStore:
+    def __init__(self):
+        self.letters = []
+
+    def add(self, stage, game_id, failures, parser_version, **kwargs):
+        self.letters.append((stage, game_id))
+
+
+def make_daemon(monkeypatch, finals, context=None):
+    """Makes a daemon whose listing is not due, with scrape_game replaced by
+    one that reports each fetch of a game as final or not from a list,
+    records a dead letter for it, and records its arguments."""
+    fetches = []
+
+    def scrape_game(scraper, cursor, season, box_id, reupload=False, status=None, context=None):
+        fetches.append({'box ID': box_id, 'reupload': reupload})
+        status['final'] = finals[len(fetches) - 1]
+        context.dead_letters.add('play-by-play', len(fetches), [], 1, season=season)
+        return []
+
+    monkeypatch.setattr(crawl_daemon.scrape_games, 'scrape_game', scrape_game)
+    daemon = crawl_daemon.CrawlDaemon(FakeScraper(), FakeConn(), context)
+    daemon.next_listing = datetime.datetime(2030, 1, 1)
+    return daemon, fetches
+
+
+def test_step_finalizes_from_status(monkeypatch):
+    """Tests that a game is finished once scrape_game reports the page shows
+    its end, and rechecked until then."""
+    daemon, fetches = make_daemon(monkeypatch, [False, True])
+    start = datetime.datetime(2020, 3, 1, 19, 0)
+    daemon.schedule.add(make_game(1), start)
+    now = start + crawl_daemon.EXPECTED_GAME_LENGTH
+    daemon.step(now)
+    assert len(daemon.schedule) == 1
+    daemon.step(now + crawl_daemon.RECHECK_DELAYS[0])
+    assert len(daemon.schedule) == 0
+    assert 1 in daemon.schedule.finished
+    assert len(fetches) == 2
+    assert daemon.scraper.metrics.summary()['counters']['games finalized'] == 1
+
+
+def test_recheck_reuploads(monkeypatch):
+    """Tests that every fetch after the first compares the game to the rows
+    already stored, so rows written before the game was final are fixed."""
+    daemon, fetches = make_daemon(monkeypatch, [False, False, True])
+    start = datetime.datetime(2020, 3, 1, 19, 0)
+    daemon.schedule.add(make_game(1), start)
+    now = start + crawl_daemon.EXPECTED_GAME_LENGTH
+    for delay in [datetime.timedelta(0)] + crawl_daemon.RECHECK_DELAYS[:2]:
+        now += delay
+        daemon.step(now)
+    assert [fetch['reupload'] for fetch in fetches] == [False, True, True]
+
+
+def test_step_dead_letters_finished_games(monkeypatch):
+    """Tests that failures are only recorded for checks after which a game is
+    finalized or given up on, not for games that are still being played."""
+    store = FakeStore()
+    daemon = make_daemon(monkeypatch, [False, True] + [False] * 7,
+                         sg.RunContext(dead_letters=store))[0]
+    start = datetime.datetime(2020, 3, 1, 19, 0)
+    daemon.schedule.add(make_game(1), start)
+    now = start + crawl_daemon.EXPECTED_GAME_LENGTH
+    daemon.step(now)
+    assert store.letters == []
+    daemon.step(now + crawl_daemon.RECHECK_DELAYS[0])
+    assert store.letters == [('play-by-play', 2)]
+
+    daemon.schedule.add(make_game(2), start)
+    for delay in [datetime.timedelta(0)] + crawl_daemon.RECHECK_DELAYS:
+        now += delay
+        daemon.step(now)
+    assert 2 in daemon.schedule.finished
+    assert store.letters == [('play-by-play', 2), ('play-by-play', 9)]
+
+
+class FakeRowCursor:
+    """Stands in for the plays table of one game, for upload_plays."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def execute(self, query, values):
+        if query.startswith("SELECT"):
+            self.result = list(self.rows.values())
+        else:
+            self.rows.setdefault(values[:2], values)
+
+    def executemany(self, query, rows):
+        if query.startswith("INSERT"):
+            self.rows.update({row[:2]: row for row in rows})
+        else:
+            for key in rows:
+                del self.rows[key]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_recheck_updates_stored_plays():
+    """Tests that a reupload fixes a play stored by an earlier check, which a
+    plain upload leaves as it was."""
+    play = {'period': 1, 'time': 30.0, 'home score': 60, 'away score': 62, 'is away': False,
+            'action': "shot", 'home partic': [], 'away partic': [],
+            'player': {'player ID': 1, 'name': "Bob Jones"}}
+    cursor = FakeRowCursor()
+    sg.upload_plays(cursor, 1, [play])
+    corrected = [dict(play, **{'home score': 63}), dict(play, time=0.0)]
+    sg.upload_plays(cursor, 1, corrected)
+    assert cursor.rows[(1, 0)] == sg.make_play_tuple(1, 0, play)
+
+    sg.upload_plays(cursor, 1, corrected, reupload=True)
+    assert cursor.rows == {(1, i): sg.make_play_tuple(1, i, corrected_play)
+                           for i, corrected_play in enumerate(corrected)}
+
+
+def test_parse_game_time():
+    default = datetime.datetime(2020, 3, 1, 19, 0)
+    assert crawl_daemon.parse_game_time("2020/03/02 13:30", default) == \
+        datetime.datetime(2020, 3, 2, 13, 30)
+    assert crawl_daemon.parse_game_time("2020/03/02", default) == \
+        datetime.datetime(2020, 3, 2, 19, 0)
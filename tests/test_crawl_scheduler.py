@@ -0,0 +1,70 @@
+import datetime
+
+import src.crawl_scheduler as crawl_scheduler
+import src.instrument as instrument
+
+
+def make_work(box_ids, date):
+    return [{'box ID': box_id, 'season': 2020, 'date': date} for box_id in box_ids]
+
+
+def test_priorities():
+    """Tests that batches run in priority order, newest first within each
+    class, without mixing classes."""
+    end_date = datetime.date(2020, 3, 10)
+    scheduler = crawl_scheduler.CrawlScheduler()
+    scheduler.add_range(make_work([1, 2], datetime.date(2020, 3, 1))
+                        + make_work([3], datetime.date(2020, 3, 9))
+                        + make_work([4], datetime.date(2020, 3, 2)), end_date)
+    scheduler.add(make_work([5], datetime.date(2020, 2, 1))[0], crawl_scheduler.MISSING_PBP)
+
+    batches = []
+    report = scheduler.run(lambda priority, games: batches.append(
+        (priority, [game['box ID'] for game in games])), instrument.Metrics())
+    assert batches == [(crawl_scheduler.NEW_GAMES, [3]), (crawl_scheduler.MISSING_PBP, [5]),
+                       (crawl_scheduler.BACKFILL, [4, 1, 2])]
+    assert report['completed'] == {"new games": 1, "missing play-by-play": 1, "backfill": 3}
+    assert report['deferred'] == {"new games": [], "missing play-by-play": [], "backfill": []}
+
+
+def test_budget(tmp_path):
+    """Tests that the scheduler stops once the budget is spent and reports
+    the games it deferred."""
+    scheduler = crawl_scheduler.CrawlScheduler(budget_seconds=0)
+    scheduler.add_range(make_work(range(25), datetime.date(2020, 3, 1)), datetime.date(2020, 3, 2))
+    metrics = instrument.Metrics()
+    report = scheduler.run(lambda priority, games: None, metrics)
+    assert report['completed']["new games"] == 0
+    assert sorted(report['deferred']["new games"]) == list(range(25))
+    assert metrics.counters["deferred new games"] == 25
+
+    scheduler.write_deferred(str(tmp_path / "deferred.json"))
+    assert (tmp_path / "deferred.json").read_text().count('"box ID"') == 25
+
+
+def test_load_deferred(tmp_path):
+    """Tests that games deferred by one run are picked up by the next in the
+    classes they were deferred in, without queueing a game twice, and that
+    the file is removed once the work is done."""
+    path = str(tmp_path / "deferred.json")
+    scheduler = crawl_scheduler.CrawlScheduler(budget_seconds=0)
+    scheduler.add_range(make_work([1, 2], datetime.date(2020, 3, 1)), datetime.date(2020, 3, 2))
+    scheduler.add(make_work([1], datetime.date(2020, 2, 1))[0], crawl_scheduler.MISSING_PBP)
+    assert not scheduler.add(make_work([2], datetime.date(2020, 3, 1))[0],
+                             crawl_scheduler.BACKFILL)
+    scheduler.run(lambda priority, games: None, instrument.Metrics())
+    scheduler.write_deferred(path)
+
+    scheduler = crawl_scheduler.CrawlScheduler()
+    scheduler.add_range(make_work([2, 3], datetime.date(2020, 3, 5)), datetime.date(2020, 3, 6))
+    assert scheduler.load_deferred(path) == 2
+    batches = []
+    scheduler.run(lambda priority, games: batches.append(
+        (priority, [(game['box ID'], game['date']) for game in games])), instrument.Metrics())
+    assert batches == [(crawl_scheduler.NEW_GAMES, [(2, datetime.date(2020, 3, 5)),
+                                                    (3, datetime.date(2020, 3, 5)),
+                                                    (1, datetime.date(2020, 3, 1))]),
+                       (crawl_scheduler.MISSING_PBP, [(1, datetime.date(2020, 2, 1))])]
+    scheduler.write_deferred(path)
+    assert not (tmp_path / "deferred.json").exists()
+    assert crawl_scheduler.CrawlScheduler().load_deferred(path) == 0
@@ -0,0 +1,59 @@
+import src.dead_letters as dead_letters
+import src.scrape_games as sg
+
+
+def test_store(tmp_path):
+    """Tests that failures are recorded with their inputs, grouped by game
+    and left out once resolved."""
+    path = str(tmp_path / "dead_letters.sqlite")
+    with dead_letters.DeadLetterStore(path) as store:
+        store.add('box score', 11, [(b"<html></html>", AttributeError("no table"))], 1,
+                  season=2020, url="http://stats.ncaa.org/contests/11/box_score")
+        store.add('parse play', 12, [([0, "19:40", "", "22-4", "bad play"], ValueError("bad")),
+                                     ([0, "19:20", "", "22-4", "worse play"], ValueError("worse"))],
+                  1, season=2020, by_pbp=True)
+        store.add('box score', 11, [], 1)
+
+    with dead_letters.DeadLetterStore(path) as store:
+        pending = store.pending()
+        assert [failure['stage'] for failure in pending] == ['box score', 'parse play',
+                                                             'parse play']
+        assert pending[0]['exception'] == "AttributeError: no table"
+        assert pending[0]['raw input'] is None
+        assert len(pending[0]['input hash']) == 40
+        assert pending[1]['raw input'] == '[0, "19:40", "", "22-4", "bad play"]'
+        assert pending[1]['parser version'] == 1
+
+        games = dead_letters.group_by_game(pending)
+        assert list(games) == [(11, False), (12, True)]
+        assert len(games[(12, True)]) == 2
+
+        store.resolve([failure['dead letter ID'] for failure in games[(11, False)]])
+        assert [failure['game ID'] for failure in store.pending()] == [12, 12]
+
+
+class FailingCursor:
+    def execute(self, query, values):
+        if values[1] == 1:
+            raise TypeError("bad value")
+
+
+def test_upload_plays_errors():
+    """Tests that plays that can't be uploaded are collected instead of
+    stopping the upload."""
+    player = {'player ID': None, 'name': None}
+    plays = [{'player': player, 'home partic': [], 'away partic': []} for _ in range(3)]
+    errors = []
+    sg.upload_plays(FailingCursor(), 1, plays, errors=errors)
+    assert len(errors) == 1
+    assert errors[0][0] is plays[1]
+    assert isinstance(errors[0][1], TypeError)
+
+
+def test_parse_all_plays_errors():
+    errors = []
+    plays = sg.parse_all_plays([[0, "19:40", "Smith,John, foul weirdtype", "0-0", ""]], [], [],
+                               errors=errors)
+    assert plays == []
+    assert len(errors) == 1
+    assert isinstance(errors[0][1], ValueError)
@@ -0,0 +1,110 @@
+import datetime
+
+import src.elo as elo
+
+SEASON_START = datetime.date(2023, 11, 6)
+
+
+def make_game(day, home, away, h_points, a_points, season=2024):
+    return {'date': SEASON_START + datetime.timedelta(day), 'season': season,
+            'home team season ID': 100 + home, 'away team season ID': 100 + away,
+            'home school ID': home, 'away school ID': away, 'home points': h_points,
+            'away points': a_points}
+
+
+def make_games():
+    games = []
+    for day in range(20):
+        for home, away in [(1, 2), (3, 4), (5, 1)]:
+            games.append(make_game(day, (home + day) % 6, (away + day) % 6, 70 + day % 7,
+                                   68 + (day * 3) % 11))
+    return games + [make_game(400, 1, 2, 60, 50, season=2025)]
+
+
+def test_update():
+    """Tests that the winner gains what the loser loses, more for bigger
+    margins, and that the home team is favored between equal teams."""
+    engine = elo.EloEngine()
+    assert engine.predict(1, 2) > 0.5
+    expected = engine.update(make_game(0, 1, 2, 80, 60))
+    assert expected > 0.5
+    gain = engine.rating(1) - elo.INITIAL_RATING
+    assert gain > 0
+    assert engine.rating(2) == elo.INITIAL_RATING - gain
+
+    close = elo.EloEngine()
+    close.update(make_game(0, 1, 2, 61, 60))
+    assert 0 < close.rating(1) - elo.INITIAL_RATING < gain
+
+    tie = elo.EloEngine()
+    tie.update(make_game(0, 1, 2, 60, 60))
+    assert tie.rating(1) == elo.INITIAL_RATING
+
+
+def test_new_season():
+    """Tests that ratings regress toward average and team seasons reset when a
+    new season starts."""
+    engine = elo.EloEngine()
+    engine.update(make_game(0, 1, 2, 80, 60))
+    rating = engine.rating(1)
+    engine.update(make_game(400, 3, 4, 70, 70, season=2025))
+    assert abs(engine.rating(1) - elo.INITIAL_RATING
+               - elo.CARRYOVER * (rating - elo.INITIAL_RATING)) < 1e-9
+    assert engine.team_season_ratings() == {103: elo.INITIAL_RATING, 104: elo.INITIAL_RATING}
+
+
+def test_run_checkpoints():
+    """Tests that a checkpoint is made at the end of each day with games, and
+    that resuming from any checkpoint gives the same ratings as one pass."""
+    games = make_games()
+    checkpoints = []
+    engine = elo.EloEngine()
+    assert elo.run(engine, iter(games),
+                   lambda *checkpoint: checkpoints.append(checkpoint)) == len(games)
+    assert [(date, count) for date, count, _ in checkpoints] == \
+        [(SEASON_START + datetime.timedelta(day), 3) for day in range(20)] \
+        + [(SEASON_START + datetime.timedelta(400), 1)]
+
+    date, _, state = checkpoints[9]
+    resumed = elo.EloEngine(state)
+    elo.run(resumed, (game for game in games if game['date'] > date), lambda *_: None)
+    assert resumed.snapshot() == engine.snapshot()
+
+
+def test_encode_state():
+    """Tests that states survive the checkpoints table."""
+    engine = elo.EloEngine()
+    for game in make_games():
+        engine.update(game)
+    assert elo.decode_state(elo.encode_state(engine.snapshot())) == engine.snapshot()
+
+
+class FakeCursor:
+    """Answers the count queries of find_replay_date."""
+
+    def __init__(self, day_counts, checkpoint_counts):
+        self.day_counts = day_counts
+        self.checkpoint_counts = checkpoint_counts
+        self.result = []
+
+    def execute(self, query, values=()):
+        if query == elo.FETCH_DAY_COUNTS_QUERY:
+            self.result = list(self.day_counts.items())
+        elif query == elo.FETCH_CHECKPOINT_COUNTS_QUERY:
+            self.result = list(self.checkpoint_counts.items())
+
+    def fetchall(self):
+        return self.result
+
+
+def test_find_replay_date():
+    """Tests that the earliest day with added, removed or unrated games is
+    replayed."""
+    days = [SEASON_START + datetime.timedelta(day) for day in range(4)]
+    assert elo.find_replay_date(FakeCursor({days[0]: 3, days[1]: 2}, {days[0]: 3, days[1]: 2})) \
+        is None
+    assert elo.find_replay_date(FakeCursor({days[0]: 3, days[1]: 3, days[3]: 1},
+                                           {days[0]: 3, days[1]: 2})) == days[1]
+    assert elo.find_replay_date(FakeCursor({days[0]: 3, days[1]: 2, days[3]: 1},
+                                           {days[0]: 3, days[1]: 2})) == days[3]
+    assert elo.find_replay_date(FakeCursor({days[0]: 3}, {days[0]: 3, days[2]: 1})) == days[2]
@@ -0,0 +1,67 @@
+import json
+
+import src.instrument as instrument
+
+
+class RecordingHook(instrument.MetricsHook):
+    def __init__(self):
+        self.timings = []
+        self.counts = []
+        self.reports = []
+
+    def on_timing(self, stage, seconds):
+        self.timings.append((stage, seconds))
+
+    def on_count(self, name, amount):
+        self.counts.append((name, amount))
+
+    def on_report(self, summary):
+        self.reports.append(summary)
+
+
+def test_percentile():
+    """Tests relevant cases of percentile."""
+    samples = list(range(1, 101))
+    assert instrument.percentile(samples, 50) == 50
+    assert instrument.percentile(samples, 95) == 95
+    assert instrument.percentile(samples, 99) == 99
+    assert instrument.percentile(samples, 100) == 100
+    assert instrument.percentile([3], 99) == 3
+    assert instrument.percentile([], 50) is None
+
+
+def test_summary():
+    """Tests that timings and counters are summarized per stage."""
+    metrics = instrument.Metrics()
+    for seconds in [0.1, 0.2, 0.3, 0.4]:
+        metrics.record('track_partic', seconds)
+    metrics.count('games', 2)
+    metrics.count('bytes fetched', 1000)
+    with metrics.timer('upload_plays'):
+        pass
+
+    summary = metrics.summary()
+    assert summary['stages']['track_partic']['count'] == 4
+    assert summary['stages']['track_partic']['p50'] == 0.2
+    assert summary['stages']['track_partic']['max'] == 0.4
+    assert summary['stages']['upload_plays']['count'] == 1
+    assert summary['games'] == 2
+    assert summary['bytes fetched'] == 1000
+    assert summary['games per hour'] > 0
+
+
+def test_hooks(tmp_path):
+    """Tests that hooks receive every metric and the final report."""
+    metrics = instrument.Metrics()
+    hook = RecordingHook()
+    metrics.add_hook(hook)
+    metrics.record('open_page', 1.5)
+    metrics.count('page retries')
+
+    report_path = tmp_path / "report.json"
+    summary = metrics.write_report(report_path)
+    assert hook.timings == [('open_page', 1.5)]
+    assert hook.counts == [('page retries', 1)]
+    assert hook.reports == [summary]
+    with open(report_path, 'r') as report_file:
+        assert json.load(report_file)['counters'] == {'page retries': 1}
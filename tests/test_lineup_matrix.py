@@ -0,0 +1,115 @@
+import bs4
+import numpy as np
+
+import src.lineup_matrix as lineup_matrix
+import src.scrape_games as sg
+import src.stints as stints
+import src.synthetic_games as synthetic
+
+
+def make_players(*player_ids):
+    return [{'player ID': player_id, 'name': f"Player {player_id}"} for player_id in player_ids]
+
+
+def make_box(player, is_away, time_played):
+    return {'player ID': player['player ID'], 'name': player['name'], 'is away': is_away,
+            'time played': time_played}
+
+
+def test_lineup_matrix():
+    """Tests seconds played, plus/minus, on-court stats and discrepancies of a
+    hand-built game."""
+    home = make_players(1, 2, 3, 4, 5, 6)
+    away = make_players(11, 12, 13, 14, 15)
+    starters = home[:5]
+    subs = home[1:]
+
+    def play(period, time, h_score, a_score, is_away, action, h_partic, **flags):
+        return dict({'period': period, 'time': time, 'home score': h_score,
+                     'away score': a_score, 'is away': is_away, 'action': action,
+                     'home partic': h_partic, 'away partic': away}, **flags)
+
+    plays = [play(0, 1100, 2, 0, False, "shot", starters, **{'flag 2': "short 2", 'flag 3': True}),
+             play(0, 1000, 2, 3, True, "shot", starters, **{'flag 2': "3", 'flag 3': True}),
+             play(0, 400, 2, 3, False, "turnover", subs),
+             play(1, 300, 4, 3, False, "shot", subs, **{'flag 2': "long 2", 'flag 3': True})]
+    boxes = [make_box(player, False, 2400 if player in subs else 1000) for player in home] \
+        + [make_box(player, True, 2400) for player in away] \
+        + [{'player ID': None, 'name': "Team", 'is away': False, 'time played': None}]
+    matrix = lineup_matrix.LineupMatrix(plays, boxes)
+
+    assert matrix.home.shape == (4, 6)
+    assert matrix.seconds.tolist() == [100, 100, 1000, 1200]
+    h_seconds, a_seconds = matrix.seconds_played()
+    assert h_seconds.tolist() == [200, 2400, 2400, 2400, 2400, 2200]
+    assert a_seconds.tolist() == [2400] * 5
+    h_plus_minus, a_plus_minus = matrix.plus_minus()
+    assert h_plus_minus.tolist() == [-1, 1, 1, 1, 1, 2]
+    assert a_plus_minus.tolist() == [-1] * 5
+    h_stats, _ = matrix.on_court_stats()
+    assert h_stats['team'][0, stints.STAT_FIELDS.index("FGM")] == 1
+    assert h_stats['opponent'][0, stints.STAT_FIELDS.index("3PM")] == 1
+    assert h_stats['team'][5, stints.STAT_FIELDS.index("TOV")] == 1
+    h_discrepancies, _ = matrix.discrepancies()
+    assert h_discrepancies.tolist() == [800, 0, 0, 0, 0, 200]
+    assert matrix.in_box[0].all()
+
+
+def test_lineup_matrix_players_not_in_box():
+    """Tests that players on the court who are not in the box score are added
+    to the roster, and that plays at the same time share their rows."""
+    lineup = make_players(1, 2, 3, 4, 5)
+    plays = [{'period': 0, 'time': 1000, 'is away': False, 'action': "timeout",
+              'home partic': lineup, 'away partic': []},
+             {'period': 0, 'time': 1000, 'is away': True, 'action': "timeout",
+              'home partic': lineup, 'away partic': [None]}]
+    matrix = lineup_matrix.LineupMatrix(plays, [make_box(lineup[0], False, 600)])
+    assert matrix.home_roster == lineup
+    assert matrix.in_box[0].tolist() == [True, False, False, False, False]
+    assert matrix.home.all()
+    assert matrix.away.shape == (2, 0)
+    assert matrix.column(False, lineup[3]) == 3
+    assert matrix.column(True, lineup[3]) is None
+
+
+def test_elapsed_seconds():
+    """Tests that the seconds of each period add up to its length."""
+    seconds = lineup_matrix.elapsed_seconds(np.array([0, 0, 1, 2, 2]),
+                                            np.array([1150.0, 30, 600, 280, 10]))
+    assert seconds.tolist() == [50, 1150, 1200, 20, 280]
+
+
+def test_score_changes():
+    """Tests that plays without a score are counted as scoring nothing."""
+    assert lineup_matrix.score_changes([None, 2, None, 5, 5]).tolist() == [0, 2, 0, 3, 0]
+
+
+def test_correct_time_played_synthetic():
+    """Tests that correcting synthetic games leaves 5 players per team on every
+    play without making the box score discrepancies worse, and that lineups
+    account for every point and second."""
+    for game in synthetic.generate_games(3, seed=6):
+        plays = sg.parse_all_plays(
+            sg.find_raw_plays(bs4.BeautifulSoup(game['pbp html'], 'html.parser')),
+            game['home roster'], game['away roster'])
+        boxes = sg.clean_raw_boxes(
+            sg.find_raw_boxes(bs4.BeautifulSoup(game['box html'], 'html.parser')),
+            game['home roster'], game['away roster'])
+        sg.track_shot_clock(plays)
+        sg.track_partic(plays)
+        before = lineup_matrix.LineupMatrix(plays, boxes).discrepancies()
+        h_minutes, a_minutes = sg.get_time_discrepancies(boxes, plays)
+        assert sorted(entry['discrepancy'] for entry in h_minutes.values()) == \
+            sorted(before[0].tolist())
+
+        sg.correct_time_played(boxes, plays)
+        matrix = lineup_matrix.LineupMatrix(plays, boxes)
+        assert (matrix.home.sum(axis=1) == 5).all()
+        assert (matrix.away.sum(axis=1) == 5).all()
+        for team in range(2):
+            assert np.abs(matrix.discrepancies()[team]).sum() <= np.abs(before[team]).sum()
+        length = matrix.seconds.sum()
+        assert abs(sum(seconds.sum() for seconds in matrix.seconds_played()) - 10 * length) < 1e-6
+        h_plus_minus, a_plus_minus = matrix.plus_minus()
+        assert h_plus_minus.sum() == 5 * (plays[-1]['home score'] - plays[-1]['away score'])
+        assert a_plus_minus.sum() == -h_plus_minus.sum()
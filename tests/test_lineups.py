@@ -0,0 +1,65 @@
+import src.lineups as lineups
+import src.scrape_games as sg
+
+
+class FakeCursor:
+    """Keeps the lineups table in memory and records the other queries."""
+
+    def __init__(self):
+        self.lineups = {}
+        self.queries = []
+
+    def executemany(self, query, values):
+        self.queries.append(query)
+        if query == lineups.INSERT_LINEUP_QUERY:
+            for row in values:
+                self.lineups.setdefault(row[:2], len(self.lineups) + 1)
+        else:
+            self.uploaded = values
+
+    def execute(self, query, values):
+        self.queries.append(query)
+        self.result = [(lineup_id, key) for (team_season_id, key), lineup_id
+                       in self.lineups.items() if team_season_id == values[0]]
+
+    def fetchall(self):
+        return self.result
+
+
+def make_lineup(*player_ids):
+    return [{'player ID': player_id, 'name': f"Player {player_id}"} for player_id in player_ids]
+
+
+def test_make_player_ids():
+    assert lineups.make_player_ids(make_lineup(5, None, 3, 4, 1)) == [1, 3, 4, 5, None]
+    assert lineups.make_player_ids(make_lineup(2, 1)) == [1, 2, None, None, None]
+    assert lineups.make_player_ids(make_lineup(6, 5, 4, 3, 2, 1)) == [1, 2, 3, 4, 5]
+    assert lineups.make_lineup_key([1, 3, 4, 5, None]) == "1,3,4,5,"
+
+
+def test_assign():
+    """Tests that lineups get the same ID whatever order their players are
+    in, and that known lineups are not looked up again."""
+    cursor = FakeCursor()
+    cache = lineups.LineupCache()
+    first = cache.assign(cursor, 10, [make_lineup(1, 2, 3, 4, 5), make_lineup(5, 4, 3, 2, 1),
+                                      make_lineup(1, 2, 3, 4, 6)])
+    assert first[0] == first[1] != first[2]
+    query_count = len(cursor.queries)
+    assert cache.assign(cursor, 10, [make_lineup(6, 4, 3, 2, 1)]) == [first[2]]
+    assert len(cursor.queries) == query_count
+    assert cache.assign(cursor, 11, [make_lineup(1, 2, 3, 4, 5)])[0] not in first
+    assert cache.assign(cursor, None, [make_lineup(1, 2, 3, 4, 5)]) == [None]
+
+
+def test_upload_lineup_plays():
+    cursor = FakeCursor()
+    home = make_lineup(1, 2, 3, 4, 5)
+    away = make_lineup(11, 12, 13, 14, 15)
+    plays = [{'period': 0, 'time': 1200 - i, 'action': "shot", 'player': home[0],
+              'home partic': home, 'away partic': away} for i in range(3)]
+    sg.upload_lineup_plays(cursor, 99, plays, (10, 20), lineups.LineupCache())
+    assert len(cursor.uploaded) == 3
+    assert all(len(row) == len(sg.LINEUP_PLAY_COLUMNS) for row in cursor.uploaded)
+    assert {row[-2:] for row in cursor.uploaded} == {(1, 2)}
+    assert cursor.uploaded[1][:2] == (99, 1)
@@ -0,0 +1,157 @@
+import re
+
+import bs4
+
+import src.instrument as instrument
+import src.live_plays as live_plays
+import src.possessions as possessions
+import src.scrape_games as sg
+import src.synthetic_games as synthetic
+
+
+def track_whole_game(pbp_html, h_roster, a_roster):
+    plays = sg.parse_all_plays(sg.find_raw_plays(bs4.BeautifulSoup(pbp_html, 'html.parser')),
+                               h_roster, a_roster)
+    sg.track_shot_clock(plays)
+    possessions.assign_possessions(plays)
+    sg.track_partic(plays)
+    return plays
+
+
+def test_poll():
+    """Tests that polling a page as rows are added gives the same plays as
+    processing the finished page, and that every play whose players or
+    offense changed is returned for upserting."""
+    for game in synthetic.generate_games(3, seed=4):
+        html = game['pbp html']
+        full = track_whole_game(html, game['home roster'], game['away roster'])
+
+        live_game = live_plays.LiveGame(1, game['home roster'], game['away roster'])
+        upserted = {}
+        row_ends = [match.end() for match in re.finditer("</tr>", html)]
+        for row_end in row_ends[3::9] + [row_ends[-1]]:
+            page = html[:row_end] + "</table></body></html>"
+            for i, play in live_game.poll(page.encode()):
+                upserted[i] = (list(play['home partic']), list(play['away partic']),
+                               play['offense is away'])
+
+        assert live_game.plays == full
+        assert not live_game.final or sg.is_game_over(full)
+        assert [upserted[i] for i in range(len(full))] == \
+            [(play['home partic'], play['away partic'], play['offense is away'])
+             for play in full]
+
+
+def test_poll_corrected_page():
+    """Tests that a page whose earlier rows were corrected is reprocessed."""
+    game = next(synthetic.generate_games(1, seed=4))
+    html = game['pbp html']
+    live_game = live_plays.LiveGame(1, game['home roster'], game['away roster'])
+    live_game.poll(html.encode())
+    count = len(live_game.plays)
+
+    first_time = re.search(r"<td class=\"smtext\">(\d\d:\d\d)", html).group(1)
+    corrected = html.replace(f">{first_time}<", ">19:59<", 1)
+    assert len(live_game.poll(corrected.encode())) == count
+    assert live_game.plays == track_whole_game(corrected, game['home roster'],
+                                               game['away roster'])
+
+
+class FakePage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeScraper:
+    """Serves the given pages of a game in turn, then the last one forever."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.opened = 0
+        self.metrics = instrument.Metrics()
+
+    def open_page(self, url):
+        self.opened += 1
+        return FakePage(self.pages[min(self.opened, len(self.pages)) - 1])
+
+
+class FakeConn:
+    def cursor(self):
+        return None
+
+    def commit(self):
+        pass
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep, so follow_game runs without waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def follow(monkeypatch, pages, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(live_plays.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(live_plays.time, 'sleep', clock.sleep)
+    monkeypatch.setattr(live_plays.scrape_games, 'upsert_plays', lambda *args: None)
+    game = next(synthetic.generate_games(1, seed=4))
+    scraper = FakeScraper([page.encode() for page in pages(game['pbp html'])])
+    followed = live_plays.follow_game(scraper, FakeConn(), 1, game['home roster'],
+                                      game['away roster'], poll_interval=30, **kwargs)
+    return followed, scraper, clock
+
+
+def cut_rows(html, count):
+    """Cuts the last rows of a play-by-play page, closing its last table."""
+    row_ends = [match.end() for match in re.finditer("</tr>", html)]
+    return html[:row_ends[-1 - count]] + "</table></body></html>"
+
+
+def add_end_row(html):
+    """Adds the row marking the end of the game after the last play."""
+    last_row = html.rindex("<tr>")
+    score = re.findall(r"<td class=\"smtext\">(\d+-\d+)</td>", html[last_row:])[0]
+    row = (f"<tr><td class=\"smtext\">00:00</td><td class=\"smtext\"></td>"
+           f"<td class=\"smtext\">{score}</td><td class=\"smtext\">game end</td></tr>\n")
+    end = html.rindex("</table>")
+    return html[:end] + row + html[end:]
+
+
+def test_follow_game_until_end_row(monkeypatch):
+    """Tests that a game whose last play comes before 0:00 is followed until
+    the row marking its end shows up, even when no new play comes with it."""
+    def pages(html):
+        last_play = cut_rows(html, 40)
+        return [cut_rows(html, 60), last_play, last_play, add_end_row(last_play)]
+
+    game, scraper, _ = follow(monkeypatch, pages)
+    assert game.final
+    assert scraper.opened == 4
+    assert scraper.metrics.summary()['counters']['live plays'] > 0
+
+
+def test_follow_game_gives_up(monkeypatch):
+    """Tests that a page that stops changing before the game ends is given up
+    on after the idle timeout, and a game that keeps changing after the
+    longest follow time."""
+    def stalled(html):
+        return [cut_rows(html, 40)]
+
+    game, scraper, clock = follow(monkeypatch, stalled, idle_timeout=600)
+    assert not game.final
+    assert clock.now == 600
+    assert scraper.metrics.summary()['counters']['live games abandoned'] == 1
+
+    def growing(html):
+        return [cut_rows(html, count) for count in range(80, 40, -1)]
+
+    game, scraper, clock = follow(monkeypatch, growing, idle_timeout=600, max_follow_time=900)
+    assert not game.final
+    assert clock.now == 900
@@ -0,0 +1,83 @@
+import bs4
+import pytest
+
+import src.parse_cache as parse_cache
+import src.parse_engine as pe
+import src.scrape_games as sg
+import src.synthetic_games as synthetic
+
+
+def raw_boxes(game):
+    return sg.find_raw_boxes(bs4.BeautifulSoup(game['box html'], 'html.parser'))
+
+
+def parse(args, cache_path=None):
+    record, errors = pe.parse_game(*args, cache_path=cache_path)
+    return record, [(row, repr(error)) for row, error in errors]
+
+
+def test_worker_cache(tmp_path, monkeypatch):
+    """Tests that a worker's cache is opened when it starts and kept for
+    every game it parses."""
+    cache_path = str(tmp_path / "parse_cache.sqlite")
+    game = next(synthetic.generate_games(1, seed=2))
+    args = (raw_boxes(game), game['pbp html'].encode(), game['home roster'],
+            game['away roster'])
+    uncached = parse(args)
+    monkeypatch.setattr(pe, 'worker_cache', None)
+    pe.warm_worker(cache_path)
+    cache = pe.worker_cache
+    assert parse(args) == uncached
+    assert cache.load(parse_cache.make_game_key(*args), pe.scrape_games.STAGE_VERSIONS)[0] == \
+        len(pe.scrape_games.STAGE_VERSIONS)
+    assert parse(args) == uncached
+    assert pe.worker_cache is cache
+    cache.close()
+
+
+def test_parse_game_cached(tmp_path, monkeypatch):
+    """Tests that a cached game parses the same as an uncached one, and that
+    bumping the version of a stage invalidates only it and the stages after
+    it."""
+    cache_path = str(tmp_path / "parse_cache.sqlite")
+    game = next(synthetic.generate_games(1, seed=2))
+    args = (raw_boxes(game), game['pbp html'].encode(), game['home roster'],
+            game['away roster'])
+    uncached = parse(args)
+    assert parse(args, cache_path) == uncached
+    assert parse(args, cache_path) == uncached
+
+    stage_versions = pe.scrape_games.STAGE_VERSIONS
+    game_key = parse_cache.make_game_key(*args)
+    with parse_cache.ParseCache(cache_path) as cache:
+        assert cache.load(game_key, stage_versions)[0] == len(stage_versions)
+        bumped = [(stage, version + 1 if stage == "track_partic" else version)
+                  for stage, version in stage_versions]
+        done, output = cache.load(game_key, bumped)
+        assert done == 2
+        assert all('home partic' not in play for play in output[1])
+        assert cache.load("other game", stage_versions) == (0, None)
+
+    monkeypatch.setattr(pe.scrape_games, 'STAGE_VERSIONS', bumped)
+    assert parse(args, cache_path) == uncached
+    with parse_cache.ParseCache(cache_path) as cache:
+        assert cache.load(game_key, bumped)[0] == len(bumped)
+
+
+def test_unusable_page_not_cached(tmp_path, monkeypatch):
+    """Tests that a play-by-play page that can't be parsed raises instead of
+    giving a game without plays, and that nothing is cached for it."""
+    cache_path = str(tmp_path / "parse_cache.sqlite")
+    game = next(synthetic.generate_games(1, seed=2))
+    args = (raw_boxes(game), b"<html>Service unavailable</html>", game['home roster'],
+            game['away roster'])
+
+    def find_raw_plays(soup):
+        raise AttributeError("'NoneType' object has no attribute 'find_all'")
+
+    monkeypatch.setattr(pe.scrape_games, 'find_raw_plays', find_raw_plays)
+    with pytest.raises(AttributeError):
+        parse(args, cache_path)
+    with parse_cache.ParseCache(cache_path) as cache:
+        game_key = parse_cache.make_game_key(*args)
+        assert cache.load(game_key, pe.scrape_games.STAGE_VERSIONS) == (0, None)
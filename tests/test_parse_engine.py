@@ -0,0 +1,99 @@
+import concurrent.futures
+
+import src.crawl_control as crawl_control
+import src.instrument as instrument
+import src.parse_engine as pe
+
+
+def test_pack_game():
+    """Tests that packing and unpacking a game gives back the same boxes and
+    plays, with each player stored only once."""
+    player1 = {'player ID': 1, 'name': "First Last"}
+    player2 = {'player ID': None, 'name': "Other Player"}
+    boxes = [{'player ID': 1, 'name': "First Last", 'is away': False, 'position': "G",
+              'time played': 600, 'FGM': 1, 'FGA': 2, '3PM': 0, '3PA': 1, 'FTM': 0,
+              'FTA': 0, 'ORB': 1, 'DRB': 0, 'AST': 2, 'TOV': 0, 'STL': 0, 'BLK': 0,
+              'PF': 1}]
+    plays = [{'period': 0, 'time': 1180, 'shot clock': 10, 'home score': 2, 'away score': 0,
+              'is away': False, 'action': "shot", 'flag 1': "layup", 'flag 2': "short 2",
+              'flag 3': True, 'flag 4': False, 'flag 5': False, 'flag 6': False,
+              'player': player1, 'home partic': [player1, player2], 'away partic': []}]
+    record = pe.pack_game(boxes, plays)
+    assert record[0] == ((1, "First Last"), (None, "Other Player"))
+
+    unpacked_boxes, unpacked_plays = pe.unpack_game(record)
+    assert unpacked_boxes == boxes
+    assert unpacked_plays == plays
+    assert unpacked_plays[0]['player'] is unpacked_plays[0]['home partic'][0]
+
+
+def test_pack_game_missing_fields():
+    """Tests that fields missing from a play are unpacked as None."""
+    plays = [{'period': 1, 'time': 30, 'is away': True, 'action': "timeout", 'flag 1': None,
+              'player': {'player ID': None, 'name': "Team"}, 'home partic': [],
+              'away partic': []}]
+    unpacked_plays = pe.unpack_game(pe.pack_game([], plays))[1]
+    assert unpacked_plays[0]['flag 6'] is None
+    assert unpacked_plays[0]['action'] == "timeout"
+
+
+class FakeEngine:
+    """Parses a game only if its play-by-play page is usable, in this process."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, raw_boxes, pbp_html, h_roster, a_roster):
+        self.submitted.append(pbp_html)
+        future = concurrent.futures.Future()
+        if pbp_html == b"unusable":
+            future.set_exception(AttributeError("no play-by-play"))
+        else:
+            future.set_result((pe.pack_game([], []), []))
+        return future
+
+
+class FakePage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeScraper:
+    """Serves the given play-by-play pages in turn."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.metrics = instrument.Metrics()
+        self.controller = crawl_control.CrawlController()
+
+    def open_page(self, url, budget=None):
+        budget.spend_transport()
+        return FakePage(self.pages.pop(0))
+
+
+def submit_game(engine, pbp_html):
+    pages = ([], pbp_html, [], [])
+    return {'metadata': {'pbp ID': 5}, 'work': (2020, 1, False), 'pages': pages,
+            'future': engine.submit(*pages)}
+
+
+def test_wait_for_parse(monkeypatch):
+    """Tests that an unusable play-by-play page is fetched again, and that a
+    page that stays unusable is dead-lettered and the game parsed without
+    it."""
+    monkeypatch.setattr(pe.scrape_games.time, 'sleep', lambda seconds: None)
+    engine = FakeEngine()
+    scraper = FakeScraper([b"unusable", b"usable"])
+    game = submit_game(engine, b"unusable")
+    pe.scrape_games.wait_for_parse(scraper, game, engine)
+    assert engine.submitted == [b"unusable", b"unusable", b"usable"]
+    assert game['pages'][1] == b"usable"
+    assert 'dead letters' not in scraper.metrics.summary()['counters']
+
+    engine = FakeEngine()
+    scraper = FakeScraper([b"unusable"] * crawl_control.PARSE_RETRIES)
+    game = submit_game(engine, b"unusable")
+    pe.scrape_games.wait_for_parse(scraper, game, engine)
+    assert engine.submitted == [b"unusable"] * (crawl_control.PARSE_RETRIES + 1) + [None]
+    assert game['pages'][1] is None
+    assert scraper.metrics.summary()['counters']['dead letters'] == 1
@@ -0,0 +1,154 @@
+import datetime
+
+import bs4
+import numpy as np
+
+import src.possessions as possessions
+import src.scrape_games as sg
+import src.synthetic_games as synthetic
+
+
+def make_play(period, is_away, action):
+    return {'period': period, 'is away': is_away, 'action': action}
+
+
+def test_assign_possessions():
+    """Tests that possessions change on defensive rebounds, turnovers and new
+    periods, but not on offensive rebounds or free throws after a shot."""
+    plays = [make_play(0, False, "substitution"),
+             make_play(0, True, "shot"),
+             make_play(0, True, "rebound"),
+             make_play(0, True, "shot"),
+             make_play(0, False, "foul committed"),
+             make_play(0, True, "free throw"),
+             make_play(0, False, "rebound"),
+             make_play(0, False, "turnover"),
+             make_play(0, True, "steal"),
+             make_play(0, True, "shot"),
+             make_play(1, False, "timeout"),
+             make_play(1, False, "shot")]
+    state = possessions.assign_possessions(plays)
+    assert [play['possession'] for play in plays] == [0, 0, 0, 0, 0, 0, 1, 1, 1, 2, 3, 3]
+    assert [play['offense is away'] for play in plays] == \
+        [True, True, True, True, True, True, False, False, False, True, False, False]
+    assert state['possession'] == 3
+    assert state['changed'] == []
+
+
+def test_assign_possessions_continued():
+    """Tests that passing the state on gives the same result as one call, and
+    reports the plays of earlier calls whose offense was found later."""
+    plays = [make_play(0, False, "substitution"),
+             make_play(0, True, "timeout"),
+             make_play(0, True, "shot"),
+             make_play(0, False, "rebound"),
+             make_play(1, True, "shot")]
+    whole = [dict(play) for play in plays]
+    possessions.assign_possessions(whole)
+    state = possessions.assign_possessions(plays[:2])
+    assert plays[0]['offense is away'] is None
+    state = possessions.assign_possessions(plays[2:], state=state)
+    assert plays == whole
+    assert state['changed'] == plays[:2]
+
+
+def test_assign_possessions_batch():
+    """Tests that the batch mode matches the linear pass on whole synthetic
+    games, including periods without any team having the ball."""
+    game_ids, periods, is_away, actions = [], [], [], []
+    expected_possessions, expected_offense = [], []
+    games = synthetic.generate_games(3, seed=8)
+    for game_id, game in enumerate(games):
+        plays = sg.parse_all_plays(
+            sg.find_raw_plays(bs4.BeautifulSoup(game['pbp html'], 'html.parser')),
+            game['home roster'], game['away roster'])
+        sg.track_shot_clock(plays)
+        if game_id == 1:
+            plays.append(make_play(plays[-1]['period'] + 1, False, "timeout"))
+        possessions.assign_possessions(plays)
+        for play in plays:
+            game_ids.append(game_id)
+            periods.append(play['period'])
+            is_away.append(play['is away'])
+            actions.append(play['action'])
+            expected_possessions.append(play['possession'])
+            expected_offense.append(np.nan if play['offense is away'] is None
+                                    else float(play['offense is away']))
+        assert plays[-1]['possession'] > 50
+
+    found_possessions, found_offense = possessions.assign_possessions_batch(
+        game_ids, periods, is_away, actions)
+    assert found_possessions.tolist() == expected_possessions
+    np.testing.assert_array_equal(found_offense, np.array(expected_offense))
+
+
+def test_assign_possessions_batch_empty():
+    """Tests that the batch mode handles no plays."""
+    found_possessions, found_offense = possessions.assign_possessions_batch([], [], [], [])
+    assert len(found_possessions) == 0
+    assert len(found_offense) == 0
+
+
+class BackfillCursor:
+    """Stands in for a database holding the plays of games 1 to 3 in the plays
+    table and those of game 2 in the lineup_plays table, keeping the
+    possessions written to each table."""
+
+    def __init__(self):
+        plays = [(1, 0, 0, False, "shot"), (1, 1, 0, True, "rebound"),
+                 (2, 0, 0, True, "turnover"), (2, 1, 0, False, "shot"),
+                 (3, 0, 1, False, "timeout")]
+        self.tables = {'plays': plays, 'lineup_plays': plays[2:4]}
+        self.written = {table: {} for table in self.tables}
+        self.updates = []
+        self.update_batches = 0
+        self.result = []
+
+    def execute(self, query, values=None):
+        self.result = []
+        if query == possessions.FETCH_GAME_IDS_QUERY:
+            self.result = [(1,), (2,), (3,)]
+        elif query == possessions.FETCH_TABLE_QUERY:
+            self.result = [values] if values[0] in self.tables else []
+        elif query.startswith("SELECT p.game_id"):
+            table = query.split()[7]
+            self.result = [row for row in self.tables[table] if values[2] <= row[0] <= values[3]]
+        elif query == possessions.CLEAR_UPDATES_QUERY:
+            self.updates = []
+        elif query.startswith("UPDATE"):
+            for game_id, play_in_game, possession, offense in self.updates:
+                self.written[query.split()[1]][(game_id, play_in_game)] = (possession, offense)
+
+    def executemany(self, query, rows):
+        assert query == possessions.INSERT_UPDATES_QUERY
+        self.updates += rows
+        self.update_batches += 1
+
+    def fetchall(self):
+        return self.result
+
+
+class BackfillConn:
+    def __init__(self):
+        self.cursor_object = BackfillCursor()
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_object
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_backfill(monkeypatch):
+    """Tests that possessions are written to both tables of plays, a chunk of
+    games at a time."""
+    monkeypatch.setattr(possessions, 'BACKFILL_CHUNK_GAMES', 2)
+    conn = BackfillConn()
+    count = possessions.backfill(conn, datetime.date(2020, 1, 1), datetime.date(2020, 2, 1))
+    cursor = conn.cursor_object
+    assert count == 7
+    assert cursor.written['plays'] == {(1, 0): (0, False), (1, 1): (1, True), (2, 0): (0, True),
+                                       (2, 1): (1, False), (3, 0): (0, None)}
+    assert cursor.written['lineup_plays'] == {(2, 0): (0, True), (2, 1): (1, False)}
+    assert (cursor.update_batches, conn.commits) == (3, 4)
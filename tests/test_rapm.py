@@ -0,0 +1,92 @@
+import numpy as np
+
+import src.rapm as rapm
+
+
+def make_stints(seed, team_count=20, roster_size=10, stint_count=6000):
+    """Simulates stints between teams whose players have known ratings."""
+    rng = np.random.default_rng(seed)
+    player_count = team_count * roster_size
+    offense = rng.normal(0, 4, player_count)
+    defense = rng.normal(0, 4, player_count)
+    rows = []
+    for i in range(stint_count):
+        home, away = rng.choice(team_count, 2, replace=False)
+        h_players = home * roster_size + rng.choice(roster_size, 5, replace=False)
+        a_players = away * roster_size + rng.choice(roster_size, 5, replace=False)
+        possessions = float(rng.integers(2, 12))
+        h_rate = 105 + offense[h_players].sum() - defense[a_players].sum() + 1.5
+        a_rate = 105 + offense[a_players].sum() - defense[h_players].sum() - 1.5
+        rows.append((i // 40, *(int(player) + 1 for player in h_players),
+                     *(int(player) + 1 for player in a_players),
+                     rng.normal(h_rate * possessions / 100, 1.5),
+                     rng.normal(a_rate * possessions / 100, 1.5), possessions, possessions))
+    return rows, offense, defense
+
+
+def test_make_stint_arrays():
+    """Tests that unidentified players and missing values become -1 and 0."""
+    rows = [(7, 1, 2, 3, 4, None, 11, 12, 13, 14, 15, 5, 3, 4.44, None)]
+    arrays = rapm.make_stint_arrays(rows)
+    assert arrays['game IDs'].tolist() == [7]
+    assert arrays['home players'].tolist() == [[1, 2, 3, 4, -1]]
+    assert arrays['away players'].tolist() == [[11, 12, 13, 14, 15]]
+    assert arrays['home possessions'].tolist() == [4.44]
+    assert arrays['away possessions'].tolist() == [0]
+    assert rapm.find_players(arrays).tolist() == [1, 2, 3, 4, 11, 12, 13, 14, 15]
+
+
+def test_build_design():
+    """Tests the rows of a stint, leaving out unidentified players and teams
+    without possessions."""
+    arrays = rapm.make_stint_arrays([(7, 1, 2, 3, 4, None, 11, 12, 13, 14, 15, 5, 3, 4, 0)])
+    player_ids = rapm.find_players(arrays)
+    design, targets, weights, game_ids = rapm.build_design(arrays, player_ids)
+    assert design.shape == (1, 19)
+    assert design.toarray()[0].tolist() == [1] * 4 + [0] * 5 + [0] * 4 + [-1] * 5 + [0.5]
+    assert targets.tolist() == [125]
+    assert weights.tolist() == [4]
+    assert game_ids.tolist() == [7]
+
+
+def test_fit_rapm():
+    """Tests that ratings of simulated stints recover the true ratings of the
+    players."""
+    rows, offense, defense = make_stints(1)
+    player_ratings = rapm.fit_rapm(rapm.make_stint_arrays(rows), 300)
+    assert player_ratings['player IDs'] == list(range(1, 201))
+    assert np.corrcoef(player_ratings['offense'], offense)[0, 1] > 0.8
+    assert np.corrcoef(player_ratings['defense'], defense)[0, 1] > 0.8
+    assert abs(player_ratings['average'] - 105) < 1
+    assert abs(player_ratings['home advantage'] - 3) < 1.5
+    assert abs(player_ratings['possessions'].sum() - 20 * sum(row[-1] for row in rows)) < 1e-6
+
+
+def test_fit_rapm_prior():
+    """Tests that a heavy penalty pulls players toward their prior ratings,
+    and players without one toward average."""
+    rows = make_stints(2, stint_count=500)[0]
+    player_ratings = rapm.fit_rapm(rapm.make_stint_arrays(rows), 1e9,
+                                   prior_ratings={1: (3.0, -2.0)})
+    assert abs(player_ratings['offense'][0] - 3) < 1e-3
+    assert abs(player_ratings['defense'][0] + 2) < 1e-3
+    assert np.abs(player_ratings['offense'][1:]).max() < 1e-3
+
+
+def test_cross_validate():
+    """Tests that cross-validation in worker processes prefers a reasonable
+    penalty over an extreme one."""
+    rows = make_stints(3, stint_count=3000)[0]
+    errors = rapm.cross_validate(rapm.make_stint_arrays(rows), penalties=[300, 1e7], folds=3,
+                                 workers=2)
+    assert sorted(errors) == [300, 1e7]
+    assert errors[300] < errors[1e7]
+
+
+def test_make_rating_rows():
+    """Tests that ratings are rounded into rows keyed by player and season."""
+    player_ratings = {'player IDs': [5], 'offense': np.array([1.234]),
+                      'defense': np.array([-0.5]), 'possessions': np.array([812.06]),
+                      'penalty': 1000}
+    assert rapm.make_rating_rows(player_ratings, 2024) == [(5, 2024, 1.23, -0.5, 0.73, 812.1,
+                                                            1000.0)]
@@ -0,0 +1,266 @@
+import datetime
+import time
+
+import numpy as np
+
+import src.ratings as ratings
+
+SEASON_START = datetime.date(2023, 11, 6)
+
+
+def make_season(seed, team_count=350, game_count=5500, home_advantage=3.0):
+    """Simulates a season of games between teams with known ratings."""
+    rng = np.random.default_rng(seed)
+    offense = rng.normal(0, 6, team_count)
+    defense = rng.normal(0, 6, team_count)
+    tempo = rng.normal(0, 3, team_count)
+    games = []
+    for i in range(game_count):
+        home, away = rng.choice(team_count, 2, replace=False)
+        possessions = 68 + tempo[home] + tempo[away] + rng.normal(0, 2)
+        games.append({
+            'game ID': i,
+            'date': SEASON_START + datetime.timedelta(int(i * 120 / game_count)),
+            'home team season ID': 1000 + int(home),
+            'away team season ID': 1000 + int(away),
+            'home points': round(possessions * (104 + offense[home] + defense[away]
+                                                + home_advantage / 2) / 100
+                                 + rng.normal(0, 6)),
+            'away points': round(possessions * (104 + offense[away] + defense[home]
+                                                - home_advantage / 2) / 100
+                                 + rng.normal(0, 6)),
+            'possessions': possessions
+        })
+    return games, offense, defense, tempo
+
+
+def test_fit_ratings():
+    """Tests that ratings of a simulated season recover the true ratings of
+    its teams and its home advantage, quickly."""
+    games, offense, defense, tempo = make_season(3)
+    start = time.perf_counter()
+    fit = ratings.fit_ratings(games, games[-1]['date'])
+    assert time.perf_counter() - start < 5
+    assert fit['team season IDs'] == list(range(1000, 1350))
+    assert np.corrcoef(fit['offense'], offense)[0, 1] > 0.9
+    assert np.corrcoef(fit['defense'], defense)[0, 1] > 0.9
+    assert np.corrcoef(fit['tempo'], tempo)[0, 1] > 0.9
+    assert abs(np.mean(fit['offense']) - 104) < 1
+    assert abs(np.mean(fit['tempo']) - 68) < 1
+    assert abs(fit['home advantage'] - 3) < 1
+    assert fit['games'].sum() == 2 * len(games)
+
+
+def test_fit_ratings_rating_date():
+    """Tests that games after the rating date don't count."""
+    games = make_season(4, team_count=20, game_count=200)[0]
+    rating_date = games[99]['date']
+    fit = ratings.fit_ratings(games, rating_date)
+    counted = sum(1 for game in games if game['date'] <= rating_date)
+    assert fit['games'].sum() == 2 * counted
+
+
+def test_game_weights():
+    """Tests recency weights halve every half-life and drop future games."""
+    games = [{'date': SEASON_START + datetime.timedelta(days)} for days in [0, 10, 20, 30]]
+    weights = ratings.game_weights(games, SEASON_START + datetime.timedelta(20), half_life=10)
+    assert weights.tolist() == [0.25, 0.5, 1, 0]
+    weights = ratings.game_weights(games, SEASON_START + datetime.timedelta(20))
+    assert weights.tolist() == [1, 1, 1, 0]
+
+
+def test_warm_start():
+    """Tests that starting from an earlier solution gives the same ratings in
+    fewer iterations."""
+    games = make_season(5, team_count=100, game_count=1500)[0]
+    earlier = ratings.fit_ratings(games[:1450], games[-1]['date'])
+    cold = ratings.fit_ratings(games, games[-1]['date'])
+    warm = ratings.fit_ratings(games, games[-1]['date'], start=earlier)
+    assert np.allclose(warm['offense'], cold['offense'], atol=1e-3)
+    assert np.allclose(warm['tempo'], cold['tempo'], atol=1e-3)
+    assert warm['iterations'] < cold['iterations']
+
+
+def test_make_rating_rows():
+    """Tests that ratings are rounded into rows keyed by team season and
+    date."""
+    fit = {'team season IDs': [7], 'offense': np.array([105.126]),
+           'defense': np.array([99.5]), 'tempo': np.array([67.0]), 'games': np.array([3])}
+    assert ratings.make_rating_rows(fit, SEASON_START) == \
+        [(7, SEASON_START, 105.13, 99.5, 67.0, 3)]
+
+
+def test_fit_ratings_no_games():
+    """Tests that fitting no games gives no ratings."""
+    fit = ratings.fit_ratings([], SEASON_START)
+    assert fit['team season IDs'] == []
+    assert ratings.make_rating_rows(fit, SEASON_START) == []
+
+
+class FakeCursor:
+    """Keeps the team_ratings and rating_snapshots tables in memory, and reads
+    games from a list of games in the format returned by fetch_games."""
+
+    def __init__(self, games=(), seasons=None):
+        self.ratings = {}
+        self.snapshots = {}
+        self.games = list(games)
+        self.seasons = seasons or {}
+        self.queries = []
+        self.result = []
+
+    def executemany(self, query, values):
+        assert query == ratings.UPLOAD_RATINGS_QUERY
+        for row in values:
+            self.ratings[row[:2]] = row[2:]
+
+    def execute(self, query, values=()):
+        self.queries.append(query)
+        if query == ratings.UPLOAD_SNAPSHOT_QUERY:
+            self.snapshots[values[:2]] = values[2:6] + values[7:]
+        elif query == ratings.FETCH_SNAPSHOT_QUERY:
+            self.result = [(key[1],) + snapshot for key, snapshot
+                           in sorted(self.snapshots.items(), reverse=True)
+                           if (key[0] == values[0]) and (key[1] < values[1])][:1]
+        elif query == ratings.FETCH_RATINGS_QUERY:
+            self.result = [(key[0],) + rating[:3] for key, rating in sorted(self.ratings.items())
+                           if (key[1] == values[0])
+                           and (self.seasons.get(key[0], 2024) == values[1])]
+        elif query in [ratings.FETCH_GAMES_QUERY, ratings.FETCH_NEW_GAMES_QUERY]:
+            games = self.find_games(*values[:2])
+            if query == ratings.FETCH_NEW_GAMES_QUERY:
+                games = [game for game in games
+                         if (game['game ID'] > values[2]) or (game['date'] >= values[3])]
+            self.read = [game['game ID'] for game in games]
+            self.result = [row for game in games for row in make_box_rows(game)]
+        elif query == ratings.FETCH_DIGEST_QUERY:
+            rows = [row for game in self.find_games(*values[:2]) if game['game ID'] <= values[2]
+                    for row in make_box_rows(game)]
+            self.result = [(len(rows) // 2,) + tuple(sum(row[i] for row in rows)
+                                                     for i in range(5, 12))]
+
+    def find_games(self, start_date, end_date):
+        return [game for game in self.games if start_date <= game['date'] < end_date]
+
+    def fetchone(self):
+        return self.result[0] if len(self.result) > 0 else None
+
+    def fetchall(self):
+        return self.result
+
+
+def make_box_rows(game):
+    """Makes the rows FETCH_GAMES_QUERY returns for a game, with each team's
+    points all from free throws."""
+    start_time = datetime.datetime.combine(game['date'], datetime.time(19))
+    return [(game['game ID'], start_time, game['home team season ID'],
+             game['away team season ID'], is_away, 0, 0, points,
+             game['possessions'] - 0.44 * points, 0, 0, points)
+            for is_away, points in [(False, game['home points']), (True, game['away points'])]]
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self.fake_cursor = cursor
+
+    def cursor(self):
+        return self.fake_cursor
+
+    def commit(self):
+        pass
+
+
+def test_update_ratings():
+    """Tests that an update reads only the games uploaded since the last
+    snapshot, including late games of earlier dates, and gives the same
+    ratings as a fit to every game, and that every game is read again once
+    the games of the snapshot have changed."""
+    games = make_season(8, team_count=30, game_count=400)[0]
+    late = games.pop(100)
+    late['game ID'] = 1000
+    cursor = FakeCursor(games[:300])
+    ratings.update_ratings(FakeConn(cursor), SEASON_START, games[299]['date'])
+    assert ratings.FETCH_NEW_GAMES_QUERY not in cursor.queries
+
+    cursor.games = games + [late]
+    cursor.queries = []
+    rating_date = games[-1]['date']
+    updated = ratings.update_ratings(FakeConn(cursor), SEASON_START, rating_date)
+    assert ratings.FETCH_GAMES_QUERY not in cursor.queries
+    assert sorted(cursor.read) == [game['game ID'] for game in games[300:]] + [1000]
+    fit = ratings.fit_ratings(games + [late], rating_date)
+    order = [fit['team season IDs'].index(team_id) for team_id in updated['team season IDs']]
+    assert np.allclose(updated['offense'], fit['offense'][order], atol=1e-3)
+    assert np.allclose(updated['tempo'], fit['tempo'][order], atol=1e-3)
+    assert updated['games'].sum() == 2 * (len(games) + 1)
+
+    cursor.games[0] = dict(games[0], **{'home points': games[0]['home points'] + 10})
+    cursor.queries = []
+    ratings.update_ratings(FakeConn(cursor), SEASON_START, rating_date + datetime.timedelta(1))
+    assert ratings.FETCH_GAMES_QUERY in cursor.queries
+    assert ratings.FETCH_NEW_GAMES_QUERY not in cursor.queries
+
+
+def test_updater_history():
+    """Tests that adding each day's games to the ratings of the day before
+    gives the same ratings as fitting each day from scratch, with fewer
+    iterations in total."""
+    games = make_season(6, team_count=60, game_count=900)[0]
+    updater = ratings.RatingsUpdater(half_life=30)
+    warm_iterations = 0
+    cold_iterations = 0
+    days = ratings.daily_games(games, games[-1]['date'])
+    for rating_date, day_games in days:
+        assert updater.add_games(day_games) == len(day_games)
+        warm = updater.rate(rating_date)
+        warm_iterations += warm['iterations']
+        if rating_date.day % 10 == 0:
+            cold = ratings.fit_ratings([game for game in games if game['date'] <= rating_date],
+                                       rating_date, half_life=30)
+            order = [cold['team season IDs'].index(team_id)
+                     for team_id in warm['team season IDs']]
+            assert np.allclose(warm['offense'], cold['offense'][order], atol=1e-3)
+            assert np.allclose(warm['tempo'], cold['tempo'][order], atol=1e-3)
+        cold_iterations += ratings.fit_ratings(
+            [game for game in games if game['date'] <= rating_date], rating_date,
+            half_life=30)['iterations']
+    assert len(updater) == len(games)
+    assert updater.add_games(games) == 0
+    assert warm_iterations < cold_iterations
+
+
+def test_daily_games():
+    """Tests that games are grouped by day, including days without games."""
+    games = [{'date': SEASON_START}, {'date': SEASON_START},
+             {'date': SEASON_START + datetime.timedelta(2)}]
+    days = ratings.daily_games(games, SEASON_START + datetime.timedelta(3))
+    assert [(date, len(day_games)) for date, day_games in days] == \
+        [(SEASON_START + datetime.timedelta(day), count)
+         for day, count in enumerate([2, 0, 1, 0])]
+    assert ratings.daily_games([], SEASON_START) == []
+
+
+def test_snapshot_round_trip():
+    """Tests that stored ratings start a later update close to its
+    solution."""
+    games = make_season(7, team_count=40, game_count=600)[0]
+    # a team of the season before, rated on the same date
+    cursor = FakeCursor(games, seasons={999: 2023})
+    first_date = games[500]['date']
+    fit = ratings.fit_ratings(games[:500], first_date)
+    ratings.upload_snapshot(cursor, fit, SEASON_START, first_date, games[:500])
+    cursor.ratings[(999, first_date)] = (100.0, 100.0, 70.0, 30)
+    assert ratings.load_snapshot(cursor, SEASON_START, first_date) == (None, None)
+
+    snapshot_date, start = ratings.load_snapshot(cursor, SEASON_START, games[-1]['date'])
+    assert snapshot_date == first_date
+    assert start['game count'] == 500
+    assert start['team season IDs'] == fit['team season IDs']
+    assert start['games'] == games[:500]
+    assert start['last game ID'] == 499
+    assert abs(start['average tempo'] - fit['average tempo']) < 1e-9
+    assert np.allclose(start['efficiency solution'], fit['efficiency solution'], atol=0.01)
+    warm = ratings.fit_ratings(games, games[-1]['date'], start=start)
+    cold = ratings.fit_ratings(games, games[-1]['date'])
+    assert np.allclose(warm['offense'], cold['offense'], atol=1e-3)
+    assert warm['iterations'] < cold['iterations']
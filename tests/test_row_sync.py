@@ -0,0 +1,61 @@
+import datetime
+import decimal
+
+import src.row_sync as row_sync
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.written = []
+        self.deleted = []
+
+    def execute(self, query, values):
+        if query.startswith("SELECT"):
+            self.result = [row for row in self.rows if row[0] == values[0]]
+        else:
+            self.deleted.append(values)
+
+    def executemany(self, query, values):
+        if query.startswith("INSERT"):
+            self.written.extend(values)
+        else:
+            self.deleted.extend(values)
+
+    def fetchall(self):
+        return self.result
+
+
+def test_sync():
+    """Tests that only new and changed rows are written, and rows missing
+    from the fresh parse are deleted."""
+    table = row_sync.RowTable("plays", ["game_id", "play_in_game", "time_remaining", "action"],
+                              index_column="play_in_game")
+    cursor = FakeCursor([(1, 0, decimal.Decimal("1200.00"), "jump ball"),
+                         (1, 1, decimal.Decimal("1180.50"), "shot"),
+                         (1, 2, decimal.Decimal("1170.00"), "rebound"),
+                         (1, 3, decimal.Decimal("1160.00"), "foul"),
+                         (2, 0, decimal.Decimal("1200.00"), "jump ball")])
+    fresh = [(1, 0, 1200.0, "jump ball"), (1, 1, 1180.5, "shot"), (1, 2, 1170.0, "turnover")]
+    assert table.sync(cursor, 1, fresh) == (1, 1, 2)
+    assert cursor.written == [(1, 2, 1170.0, "turnover")]
+    assert cursor.deleted == [(1, 3)]
+    assert table.upsert_query.endswith("time_remaining = VALUES(time_remaining), "
+                                       "action = VALUES(action)")
+
+
+def test_sync_game():
+    table = row_sync.RowTable("games", ["game_id", "start_time", "is_exhibition"])
+    cursor = FakeCursor([(1, datetime.datetime(2020, 3, 1, 19, 0), 0)])
+    assert table.sync(cursor, 1, [(1, "2020/03/01 19:00", False)]) == (0, 0, 1)
+    assert table.sync(cursor, 1, [(1, "2020/03/01 20:00", False)]) == (1, 0, 0)
+    assert table.sync(cursor, 2, [(2, "2020/03/01", True)]) == (1, 0, 0)
+
+
+def test_same_value():
+    assert row_sync.same_value(None, None)
+    assert not row_sync.same_value(None, 0)
+    assert row_sync.same_value(1, True)
+    assert row_sync.same_value(decimal.Decimal("12.30"), 12.3)
+    assert not row_sync.same_value("Smith, John", "Smith, Jon")
+    assert row_sync.same_value(datetime.datetime(2020, 3, 1), "2020/03/01")
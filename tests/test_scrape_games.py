@@ -1,7 +1,10 @@
 import bs4
+import datetime
 import json
 import pymysql
+import types
 
+import src.database as database
 import src.scrape_games as sg
 
 PATH_BOX_HTML_VALUES = "../tests/test_cases/box_html_values.json"
@@ -17,7 +20,7 @@ def test_integration():
 
 
 def test_scrape_game():
-    conn = sg.connect_to_db()
+    conn = database.connect_to_db()
     cursor = conn.cursor()
     box_file = open('../tests/webpages/box_1602674.html', 'r')
     box_soup = bs4.BeautifulSoup(box_file, 'html.parser')
@@ -133,7 +136,7 @@ def test_db_interaction():
 
 
 def test_connect_to_db():
-    conn = sg.connect_to_db()
+    conn = database.connect_to_db()
     assert isinstance(conn, pymysql.connections.Connection)
     return conn
 
@@ -151,10 +154,87 @@ def test_fetch_roster(cursor):
             assert found_roster == roster
 
 
+class SchemaCursor:
+    """Records the queries run by ensure_schema."""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, values=None):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return []
+
+
+class FakeScorer:
+    def create_tables(self, cursor):
+        cursor.execute("CREATE TABLE win_probabilities")
+
+
+def test_ensure_schema():
+    """Tests that the tables and columns added since the database was set up
+    are created, and the optional ones only when they are used."""
+    cursor = SchemaCursor()
+    sg.ensure_schema(cursor)
+    assert sg.stints.CREATE_STINTS_QUERY in cursor.queries
+    assert sg.possessions.ADD_COLUMNS_QUERY in cursor.queries
+    assert sg.lineups.CREATE_LINEUPS_QUERY not in cursor.queries
+    assert "CREATE TABLE win_probabilities" not in cursor.queries
+
+    cursor = SchemaCursor()
+    sg.ensure_schema(cursor, lineup_plays=True, scorer=FakeScorer())
+    assert sg.lineups.CREATE_LINEUPS_QUERY in cursor.queries
+    assert "CREATE TABLE win_probabilities" in cursor.queries
+
+
+def test_fetch_games_missing_plays():
+    """Tests that games missing plays are looked for in the table the plays are
+    stored in."""
+    cursor = SchemaCursor()
+    cursor.fetchall = lambda: [(5, datetime.datetime(2020, 1, 2, 19, 0))]
+    work = sg.fetch_games_missing_plays(cursor, datetime.date(2020, 1, 1),
+                                        datetime.date(2020, 2, 1))
+    assert work == [{'box ID': 5, 'season': 2020, 'date': datetime.date(2020, 1, 2)}]
+    sg.fetch_games_missing_plays(cursor, datetime.date(2020, 1, 1), datetime.date(2020, 2, 1),
+                                 lineup_plays=True)
+    assert cursor.queries == [sg.FETCH_GAMES_MISSING_PLAYS_QUERY,
+                              sg.FETCH_GAMES_MISSING_LINEUP_PLAYS_QUERY]
+
+
+def test_main_options(monkeypatch):
+    """Tests that the options of main reach scrape_range wherever they are in
+    the arguments, along with a scorer of the fitted win probability model."""
+    calls = []
+    monkeypatch.setattr(sg, 'scrape_range', lambda *args, **kwargs: calls.append((args, kwargs)))
+    monkeypatch.setattr(sg.scrape_log, 'configure', lambda: None)
+    model = types.SimpleNamespace(load_model=lambda: "model",
+                                  GameScorer=lambda model: ("scorer", model))
+    monkeypatch.setattr(sg, 'win_probability', model)
+    sg.main(["2020", "1", "1", "--parse-workers", "4", "2020", "1", "2", "--lineup-plays"])
+    sg.main(["reupload", "2020", "1", "1", "2020", "1", "2"])
+    assert calls == [((2020, 1, 1, 2020, 1, 2), {'parse_workers': 4, 'lineup_plays': True,
+                                                 'scorer': ("scorer", "model")}),
+                     ((2020, 1, 1, 2020, 1, 2), {'reupload': True, 'parse_workers': 0,
+                                                 'lineup_plays': False,
+                                                 'scorer': ("scorer", "model")})]
+
+    model.load_model = lambda: None
+    sg.main(["2020", "1", "1", "2020", "1", "2"])
+    assert calls[-1][1]['scorer'] is None
+
+
 # Test cases for functions that to clean the raw data extracted from
 # stats.ncaa.org box score pages.
 
 
+def test_find_season():
+    assert sg.find_season(datetime.date(2019, 11, 5)) == (2020, 17060)
+    assert sg.find_season(datetime.date(2020, 3, 15)) == (2020, 17060)
+    assert sg.find_season(datetime.date(2019, 3, 15)) == (2019, 16700)
+    assert sg.find_season(datetime.date(2030, 1, 1)) == (2030, None)
+
+
 def test_clean_raw_box_data():
     """Runs all tests of functions that clean raw box score data."""
     test_clean_name()
@@ -0,0 +1,36 @@
+import json
+import logging
+
+import src.scrape_log as scrape_log
+
+
+def test_json_lines_formatter():
+    """Tests that records are formatted as JSON with the structured fields."""
+    record = logging.LogRecord("ncaa.test", logging.INFO, __file__, 1, "Fetched %s bytes.",
+                               (1024,), None)
+    record.url = "http://stats.ncaa.org/game/play_by_play/4654374"
+    record.attempt = 2
+    entry = json.loads(scrape_log.JsonLinesFormatter().format(record))
+    assert entry['level'] == "INFO"
+    assert entry['message'] == "Fetched 1024 bytes."
+    assert entry['url'] == "http://stats.ncaa.org/game/play_by_play/4654374"
+    assert entry['attempt'] == 2
+    assert 'box_id' not in entry
+
+
+def test_configure(tmp_path):
+    """Tests that logged messages at or above the level are written as JSON
+    lines once the queue is flushed."""
+    log_path = tmp_path / "scrape.log"
+    scrape_log.configure(logging.INFO, path=log_path)
+    logger = scrape_log.get_logger("test")
+    logger.debug("Not written.")
+    logger.warning("Done retrying.", extra={'box_id': 1602674})
+    scrape_log.shutdown()
+
+    with open(log_path, 'r') as log_file:
+        entries = [json.loads(line) for line in log_file]
+    assert len(entries) == 1
+    assert entries[0]['message'] == "Done retrying."
+    assert entries[0]['box_id'] == 1602674
+    assert entries[0]['logger'] == "ncaa.test"
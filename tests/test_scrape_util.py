@@ -1,4 +1,5 @@
 import pytest
+import requests
 import src.scrape_util
 import time
 
@@ -20,9 +21,28 @@ def test_cancel():
     time.sleep(1)
 
 
+def test_page():
+    page = src.scrape_util.Page("http://stats.ncaa.org/", b"<p>hi</p>", 200, {}, 0.1, None)
+    assert page.parsed is None
+    assert page.soup.find('p').text == "hi"
+    assert page.soup is page.parsed
+    page.release()
+    assert page.parsed is None
+    assert page.soup.find('p').text == "hi"
+
+
+def test_is_proxy_error():
+    assert src.scrape_util.is_proxy_error(requests.exceptions.ProxyError())
+    assert src.scrape_util.is_proxy_error(requests.exceptions.ConnectTimeout())
+    assert src.scrape_util.is_proxy_error(IndexError())
+    assert not src.scrape_util.is_proxy_error(requests.exceptions.ReadTimeout())
+    assert not src.scrape_util.is_proxy_error(TimeoutError())
+
+
 def main():
     test_timeout_error()
     test_cancel()
+    test_page()
 
 
 ### ACTUAL STUFF ###
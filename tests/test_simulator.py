@@ -0,0 +1,115 @@
+import numpy as np
+
+import src.simulator as simulator
+
+
+def make_ratings():
+    """Makes ratings of four teams, from best to worst, as load_ratings
+    returns them."""
+    return {
+        'team season IDs': [11, 12, 13, 14],
+        'efficiency solution': np.array([8.0, 2.0, -2.0, -8.0, -6.0, -1.0, 1.0, 6.0, 4.0]),
+        'tempo solution': np.array([2.0, 0.0, -1.0, -1.0]),
+        'average efficiency': 100.0,
+        'average tempo': 68.0
+    }
+
+
+def test_predict_margins():
+    """Tests the predicted margin of a home game and of a neutral game."""
+    team_ratings = make_ratings()
+    margins = simulator.predict_margins(team_ratings, np.array([0, 3]), np.array([3, 0]),
+                                        np.array([False, True]))
+    # (8 + 6 - (-8) - (-6) + 4) per 100 over 68 + 2 - 1 possessions
+    assert np.allclose(margins, [32 * 69 / 100, -28 * 69 / 100])
+    probabilities = simulator.win_probabilities(margins)
+    assert probabilities[0] > 0.95 and probabilities[1] < 0.05
+
+
+def test_team_indices():
+    """Tests that teams without ratings are added as average teams."""
+    team_ratings = make_ratings()
+    indices = simulator.team_indices(team_ratings, [12, 20, 11, 20])
+    assert indices.tolist() == [1, 4, 0, 4]
+    assert team_ratings['team season IDs'] == [11, 12, 13, 14, 20]
+    efficiency = team_ratings['efficiency solution']
+    assert efficiency.tolist() == [8, 2, -2, -8, 0, -6, -1, 1, 6, 0, 4]
+    assert simulator.predict_margins(team_ratings, np.array([4]), np.array([0]),
+                                     np.array([True]))[0] < 0
+
+
+def make_schedule():
+    games = []
+    for home in [11, 12, 13, 14]:
+        for away in [11, 12, 13, 14]:
+            if home != away:
+                games.append({'home team season ID': home, 'away team season ID': away,
+                              'neutral': False})
+    return games
+
+
+def test_simulate_season():
+    """Tests that expected wins match the sum of the win probabilities, that
+    group titles add up to 1 and that the results depend on the seed and not
+    on the number of workers."""
+    schedule = make_schedule()
+    team_ratings = make_ratings()
+    projections = simulator.simulate_season(team_ratings, schedule, {11: 3, 14: 1},
+                                            {'all': [11, 12, 13, 14], 'bottom': [13, 14]},
+                                            simulations=20000, workers=2, seed=3)
+    indices = simulator.team_indices(team_ratings, [11, 12, 13, 14])
+    home = indices[np.repeat(np.arange(4), 3)]
+    away = np.array([indices[j] for i in range(4) for j in range(4) if i != j])
+    probabilities = simulator.win_probabilities(
+        simulator.predict_margins(team_ratings, home, away, np.zeros(12, dtype=bool)))
+    for team in range(4):
+        exact = probabilities[home == team].sum() + (1 - probabilities[away == team]).sum()
+        exact += {0: 3, 3: 1}.get(team, 0)
+        assert abs(projections[11 + team]['expected wins'] - exact) < 0.05
+    for name, teams in [('all', [11, 12, 13, 14]), ('bottom', [13, 14])]:
+        assert abs(sum(projections[team]['group titles'][name] for team in teams) - 1) < 1e-9
+    assert projections[11]['group titles']['all'] > 0.5
+    assert projections[13]['group titles']['bottom'] > projections[14]['group titles']['bottom']
+    assert projections[12]['group titles'] == {'all': projections[12]['group titles']['all']}
+    assert projections[12]['wins SD'] > 0
+
+    again = simulator.simulate_season(make_ratings(), schedule, {11: 3, 14: 1},
+                                      {'all': [11, 12, 13, 14], 'bottom': [13, 14]},
+                                      simulations=20000, workers=1, seed=3)
+    assert again == projections
+
+
+def test_simulate_tournament():
+    """Tests a bracket with a bye against the exact probabilities of each team
+    reaching each round."""
+    team_ratings = make_ratings()
+    projections = simulator.simulate_tournament(team_ratings, [11, None, 12, 13],
+                                                simulations=40000, workers=2, seed=1)
+    teams = simulator.team_indices(team_ratings, [11, 12, 13])
+
+    def beat(a, b):
+        return simulator.win_probabilities(simulator.predict_margins(
+            team_ratings, teams[[a]], teams[[b]], np.array([True])))[0]
+
+    champion = beat(0, 1) * beat(1, 2) + beat(0, 2) * beat(2, 1)
+    assert projections[11][0] == 1
+    assert abs(projections[12][0] - beat(1, 2)) < 0.01
+    assert abs(projections[11][1] - champion) < 0.01
+    assert abs(sum(projection[1] for projection in projections.values()) - 1) < 1e-9
+
+
+def test_load_schedule_file(tmp_path):
+    """Tests reading a schedule file and a bracket file."""
+    schedule_path = tmp_path / "schedule.json"
+    schedule_path.write_text('{"games": [{"home": 1, "away": 2}, '
+                             '{"home": 2, "away": 3, "neutral": true}], '
+                             '"groups": {"A": [1, 2, 3]}}')
+    schedule = simulator.load_schedule_file(str(schedule_path))
+    assert schedule['games'][1] == {'home team season ID': 2, 'away team season ID': 3,
+                                    'neutral': True}
+    assert not schedule['games'][0]['neutral']
+    assert schedule['groups'] == {'A': [1, 2, 3]}
+
+    bracket_path = tmp_path / "bracket.json"
+    bracket_path.write_text('{"bracket": [1, null, 2, 3]}')
+    assert simulator.load_schedule_file(str(bracket_path)) == {'bracket': [1, None, 2, 3]}
@@ -0,0 +1,104 @@
+import datetime
+import os
+
+import bs4
+import requests
+
+import src.scrape_games as sg
+import src.scrape_util as scrape_util
+import src.stand_in_server as stand_in
+import src.synthetic_games as synthetic
+
+
+def make_server(tmp_path, faults=None):
+    """Writes a small synthetic corpus and returns a stand-in server for it on a free port."""
+    synthetic.write_corpus(str(tmp_path), 4, seed=3)
+    return stand_in.StandInServer(str(tmp_path), ("127.0.0.1", 0), faults, seed=0)
+
+
+def test_find_page(tmp_path):
+    """Tests that every route finds the right stored page, directly and by
+    absolute URL."""
+    game = next(synthetic.generate_games(1, seed=3))
+    synthetic.write_corpus(str(tmp_path), 4, seed=3)
+    pages = stand_in.load_pages(str(tmp_path))
+    box_id, pbp_id = game['box ID'], game['pbp ID']
+    assert stand_in.find_page(pages, f"/contests/{box_id}/box_score") == game['box html'].encode()
+    assert stand_in.find_page(pages, f"http://stats.ncaa.org/game/box_score/{pbp_id}") == \
+        game['box html'].encode()
+    assert stand_in.find_page(pages, f"/game/play_by_play/{pbp_id}") == game['pbp html'].encode()
+    assert stand_in.find_page(pages, "/contests/1/box_score") is None
+
+    date = game['start time']
+    url = f"/season_divisions/1/scoreboards?game_date={date.month}%2F{date.day}%2F{date.year}"
+    soup = bs4.BeautifulSoup(stand_in.find_page(pages, url), 'html.parser')
+    assert box_id in sg.find_box_ids(soup)
+    url = "/season_divisions/1/scoreboards?game_date=1%2F1%2F1999"
+    assert sg.find_box_ids(bs4.BeautifulSoup(stand_in.find_page(pages, url), 'html.parser')) == []
+
+
+def test_faults(tmp_path):
+    """Tests that injected errors and truncated bodies reach the client."""
+    url_path = f"/contests/{synthetic.FIRST_BOX_ID}/box_score"
+    with make_server(tmp_path, {'error rate': 1}) as server:
+        assert requests.get(server.url + url_path).status_code in stand_in.ERROR_STATUSES
+    with make_server(tmp_path, {'truncate rate': 1}) as server:
+        try:
+            requests.get(server.url + url_path)
+            assert False
+        except requests.exceptions.RequestException:
+            pass
+        assert server.report()['counters']['truncations injected'] == 1
+
+
+def test_drive(tmp_path):
+    """Tests that a scraper fetches every page through the server as a proxy."""
+    with make_server(tmp_path, {'error rate': 0.2}) as server:
+        urls = stand_in.corpus_urls(server.pages)
+        report = stand_in.drive(server, urls, concurrency=4)
+    assert report['pages fetched'] == len(urls) == report['pages']
+    assert report['server']['counters']['pages served'] == len(urls)
+
+
+def test_enumerate_games(tmp_path):
+    """Tests that enumerating a range through the server lists every game
+    once, across a season boundary, with the season of its date."""
+    games = list(synthetic.generate_games(4, seed=3))
+    synthetic.write_corpus(str(tmp_path), 4, seed=3)
+    # move the first game back into the season before, which ends on June 30
+    first_date = games[0]['start time'].strftime('%Y%m%d')
+    os.rename(tmp_path / f"scoreboard_{first_date}.html", tmp_path / "scoreboard_20190628.html")
+    dates = [datetime.date(2019, 6, 28)] + [game['start time'].date() for game in games[1:]]
+
+    with stand_in.StandInServer(str(tmp_path), ("127.0.0.1", 0), seed=0) as server:
+        scraper = scrape_util.Scraper(thread_count=2, masks=[
+            {'address': server.url, 'user-agent': "test"}] * 2)
+        work = sg.enumerate_games(scraper, datetime.date(2019, 6, 25), datetime.date(2020, 7, 5))
+    assert [(game['box ID'], game['date'], game['season']) for game in work] == \
+        [(game['box ID'], date, 2019 if i == 0 else 2020)
+         for i, (game, date) in enumerate(zip(games, dates))]
+    assert [game['date'] for game in work] == sorted(game['date'] for game in work)
+
+
+def test_fetch_games_concurrently(tmp_path):
+    """Tests that the pages of several games are fetched at once through the
+    server, each game's pages together, in the order of the work list."""
+    games = list(synthetic.generate_games(4, seed=3))
+    with make_server(tmp_path) as server:
+        scraper = scrape_util.Scraper(thread_count=2, masks=[
+            {'address': server.url, 'user-agent': "test"}] * 4)
+        fetched = list(scraper.controller.map(
+            lambda game: sg.fetch_game(scraper, 2020, game['box ID']), games))
+    assert [(pbp_id, pbp_page.content) for _, pbp_id, pbp_page in fetched] == \
+        [(game['pbp ID'], game['pbp html'].encode()) for game in games]
+    assert [box_page.content for box_page, _, _ in fetched] == \
+        [game['box html'].encode() for game in games]
+
+
+def test_main_default_corpus(tmp_path, monkeypatch):
+    """Tests that the server runs without a corpus given, on a synthetic
+    corpus it writes on first use."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stand_in, 'DEFAULT_CORPUS_GAMES', 2)
+    assert stand_in.main(["--port", "0", "--drive", "--concurrency", "2"]) == 0
+    assert len(list((tmp_path / stand_in.PATH_CORPUS).glob("box_*.html"))) == 2
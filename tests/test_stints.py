@@ -0,0 +1,61 @@
+import bs4
+
+import src.lineup_matrix as lineup_matrix
+import src.scrape_games as sg
+import src.stints as stints
+import src.synthetic_games as synthetic
+
+
+def make_players(*player_ids):
+    return [{'player ID': player_id, 'name': f"Player {player_id}"} for player_id in player_ids]
+
+
+def test_find_stints():
+    """Tests that plays are split into stints when either lineup or the
+    period changes, with times, points and counts of each stint."""
+    home = make_players(1, 2, 3, 4, 5)
+    home_sub = make_players(1, 2, 3, 4, 6)
+    away = make_players(11, 12, 13, 14, 15)
+
+    def play(period, time, h_score, a_score, is_away, action, h_partic, **flags):
+        return dict({'period': period, 'time': time, 'home score': h_score,
+                     'away score': a_score, 'is away': is_away, 'action': action,
+                     'home partic': h_partic, 'away partic': away}, **flags)
+
+    plays = [play(0, 1190, 2, 0, False, "shot", home, **{'flag 2': "short 2", 'flag 3': True}),
+             play(0, 1170, 2, 0, True, "shot", list(reversed(home)), **{'flag 2': "3"}),
+             play(0, 1165, 2, 0, False, "rebound", home, **{'flag 3': False}),
+             play(0, 1100, 2, 0, False, "substitution", home_sub),
+             play(0, 1000, 2, 1, True, "free throw", home_sub, **{'flag 3': True}),
+             play(1, 1150, 4, 1, False, "shot", home_sub,
+                  **{'flag 2': "long 2", 'flag 3': True})]
+    found = stints.find_stints(plays, lineup_matrix.LineupMatrix(plays))
+    assert [(stint['period'], stint['start time'], stint['end time']) for stint in found] == \
+        [(0, 1200, 1100), (0, 1100, 0), (1, 1200, 0)]
+    assert [(stint['first play'], stint['last play']) for stint in found] == \
+        [(0, 2), (3, 4), (5, 5)]
+    assert [(stint['home points'], stint['away points']) for stint in found] == \
+        [(2, 0), (0, 1), (2, 0)]
+    assert found[0]['home stats']['FGM'] == 1
+    assert found[0]['home stats']['DRB'] == 1
+    assert found[0]['away stats']['3PA'] == 1
+    assert found[1]['away possessions'] == 0.44
+    assert found[1]['home lineup'] == home_sub
+
+
+def test_find_stints_synthetic():
+    """Tests that the stints of whole games account for every play, point
+    and second."""
+    for game in synthetic.generate_games(3, seed=6):
+        plays = sg.parse_all_plays(
+            sg.find_raw_plays(bs4.BeautifulSoup(game['pbp html'], 'html.parser')),
+            game['home roster'], game['away roster'])
+        sg.track_shot_clock(plays)
+        sg.track_partic(plays)
+        found = stints.find_stints(plays, lineup_matrix.LineupMatrix(plays))
+        assert found[-1]['last play'] == len(plays) - 1
+        assert sum(stint['home points'] for stint in found) == plays[-1]['home score']
+        assert sum(stint['away points'] for stint in found) == plays[-1]['away score']
+        assert abs(sum(stint['start time'] - stint['end time'] for stint in found)
+                   - sum(stints.period_length(period)
+                         for period in range(plays[-1]['period'] + 1))) < 1e-6
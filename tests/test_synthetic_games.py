@@ -0,0 +1,40 @@
+import random
+
+import src.scrape_games as sg
+import src.synthetic_games as synthetic
+
+
+def test_generate_games_is_seeded():
+    """Tests that the same seed generates the same games and a different seed
+    generates different ones."""
+    games1 = list(synthetic.generate_games(2, seed=7))
+    games2 = list(synthetic.generate_games(2, seed=7))
+    games3 = list(synthetic.generate_games(2, seed=8))
+    assert [game['pbp html'] for game in games1] == [game['pbp html'] for game in games2]
+    assert [game['box html'] for game in games1] == [game['box html'] for game in games2]
+    assert games1[0]['pbp html'] != games3[0]['pbp html']
+
+
+def test_write_play():
+    """Tests that written plays parse back to the simulated action in both
+    notations."""
+    rng = random.Random(0)
+    home, away = synthetic.make_teams(rng, 2)
+    game = synthetic.simulate_game(rng, home, away)
+    for notation in synthetic.NOTATIONS:
+        for event in game['events']:
+            text = synthetic.write_play(event, notation)
+            if (text is None) or (event['action'] == "garbage"):
+                continue
+            parsed = sg.parse_play(text)
+            assert parsed['action'] == event['action']
+            if event['player'] is not None:
+                assert parsed['player'] == event['player']['name']
+
+
+def test_write_time():
+    """Tests relevant cases of write_time."""
+    assert synthetic.write_time(1200, "semicolon") == "20:00:00"
+    assert synthetic.write_time(72.63, "semicolon") == "01:12:63"
+    assert synthetic.write_time(72.63, "caps") == "01:12"
+    assert sg.clean_centi_time(synthetic.write_time(72.63, "semicolon")) == 72.63
@@ -0,0 +1,177 @@
+import datetime
+
+import numpy as np
+
+import src.elo as elo
+import src.win_probability as win_probability
+
+
+def simulate_plays(game_count, seed=0, plays_per_half=80):
+    """Simulates the plays of games between teams with random rating gaps, in
+    the form returned by fetch_plays."""
+    rng = np.random.default_rng(seed)
+    gaps = rng.normal(0, 150, game_count)
+    play_count = 2 * plays_per_half
+    periods = np.tile(np.repeat([0.0, 1.0], plays_per_half), game_count)
+    times = np.tile(np.tile(np.linspace(1190, 0, plays_per_half), 2), game_count)
+    # each play is a possession of the team in possession of the ball, alternating
+    offense = np.tile(np.arange(play_count) % 2, game_count).astype(float)
+    edge = np.repeat(gaps / 2000, play_count)
+    scoring = rng.random(game_count * play_count) < 0.5 + np.where(offense == 0, edge, -edge)
+    points = scoring * rng.choice([2, 3], game_count * play_count)
+    h_points = np.where(offense == 0, points, 0).reshape(game_count, play_count)
+    a_points = np.where(offense == 1, points, 0).reshape(game_count, play_count)
+    # settle ties on the last play
+    h_scores = h_points.cumsum(axis=1)
+    a_scores = a_points.cumsum(axis=1)
+    h_scores[:, -1] += h_scores[:, -1] == a_scores[:, -1]
+    return {
+        'game IDs': np.repeat(np.arange(game_count, dtype=float), play_count),
+        'plays in game': np.tile(np.arange(play_count, dtype=float), game_count),
+        'periods': periods, 'times': times,
+        'home scores': h_scores.ravel().astype(float),
+        'away scores': a_scores.ravel().astype(float),
+        'offense is away': offense
+    }, dict(enumerate(gaps.tolist()))
+
+
+def test_fill_scores():
+    """Tests that missing scores are carried forward within a game and start
+    at 0 in a new game."""
+    starts = np.array([True, False, False, True, False])
+    scores = np.array([np.nan, 2, np.nan, np.nan, 3])
+    assert win_probability.fill_scores(starts, scores).tolist() == [0, 2, 2, 0, 3]
+
+
+def test_make_features():
+    """Tests the time left and possession behind the features."""
+    features = win_probability.make_features(
+        np.array([0, 1, 2]), np.array([1200, 60, 300]), np.array([4, 4, 4]),
+        np.array([0, 1, np.nan]), np.array([100, 100, 100]))
+    scales = np.sqrt(np.array([2400, 60, 300]) / 60 + win_probability.SCALE_MINUTES)
+    assert np.allclose(features[:, 1], 4 / scales)
+    assert np.allclose(features[:, 2] * scales, [1, -1, 0])
+    assert np.allclose(features[:, 3] * scales, [1, 60 / 2400, 300 / 2400])
+    assert features[:, 0].tolist() == [1, 1, 1]
+
+
+def test_game_outcomes():
+    """Tests that each play gets the result of its game, and ties get NaN."""
+    game_ids = np.array([1, 1, 2, 2, 3])
+    starts = win_probability.game_starts(game_ids)
+    outcomes = win_probability.game_outcomes(starts, np.array([2, -1, 0, 3, 0]))
+    assert outcomes[:4].tolist() == [0, 0, 1, 1]
+    assert np.isnan(outcomes[4])
+
+
+def test_fit_model():
+    """Tests that Newton's method recovers the coefficients of simulated
+    logistic data."""
+    rng = np.random.default_rng(1)
+    features = np.column_stack([np.ones(100000), rng.normal(size=(100000, 2))])
+    coefficients = np.array([0.3, 1.5, -0.8])
+    outcomes = (rng.random(100000) < win_probability.sigmoid(features @ coefficients)) * 1.0
+    fit, iterations = win_probability.fit_model(features, outcomes)
+    assert np.abs(fit - coefficients).max() < 0.05
+    assert iterations < 15
+
+
+def test_fit_simulated_season():
+    """Tests that a model fit to simulated games favors the team ahead, more so
+    late in the game, and the team with the better rating."""
+    plays, gaps = simulate_plays(600)
+    features, outcomes = win_probability.make_season_features(plays, gaps)
+    coefficients, _ = win_probability.fit_model(features, outcomes)
+    model = win_probability.WinProbabilityModel(coefficients)
+    probabilities = model.predict(features)
+    assert win_probability.log_loss(probabilities, outcomes) < 0.5
+
+    def probability(period, time, margin, gap):
+        return model.predict(win_probability.make_features(
+            np.array([period]), np.array([time]), np.array([margin]), np.array([np.nan]),
+            np.array([gap])))[0]
+
+    assert probability(1, 60, 5, 0) > probability(0, 1000, 5, 0) > 0.5
+    assert probability(1, 0, 1, 0) > 0.85
+    assert probability(0, 1200, 0, 200) > probability(0, 1200, 0, 0)
+    assert abs(probability(1, 60, 0, 200) - 0.5) < abs(probability(0, 1200, 0, 200) - 0.5)
+
+
+def test_score_plays():
+    """Tests that scoring a game's plays matches scoring the season arrays,
+    including plays without a score."""
+    plays, gaps = simulate_plays(2)
+    model = win_probability.WinProbabilityModel([0.1, 0.9, 0.2, 0.5, 0.3])
+    features, _ = win_probability.make_season_features(plays, gaps)
+    season = model.predict(features)
+    game_plays = []
+    for i in range(160):
+        game_plays.append({'period': int(plays['periods'][i]), 'time': plays['times'][i],
+                           'home score': int(plays['home scores'][i]),
+                           'away score': int(plays['away scores'][i]),
+                           'offense is away': bool(plays['offense is away'][i])})
+    game_plays[5]['home score'] = None
+    game_plays[5]['away score'] = None
+    game_plays[6]['offense is away'] = None
+    scored = model.score_plays(game_plays, gaps[0])
+    assert np.allclose(np.delete(scored, [5, 6]), np.delete(season[:160], [5, 6]))
+    assert abs(scored[5] - season[4]) < 0.05
+
+
+def test_save_and_load(tmp_path):
+    """Tests that a saved model loads with the same coefficients, and that a
+    missing file loads as None."""
+    path = str(tmp_path / "model.json")
+    assert win_probability.load_model(path) is None
+    win_probability.WinProbabilityModel([1, 2, 3, 4, 5], {'plays': 10}).save(path)
+    model = win_probability.load_model(path)
+    assert model.coefficients.tolist() == [1, 2, 3, 4, 5]
+    assert model.info == {'plays': 10}
+
+
+class FakeCursor:
+    def __init__(self, state):
+        self.state = state
+        self.row = None
+        self.uploaded = []
+        self.queries = []
+
+    def execute(self, query, values):
+        self.queries.append(query)
+        if query == win_probability.FETCH_SCHOOL_QUERY:
+            self.row = (values[0] - 100,)
+        else:
+            self.row = (values[0], elo.encode_state(self.state))
+
+    def fetchone(self):
+        return self.row
+
+    def executemany(self, query, rows):
+        self.uploaded += rows
+
+
+def test_game_scorer():
+    """Tests that the scorer uploads a probability for each play, reads the
+    rating gap from the day before, and reads each school and day once."""
+    engine = elo.EloEngine()
+    engine.update({'season': 2024, 'home team season ID': 101, 'away team season ID': 102,
+                   'home school ID': 1, 'away school ID': 2, 'home points': 90,
+                   'away points': 60})
+    cursor = FakeCursor(engine.snapshot())
+    model = win_probability.WinProbabilityModel([0, 0, 0, 1, 0])
+    scorer = win_probability.GameScorer(model)
+    plays = [{'period': 0, 'time': 1200, 'home score': 0, 'away score': 0, 'is away': False,
+              'offense is away': False},
+             {'period': 0, 'time': 1150, 'home score': 2, 'away score': 0, 'is away': False,
+              'offense is away': False}]
+    probabilities = scorer.upload_game(cursor, 5, 2024, "2024/01/10 19:00", (101, 102), plays)
+    gap = engine.rating(1) - engine.rating(2)
+    expected = model.score_plays(plays, gap)
+    assert np.allclose(probabilities, expected)
+    assert [row[:2] for row in cursor.uploaded] == [(5, 0), (5, 1)]
+    assert probabilities[0] > 0.5
+
+    next_season = scorer.upload_game(cursor, 6, 2025, "2024/01/10", (101, 102), plays)
+    assert np.allclose(next_season, model.score_plays(plays, gap * elo.CARRYOVER))
+    assert len(cursor.queries) == 3
+    assert scorer.state(cursor, datetime.date(2024, 1, 10)) is not None